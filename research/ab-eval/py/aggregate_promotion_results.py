@@ -1,9 +1,12 @@
 import json
 import os
 import glob
+from pathlib import Path
+
+from bootstrap_ci import bootstrap_from_paths, print_summary
 
 def load_results(pattern):
-    files = glob.glob(pattern)
+    files = sorted(glob.glob(pattern))
     all_data = []
     for f in files:
         with open(f, 'r') as j:
@@ -49,8 +52,8 @@ def build_comparison():
             "v3_4": agg_treatment['metrics']
         },
         "details": {
-            "control_runs": [os.path.basename(f) for f in glob.glob(control_pattern)],
-            "treatment_runs": [os.path.basename(f) for f in glob.glob(treatment_pattern)]
+            "control_runs": [os.path.basename(f) for f in sorted(glob.glob(control_pattern))],
+            "treatment_runs": [os.path.basename(f) for f in sorted(glob.glob(treatment_pattern))]
         },
         "helps_hurts": {
             "helps_count": 0,
@@ -62,6 +65,13 @@ def build_comparison():
         }
     }
     
+    # Paired query-level bootstrap over the repeats
+    comparison["bootstrap"] = bootstrap_from_paths(
+        [Path(f) for f in sorted(glob.glob(control_pattern))],
+        [Path(f) for f in sorted(glob.glob(treatment_pattern))],
+    )
+    print_summary(comparison["bootstrap"])
+
     # Calculate G1 delta
     g1_delta = agg_treatment['metrics']['agreement'] - agg_control['metrics']['agreement']
     print(f"G1 Agreement Delta: {g1_delta:+.4f}")
@@ -0,0 +1,182 @@
+"""
+CPU loading benchmark and embedding parity for Qwen3VLEmbedder precisions
+
+Each precision is loaded in its own child process (so peak RSS is measured
+per mode, not accumulated) and embeds the same sample of glyph sheets and
+query texts. The parent compares every mode to the fp32 reference by
+per-item cosine similarity.
+
+Usage:
+    python research/ab-eval/py/bench_embedder_cpu.py --modes fp32 fp16 bf16 int8 --n-images 16 --n-texts 16
+
+This produces:
+    research/ab-eval/out/embedder_cpu_bench.json   (per mode: load_s, peak_rss_mb, items/s, cosine vs fp32)
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_GLYPH_DIR = "research/ab-eval/out/glyphs"
+DEFAULT_QUERIES = "research/ab-eval/data/queries.medium.human.v1.json"
+DEFAULT_OUT = "research/ab-eval/out/embedder_cpu_bench.json"
+
+
+def peak_rss_bytes() -> Optional[int]:
+    try:
+        import resource  # Unix
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil  # Windows: peak working set
+        return int(psutil.Process().memory_info().peak_wset)
+    except (ImportError, AttributeError):
+        return None
+
+
+def sample_items(glyph_dir: str, queries_path: str, n_images: int, n_texts: int) -> List[Dict[str, str]]:
+    images = sorted(Path(glyph_dir).glob("*.png"))[:n_images]
+    with open(queries_path, "r", encoding="utf-8") as f:
+        queries = json.load(f)
+    items = [{"image": str(p)} for p in images]
+    items += [{"text": q["text"]} for q in queries[:n_texts]]
+    return items
+
+
+def run_worker(model: str, precision: str, items_path: str, out_npy: str, threads: int) -> Dict[str, Any]:
+    import torch
+    from embed_qwen3_vl import Qwen3VLEmbedder
+
+    if threads:
+        torch.set_num_threads(threads)
+    with open(items_path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+
+    t0 = time.perf_counter()
+    embedder = Qwen3VLEmbedder(model_name=model, precision=precision)
+    load_s = time.perf_counter() - t0
+    rss_after_load = peak_rss_bytes()
+
+    embedder.embed_items(items[:1])  # warm-up (first call pays lazy init / page faults)
+    t1 = time.perf_counter()
+    embs = embedder.embed_items(items)
+    embed_s = time.perf_counter() - t1
+    np.save(out_npy, embs.astype(np.float32))
+    rss_peak = peak_rss_bytes()
+
+    return {
+        "precision": embedder.precision,
+        "device": str(embedder.device),
+        "load_s": round(load_s, 2),
+        "embed_s": round(embed_s, 2),
+        "items": len(items),
+        "items_per_s": round(len(items) / embed_s, 3) if embed_s else None,
+        "peak_rss_after_load_mb": round(rss_after_load / 2**20, 1) if rss_after_load else None,
+        "peak_rss_mb": round(rss_peak / 2**20, 1) if rss_peak else None,
+    }
+
+
+def cosine_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return np.sum(a * b, axis=1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Peak RSS / throughput / parity benchmark for embedder precisions")
+    parser.add_argument("--model", default="Qwen/Qwen3-VL-Embedding-8B")
+    parser.add_argument("--modes", nargs="+", default=["fp32", "fp16", "bf16", "int8"],
+                        help="Precisions to compare; fp16 is the original loading path, fp32 is the parity reference")
+    parser.add_argument("--glyph-dir", default=DEFAULT_GLYPH_DIR)
+    parser.add_argument("--queries", default=DEFAULT_QUERIES)
+    parser.add_argument("--n-images", type=int, default=16)
+    parser.add_argument("--n-texts", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=0, help="torch.set_num_threads (0 = torch default)")
+    parser.add_argument("--min-mean-cosine", type=float, default=0.99)
+    parser.add_argument("--min-item-cosine", type=float, default=0.97)
+    parser.add_argument("--out", default=DEFAULT_OUT)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--items-file", help=argparse.SUPPRESS)
+    parser.add_argument("--out-npy", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print("RESULT " + json.dumps(run_worker(args.model, args.worker, args.items_file, args.out_npy, args.threads)))
+        return
+
+    modes = list(dict.fromkeys(["fp32"] + args.modes))  # reference always first
+    items = sample_items(args.glyph_dir, args.queries, args.n_images, args.n_texts)
+    print(f"Benchmarking {modes} on {len(items)} items ({args.n_images} images, {args.n_texts} texts)")
+
+    results: Dict[str, Any] = {}
+    embeddings: Dict[str, np.ndarray] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        items_path = os.path.join(tmp, "items.json")
+        with open(items_path, "w", encoding="utf-8") as f:
+            json.dump(items, f)
+        for mode in modes:
+            out_npy = os.path.join(tmp, f"{mode}.npy")
+            cmd = [sys.executable, __file__, "--worker", mode, "--model", args.model,
+                   "--items-file", items_path, "--out-npy", out_npy, "--threads", str(args.threads)]
+            print(f"\n--- {mode} ---")
+            proc = subprocess.run(cmd, capture_output=True, text=True)
+            result_lines = [l for l in proc.stdout.splitlines() if l.startswith("RESULT ")]
+            if proc.returncode != 0 or not result_lines:
+                print(proc.stdout[-2000:], proc.stderr[-2000:])
+                results[mode] = {"error": f"exit {proc.returncode}"}
+                continue
+            results[mode] = json.loads(result_lines[-1][len("RESULT "):])
+            embeddings[mode] = np.load(out_npy)
+            print(json.dumps(results[mode]))
+
+    ref = embeddings.get("fp32")
+    for mode, emb in embeddings.items():
+        if ref is None or mode == "fp32":
+            continue
+        cos = cosine_rows(emb, ref)
+        results[mode]["cosine_vs_fp32"] = {
+            "mean": round(float(cos.mean()), 5),
+            "min": round(float(cos.min()), 5),
+            "p05": round(float(np.percentile(cos, 5)), 5),
+        }
+        results[mode]["parity_ok"] = bool(cos.mean() >= args.min_mean_cosine and cos.min() >= args.min_item_cosine)
+
+    report = {
+        "model": args.model,
+        "items": len(items),
+        "n_images": args.n_images,
+        "n_texts": args.n_texts,
+        "threads": args.threads or None,
+        "thresholds": {"min_mean_cosine": args.min_mean_cosine, "min_item_cosine": args.min_item_cosine},
+        "modes": results,
+    }
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'Mode':<6} {'Load s':>8} {'Peak RSS MB':>12} {'Items/s':>9} {'Cos mean':>9} {'Cos min':>8}")
+    for mode in modes:
+        r = results.get(mode, {})
+        if "error" in r:
+            print(f"{mode:<6} {r['error']}")
+            continue
+        cos = r.get("cosine_vs_fp32", {"mean": 1.0, "min": 1.0})
+        print(f"{mode:<6} {r['load_s']:>8} {str(r['peak_rss_mb']):>12} {str(r['items_per_s']):>9} "
+              f"{cos['mean']:>9} {cos['min']:>8}")
+    print(f"Saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
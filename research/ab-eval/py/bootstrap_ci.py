@@ -0,0 +1,286 @@
+"""
+Paired query-level bootstrap for promotion gate deltas (G1/G2/G3)
+
+Control and treatment runs are aligned on their common (query_id, font_name)
+pairs and reduced to per-query sufficient statistics (TP/FP/FN/TN per arm,
+helps/hurts). Each bootstrap replicate resamples whole queries with
+replacement; replicates are drawn as one (n_boot, n_queries) index matrix,
+turned into multiplicity weights and contracted against the per-query table,
+so thousands of replicates cost one matrix product per repeat.
+
+Repeated runs (r1..rN) are averaged the way aggregate_promotion_results.py and
+validate_gates.py average them: agreement and precision are computed per
+repeat and then averaged over repeats (not computed on counts pooled across
+repeats), and helps/hurts are averaged over the zipped control/treatment
+repeat pairs.
+
+Gate semantics are unchanged: point estimates still decide PASS/FAIL in
+validate_gates.py. The bootstrap block is attached as supporting evidence.
+
+Usage:
+    python research/ab-eval/py/bootstrap_ci.py \
+        --control research/ab-eval/out/promo_v3_control_r*_results.json \
+        --treatment research/ab-eval/out/promo_v3_3_treatment_r*_results.json \
+        --attach research/ab-eval/out/promo_v3_vs_v3_3_comparison_repeats3.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from metrics_kernel import N, TP, FP, TN, confusion_matrix, remap_label
+from results_columnar import load_detail_rows
+from validate_gates import AGREEMENT_DELTA_MIN, PRECISION_DELTA_MIN
+
+HELPS_HURTS_NET_MIN = 0
+RUN_COLUMNS = ("query_id", "font_name", "ai_match", "ai_match_gated", "human_match")
+
+
+def load_json(path: Path) -> Any:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def expand_paths(patterns: List[str]) -> List[Path]:
+    paths: List[Path] = []
+    for p in patterns:
+        matches = sorted(glob.glob(p))
+        paths.extend(Path(m) for m in (matches or [p]))
+    return paths
+
+
+def load_run(path: Path) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    rows = load_detail_rows(path, RUN_COLUMNS) or []
+    return {(r["query_id"], r["font_name"]): r for r in rows}
+
+
+def row_prediction(row: Dict[str, Any]) -> int:
+    """Gated prediction when the runner stored one, raw verdict otherwise."""
+    return 1 if row.get("ai_match_gated", row.get("ai_match", 0)) == 1 else 0
+
+
+def paired_query_stats(
+    control_runs: List[Dict[Tuple[str, str], Dict[str, Any]]],
+    treatment_runs: List[Dict[Tuple[str, str], Dict[str, Any]]],
+    ssot_map: Optional[Dict[Tuple[str, str], int]] = None,
+) -> Dict[str, Any]:
+    """
+    Per-query sufficient statistics over pairs common to every run.
+
+    Labels come from `ssot_map` when given, else from each row's `human_match`.
+    Returns `control`/`treatment` arrays of shape (n_repeats, n_queries, 4) holding
+    TP/FP/FN/TN per repeat, and `helps`/`hurts` arrays of shape (n_queries,) summed
+    over the `repeat_pairs` zipped control/treatment repeats.
+    """
+    if not control_runs or not treatment_runs:
+        raise ValueError("Need at least one control run and one treatment run")
+
+    common = set(control_runs[0])
+    for run in control_runs[1:] + treatment_runs:
+        common &= set(run)
+    if ssot_map is not None:
+        common &= set(ssot_map)
+    keys = sorted(common)
+    if not keys:
+        raise ValueError("Control and treatment runs share no evaluable pairs")
+
+    query_ids, query_codes = np.unique([k[0] for k in keys], return_inverse=True)
+    n_q = len(query_ids)
+
+    if ssot_map is not None:
+        labels = np.array([ssot_map[k] for k in keys])
+    else:
+        labels = np.array([remap_label(control_runs[0][k].get("human_match", 0)) for k in keys])
+
+    def predictions(runs):
+        return np.array([[row_prediction(run[k]) for k in keys] for run in runs])
+
+    pred_c = predictions(control_runs)
+    pred_t = predictions(treatment_runs)
+
+    def per_query_counts(preds: np.ndarray) -> np.ndarray:
+        # Integer counts keep every replicate exact, so ties at 0 / thresholds are stable.
+        return np.stack([
+            np.ascontiguousarray(confusion_matrix(labels, p, query_codes, n_q)[:, :N], dtype=float) for p in preds
+        ])
+
+    n_repeat_pairs = min(len(pred_c), len(pred_t))
+    correct_c = pred_c[:n_repeat_pairs] == labels[None, :]
+    correct_t = pred_t[:n_repeat_pairs] == labels[None, :]
+    helps = np.bincount(query_codes, weights=(~correct_c & correct_t).sum(axis=0), minlength=n_q)
+    hurts = np.bincount(query_codes, weights=(correct_c & ~correct_t).sum(axis=0), minlength=n_q)
+
+    return {
+        "query_ids": query_ids.tolist(),
+        "n_pairs": len(keys),
+        "control_repeats": len(control_runs),
+        "treatment_repeats": len(treatment_runs),
+        "repeat_pairs": n_repeat_pairs,
+        "control": per_query_counts(pred_c),
+        "treatment": per_query_counts(pred_t),
+        "helps": helps,
+        "hurts": hurts,
+    }
+
+
+def resample_weights(n_items: int, n_boot: int, seed: int) -> np.ndarray:
+    """(n_boot, n_items) multiplicity matrix for resampling items with replacement."""
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, n_items, size=(n_boot, n_items))
+    flat = (idx + np.arange(n_boot)[:, None] * n_items).ravel()
+    return np.bincount(flat, minlength=n_boot * n_items).reshape(n_boot, n_items).astype(float)
+
+
+def agreement(counts: np.ndarray) -> np.ndarray:
+    total = counts.sum(axis=-1)
+    return np.divide(counts[..., TP] + counts[..., TN], total, out=np.zeros_like(total), where=total > 0)
+
+
+def precision(counts: np.ndarray) -> np.ndarray:
+    predicted = counts[..., TP] + counts[..., FP]
+    return np.divide(counts[..., TP], predicted, out=np.zeros_like(predicted), where=predicted > 0)
+
+
+def summarize(point: float, replicates: np.ndarray, threshold: float, strict: bool, alpha: float) -> Dict[str, Any]:
+    n_boot = len(replicates)
+    lo, hi = np.quantile(replicates, [alpha / 2, 1 - alpha / 2])
+    p_le = (np.sum(replicates <= 0) + 1) / (n_boot + 1)
+    p_ge = (np.sum(replicates >= 0) + 1) / (n_boot + 1)
+    passing = replicates > threshold if strict else replicates >= threshold
+    return {
+        "point": round(float(point), 4),
+        "ci_low": round(float(lo), 4),
+        "ci_high": round(float(hi), 4),
+        "std_err": round(float(np.std(replicates, ddof=1)), 4),
+        "p_value": round(float(min(1.0, 2 * min(p_le, p_ge))), 4),
+        "p_gate_pass": round(float(np.mean(passing)), 4),
+    }
+
+
+def paired_bootstrap(
+    stats: Dict[str, Any],
+    n_boot: int = 5000,
+    seed: int = 42,
+    alpha: float = 0.05,
+) -> Dict[str, Any]:
+    """CIs, two-sided p-values (H0: delta == 0) and P(gate passes) for G1/G2/G3."""
+    W = resample_weights(len(stats["query_ids"]), n_boot, seed)
+
+    ctrl, trt = stats["control"], stats["treatment"]
+    boot_c = W @ ctrl
+    boot_t = W @ trt
+    net_per_query = stats["helps"] - stats["hurts"]
+    n_repeat_pairs = stats["repeat_pairs"]
+
+    def mean_over_repeats(rate, counts: np.ndarray) -> np.ndarray:
+        return rate(counts).mean(axis=0)
+
+    # Rounded so float noise from averaging ratios does not split exact ties at 0
+    g1 = np.round(mean_over_repeats(agreement, boot_t) - mean_over_repeats(agreement, boot_c), 12)
+    g2 = np.round(mean_over_repeats(precision, boot_t) - mean_over_repeats(precision, boot_c), 12)
+    g3 = (W @ net_per_query) / n_repeat_pairs
+
+    c_sum, t_sum = ctrl.sum(axis=1), trt.sum(axis=1)
+    return {
+        "method": "paired query-level bootstrap (percentile CI)",
+        "n_boot": n_boot,
+        "seed": seed,
+        "alpha": alpha,
+        "n_queries": len(stats["query_ids"]),
+        "n_pairs": stats["n_pairs"],
+        "control_repeats": stats["control_repeats"],
+        "treatment_repeats": stats["treatment_repeats"],
+        "gates": {
+            "G1 (Agreement Delta)": summarize(
+                mean_over_repeats(agreement, t_sum) - mean_over_repeats(agreement, c_sum), g1, AGREEMENT_DELTA_MIN, False, alpha
+            ),
+            "G2 (Precision Delta)": summarize(
+                mean_over_repeats(precision, t_sum) - mean_over_repeats(precision, c_sum), g2, PRECISION_DELTA_MIN, False, alpha
+            ),
+            "G3 (Helps/Hurts Net)": summarize(
+                net_per_query.sum() / n_repeat_pairs, g3, HELPS_HURTS_NET_MIN, True, alpha
+            ),
+        },
+    }
+
+
+def bootstrap_from_paths(
+    control_paths: List[Path],
+    treatment_paths: List[Path],
+    ssot_path: Optional[Path] = None,
+    n_boot: int = 5000,
+    seed: int = 42,
+    alpha: float = 0.05,
+) -> Dict[str, Any]:
+    ssot_map = None
+    if ssot_path is not None:
+        ssot = load_json(ssot_path)
+        ssot_map = {(d["query_id"], d["font_name"]): remap_label(d.get("casey_label", 0)) for d in ssot["decisions"]}
+
+    stats = paired_query_stats(
+        [load_run(p) for p in control_paths],
+        [load_run(p) for p in treatment_paths],
+        ssot_map,
+    )
+    result = paired_bootstrap(stats, n_boot=n_boot, seed=seed, alpha=alpha)
+    result["control_results"] = [p.as_posix() for p in control_paths]
+    result["treatment_results"] = [p.as_posix() for p in treatment_paths]
+    result["label_source"] = ssot_path.as_posix() if ssot_path else "details.human_match"
+    return result
+
+
+def print_summary(result: Dict[str, Any]) -> None:
+    print(f"Paired bootstrap: {result['n_boot']} replicates over {result['n_queries']} queries "
+          f"({result['n_pairs']} pairs, repeats {result['control_repeats']}x{result['treatment_repeats']})")
+    ci_label = f"{100 * (1 - result['alpha']):g}% CI"
+    print(f"{'Gate':<24} | {'Point':>8} | {ci_label:>19} | {'p':>6} | {'P(pass)':>7}")
+    print("-" * 76)
+    for name, g in result["gates"].items():
+        ci = f"[{g['ci_low']:+.4f}, {g['ci_high']:+.4f}]"
+        print(f"{name:<24} | {g['point']:>+8.4f} | {ci:>19} | {g['p_value']:>6.4f} | {g['p_gate_pass']:>7.4f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Paired bootstrap CIs for promotion gate deltas")
+    parser.add_argument("--control", nargs="+", required=True, help="Control results JSON paths or globs")
+    parser.add_argument("--treatment", nargs="+", required=True, help="Treatment results JSON paths or globs")
+    parser.add_argument("--ssot", default="", help="Optional SSoT export; defaults to details.human_match labels")
+    parser.add_argument("--n-boot", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--out", default="", help="Optional path to save the bootstrap block (json)")
+    parser.add_argument("--attach", default="", help="Optional comparison report to update in place under 'bootstrap'")
+    args = parser.parse_args()
+
+    result = bootstrap_from_paths(
+        expand_paths(args.control),
+        expand_paths(args.treatment),
+        Path(args.ssot) if args.ssot else None,
+        n_boot=args.n_boot,
+        seed=args.seed,
+        alpha=args.alpha,
+    )
+    print_summary(result)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"Saved bootstrap to {args.out}")
+
+    if args.attach:
+        report_path = Path(args.attach)
+        report = load_json(report_path)
+        report["bootstrap"] = result
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Attached bootstrap to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
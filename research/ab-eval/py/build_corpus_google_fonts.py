@@ -4,19 +4,95 @@ import requests
 import random
 import time
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-def fetch_fonts_list():
+from corpus_changes import diff_corpora, metadata_hash, sha256_file
+
+DEFAULT_API_BASE = "https://api.fontsource.org/v1"
+DEFAULT_CACHE_DIR = "research/ab-eval/out/.fontsource_cache"
+
+
+def make_session(workers: int) -> requests.Session:
+    """One pooled session shared by all workers (keep-alive, retries on 429/5xx)."""
+    retry = Retry(
+        total=4,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET", "HEAD"),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(workers, 4), max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class JsonCache:
+    """
+    On-disk cache of API responses keyed by name, revalidated with ETag /
+    Last-Modified on every use: a 304 costs one round trip and no body.
+    """
+
+    def __init__(self, cache_dir: str, session: requests.Session, timeout: float = 10):
+        self.dir = Path(cache_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.session = session
+        self.timeout = timeout
+        self.stats = {"fetched": 0, "revalidated": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def get(self, url: str, name: str) -> Any:
+        path = self.dir / f"{name}.json"
+        cached = None
+        headers = {}
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        resp = self.session.get(url, headers=headers, timeout=self.timeout)
+        if resp.status_code == 304 and cached is not None:
+            self._count("revalidated")
+            return cached["body"]
+        resp.raise_for_status()
+        body = resp.json()
+        self._count("fetched")
+
+        tmp = path.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "url": url,
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "body": body,
+            }, f)
+        os.replace(tmp, path)
+        return body
+
+
+def fetch_fonts_list(cache: JsonCache, api_base: str = DEFAULT_API_BASE):
     """Fetches the list of all fonts from Fontsource."""
     print("Fetching fonts list from Fontsource...")
-    resp = requests.get("https://api.fontsource.org/v1/fonts", timeout=10)
-    resp.raise_for_status()
-    return resp.json()
+    return cache.get(f"{api_base}/fonts", "fonts")
+
 
-def fetch_font_details(font_id):
+def fetch_font_details(cache: JsonCache, font_id: str, api_base: str = DEFAULT_API_BASE):
     """Fetches details for a specific font."""
-    resp = requests.get(f"https://api.fontsource.org/v1/fonts/{font_id}", timeout=10)
-    resp.raise_for_status()
-    return resp.json()
+    return cache.get(f"{api_base}/fonts/{font_id}", f"details/{font_id}")
+
 
 def get_best_file_url(details):
     """Extracts a stable TTF or WOFF2 URL for the 400 normal variant."""
@@ -38,34 +114,55 @@ def get_best_file_url(details):
                             return url_dict.get('ttf') or url_dict.get('woff2')
     return None
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--limit", type=int, default=200)
-    parser.add_argument("--out", default="research/ab-eval/data/corpus.200.json")
-    parser.add_argument("--fonts-dir", default="research/ab-eval/out/fonts")
-    args = parser.parse_args()
 
-    os.makedirs(os.path.dirname(args.out), exist_ok=True)
-    os.makedirs(args.fonts_dir, exist_ok=True)
+def local_font_path(fonts_dir: str, font_id: str, url: str) -> Path:
+    ext = "ttf" if ".ttf" in url else "woff2"
+    return Path(fonts_dir) / f"{font_id}.{ext}"
+
+
+def download_font(session: requests.Session, url: str, dest: Path, timeout: float = 30) -> str:
+    """
+    Streams a font binary to `dest` (atomic rename). An existing file is
+    revalidated with the ETag recorded next to it (`<dest>.etag`), so upstream
+    binary changes are picked up. Returns "downloaded" or "not_modified".
+    """
+    etag_path = dest.with_name(dest.name + ".etag")
+    headers = {}
+    if dest.exists() and dest.stat().st_size > 0 and etag_path.exists():
+        headers["If-None-Match"] = etag_path.read_text(encoding="utf-8").strip()
+    tmp = dest.with_name(dest.name + ".part")
+    with session.get(url, headers=headers, timeout=timeout, stream=True) as r:
+        if r.status_code == 304:
+            return "not_modified"
+        r.raise_for_status()
+        with open(tmp, "wb") as f_out:
+            for chunk in r.iter_content(chunk_size=1 << 16):
+                f_out.write(chunk)
+        etag = r.headers.get("ETag")
+    os.replace(tmp, dest)
+    if etag:
+        etag_path.write_text(etag, encoding="utf-8")
+    return "downloaded"
 
-    all_fonts = fetch_fonts_list()
+
+def select_fonts(all_fonts: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
     # Filter for Google fonts to keep it clean
     google_fonts = [f for f in all_fonts if f.get('type') == 'google']
-    
+
     # Group by category
     by_cat = {}
     for f in google_fonts:
         cat = f.get('category', 'other')
         if cat not in by_cat: by_cat[cat] = []
         by_cat[cat].append(f)
-    
+
     print(f"Categories found: {list(by_cat.keys())}")
-    
+
     # Stratified sampling
-    target_count = args.limit
+    target_count = limit
     cats = ['sans-serif', 'serif', 'display', 'handwriting', 'monospace']
     per_cat = target_count // len(cats)
-    
+
     selected_fonts = []
     for cat in cats:
         fonts_in_cat = by_cat.get(cat, [])
@@ -73,7 +170,7 @@ def main():
         random.seed(42) # Reproducibility
         random.shuffle(fonts_in_cat)
         selected_fonts.extend(fonts_in_cat[:per_cat])
-    
+
     # Fill remaining if any
     if len(selected_fonts) < target_count:
         remaining_count = target_count - len(selected_fonts)
@@ -81,63 +178,117 @@ def main():
         others = [f for f in google_fonts if f['id'] not in already_selected]
         random.shuffle(others)
         selected_fonts.extend(others[:remaining_count])
+    return selected_fonts
+
 
-    print(f"Selected {len(selected_fonts)} fonts. Fetching details and validating URLs...")
-    
-    corpus = []
-    for i, f in enumerate(selected_fonts):
-        fid = f['id']
-        print(f"[{i+1}/{len(selected_fonts)}] Processing {fid}...")
-        try:
-            details = fetch_font_details(fid)
-            url = get_best_file_url(details)
-            
-            if not url:
-                print(f"  Warning: No suitable file URL for {fid}")
-                continue
-                
+def process_font(f: Dict[str, Any], cache: JsonCache, session: requests.Session, args) -> Optional[Dict[str, Any]]:
+    """Details + download (or HEAD validation) for one font; None when it cannot be used."""
+    fid = f['id']
+    try:
+        details = fetch_font_details(cache, fid, args.api_base)
+        url = get_best_file_url(details)
+
+        if not url:
+            print(f"  Warning: No suitable file URL for {fid}")
+            return None
+
+        local_file = None
+        if args.no_download:
             # Basic validation (HEAD request)
-            try:
-                head = requests.head(url, timeout=5, allow_redirects=True)
-                if head.status_code >= 400:
-                    print(f"  Warning: URL validation failed for {fid} ({head.status_code})")
-                    continue
-            except Exception as e:
-                print(f"  Warning: URL validation error for {fid}: {e}")
-                continue
-
-            # Create corpus entry
-            entry = {
-                "name": f['family'],
-                "category": f.get('category', 'unknown'),
-                "source": "Google Fonts (via Fontsource)",
-                "tags": f.get('subsets', []), # Use subsets as proxy tags if nothing else
-                "description": f"A {f.get('category')} font from Google Fonts.",
-                "files": {
-                    "400": url
-                },
-                "fontsource_id": fid
-            }
-            corpus.append(entry)
-            
-            # Optional: Download to cache
-            # ext = "ttf" if ".ttf" in url else "woff2"
-            # local_path = os.path.join(args.fonts_dir, f"{fid}.{ext}")
-            # if not os.path.exists(local_path):
-            #     r = requests.get(url, timeout=10)
-            #     with open(local_path, 'wb') as f_out:
-            #         f_out.write(r.content)
-            
-            # Be nice to the API
-            time.sleep(0.1)
-            
-        except Exception as e:
-            print(f"  Error processing {fid}: {e}")
-
-    print(f"Successfully built corpus with {len(corpus)} fonts.")
+            head = session.head(url, timeout=5, allow_redirects=True)
+            if head.status_code >= 400:
+                print(f"  Warning: URL validation failed for {fid} ({head.status_code})")
+                return None
+        else:
+            dest = local_font_path(args.fonts_dir, fid, url)
+            download_font(session, url, dest)
+            local_file = dest.as_posix()
+
+        # Create corpus entry
+        entry = {
+            "name": f['family'],
+            "category": f.get('category', 'unknown'),
+            "source": "Google Fonts (via Fontsource)",
+            "tags": f.get('subsets', []), # Use subsets as proxy tags if nothing else
+            "description": f"A {f.get('category')} font from Google Fonts.",
+            "files": {
+                "400": url
+            },
+            "fontsource_id": fid
+        }
+        entry["content_hash"] = {
+            "metadata": metadata_hash(entry, details),
+            "binary": sha256_file(Path(local_file)) if local_file else None,
+        }
+        if local_file:
+            entry["local_file"] = local_file
+        return entry
+    except Exception as e:
+        print(f"  Error processing {fid}: {e}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--out", default="research/ab-eval/data/corpus.200.json")
+    parser.add_argument("--fonts-dir", default="research/ab-eval/out/fonts")
+    parser.add_argument("--api-base", default=DEFAULT_API_BASE, help="Fontsource API root (point at a local stub for testing)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="On-disk cache for list/details JSON (ETag revalidated)")
+    parser.add_argument("--workers", type=int, default=16, help="Concurrent detail/download workers")
+    parser.add_argument("--no-download", action="store_true", help="Only HEAD-validate font URLs instead of downloading binaries")
+    parser.add_argument("--previous", default="", help="Corpus to diff against (default: the existing --out file)")
+    parser.add_argument("--changes-out", default="", help="Change manifest path (default: <out stem>.changes.json)")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    os.makedirs(args.fonts_dir, exist_ok=True)
+
+    previous_path = args.previous or (args.out if os.path.exists(args.out) else "")
+    previous = []
+    if previous_path:
+        with open(previous_path, 'r') as f:
+            previous = json.load(f)
+
+    t0 = time.time()
+    session = make_session(args.workers)
+    cache = JsonCache(args.cache_dir, session)
+    (Path(args.cache_dir) / "details").mkdir(parents=True, exist_ok=True)
+
+    all_fonts = fetch_fonts_list(cache, args.api_base)
+    selected_fonts = select_fonts(all_fonts, args.limit)
+
+    print(f"Selected {len(selected_fonts)} fonts. Fetching details and {'validating URLs' if args.no_download else 'downloading binaries'} with {args.workers} workers...")
+
+    done = 0
+    lock = threading.Lock()
+
+    def work(f):
+        nonlocal done
+        entry = process_font(f, cache, session, args)
+        with lock:
+            done += 1
+            if done % 100 == 0 or done == len(selected_fonts):
+                print(f"  [{done}/{len(selected_fonts)}] processed ({time.time() - t0:.1f}s)")
+        return entry
+
+    # map() keeps selection order, so the corpus is identical for any worker count
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        corpus = [e for e in pool.map(work, selected_fonts) if e is not None]
+
+    print(f"Successfully built corpus with {len(corpus)} fonts in {time.time() - t0:.1f}s "
+          f"(API fetched={cache.stats['fetched']}, revalidated={cache.stats['revalidated']})")
     with open(args.out, 'w') as f:
         json.dump(corpus, f, indent=2)
     print(f"Saved to {args.out}")
 
+    changes = diff_corpora(previous, corpus, previous_path, args.out)
+    changes_out = args.changes_out or str(Path(args.out).with_suffix("")) + ".changes.json"
+    with open(changes_out, 'w') as f:
+        json.dump(changes, f, indent=2)
+    c = changes["counts"]
+    print(f"Changes vs {previous_path or '(none)'}: +{c['added']} added, ~{c['changed']} changed, "
+          f"-{c['removed']} removed, {c['unchanged']} unchanged -> {changes_out}")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,446 @@
+"""
+Probabilistic calibration of VLM judge confidence (isotonic + Platt)
+
+The judge returns a binary `ai_match` plus a `confidence` in that verdict. This
+tool converts each verdict into a match score (confidence if ai_match == 1,
+otherwise 1 - confidence) and learns per-query-group maps from that score to
+P(human match) using the amended SSoT labels (2 -> 0). Rows without a
+numeric `confidence` (e.g. judges that do not emit one) are dropped and
+counted rather than fitted at a guessed value.
+
+Subcommands:
+- fit:   fit isotonic + Platt maps per group, report query-grouped CV quality,
+         and write a small JSON artifact
+- apply: load an artifact and add calibrated probabilities to any results file
+         (`details` list or raw cache list), with reliability diagrams when the
+         rows overlap the SSoT
+
+Outputs (defaults):
+- research/ab-eval/out/judge_calibration_week2_g3pro_v3_1.json
+- research/ab-eval/out/<results stem>_calibrated.json
+- research/ab-eval/out/<results stem>_reliability.md (+ .png)
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from week3_threshold_calibration import TECHNICAL_CLASSES
+
+GLOBAL_GROUP = "__global__"
+METHODS = ("isotonic", "platt")
+
+
+def remap_label(label: Any) -> int:
+    """Governance policy: non-binary label 2 is treated as 0 for primary metrics."""
+    if label == 2:
+        return 0
+    return 1 if label == 1 else 0
+
+
+def load_json(path: Path) -> Any:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def result_rows(data: Any) -> List[Dict[str, Any]]:
+    """Results files store rows under `details`; raw caches are bare lists."""
+    if isinstance(data, list):
+        return data
+    return data.get("details", [])
+
+
+def match_scores(ai_match: np.ndarray, confidence: np.ndarray) -> np.ndarray:
+    confidence = np.clip(np.nan_to_num(confidence.astype(float), nan=0.5), 0.0, 1.0)
+    return np.where(ai_match == 1, confidence, 1.0 - confidence)
+
+
+def group_names(query_ids: np.ndarray, q_class_map: Dict[str, str], group_by: str) -> np.ndarray:
+    if group_by == "class":
+        names = [q_class_map.get(q, "unclassified") for q in query_ids]
+    else:
+        names = ["Technical" if q_class_map.get(q) in TECHNICAL_CLASSES else "Subjective" for q in query_ids]
+    return np.array(names, dtype=object)
+
+
+# --- Isotonic regression (pool-adjacent-violators) ---
+
+def fit_isotonic(scores: np.ndarray, labels: np.ndarray) -> Dict[str, List[float]]:
+    """
+    Non-decreasing step map from score to P(match).
+
+    Scores are collapsed to unique levels first (judges emit a handful of
+    confidence values), so PAV runs over O(levels) blocks rather than O(n) rows.
+    """
+    levels, inverse = np.unique(scores, return_inverse=True)
+    weight = np.bincount(inverse).astype(float)
+    total = np.bincount(inverse, weights=labels.astype(float))
+
+    block_w: List[float] = []
+    block_sum: List[float] = []
+    block_end: List[int] = []
+    for i in range(len(levels)):
+        block_w.append(weight[i])
+        block_sum.append(total[i])
+        block_end.append(i)
+        while len(block_w) > 1 and block_sum[-2] / block_w[-2] >= block_sum[-1] / block_w[-1]:
+            w, s, e = block_w.pop(), block_sum.pop(), block_end.pop()
+            block_w[-1] += w
+            block_sum[-1] += s
+            block_end[-1] = e
+
+    fitted = np.empty(len(levels))
+    start = 0
+    for w, s, e in zip(block_w, block_sum, block_end):
+        fitted[start:e + 1] = s / w
+        start = e + 1
+
+    return {"x": [round(float(v), 6) for v in levels], "y": [round(float(v), 6) for v in fitted]}
+
+
+def apply_isotonic(model: Dict[str, List[float]], scores: np.ndarray) -> np.ndarray:
+    return np.interp(scores, np.asarray(model["x"]), np.asarray(model["y"]))
+
+
+# --- Platt scaling (logistic on the score) ---
+
+def fit_platt(scores: np.ndarray, labels: np.ndarray, max_iter: int = 100) -> Dict[str, float]:
+    """
+    Newton-Raphson fit of P(match) = sigmoid(a * score + b).
+
+    Uses Platt's smoothed targets so perfectly separated groups still give
+    finite coefficients.
+    """
+    n_pos = float(np.sum(labels == 1))
+    n_neg = float(len(labels) - n_pos)
+    target = np.where(labels == 1, (n_pos + 1.0) / (n_pos + 2.0), 1.0 / (n_neg + 2.0))
+    X = np.column_stack([scores, np.ones_like(scores)])
+    w = np.array([0.0, np.log((n_pos + 1.0) / (n_neg + 1.0))])
+
+    for _ in range(max_iter):
+        p = 1.0 / (1.0 + np.exp(-(X @ w)))
+        grad = X.T @ (p - target)
+        hess = (X * (p * (1.0 - p))[:, None]).T @ X + 1e-9 * np.eye(2)
+        step = np.linalg.solve(hess, grad)
+        w -= step
+        if np.max(np.abs(step)) < 1e-10:
+            break
+
+    return {"a": round(float(w[0]), 6), "b": round(float(w[1]), 6)}
+
+
+def apply_platt(model: Dict[str, float], scores: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-(model["a"] * scores + model["b"])))
+
+
+# --- Fitting / applying per group ---
+
+def fit_group_models(
+    scores: np.ndarray,
+    labels: np.ndarray,
+    groups: np.ndarray,
+    min_group_size: int,
+) -> Dict[str, Dict[str, Any]]:
+    models: Dict[str, Dict[str, Any]] = {
+        GLOBAL_GROUP: {
+            "n": int(len(labels)),
+            "positives": int(labels.sum()),
+            "isotonic": fit_isotonic(scores, labels),
+            "platt": fit_platt(scores, labels),
+        }
+    }
+    for grp in np.unique(groups):
+        mask = groups == grp
+        if mask.sum() < min_group_size:
+            continue
+        models[str(grp)] = {
+            "n": int(mask.sum()),
+            "positives": int(labels[mask].sum()),
+            "isotonic": fit_isotonic(scores[mask], labels[mask]),
+            "platt": fit_platt(scores[mask], labels[mask]),
+        }
+    return models
+
+
+def calibrate(models: Dict[str, Dict[str, Any]], scores: np.ndarray, groups: np.ndarray, method: str) -> np.ndarray:
+    """Apply the per-group map to every row; unseen or small groups fall back to the global map."""
+    apply_fn = apply_isotonic if method == "isotonic" else apply_platt
+    out = np.empty(len(scores), dtype=float)
+    covered = np.zeros(len(scores), dtype=bool)
+    for grp, model in models.items():
+        if grp == GLOBAL_GROUP:
+            continue
+        mask = groups == grp
+        if mask.any():
+            out[mask] = apply_fn(model[method], scores[mask])
+            covered |= mask
+    if (~covered).any():
+        out[~covered] = apply_fn(models[GLOBAL_GROUP][method], scores[~covered])
+    return out
+
+
+# --- Reliability ---
+
+def reliability_bins(probs: np.ndarray, labels: np.ndarray, n_bins: int) -> List[Dict[str, Any]]:
+    idx = np.minimum((probs * n_bins).astype(int), n_bins - 1)
+    count = np.bincount(idx, minlength=n_bins)
+    prob_sum = np.bincount(idx, weights=probs, minlength=n_bins)
+    pos_sum = np.bincount(idx, weights=labels.astype(float), minlength=n_bins)
+
+    rows = []
+    for b in range(n_bins):
+        if count[b] == 0:
+            continue
+        rows.append({
+            "bin_lo": round(b / n_bins, 4),
+            "bin_hi": round((b + 1) / n_bins, 4),
+            "count": int(count[b]),
+            "mean_pred": round(float(prob_sum[b] / count[b]), 4),
+            "observed": round(float(pos_sum[b] / count[b]), 4),
+        })
+    return rows
+
+
+def calibration_quality(probs: np.ndarray, labels: np.ndarray, n_bins: int) -> Dict[str, float]:
+    if len(labels) == 0:
+        return {"brier": 0.0, "log_loss": 0.0, "ece": 0.0}
+    bins = reliability_bins(probs, labels, n_bins)
+    ece = sum(b["count"] * abs(b["mean_pred"] - b["observed"]) for b in bins) / len(labels)
+    p = np.clip(probs, 1e-6, 1 - 1e-6)
+    log_loss = -np.mean(labels * np.log(p) + (1 - labels) * np.log(1 - p))
+    return {
+        "brier": round(float(np.mean((probs - labels) ** 2)), 4),
+        "log_loss": round(float(log_loss), 4),
+        "ece": round(float(ece), 4),
+    }
+
+
+def query_grouped_cv(
+    scores: np.ndarray,
+    labels: np.ndarray,
+    groups: np.ndarray,
+    query_ids: np.ndarray,
+    folds: int,
+    seed: int,
+    min_group_size: int,
+    n_bins: int,
+) -> Dict[str, Dict[str, float]]:
+    """Held-out calibration quality with whole queries assigned to folds."""
+    unique_queries = np.unique(query_ids)
+    rng = np.random.RandomState(seed)
+    rng.shuffle(unique_queries)
+    fold_of_query = {q: i % folds for i, q in enumerate(unique_queries)}
+    fold_codes = np.array([fold_of_query[q] for q in query_ids])
+
+    held_out = {m: np.empty(len(labels)) for m in METHODS}
+    for i in range(folds):
+        test = fold_codes == i
+        if not test.any():
+            continue
+        models = fit_group_models(scores[~test], labels[~test], groups[~test], min_group_size)
+        for m in METHODS:
+            held_out[m][test] = calibrate(models, scores[test], groups[test], m)
+
+    out = {"raw": calibration_quality(scores, labels, n_bins)}
+    for m in METHODS:
+        out[m] = calibration_quality(held_out[m], labels, n_bins)
+    return out
+
+
+def write_reliability_png(path: Path, series: Dict[str, List[Dict[str, Any]]], size: int = 480) -> None:
+    from PIL import Image, ImageDraw
+
+    pad = 40
+    plot = size - 2 * pad
+    colors = {"raw": (150, 150, 150), "isotonic": (31, 119, 180), "platt": (214, 39, 40)}
+
+    img = Image.new("RGB", (size, size), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+
+    def xy(px: float, py: float) -> Tuple[float, float]:
+        return pad + px * plot, size - pad - py * plot
+
+    draw.rectangle([xy(0, 1), xy(1, 0)], outline=(0, 0, 0))
+    draw.line([xy(0, 0), xy(1, 1)], fill=(200, 200, 200))
+    for i, (name, bins) in enumerate(series.items()):
+        color = colors.get(name, (0, 0, 0))
+        pts = [xy(b["mean_pred"], b["observed"]) for b in bins]
+        if len(pts) > 1:
+            draw.line(pts, fill=color, width=2)
+        for x, y in pts:
+            draw.ellipse([x - 3, y - 3, x + 3, y + 3], fill=color)
+        draw.text((pad + 6, pad + 6 + 14 * i), name, fill=color)
+    draw.text((pad, size - pad + 8), "mean predicted P(match)", fill=(0, 0, 0))
+    draw.text((4, pad - 16), "observed match rate", fill=(0, 0, 0))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    img.save(path)
+
+
+def load_ssot_labels(path: Path) -> Dict[Tuple[str, str], int]:
+    ssot = load_json(path)
+    return {(d["query_id"], d["font_name"]): remap_label(d.get("casey_label", 0)) for d in ssot["decisions"]}
+
+
+def load_query_classes(path: Path) -> Dict[str, str]:
+    return {q["id"]: q.get("class", "unclassified") for q in load_json(path)}
+
+
+def split_unscored(rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+    """Rows that carry a numeric confidence, and how many were dropped (e.g. judges that emit none)."""
+    scored = [r for r in rows if isinstance(r.get("confidence"), (int, float))]
+    return scored, len(rows) - len(scored)
+
+
+def rows_to_arrays(rows: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    query_ids = np.array([r["query_id"] for r in rows], dtype=object)
+    ai_match = np.array([r.get("ai_match", 0) for r in rows])
+    confidence = np.array([r["confidence"] for r in rows], dtype=float)
+    return query_ids, ai_match, match_scores(ai_match, confidence)
+
+
+def cmd_fit(args: argparse.Namespace) -> None:
+    rows = result_rows(load_json(Path(args.results)))
+    ssot_map = load_ssot_labels(Path(args.ssot))
+    q_class_map = load_query_classes(Path(args.queries))
+
+    rows = [r for r in rows if (r["query_id"], r["font_name"]) in ssot_map]
+    rows, dropped = split_unscored(rows)
+    if dropped:
+        print(f"Dropped {dropped} SSoT pair(s) without a confidence")
+    if not rows:
+        raise RuntimeError("No results rows with a confidence overlap the SSoT; nothing to fit.")
+
+    query_ids, _, scores = rows_to_arrays(rows)
+    labels = np.array([ssot_map[(r["query_id"], r["font_name"])] for r in rows])
+    groups = group_names(query_ids, q_class_map, args.group_by)
+
+    models = fit_group_models(scores, labels, groups, args.min_group_size)
+    cv = query_grouped_cv(scores, labels, groups, query_ids, args.folds, args.seed, args.min_group_size, args.bins)
+
+    artifact = {
+        "version": 1,
+        "score": "match_score = confidence if ai_match == 1 else 1 - confidence",
+        "group_by": args.group_by,
+        "technical_classes": TECHNICAL_CLASSES,
+        "label_policy": "2->0",
+        "source": {
+            "results": Path(args.results).as_posix(),
+            "ssot": Path(args.ssot).as_posix(),
+            "pair_count": len(rows),
+            "dropped_without_confidence": dropped,
+        },
+        "timestamp_utc": datetime.now(timezone.utc).isoformat(),
+        "cv": {"folds": args.folds, "seed": args.seed, "quality": cv},
+        "groups": models,
+    }
+
+    out_path = Path(args.out)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(artifact, f, indent=2)
+
+    print(f"Fitted {len(models) - 1} group(s) + global on {len(rows)} SSoT pairs")
+    print(f"{'Method':<10} | {'Brier':<8} | {'LogLoss':<8} | {'ECE':<8}  (query-grouped {args.folds}-fold CV)")
+    for name, q in cv.items():
+        print(f"{name:<10} | {q['brier']:<8.4f} | {q['log_loss']:<8.4f} | {q['ece']:<8.4f}")
+    print(f"Saved artifact: {out_path}")
+
+
+def cmd_apply(args: argparse.Namespace) -> None:
+    artifact = load_json(Path(args.model))
+    results_path = Path(args.results)
+    data = load_json(results_path)
+    rows, dropped = split_unscored(result_rows(data))
+    if dropped:
+        print(f"Skipping {dropped} row(s) without a confidence (left uncalibrated)")
+    if not rows:
+        raise RuntimeError("No results rows carry a confidence; nothing to calibrate.")
+    q_class_map = load_query_classes(Path(args.queries))
+
+    query_ids, _, scores = rows_to_arrays(rows)
+    groups = group_names(query_ids, q_class_map, artifact["group_by"])
+    probs = {m: calibrate(artifact["groups"], scores, groups, m) for m in METHODS}
+
+    for i, r in enumerate(rows):
+        r["match_score"] = round(float(scores[i]), 4)
+        for m in METHODS:
+            r[f"p_match_{m}"] = round(float(probs[m][i]), 4)
+
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    calibrated_path = out_dir / f"{results_path.stem}_calibrated.json"
+    with open(calibrated_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    print(f"Calibrated {len(rows)} rows -> {calibrated_path}")
+
+    ssot_map = load_ssot_labels(Path(args.ssot))
+    labeled = np.array([(r["query_id"], r["font_name"]) in ssot_map for r in rows], dtype=bool)
+    if not labeled.any():
+        print("No rows overlap the SSoT; skipping reliability diagrams.")
+        return
+
+    labels = np.array([ssot_map[(r["query_id"], r["font_name"])] for r, ok in zip(rows, labeled) if ok])
+    series = {"raw": reliability_bins(scores[labeled], labels, args.bins)}
+    quality = {"raw": calibration_quality(scores[labeled], labels, args.bins)}
+    for m in METHODS:
+        series[m] = reliability_bins(probs[m][labeled], labels, args.bins)
+        quality[m] = calibration_quality(probs[m][labeled], labels, args.bins)
+
+    md_path = out_dir / f"{results_path.stem}_reliability.md"
+    png_path = out_dir / f"{results_path.stem}_reliability.png"
+    with open(md_path, "w", encoding="utf-8") as f:
+        f.write(f"# Reliability: {results_path.name}\n\n")
+        f.write(f"- Calibration artifact: `{Path(args.model).as_posix()}`\n")
+        f.write(f"- SSoT-labeled rows: {int(labeled.sum())} / {len(rows)}\n")
+        f.write(f"- Rows without a confidence (uncalibrated): {dropped}\n\n")
+        f.write("| Method | Brier | LogLoss | ECE |\n| :--- | :--- | :--- | :--- |\n")
+        for name, q in quality.items():
+            f.write(f"| {name} | {q['brier']:.4f} | {q['log_loss']:.4f} | {q['ece']:.4f} |\n")
+        for name, bins in series.items():
+            f.write(f"\n## {name}\n\n| Bin | Count | Mean P | Observed |\n| :--- | :--- | :--- | :--- |\n")
+            for b in bins:
+                f.write(f"| {b['bin_lo']:.2f}-{b['bin_hi']:.2f} | {b['count']} | {b['mean_pred']:.4f} | {b['observed']:.4f} |\n")
+        f.write(f"\n![reliability]({png_path.name})\n")
+    write_reliability_png(png_path, series)
+    print(f"Reliability report: {md_path}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fit/apply isotonic and Platt calibration for judge confidence")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--queries", default="research/ab-eval/data/queries.medium.human.v1.json")
+    common.add_argument("--ssot", default="research/ab-eval/out/full_set_review_export_1770612809775.json")
+    common.add_argument("--bins", type=int, default=10)
+
+    fit = sub.add_parser("fit", parents=[common])
+    fit.add_argument("--results", default="research/ab-eval/out/week2_g3pro_v3_1_results.json")
+    fit.add_argument("--group-by", choices=["technical", "class"], default="technical")
+    fit.add_argument("--min-group-size", type=int, default=30,
+                     help="Groups with fewer SSoT pairs use the global map")
+    fit.add_argument("--folds", type=int, default=5)
+    fit.add_argument("--seed", type=int, default=42)
+    fit.add_argument("--out", default="research/ab-eval/out/judge_calibration_week2_g3pro_v3_1.json")
+
+    apply = sub.add_parser("apply", parents=[common])
+    apply.add_argument("results", help="Results JSON (details list) or raw cache list")
+    apply.add_argument("--model", default="research/ab-eval/out/judge_calibration_week2_g3pro_v3_1.json")
+    apply.add_argument("--out-dir", default="research/ab-eval/out")
+
+    args = parser.parse_args()
+    if args.command == "fit":
+        cmd_fit(args)
+    else:
+        cmd_apply(args)
+
+
+if __name__ == "__main__":
+    main()
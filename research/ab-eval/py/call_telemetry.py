@@ -0,0 +1,183 @@
+"""
+Per-call latency telemetry for judging runs
+
+Call functions time their phases with a `CallTimer` and attach the result to
+the response dict as `timing`; the runner hands every response to one
+`Telemetry`, which writes a time series and prints percentiles at the end:
+
+- queue_wait : time before the successful attempt was sent: waiting for a
+               worker (when the caller passes `submitted_at`), failed
+               attempts and their retry/back-off sleeps
+- upload     : encoding the specimen images and building the request payload
+- model_time : the successful HTTP round-trip (request body sent, model run,
+               response received)
+- parse      : decoding the response body and the model's JSON
+- total      : sum of the above
+
+The summary is per (provider, model): calls, errors, mean attempts,
+p50/p95/p99 of each phase and calls/min over the span between the first
+call's start and the last call's end.
+
+Usage:
+    telemetry = Telemetry(run_id="v3_full")
+    resp = call_gemini_v3(...)
+    telemetry.record(resp, provider="gemini", model=args.model, n_queries=len(batch))
+    telemetry.write(final_path)
+
+    python research/ab-eval/py/call_telemetry.py summarize research/ab-eval/out/<results stem>.telemetry.jsonl
+
+This produces:
+- `research/ab-eval/out/<results stem>.telemetry.jsonl` (one line per call: start offset, provider, model, ok, attempts, phase seconds)
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+PHASES = ("queue_wait", "upload", "model_time", "parse")
+PERCENTILES = (50, 95, 99)
+
+
+class CallTimer:
+    """Phase stopwatch for one call: `lap(phase)` charges the time since the previous lap to `phase`."""
+
+    def __init__(self, submitted_at: Optional[float] = None):
+        now = time.time()
+        self.started = submitted_at if submitted_at is not None else now
+        self._last = now
+        self.attempts = 0
+        self.phases = {p: 0.0 for p in PHASES}
+        self.phases["queue_wait"] = now - self.started
+
+    def lap(self, phase: str) -> None:
+        now = time.time()
+        self.phases[phase] += now - self._last
+        self._last = now
+
+    def attempt(self) -> None:
+        """Call before each request attempt; time since the last lap (a failed attempt, a back-off) is queue wait."""
+        self.lap("queue_wait")
+        self.attempts += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {p: round(v, 4) for p, v in self.phases.items()}
+        out["total"] = round(sum(self.phases.values()), 4)
+        out["attempts"] = self.attempts
+        out["started"] = self.started
+        return out
+
+
+class Telemetry:
+    def __init__(self, run_id: str = ""):
+        self.run_id = run_id
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self.events: List[Dict[str, Any]] = []
+
+    def record(self, resp: Optional[Dict[str, Any]], provider: str, model: str, n_queries: int = 0) -> None:
+        """Adds one call; responses without `timing` (e.g. raised before timing) count by their `latency_sec`."""
+        resp = resp or {}
+        timing = dict(resp.get("timing") or {})
+        if not timing:
+            timing = {p: 0.0 for p in PHASES}
+            timing["model_time"] = timing["total"] = float(resp.get("latency_sec") or 0)
+            timing["attempts"] = 1
+            timing["started"] = time.time() - timing["total"]
+        event = {
+            "t": round(timing.pop("started") - self.started, 3),
+            "provider": provider,
+            "model": model,
+            "ok": "error" not in resp,
+            "n_queries": n_queries,
+            **timing,
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def write(self, results_path: Path) -> Path:
+        """Writes `<results stem>.telemetry.jsonl` and prints the summary table."""
+        results_path = Path(results_path)
+        path = results_path.with_name(results_path.stem + ".telemetry.jsonl")
+        with self._lock:
+            events = sorted(self.events, key=lambda e: e["t"])
+        with open(path, "w", encoding="utf-8") as f:
+            for e in events:
+                f.write(json.dumps(e) + "\n")
+        print_summary(summarize(events), title=f"Call telemetry ({self.run_id or results_path.stem})")
+        print(f"Time series: {path}")
+        return path
+
+
+def summarize(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    groups: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for e in events:
+        groups.setdefault((e["provider"], e["model"]), []).append(e)
+    rows = []
+    for (provider, model), evs in sorted(groups.items()):
+        span = max(e["t"] + e["total"] for e in evs) - min(e["t"] for e in evs)
+        row: Dict[str, Any] = {
+            "provider": provider,
+            "model": model,
+            "calls": len(evs),
+            "errors": sum(1 for e in evs if not e["ok"]),
+            "mean_attempts": round(float(np.mean([e["attempts"] for e in evs])), 2),
+            "calls_per_min": round(len(evs) / span * 60, 2) if span > 0 else None,
+            "queries_per_min": round(sum(e["n_queries"] for e in evs) / span * 60, 2) if span > 0 else None,
+        }
+        for phase in (*PHASES, "total"):
+            values = np.array([e[phase] for e in evs], dtype=np.float64)
+            for q, v in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+                row[f"{phase}_p{q}"] = round(float(v), 3)
+        rows.append(row)
+    return rows
+
+
+def print_summary(rows: List[Dict[str, Any]], title: str = "Call telemetry") -> None:
+    print("\n" + "=" * 40)
+    print(title)
+    print("=" * 40)
+    if not rows:
+        print("No calls recorded.")
+        return
+    print(f"{'provider/model':<44} {'calls':>5} {'err':>4} {'try':>4} {'/min':>6} "
+          f"{'total p50/p95/p99 (s)':>23} {'queue p95':>9} {'upload p95':>10} {'model p95':>9} {'parse p95':>9}")
+    for r in rows:
+        name = f"{r['provider']}/{r['model']}"[:44]
+        per_min = "-" if r["calls_per_min"] is None else f"{r['calls_per_min']:.1f}"
+        total = f"{r['total_p50']:.2f}/{r['total_p95']:.2f}/{r['total_p99']:.2f}"
+        print(f"{name:<44} {r['calls']:>5} {r['errors']:>4} {r['mean_attempts']:>4.1f} {per_min:>6} {total:>23} "
+              f"{r['queue_wait_p95']:>9.2f} {r['upload_p95']:>10.2f} {r['model_time_p95']:>9.2f} {r['parse_p95']:>9.3f}")
+
+
+def load_events(path: Path) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Latency percentiles and throughput from call telemetry")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("summarize", help="Print the summary of one or more .telemetry.jsonl files")
+    p.add_argument("paths", nargs="+")
+    p.add_argument("--json-out", default="", help="Optional path for the summaries as JSON, keyed by file name")
+    args = parser.parse_args()
+
+    if args.cmd == "summarize":
+        summaries = {}
+        for path in args.paths:
+            rows = summaries[Path(path).name] = summarize(load_events(Path(path)))
+            print_summary(rows, title=f"Call telemetry ({Path(path).name})")
+        if args.json_out:
+            with open(args.json_out, "w", encoding="utf-8") as f:
+                json.dump(summaries, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ import json
 from pathlib import Path
 from typing import Dict, Any, Tuple
 
+from metrics_kernel import compute_metrics as pair_metrics
+
 
 def remap_casey_label(label: Any) -> int:
     """
@@ -33,47 +35,15 @@ def extract_case_map(results: Dict[str, Any]) -> Dict[Tuple[str, str], Dict[str,
 
 
 def compute_metrics(cases: Dict[Tuple[str, str], Dict[str, Any]]) -> Dict[str, Any]:
-    tp = fp = fn = tn = 0
-    considered = 0
-    for _, c in cases.items():
-        h = remap_casey_label(c["human"])
-        a = c["ai"]
-
-        # Keep parity with production-trial scorer: only binary human labels
-        # affect confusion counts, but denominator remains full set size.
-        if h not in (0, 1):
-            continue
-
-        considered += 1
-        if h == 1 and a == 1:
-            tp += 1
-        elif h == 0 and a == 1:
-            fp += 1
-        elif h == 1 and a == 0:
-            fn += 1
-        else:
-            tn += 1
-
-    total = len(cases)
-    agreement = (tp + tn) / total if total else 0.0
-    precision = tp / (tp + fp) if (tp + fp) else 0.0
-    recall = tp / (tp + fn) if (tp + fn) else 0.0
-    f1 = (2 * precision * recall / (precision + recall)) if (precision + recall) else 0.0
-
-    return {
-        "agreement": round(agreement, 4),
-        "precision": round(precision, 4),
-        "recall": round(recall, 4),
-        "f1": round(f1, 4),
-        "counts": {
-            "tp": tp,
-            "fp": fp,
-            "fn": fn,
-            "tn": tn,
-            "considered_binary": considered,
-            "total": total,
-        },
-    }
+    # Keep parity with production-trial scorer: only binary human labels
+    # affect confusion counts, but denominator remains full set size.
+    labels = [remap_casey_label(c["human"]) for c in cases.values()]
+    preds = [c["ai"] for c in cases.values()]
+    metrics = pair_metrics(labels, preds)
+    counts = metrics["counts"]
+    counts["considered_binary"] = sum(1 for h in labels if h in (0, 1))
+    metrics["counts"] = {k: counts[k] for k in ("tp", "fp", "fn", "tn", "considered_binary", "total")}
+    return metrics
 
 
 def main():
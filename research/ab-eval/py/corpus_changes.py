@@ -0,0 +1,141 @@
+"""
+Per-font content hashes and corpus change manifests
+
+`build_corpus_google_fonts.py` stores `content_hash: {metadata, binary}` on
+every corpus entry and diffs the new corpus against the previous one. The
+resulting manifest lists fonts (by corpus `name`) that were added, changed
+(with which hash moved) or removed:
+
+    {
+      "corpus": "research/ab-eval/data/corpus.200.json",
+      "previous": "...",
+      "counts": {"added": 3, "changed": 5, "removed": 1, "unchanged": 191},
+      "added": ["Font A", ...],
+      "changed": [{"name": "Font B", "fields": ["binary"]}, ...],
+      "removed": ["Font C", ...]
+    }
+
+Rendering, description and embedding steps take `--changes <manifest>` and
+only reprocess `added` + `changed` fonts (see `filter_corpus`). Renderers read
+the binary through `font_bytes`, which prefers the entry's `local_file` so the
+rendered font is the one that was hashed.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+import requests
+
+# Entry fields that are bookkeeping rather than content.
+NON_CONTENT_FIELDS = ("content_hash", "local_file")
+
+
+def sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def metadata_hash(entry: Dict[str, Any], details: Optional[Dict[str, Any]] = None) -> str:
+    """Hash of the corpus entry content plus the upstream details record, if any."""
+    content = {k: v for k, v in entry.items() if k not in NON_CONTENT_FIELDS}
+    blob = json.dumps({"entry": content, "details": details}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def diff_corpora(
+    previous: List[Dict[str, Any]],
+    current: List[Dict[str, Any]],
+    previous_path: str = "",
+    current_path: str = "",
+) -> Dict[str, Any]:
+    """
+    Change manifest between two corpora keyed by font name. Previous entries
+    without `content_hash` cannot be verified and are reported as changed
+    with field "unhashed".
+    """
+    prev = {e["name"]: e for e in previous}
+    cur = {e["name"]: e for e in current}
+
+    added = [n for n in cur if n not in prev]
+    removed = [n for n in prev if n not in cur]
+    changed = []
+    unchanged = 0
+    for name, entry in cur.items():
+        if name not in prev:
+            continue
+        old = prev[name].get("content_hash")
+        new = entry.get("content_hash") or {}
+        if not old:
+            changed.append({"name": name, "fields": ["unhashed"]})
+            continue
+        fields = [k for k in ("metadata", "binary") if old.get(k) != new.get(k)]
+        if fields:
+            changed.append({"name": name, "fields": fields})
+        else:
+            unchanged += 1
+
+    return {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "corpus": current_path,
+        "previous": previous_path,
+        "counts": {"added": len(added), "changed": len(changed), "removed": len(removed), "unchanged": unchanged},
+        "added": added,
+        "changed": changed,
+        "removed": removed,
+    }
+
+
+def load_changes(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def names_to_process(manifest: Dict[str, Any]) -> Set[str]:
+    return set(manifest.get("added", [])) | {c["name"] for c in manifest.get("changed", [])}
+
+
+def filter_corpus(corpus: List[Dict[str, Any]], changes_path: str = "") -> List[Dict[str, Any]]:
+    """Corpus entries to (re)process: all of them, or only added/changed ones when a manifest is given."""
+    if not changes_path:
+        return corpus
+    todo = names_to_process(load_changes(changes_path))
+    subset = [f for f in corpus if f.get("name") in todo]
+    print(f"Change manifest {changes_path}: processing {len(subset)} of {len(corpus)} fonts (added/changed)")
+    return subset
+
+
+def stale_names(changes_path: str = "") -> Optional[Set[str]]:
+    """
+    Fonts whose previous outputs must not be reused (added, changed or
+    removed), or None when there is no manifest and everything is recomputed.
+    """
+    if not changes_path:
+        return None
+    manifest = load_changes(changes_path)
+    return names_to_process(manifest) | set(manifest.get("removed", []))
+
+
+def font_bytes(entry: Dict[str, Any]) -> Optional[bytes]:
+    """
+    The entry's font binary: its `local_file` (the file whose hash is
+    `content_hash.binary`) when still on disk, else a download of `files`
+    (400 weight first). None when there is neither.
+    """
+    local = entry.get("local_file")
+    if local and Path(local).is_file() and Path(local).stat().st_size > 0:
+        return Path(local).read_bytes()
+    files = entry.get("files", {})
+    url = files.get("400") or (next(iter(files.values())) if files else None)
+    if not url:
+        return None
+    resp = requests.get(url, timeout=10)
+    resp.raise_for_status()
+    return resp.content
@@ -6,11 +6,16 @@ import numpy as np
 from dotenv import load_dotenv
 import argparse
 
+from corpus_changes import stale_names
+from http_cassette import install_from_env
+from usage_accounting import UsageLedger, usage_from_response
+
 # Load .env.local from the project root
 load_dotenv(".env.local")
+install_from_env()
 
-def get_embedding(text, api_key):
-    """Calls OpenRouter to get the embedding for a given text."""
+def get_embedding(text, api_key, ledger=None, kind=""):
+    """Calls OpenRouter to get the embedding for a given text; token usage goes to `ledger` if given."""
     if not api_key:
         raise ValueError("OPENROUTER_API_KEY is not set")
     
@@ -26,7 +31,10 @@ def get_embedding(text, api_key):
     
     response = requests.post(url, headers=headers, json=payload, timeout=30)
     response.raise_for_status()
-    return response.json()['data'][0]['embedding']
+    body = response.json()
+    if ledger is not None:
+        ledger.add(None, payload["model"], kind, n_queries=1, usage=usage_from_response(body))
+    return body['data'][0]['embedding']
 
 def main():
     parser = argparse.ArgumentParser()
@@ -34,6 +42,7 @@ def main():
     parser.add_argument("--queries", default="research/ab-eval/data/queries.toy.json")
     parser.add_argument("--out_docs", default="research/ab-eval/out/embeddings_text_docs.jsonl")
     parser.add_argument("--out_queries", default="research/ab-eval/out/embeddings_text_queries.jsonl")
+    parser.add_argument("--changes", default="", help="Change manifest from build_corpus_google_fonts.py; unchanged fonts keep their previous embeddings")
     args = parser.parse_args()
 
     api_key = os.getenv("OPENROUTER_API_KEY")
@@ -45,33 +54,52 @@ def main():
     print(f"Embedding corpus from {args.corpus}...")
     with open(args.corpus, 'r') as f:
         corpus = json.load(f)
-    
+
+    # Embeddings from the previous run that the change manifest says are still valid
+    stale = stale_names(args.changes)
+    previous = {}
+    if stale is not None and os.path.exists(args.out_docs):
+        with open(args.out_docs, 'r') as f:
+            for line in f:
+                row = json.loads(line)
+                if row["name"] not in stale:
+                    previous[row["name"]] = line.rstrip("\n")
+        print(f"  Reusing {sum(1 for font in corpus if font['name'] in previous)} unchanged embeddings")
+
+    docs_ledger = UsageLedger(run_id="embeddings_text_docs")
     with open(args.out_docs, 'w') as f:
         for font in corpus:
+            if font['name'] in previous:
+                f.write(previous[font['name']] + "\n")
+                continue
             # Match contextString from scripts/seed-fonts.ts:193
             context = f"Name: {font['name']}. Category: {font['category']}. Tags: {', '.join(font['tags'])}. Description: {font['description']}"
             print(f"  Embedding font: {font['name']}...")
             try:
-                embedding = get_embedding(context, api_key)
+                embedding = get_embedding(context, api_key, docs_ledger, "docs")
                 f.write(json.dumps({"name": font['name'], "embedding": embedding}) + "\n")
             except Exception as e:
                 print(f"    Failed: {e}")
 
+    docs_ledger.write(args.out_docs)
+
     # Process Queries
     print(f"Embedding queries from {args.queries}...")
     with open(args.queries, 'r') as f:
         queries = json.load(f)
     
+    queries_ledger = UsageLedger(run_id="embeddings_text_queries")
     with open(args.out_queries, 'w') as f:
         for q in queries:
             print(f"  Embedding query: {q['text']}...")
             try:
                 # Match POST() from src/app/api/search/route.ts:50 (raw message)
-                embedding = get_embedding(q['text'], api_key)
+                embedding = get_embedding(q['text'], api_key, queries_ledger, "queries")
                 f.write(json.dumps({"id": q['id'], "text": q['text'], "embedding": embedding}) + "\n")
             except Exception as e:
                 print(f"    Failed: {e}")
 
+    queries_ledger.write(args.out_queries)
     print("Embedding complete.")
 
 if __name__ == "__main__":
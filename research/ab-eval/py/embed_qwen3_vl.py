@@ -4,23 +4,133 @@ import numpy as np
 from PIL import Image
 from transformers import AutoProcessor, AutoModel
 from qwen_vl_utils import process_vision_info
+import time
 from typing import List, Dict, Union, Optional
 
+# Qwen3-VL: 16px patches merged 2x2, so one vision token covers 32x32 pixels. Only a
+# fallback; the embedder reads patch_size * merge_size from the loaded processor.
+DEFAULT_PIXELS_PER_VISION_TOKEN = 32 * 32
+
+# Explicit min/max vision-token budgets per image kind; "default" leaves the processor's own policy.
+# Glyph sheets (512x256) are mostly white space; specimens (1024 wide) carry multi-size text.
+VISION_TOKEN_POLICIES = {
+    "default": {},
+    "glyph": {"min_tokens": 64, "max_tokens": 160},
+    "specimen": {"min_tokens": 256, "max_tokens": 1024},
+}
+
+PRECISIONS = ("auto", "fp32", "fp16", "bf16", "int8")
+_DTYPES = {"fp32": torch.float32, "fp16": torch.float16, "bf16": torch.bfloat16}
+
+
+def resolve_precision(precision: str) -> str:
+    """"auto" keeps fp16 on CUDA (the original path) and picks bf16 on CPU, where fp16 kernels are slow."""
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision!r}; expected one of {PRECISIONS}")
+    if precision == "auto":
+        return "fp16" if torch.cuda.is_available() else "bf16"
+    return precision
+
+
+def pixels_per_vision_token(processor) -> int:
+    """Pixel area of one merged vision token: (patch_size * merge_size) ** 2 from the image processor."""
+    image_processor = getattr(processor, "image_processor", None)
+    patch = getattr(image_processor, "patch_size", None)
+    merge = getattr(image_processor, "merge_size", None)
+    if isinstance(patch, int) and isinstance(merge, int):
+        return (patch * merge) ** 2
+    return DEFAULT_PIXELS_PER_VISION_TOKEN
+
+
+def quantize_linear_int8(model: torch.nn.Module) -> int:
+    """
+    Replaces every nn.Linear with a dynamic int8 Linear, one layer at a time so
+    only a single layer is ever upcast to fp32 (quantize_dynamic on the whole
+    model would need a full fp32 copy). Returns the number of layers replaced.
+    """
+    from torch.ao.nn.quantized.dynamic import Linear as DynamicQuantLinear
+    from torch.ao.quantization import default_dynamic_qconfig
+
+    replaced = 0
+    for module in list(model.modules()):
+        for child_name, child in list(module.named_children()):
+            if type(child) is torch.nn.Linear:
+                child.float()
+                child.qconfig = default_dynamic_qconfig
+                setattr(module, child_name, DynamicQuantLinear.from_float(child))
+                replaced += 1
+    # Dynamic int8 kernels take fp32 activations, so the remaining (non-Linear) weights go to fp32
+    model.float()
+    return replaced
+
+
 class Qwen3VLEmbedder:
-    def __init__(self, model_name: str = "Qwen/Qwen3-VL-Embedding-8B", device_map: str = "auto", torch_dtype: torch.dtype = torch.float16):
-        print(f"Loading model {model_name}...")
+    def __init__(
+        self,
+        model_name: str = "Qwen/Qwen3-VL-Embedding-8B",
+        device_map: Optional[str] = "auto",
+        torch_dtype: Optional[torch.dtype] = None,
+        precision: str = "auto",
+        vision_policy: str = "default",
+        min_pixels: Optional[int] = None,
+        max_pixels: Optional[int] = None,
+    ):
+        """
+        `precision`: "fp16" (original GPU path), "bf16" / "fp32", or "int8"
+        (dynamic int8 Linear layers, CPU only). "auto" = fp16 on CUDA, bf16 on
+        CPU. An explicit `torch_dtype` overrides `precision` for the weights.
+        On CPU, safetensors shards are memory-mapped (`low_cpu_mem_usage`)
+        instead of being materialized as a second in-RAM copy.
+
+        Image resolution follows `vision_policy` (a VISION_TOKEN_POLICIES key,
+        converted to pixels with the processor's `pixels_per_token`);
+        `min_pixels` / `max_pixels` override it, and items may carry their own.
+        """
+        self.last_vision_tokens: List[int] = []
+        self.last_item_seconds: List[float] = []
+        self.precision = resolve_precision(precision)
+        cpu = not torch.cuda.is_available() or self.precision == "int8"
+        if torch_dtype is None:
+            torch_dtype = _DTYPES["bf16" if self.precision == "int8" else self.precision]
+        print(f"Loading model {model_name} ({self.precision}{', cpu' if cpu else ''})...")
         self.processor = AutoProcessor.from_pretrained(model_name, trust_remote_code=True)
+        self.pixels_per_token = pixels_per_vision_token(self.processor)
+        self.set_vision_policy(vision_policy, min_pixels, max_pixels)
         # We use AutoModel for embedding models; if it's a specific class like Qwen2_5_VLEmbedding, 
         # transformers should pick it up via trust_remote_code or standard mapping.
         self.model = AutoModel.from_pretrained(
             model_name,
             trust_remote_code=True,
             torch_dtype=torch_dtype,
-            device_map=device_map
+            device_map=None if cpu else device_map,
+            low_cpu_mem_usage=True,
+            use_safetensors=True,
         ).eval()
+        if self.precision == "int8":
+            n = quantize_linear_int8(self.model)
+            print(f"Quantized {n} Linear layers to dynamic int8")
         self.device = self.model.device
         print(f"Model loaded on {self.device}")
 
+    def set_vision_policy(self, policy: str = "default", min_pixels: Optional[int] = None, max_pixels: Optional[int] = None):
+        if policy not in VISION_TOKEN_POLICIES:
+            raise ValueError(f"Unknown vision policy {policy!r}; expected one of {list(VISION_TOKEN_POLICIES)}")
+        base = VISION_TOKEN_POLICIES[policy]
+        self.vision_policy = policy
+        if min_pixels is None and "min_tokens" in base:
+            min_pixels = base["min_tokens"] * self.pixels_per_token
+        if max_pixels is None and "max_tokens" in base:
+            max_pixels = base["max_tokens"] * self.pixels_per_token
+        self.min_pixels = min_pixels
+        self.max_pixels = max_pixels
+
+    def _vision_tokens(self, inputs) -> int:
+        grid = inputs.get("image_grid_thw") if hasattr(inputs, "get") else None
+        if grid is None:
+            return 0
+        merge = getattr(getattr(self.processor, "image_processor", None), "merge_size", 2)
+        return int(grid.prod(-1).sum().item()) // (merge * merge)
+
     def embed_items(self, items: List[Dict[str, str]], normalize: bool = True) -> np.ndarray:
         """
         Embeds a list of items.
@@ -28,10 +138,16 @@ class Qwen3VLEmbedder:
         - {"text": "..."}
         - {"image": "path/to/image"}
         - {"text": "...", "image": "path/to/image"}
+        Image items may also set "min_pixels" / "max_pixels". Per-item vision
+        token counts and latencies are left in `last_vision_tokens` /
+        `last_item_seconds`.
         """
         embeddings = []
+        self.last_vision_tokens = []
+        self.last_item_seconds = []
         
         for item in items:
+            t0 = time.perf_counter()
             messages = []
             content = []
             
@@ -40,7 +156,14 @@ class Qwen3VLEmbedder:
                 image_path = item["image"]
                 if not image_path.startswith("file://") and not image_path.startswith("http"):
                     image_path = f"file://{os.path.abspath(image_path)}"
-                content.append({"type": "image", "image": image_path})
+                image_entry = {"type": "image", "image": image_path}
+                min_px = item.get("min_pixels", self.min_pixels)
+                max_px = item.get("max_pixels", self.max_pixels)
+                if min_px:
+                    image_entry["min_pixels"] = int(min_px)
+                if max_px:
+                    image_entry["max_pixels"] = int(max_px)
+                content.append(image_entry)
             
             if "text" in item:
                 content.append({"type": "text", "text": item["text"]})
@@ -59,6 +182,7 @@ class Qwen3VLEmbedder:
                 return_tensors="pt"
             )
             inputs = inputs.to(self.device)
+            self.last_vision_tokens.append(self._vision_tokens(inputs))
 
             with torch.no_grad():
                 # For embedding models, the forward pass usually returns the pooled output 
@@ -87,6 +211,7 @@ class Qwen3VLEmbedder:
                     emb = emb / norm
                 
                 embeddings.append(emb)
+            self.last_item_seconds.append(time.perf_counter() - t0)
 
         return np.vstack(embeddings)
 
@@ -98,6 +223,8 @@ def smoke_test():
     parser = argparse.ArgumentParser()
     parser.add_argument("--model", default="Qwen/Qwen3-VL-Embedding-8B")
     parser.add_argument("--image", help="Path to a local PNG for testing")
+    parser.add_argument("--precision", default="auto", choices=PRECISIONS)
+    parser.add_argument("--server", default="", help="Smoke-test a running embed_server.py instead of loading the model")
     args = parser.parse_args()
 
     # Create dummy image if none provided
@@ -109,7 +236,11 @@ def smoke_test():
         print(f"Created dummy image: {test_image_path}")
 
     try:
-        embedder = Qwen3VLEmbedder(model_name=args.model)
+        if args.server:
+            from embed_server import EmbedClient
+            embedder = EmbedClient(args.server, model_name=args.model)
+        else:
+            embedder = Qwen3VLEmbedder(model_name=args.model, precision=args.precision)
         
         items = [
             {"text": "heavy display font"},
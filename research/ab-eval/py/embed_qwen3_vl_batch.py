@@ -4,7 +4,27 @@ import argparse
 import numpy as np
 import subprocess
 import sys
-from embed_qwen3_vl import Qwen3VLEmbedder
+from embed_server import load_embedder
+from corpus_changes import stale_names
+
+def embed_with_reuse(embedder, corpus, items, npy_path, prev_index, stale):
+    """
+    Embeds `items` (aligned with `corpus`), reusing rows of the previous `npy_path`
+    for fonts the change manifest marks unchanged. Without a manifest or a
+    previous output everything is embedded.
+    """
+    if stale is None or prev_index is None or not os.path.exists(npy_path):
+        return embedder.embed_items(items)
+    prev = np.load(npy_path)
+    todo = [i for i, f in enumerate(corpus) if f['name'] in stale or f['name'] not in prev_index]
+    out = np.zeros((len(corpus), prev.shape[1]), dtype=prev.dtype)
+    for i, font in enumerate(corpus):
+        if font['name'] not in stale and font['name'] in prev_index:
+            out[i] = prev[prev_index[font['name']]]
+    if todo:
+        out[todo] = embedder.embed_items([items[i] for i in todo])
+    print(f"  Reused {len(corpus) - len(todo)} rows from {npy_path}, embedded {len(todo)}")
+    return out
 
 def main():
     parser = argparse.ArgumentParser()
@@ -13,14 +33,23 @@ def main():
     parser.add_argument("--model", default="Qwen/Qwen3-VL-Embedding-8B")
     parser.add_argument("--out_dir", default="research/ab-eval/out")
     parser.add_argument("--glyph_dir", default="research/ab-eval/out/glyphs")
+    parser.add_argument("--precision", default="auto", help="auto|fp32|fp16|bf16|int8 for in-process loading (see Qwen3VLEmbedder)")
+    parser.add_argument("--vision-policy", default="default", help="Glyph image pixel budget: default|glyph|specimen (see VISION_TOKEN_POLICIES)")
+    parser.add_argument("--embed-server", default="", help="URL of a running embed_server.py (default: $AB_EVAL_EMBED_SERVER, else load the model in-process)")
+    parser.add_argument("--skip-render", action="store_true", help="Glyph sheets are already rendered (e.g. by the pipeline's glyphs stage)")
+    parser.add_argument("--changes", default="", help="Change manifest from build_corpus_google_fonts.py; unchanged fonts keep their previous doc embeddings")
     args = parser.parse_args()
 
     os.makedirs(args.out_dir, exist_ok=True)
 
     # 1. Ensure glyph sheets exist
-    print("Ensuring glyph sheets exist...")
-    render_script = os.path.join("research", "ab-eval", "py", "render_glyph_sheet.py")
-    subprocess.run([sys.executable, render_script, "--corpus", args.corpus, "--out", args.glyph_dir], check=True)
+    if not args.skip_render:
+        print("Ensuring glyph sheets exist...")
+        render_script = os.path.join("research", "ab-eval", "py", "render_glyph_sheet.py")
+        render_cmd = [sys.executable, render_script, "--corpus", args.corpus, "--out", args.glyph_dir]
+        if args.changes:
+            render_cmd += ["--changes", args.changes]
+        subprocess.run(render_cmd, check=True)
 
     # 2. Load data
     with open(args.corpus, 'r') as f:
@@ -28,8 +57,16 @@ def main():
     with open(args.queries, 'r') as f:
         queries = json.load(f)
 
+    # Previous doc order, so unchanged fonts can keep their rows
+    stale = stale_names(args.changes)
+    prev_index = None
+    metadata_path = os.path.join(args.out_dir, "metadata_docs.json")
+    if stale is not None and os.path.exists(metadata_path):
+        with open(metadata_path, 'r') as f:
+            prev_index = {m["name"]: i for i, m in enumerate(json.load(f))}
+
     # 3. Initialize embedder
-    embedder = Qwen3VLEmbedder(model_name=args.model)
+    embedder = load_embedder(args.model, args.embed_server, args.precision, args.vision_policy)
 
     # 4. Generate B1 Doc Embeddings (Image only)
     print("\nGenerating B1 Doc Embeddings (Image only)...")
@@ -43,13 +80,10 @@ def main():
             print(f"Warning: Glyph not found for {font['name']}, using empty dict")
             b1_items.append({}) # Should probably handle this better
     
-    b1_embs = embedder.embed_items(b1_items)
-    np.save(os.path.join(args.out_dir, "embeddings_vl_docs_b1.npy"), b1_embs)
+    b1_path = os.path.join(args.out_dir, "embeddings_vl_docs_b1.npy")
+    b1_embs = embed_with_reuse(embedder, corpus, b1_items, b1_path, prev_index, stale)
+    np.save(b1_path, b1_embs)
     
-    # Save metadata for mapping
-    with open(os.path.join(args.out_dir, "metadata_docs.json"), 'w') as f:
-        json.dump([{"name": f["name"]} for f in corpus], f)
-
     # 5. Generate B2 Doc Embeddings (Image + short text)
     print("\nGenerating B2 Doc Embeddings (Image + short text)...")
     b2_items = []
@@ -63,8 +97,9 @@ def main():
             item["image"] = glyph_path
         b2_items.append(item)
     
-    b2_embs = embedder.embed_items(b2_items)
-    np.save(os.path.join(args.out_dir, "embeddings_vl_docs_b2.npy"), b2_embs)
+    b2_path = os.path.join(args.out_dir, "embeddings_vl_docs_b2.npy")
+    b2_embs = embed_with_reuse(embedder, corpus, b2_items, b2_path, prev_index, stale)
+    np.save(b2_path, b2_embs)
 
     # 5b. Generate B2-plus Doc Embeddings (Image + expanded text)
     print("\nGenerating B2-plus Doc Embeddings (Image + expanded text)...")
@@ -79,8 +114,13 @@ def main():
             item["image"] = glyph_path
         b2plus_items.append(item)
     
-    b2plus_embs = embedder.embed_items(b2plus_items)
-    np.save(os.path.join(args.out_dir, "embeddings_vl_docs_b2plus.npy"), b2plus_embs)
+    b2plus_path = os.path.join(args.out_dir, "embeddings_vl_docs_b2plus.npy")
+    b2plus_embs = embed_with_reuse(embedder, corpus, b2plus_items, b2plus_path, prev_index, stale)
+    np.save(b2plus_path, b2plus_embs)
+
+    # Save metadata for mapping (after all doc matrices, so reuse indices never go stale)
+    with open(metadata_path, 'w') as f:
+        json.dump([{"name": f["name"]} for f in corpus], f)
 
     # 6. Generate Query Embeddings (Text only)
     print("\nGenerating VL Query Embeddings (Text only)...")
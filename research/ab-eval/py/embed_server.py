@@ -0,0 +1,309 @@
+"""
+Long-lived local Qwen3-VL embedding server
+
+Loads `Qwen3VLEmbedder` once and serves embed requests over HTTP on
+localhost, so back-to-back runs (toy, 200, medium) and the seeding scripts
+share one loaded model instead of paying the multi-minute load each time.
+
+Endpoints:
+- POST /embed   {"items": [{"text": ..., "image": ...}, ...], "normalize": true, "model": "..."}
+                -> {"model": ..., "dim": D, "n": N, "dtype": "float32", "embeddings_b64": "..."}
+                (add "encoding": "json" for a plain `embeddings` list of lists)
+                Single-item form used by src/lib/ai/embeddings.ts (VL_EMBEDDING_ENDPOINT):
+                {"text": ..., "image": ...} -> {"embedding": [...]}
+- GET  /health  model, device and coalescing counters
+
+Requests from all callers go through one batching worker: it gathers items
+for up to `--max-wait-ms` (or `--max-batch` items), embeds each distinct
+item once (identical in-flight items are coalesced) and answers every
+waiting request. Recently embedded items are kept in an LRU cache; image
+items are keyed by path plus file size/mtime so re-rendered sheets miss.
+
+Usage:
+    python research/ab-eval/py/embed_server.py --model Qwen/Qwen3-VL-Embedding-8B --port 8000
+    python research/ab-eval/py/run_all.py --dataset toy --variant B --embed-server http://127.0.0.1:8000
+    python research/ab-eval/py/run_all.py --dataset 200 --variant B --embed-server http://127.0.0.1:8000
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import requests
+
+DEFAULT_MODEL = "Qwen/Qwen3-VL-Embedding-8B"
+# Picked up by load_embedder() when no explicit server URL is passed
+SERVER_ENV = "AB_EVAL_EMBED_SERVER"
+
+
+def normalize_item(item: Dict[str, str]) -> Dict[str, str]:
+    """Local image paths become absolute so the server resolves them regardless of its cwd."""
+    out = {k: item[k] for k in ("text", "image", "min_pixels", "max_pixels") if k in item}
+    image = out.get("image")
+    if image and not image.startswith(("file://", "http://", "https://", "data:")):
+        out["image"] = os.path.abspath(image)
+    return out
+
+
+def item_key(item: Dict[str, str]) -> str:
+    key: Dict[str, Any] = dict(item)
+    image = item.get("image", "")
+    local = image[len("file://"):] if image.startswith("file://") else image
+    if image and os.path.isfile(local):
+        st = os.stat(local)
+        key["_file"] = [st.st_size, st.st_mtime_ns]
+    return json.dumps(key, sort_keys=True)
+
+
+class Coalescer:
+    """Single worker thread that batches and de-duplicates embed requests from all callers."""
+
+    def __init__(self, embedder, max_batch: int = 32, max_wait_ms: float = 20, cache_size: int = 4096):
+        self.embedder = embedder
+        self.max_batch = max_batch
+        self.max_wait_s = max_wait_ms / 1000
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._queue: "queue.Queue[Tuple[str, Dict[str, str], Future]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "items": 0, "embedded": 0, "coalesced": 0, "cache_hits": 0, "batches": 0}
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def _bump(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += n
+
+    def submit(self, items: List[Dict[str, str]]) -> np.ndarray:
+        """Blocks until every item is embedded; returns unnormalized rows in item order."""
+        self._bump("requests")
+        self._bump("items", len(items))
+        futures = []
+        for item in items:
+            key = item_key(item)
+            with self._lock:
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+            if cached is not None:
+                self._bump("cache_hits")
+                fut: Future = Future()
+                fut.set_result(cached)
+            else:
+                fut = Future()
+                self._queue.put((key, item, fut))
+            futures.append(fut)
+        return np.vstack([f.result() for f in futures])
+
+    def _worker(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait_s
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            waiting: "OrderedDict[str, List[Future]]" = OrderedDict()
+            unique: Dict[str, Dict[str, str]] = {}
+            for key, item, fut in batch:
+                waiting.setdefault(key, []).append(fut)
+                unique.setdefault(key, item)
+            self._bump("coalesced", len(batch) - len(unique))
+            # Items queued while an identical one was being embedded are answered from the cache
+            with self._lock:
+                hits = {k: self._cache[k] for k in waiting if k in self._cache}
+            for key, row in hits.items():
+                for fut in waiting.pop(key):
+                    fut.set_result(row)
+            self._bump("cache_hits", len(hits))
+            if not waiting:
+                continue
+            self._bump("batches")
+            keys = list(waiting)
+            try:
+                embs = self.embedder.embed_items([unique[k] for k in keys], normalize=False)
+            except Exception as e:
+                for futs in waiting.values():
+                    for fut in futs:
+                        fut.set_exception(e)
+                continue
+            self._bump("embedded", len(keys))
+            with self._lock:
+                for key, row in zip(keys, embs):
+                    self._cache[key] = row
+                    self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            for key, row in zip(keys, embs):
+                for fut in waiting[key]:
+                    fut.set_result(row)
+
+
+def l2_normalize(embs: np.ndarray) -> np.ndarray:
+    return embs / np.linalg.norm(embs, axis=1, keepdims=True)
+
+
+def make_handler(coalescer: Coalescer, model_name: str, device: str, api_key: Optional[str]):
+    started = time.time()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):  # keep the console quiet
+            pass
+
+        def _send(self, status: int, payload: Dict[str, Any]) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.split("?")[0] == "/health":
+                with coalescer._lock:
+                    stats = dict(coalescer.stats)
+                self._send(200, {"model": model_name, "device": device,
+                                 "uptime_s": round(time.time() - started, 1), **stats})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path.split("?")[0] != "/embed":
+                self._send(404, {"error": "not found"})
+                return
+            if api_key and self.headers.get("Authorization") != f"Bearer {api_key}":
+                self._send(401, {"error": "unauthorized"})
+                return
+            try:
+                req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            except json.JSONDecodeError as e:
+                self._send(400, {"error": f"invalid JSON: {e}"})
+                return
+            if req.get("model") and req["model"] != model_name:
+                self._send(409, {"error": f"server has {model_name} loaded, request asked for {req['model']}"})
+                return
+
+            single = "items" not in req
+            items = [req] if single else req["items"]
+            items = [normalize_item(i) for i in items]
+            if not items or any(not i for i in items):
+                self._send(400, {"error": "every item needs 'text' and/or 'image'"})
+                return
+            try:
+                embs = coalescer.submit(items)
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+                return
+            if req.get("normalize", True):
+                embs = l2_normalize(embs)
+            embs = embs.astype(np.float32)
+
+            if single:
+                self._send(200, {"embedding": embs[0].tolist()})
+            elif req.get("encoding") == "json":
+                self._send(200, {"model": model_name, "dim": embs.shape[1], "n": len(embs), "embeddings": embs.tolist()})
+            else:
+                self._send(200, {
+                    "model": model_name, "dim": embs.shape[1], "n": len(embs), "dtype": "float32",
+                    "embeddings_b64": base64.b64encode(embs.tobytes()).decode("ascii"),
+                })
+
+    return Handler
+
+
+class EmbedClient:
+    """Drop-in for `Qwen3VLEmbedder.embed_items` backed by a running embed_server."""
+
+    def __init__(self, url: str, model_name: Optional[str] = None, chunk_size: int = 64, timeout: float = 3600):
+        self.url = url.rstrip("/")
+        self.model_name = model_name
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.session = requests.Session()
+        health = self.health()
+        print(f"Using embed server {self.url} ({health['model']} on {health['device']})")
+
+    def health(self) -> Dict[str, Any]:
+        r = self.session.get(f"{self.url}/health", timeout=10)
+        r.raise_for_status()
+        return r.json()
+
+    def embed_items(self, items: List[Dict[str, str]], normalize: bool = True) -> np.ndarray:
+        out = []
+        for start in range(0, len(items), self.chunk_size):
+            chunk = [normalize_item(i) for i in items[start:start + self.chunk_size]]
+            payload: Dict[str, Any] = {"items": chunk, "normalize": normalize}
+            if self.model_name:
+                payload["model"] = self.model_name
+            r = self.session.post(f"{self.url}/embed", json=payload, timeout=self.timeout)
+            if r.status_code != 200:
+                raise RuntimeError(f"embed server error {r.status_code}: {r.text[:500]}")
+            data = r.json()
+            raw = base64.b64decode(data["embeddings_b64"])
+            out.append(np.frombuffer(raw, dtype=np.float32).reshape(data["n"], data["dim"]))
+        return np.vstack(out)
+
+
+def load_embedder(model_name: str = DEFAULT_MODEL, server: str = "", precision: str = "auto", vision_policy: str = "default"):
+    """
+    EmbedClient when a server URL is given (or set in AB_EVAL_EMBED_SERVER),
+    else an in-process model. `precision` / `vision_policy` only apply
+    in-process; a server uses the ones it was started with.
+    """
+    server = server or os.environ.get(SERVER_ENV, "")
+    if server:
+        return EmbedClient(server, model_name=model_name)
+    from embed_qwen3_vl import Qwen3VLEmbedder
+    return Qwen3VLEmbedder(model_name=model_name, precision=precision, vision_policy=vision_policy)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve Qwen3-VL embeddings from one loaded model")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--precision", default="auto", help="auto|fp32|fp16|bf16|int8 (see Qwen3VLEmbedder)")
+    parser.add_argument("--vision-policy", default="default", help="Image pixel budget: default|glyph|specimen (see VISION_TOKEN_POLICIES)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000, help="8000 matches VL_EMBEDDING_ENDPOINT in .env.local.example")
+    parser.add_argument("--max-batch", type=int, default=32, help="Max items gathered into one embed call")
+    parser.add_argument("--max-wait-ms", type=float, default=20, help="How long to wait for more callers before embedding")
+    parser.add_argument("--cache-size", type=int, default=4096, help="LRU entries of recent item embeddings (0 disables)")
+    parser.add_argument("--api-key", default=os.environ.get("VL_EMBEDDING_API_KEY"), help="Require this Bearer token")
+    args = parser.parse_args()
+
+    from embed_qwen3_vl import Qwen3VLEmbedder
+
+    t0 = time.time()
+    embedder = Qwen3VLEmbedder(model_name=args.model, precision=args.precision, vision_policy=args.vision_policy)
+    print(f"Model ready in {time.time() - t0:.1f}s ({embedder.precision})")
+
+    coalescer = Coalescer(embedder, args.max_batch, args.max_wait_ms, args.cache_size)
+    server = ThreadingHTTPServer(
+        (args.host, args.port), make_handler(coalescer, args.model, f"{embedder.device}/{embedder.precision}", args.api_key)
+    )
+    server.daemon_threads = True
+    print(f"Embed server on http://{args.host}:{args.port} (POST /embed, GET /health)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,433 @@
+"""
+Deterministic typographic features from font binaries
+
+Technical queries ("monospace", "high contrast", "condensed", "geometric",
+"italic", "serif") hinge on measurable properties of the font file, which
+are read here offline instead of being asked of a VLM:
+
+- advance widths (monospace: coefficient of variation across a-z, A-Z, 0-9),
+- x-height / cap-height / descender in em, and their ratio,
+- width (mean lowercase advance, `n` advance vs x-height),
+- stem weight and stroke contrast, from rasterized `H` and `o`,
+- serif presence (foot/head width of the `H` stem vs the stem itself),
+- italic angle (slope of the `I` stem centre line),
+- roundness of `O` (geometric sans).
+
+Glyph masks come from the shared glyph atlas (`glyph_atlas.py`) at the
+specimen display size, so fonts that were already rendered cost no extra
+rasterization. When fontTools is installed, the OS/2 and post table values
+(width/weight class, italic angle, fixed-pitch flag) are recorded alongside.
+
+Query rules map keywords to feature scores (corpus percentile, 0..1) and to
+conservative vetoes (a clearly proportional font cannot be "monospace").
+`score_all_variants.py --features` fuses the scores into the retrieval
+variants; `predecide` measures how many SSoT pairs the vetoes settle before
+any judge call.
+
+Usage:
+    python research/ab-eval/py/font_features.py extract --corpus research/ab-eval/data/corpus.200.json
+    python research/ab-eval/py/font_features.py predecide --features research/ab-eval/out/font_features.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import requests
+
+from corpus_changes import filter_corpus, stale_names
+from glyph_atlas import GlyphAtlas
+from metrics_kernel import compute_metrics, remap_label
+
+FEATURE_SIZE = 200  # px per em; the v3/v3.1 display size, so atlas masks are shared
+INK = 128
+DEFAULT_OUT = "research/ab-eval/out/font_features.json"
+SSOT_PATH = "research/ab-eval/out/full_set_review_export_1770612809775.json"
+QUERIES_PATH = "research/ab-eval/data/queries.medium.human.v1.json"
+
+ADVANCE_CHARS = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+
+# Veto thresholds (conservative: only clear-cut fonts are pre-decided)
+PROPORTIONAL_MIN_CV = 0.05
+MONOLINE_MAX_CONTRAST = 1.3
+HIGH_CONTRAST_MIN = 2.5
+SANS_MAX_SERIF_RATIO = 1.1
+SERIF_MIN_SERIF_RATIO = 1.6
+UPRIGHT_MAX_ANGLE = 1.0
+# n advance / x-height: regular-width faces reach ~1.25 and their bolds ~1.4 (DejaVu Serif Bold 1.39)
+WIDE_MIN_N_RATIO = 1.6
+
+
+# ---------------------------------------------------------------------------
+# Extraction
+# ---------------------------------------------------------------------------
+
+def _ink(atlas: GlyphAtlas, ch: str) -> Tuple[np.ndarray, int]:
+    """Boolean ink mask of `ch` and its top offset from the baseline (negative = above)."""
+    g = atlas.glyph(FEATURE_SIZE, ch)
+    return np.asarray(g.mask) >= INK, g.dy
+
+
+def _first_run(line: np.ndarray) -> int:
+    """Length of the first run of ink pixels in a 1-D boolean array."""
+    idx = np.flatnonzero(line)
+    if not len(idx):
+        return 0
+    gaps = np.flatnonzero(np.diff(idx) > 1)
+    end = idx[gaps[0]] if len(gaps) else idx[-1]
+    return int(end - idx[0] + 1)
+
+
+def _table_features(font_path: str) -> Dict[str, Any]:
+    try:
+        from fontTools.ttLib import TTFont
+    except ImportError:
+        return {}
+    try:
+        tt = TTFont(font_path, lazy=True)
+        out: Dict[str, Any] = {}
+        if "OS/2" in tt:
+            os2 = tt["OS/2"]
+            out["os2_width_class"] = int(os2.usWidthClass)
+            out["os2_weight_class"] = int(os2.usWeightClass)
+        if "post" in tt:
+            out["post_italic_angle"] = float(tt["post"].italicAngle)
+            out["post_is_fixed_pitch"] = bool(tt["post"].isFixedPitch)
+        return out
+    except Exception as e:
+        return {"table_error": str(e)}
+
+
+def extract_features(font_path: str, atlas: Optional[GlyphAtlas] = None) -> Dict[str, Any]:
+    """Numeric feature row for one font file (all lengths in em)."""
+    atlas = atlas or GlyphAtlas(font_path)
+    em = float(FEATURE_SIZE)
+
+    advances = np.array([atlas.glyph(FEATURE_SIZE, c).advance for c in ADVANCE_CHARS])
+    lower_adv = advances[:26]
+
+    x_mask, x_top = _ink(atlas, "x")
+    h_mask, h_top = _ink(atlas, "H")
+    p_mask, p_top = _ink(atlas, "p")
+    x_height = -x_top / em
+    cap_height = -h_top / em
+    descender = (p_top + p_mask.shape[0]) / em
+
+    # Stem weight and serifs from the left stem of "H" (monospace "I"/"l" carry slab bars even in sans designs):
+    # stem width at quarter height vs the widest first run in the head and foot bands
+    stem_half = h_mask[:, : h_mask.shape[1] // 2]
+    hh = stem_half.shape[0]
+    stem = _first_run(stem_half[hh // 4]) if hh else 0
+    band = max(1, int(round(hh * 0.08)))
+    head_foot = max([_first_run(stem_half[r]) for r in list(range(band)) + list(range(hh - band, hh))] or [0])
+    serif_ratio = head_foot / stem if stem else 0.0
+
+    # Contrast from "o": side (vertical stroke) thickness at mid row vs top (horizontal stroke) at mid column
+    o_mask, _ = _ink(atlas, "o")
+    oh, ow = o_mask.shape
+    side = _first_run(o_mask[oh // 2]) if oh else 0
+    top = _first_run(o_mask[:, ow // 2]) if ow else 0
+    contrast = max(side, top) / min(side, top) if min(side, top) else 0.0
+
+    # Italic angle from the centre line of the "I" stem (rows 20%..80%, clear of serifs and slab bars)
+    i_mask, _ = _ink(atlas, "I")
+    rows = np.arange(int(i_mask.shape[0] * 0.2), int(i_mask.shape[0] * 0.8))
+    rows = rows[i_mask[rows].any(axis=1)] if len(rows) else rows
+    italic_angle = 0.0
+    if len(rows) >= 2:
+        centres = np.array([np.flatnonzero(i_mask[r]).mean() for r in rows])
+        slope = np.polyfit(rows, centres, 1)[0]  # px right per px down
+        italic_angle = math.degrees(math.atan(-slope))
+
+    big_o, _ = _ink(atlas, "O")
+    o_aspect = big_o.shape[1] / big_o.shape[0] if big_o.size else 0.0
+    n_adv = atlas.glyph(FEATURE_SIZE, "n").advance
+
+    row = {
+        "advance_cv": round(float(advances.std() / advances.mean()), 4) if advances.mean() else 0.0,
+        "width_em": round(float(lower_adv.mean() / em), 4),
+        "n_width_ratio": round(float(n_adv / (x_height * em)), 4) if x_height > 0 else 0.0,
+        "x_height_em": round(x_height, 4),
+        "cap_height_em": round(cap_height, 4),
+        "x_to_cap": round(x_height / cap_height, 4) if cap_height > 0 else 0.0,
+        "descender_em": round(descender, 4),
+        "stem_em": round(stem / em, 4),
+        "stroke_contrast": round(float(contrast), 4),
+        "serif_ratio": round(float(serif_ratio), 4),
+        "italic_angle": round(italic_angle, 2),
+        "o_aspect": round(float(o_aspect), 4),
+        "ink_x": round(float(x_mask.mean()), 4) if x_mask.size else 0.0,
+    }
+    row.update(_table_features(font_path))
+    return row
+
+
+# ---------------------------------------------------------------------------
+# Query rules
+# ---------------------------------------------------------------------------
+
+class Rule:
+    """Keyword pattern -> feature score in [0, 1] and an optional veto (True = clearly not a match)."""
+
+    def __init__(self, name: str, pattern: str, score: Callable[[Dict[str, float]], float],
+                 veto: Optional[Callable[[Dict[str, Any]], bool]] = None):
+        self.name = name
+        self.pattern = re.compile(pattern, re.IGNORECASE)
+        self.score = score
+        self.veto = veto
+
+
+# `p` holds corpus percentiles (0..1) of each numeric feature; `f` the raw values.
+RULES: List[Rule] = [
+    Rule("monospace", r"\bmono(space[d]?)?\b|fixed[- ]width|\bcod(e|ing)\b|terminal|typewriter",
+         lambda p: 1 - p["advance_cv"], lambda f: f["advance_cv"] >= PROPORTIONAL_MIN_CV),
+    Rule("high_contrast", r"high[- ]contrast|hairline|didone|modern serif",
+         lambda p: p["stroke_contrast"], lambda f: f["stroke_contrast"] < MONOLINE_MAX_CONTRAST),
+    Rule("low_contrast", r"low (stroke )?(contrast|variation)|monoline|uniform stroke",
+         lambda p: 1 - p["stroke_contrast"], lambda f: f["stroke_contrast"] >= HIGH_CONTRAST_MIN),
+    Rule("condensed", r"condensed|compressed|narrow",
+         lambda p: 1 - p["width_em"], lambda f: f["n_width_ratio"] >= WIDE_MIN_N_RATIO),
+    Rule("extended", r"extended|expanded|\bwide\b",
+         lambda p: p["width_em"]),
+    Rule("geometric", r"geometric|perfect circles",
+         lambda p: (p["o_roundness"] + 1 - p["stroke_contrast"]) / 2),
+    Rule("sans", r"\bsans\b",
+         lambda p: 1 - p["serif_ratio"], lambda f: f["serif_ratio"] >= SERIF_MIN_SERIF_RATIO),
+    Rule("serif", r"(?<!sans )(?<!sans-)\bserif",
+         lambda p: p["serif_ratio"], lambda f: f["serif_ratio"] <= SANS_MAX_SERIF_RATIO),
+    Rule("italic", r"italic|slanted|oblique",
+         lambda p: p["abs_italic_angle"], lambda f: abs(f["italic_angle"]) < UPRIGHT_MAX_ANGLE),
+    Rule("heavy", r"heavy|\bbold\b|\bblack\b|thick",
+         lambda p: p["stem_em"]),
+    Rule("thin", r"ultra[- ]thin|\bthin\b|\blight\b|hairline",
+         lambda p: 1 - p["stem_em"]),
+]
+
+
+def match_rules(text: str) -> List[Rule]:
+    rules = [r for r in RULES if r.pattern.search(text)]
+    if any(r.name == "sans" for r in rules):
+        rules = [r for r in rules if r.name != "serif"]
+    return rules
+
+
+class FeatureTable:
+    """Feature rows aligned to a doc order, with corpus percentiles for rule scores."""
+
+    def __init__(self, rows: Dict[str, Dict[str, Any]], doc_names: Sequence[str]):
+        self.doc_names = list(doc_names)
+        self.present = np.array([n in rows for n in self.doc_names], dtype=bool)
+        self.raw = [rows.get(n) for n in self.doc_names]
+        derived = {
+            "abs_italic_angle": lambda f: abs(f["italic_angle"]),
+            "o_roundness": lambda f: -abs(f["o_aspect"] - 1.0),
+        }
+        keys = [k for k, v in next((r for r in self.raw if r), {}).items() if isinstance(v, (int, float)) and not isinstance(v, bool)]
+        self.pct: List[Dict[str, float]] = [{} for _ in self.doc_names]
+        for key in keys + list(derived):
+            get = derived.get(key, lambda f, k=key: f[k])
+            vals = np.array([get(r) if r else np.nan for r in self.raw], dtype=float)
+            ok = ~np.isnan(vals)
+            ranks = np.full(len(vals), 0.5)
+            if ok.sum() > 1:
+                order = vals[ok].argsort(kind="stable").argsort(kind="stable")
+                ranks[ok] = order / (ok.sum() - 1)
+            for i, v in enumerate(ranks):
+                self.pct[i][key] = float(v)
+
+    @classmethod
+    def load(cls, path: str, doc_names: Sequence[str]) -> "FeatureTable":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f)["fonts"], doc_names)
+
+    def score_matrix(self, query_texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (scores, has_rule): scores[q, d] is the mean rule score centred on 0
+        (range -0.5..0.5; 0 for docs without features), has_rule[q] whether any rule fired.
+        """
+        scores = np.zeros((len(query_texts), len(self.doc_names)))
+        has_rule = np.zeros(len(query_texts), dtype=bool)
+        for qi, text in enumerate(query_texts):
+            rules = match_rules(text)
+            if not rules:
+                continue
+            has_rule[qi] = True
+            for di, p in enumerate(self.pct):
+                if self.present[di]:
+                    scores[qi, di] = float(np.mean([r.score(p) for r in rules])) - 0.5
+        return scores, has_rule
+
+    def veto_matrix(self, query_texts: Sequence[str]) -> np.ndarray:
+        """veto[q, d] True when a rule of query q clearly rules out doc d."""
+        veto = np.zeros((len(query_texts), len(self.doc_names)), dtype=bool)
+        for qi, text in enumerate(query_texts):
+            rules = [r for r in match_rules(text) if r.veto]
+            for di, f in enumerate(self.raw):
+                if f and rules:
+                    veto[qi, di] = any(r.veto(f) for r in rules)
+        return veto
+
+
+def fuse_scores(base: np.ndarray, features: np.ndarray, has_rule: np.ndarray, weight: float,
+                veto: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Adds `weight` x feature score, scaled by each query row's score spread, to
+    rule-bearing queries; vetoed docs drop below the row minimum.
+    """
+    spread = base.std(axis=1, keepdims=True)
+    fused = base + weight * spread * features * has_rule[:, None]
+    if veto is not None:
+        # Shift by the row's range + 1: vetoed docs sink below every other doc but keep their relative order
+        shift = fused.max(axis=1, keepdims=True) - fused.min(axis=1, keepdims=True) + 1.0
+        fused = np.where(veto, fused - shift, fused)
+    return fused
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def font_file(entry: Dict[str, Any], fonts_dir: str) -> Tuple[Optional[str], bool]:
+    """Local binary from build_corpus_google_fonts.py when present, else a temp download. Returns (path, is_temp)."""
+    url = entry.get("files", {}).get("400") or next(iter(entry.get("files", {}).values()), None)
+    recorded = entry.get("local_file")
+    if recorded and Path(recorded).is_file() and Path(recorded).stat().st_size > 0:
+        return recorded, False
+    fid = entry.get("fontsource_id")
+    if fid:
+        for ext in ("ttf", "otf", "woff2"):
+            local = Path(fonts_dir) / f"{fid}.{ext}"
+            if local.exists() and local.stat().st_size > 0:
+                return str(local), False
+    if not url:
+        return None, False
+    resp = requests.get(url, timeout=10)
+    resp.raise_for_status()
+    with tempfile.NamedTemporaryFile(suffix=".ttf", delete=False) as tmp:
+        tmp.write(resp.content)
+        return tmp.name, True
+
+
+def cmd_extract(args) -> None:
+    with open(args.corpus, "r", encoding="utf-8") as f:
+        corpus = json.load(f)
+    table: Dict[str, Any] = {}
+    if os.path.exists(args.out):
+        with open(args.out, "r", encoding="utf-8") as f:
+            table = json.load(f).get("fonts", {})
+    stale = stale_names(args.changes)
+    if stale is not None:
+        table = {k: v for k, v in table.items() if k not in stale}
+    corpus = [e for e in filter_corpus(corpus, args.changes) if e["name"] not in table]
+
+    t_total = 0.0
+    for entry in corpus:
+        name = entry["name"]
+        try:
+            path, is_temp = font_file(entry, args.fonts_dir)
+        except Exception as e:
+            print(f"  {name}: download failed ({e})")
+            continue
+        if not path:
+            print(f"  {name}: no font file")
+            continue
+        try:
+            t0 = time.perf_counter()
+            atlas = GlyphAtlas(path)
+            table[name] = extract_features(path, atlas)
+            t_total += time.perf_counter() - t0
+            atlas.save()
+        except Exception as e:
+            print(f"  {name}: extraction failed ({e})")
+        finally:
+            if is_temp:
+                os.unlink(path)
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({"feature_size": FEATURE_SIZE, "fonts": dict(sorted(table.items()))}, f, indent=2)
+    if corpus:
+        print(f"Extracted {len(corpus)} fonts in {t_total:.2f}s ({1000 * t_total / len(corpus):.1f} ms/font)")
+    print(f"Saved {len(table)} feature rows to {args.out}")
+
+
+def cmd_show(args) -> None:
+    for path in args.fonts:
+        print(os.path.basename(path), json.dumps(extract_features(path, GlyphAtlas(path, cache_dir=None))))
+
+
+def cmd_predecide(args) -> None:
+    with open(args.ssot, "r", encoding="utf-8") as f:
+        decisions = json.load(f)["decisions"]
+    with open(args.queries, "r", encoding="utf-8") as f:
+        query_text = {q["id"]: q["text"] for q in json.load(f)}
+    with open(args.features, "r", encoding="utf-8") as f:
+        rows = json.load(f)["fonts"]
+
+    fonts = sorted({d["font_name"] for d in decisions})
+    qids = sorted({d["query_id"] for d in decisions})
+    veto = FeatureTable(rows, fonts).veto_matrix([query_text[q] for q in qids])
+    q_index = {q: i for i, q in enumerate(qids)}
+    f_index = {f: i for i, f in enumerate(fonts)}
+
+    decided = [d for d in decisions if veto[q_index[d["query_id"]], f_index[d["font_name"]]]]
+    labels = [remap_label(d.get("casey_label", 0)) for d in decided]
+    m = compute_metrics(labels, [0] * len(labels))
+    covered = sum(1 for d in decisions if d["font_name"] in rows)
+    by_rule: Dict[str, int] = {}
+    false_by_rule: Dict[str, int] = {}
+    for d, label in zip(decided, labels):
+        for r in match_rules(query_text[d["query_id"]]):
+            if r.veto and r.veto(rows[d["font_name"]]):
+                by_rule[r.name] = by_rule.get(r.name, 0) + 1
+                false_by_rule[r.name] = false_by_rule.get(r.name, 0) + label
+    report = {
+        "pairs": len(decisions),
+        "pairs_with_features": covered,
+        "predecided_no_match": len(decided),
+        "predecided_share": round(len(decided) / len(decisions), 4) if decisions else 0.0,
+        "agreement_on_predecided": m["agreement"],
+        "false_vetoes": int(sum(labels)),
+        "by_rule": by_rule,
+        "false_vetoes_by_rule": false_by_rule,
+    }
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Typographic features from font binaries")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_ext = sub.add_parser("extract", help="Feature table for a corpus")
+    p_ext.add_argument("--corpus", default="research/ab-eval/data/corpus.200.json")
+    p_ext.add_argument("--fonts-dir", default="research/ab-eval/out/fonts", help="Binaries from build_corpus_google_fonts.py")
+    p_ext.add_argument("--changes", default="", help="Change manifest; only added/changed fonts are re-extracted")
+    p_ext.add_argument("--out", default=DEFAULT_OUT)
+
+    p_show = sub.add_parser("show", help="Print features for local font files")
+    p_show.add_argument("fonts", nargs="+")
+
+    p_pre = sub.add_parser("predecide", help="Share of SSoT pairs settled by feature vetoes, and their agreement")
+    p_pre.add_argument("--features", default=DEFAULT_OUT)
+    p_pre.add_argument("--ssot", default=SSOT_PATH)
+    p_pre.add_argument("--queries", default=QUERIES_PATH)
+    p_pre.add_argument("--out", default="")
+
+    args = parser.parse_args()
+    {"extract": cmd_extract, "show": cmd_show, "predecide": cmd_predecide}[args.cmd](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,10 @@ from typing import Any, Dict, List, Optional, Tuple
 import requests
 from dotenv import load_dotenv
 
+from corpus_changes import filter_corpus, stale_names
+from http_cassette import install_from_env
+from usage_accounting import UsageLedger, local_usage, usage_from_response
+
 
 DEFAULT_CORPUS = "research/ab-eval/data/corpus.200.json"
 DEFAULT_GLYPH_DIR = "research/ab-eval/out/glyphs"
@@ -76,6 +80,12 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--limit", type=int, default=None)
     parser.add_argument("--out", default=DEFAULT_OUT)
     parser.add_argument("--resume", action="store_true")
+    parser.add_argument(
+        "--changes",
+        default="",
+        help="Change manifest from build_corpus_google_fonts.py; only added/changed fonts are described "
+        "and their earlier rows are not counted for --resume.",
+    )
     parser.add_argument(
         "--prompt-template",
         default="default_v1",
@@ -257,7 +267,7 @@ def call_gemini(model: str, prompt: str, image_path: Path, timeout_s: int = 180)
 
     metadata = {
         "latency_sec": round(latency, 3),
-        "usage": body.get("usageMetadata"),
+        "usage": usage_from_response(body),
         "response_model_version": body.get("modelVersion"),
     }
     return text_out, metadata
@@ -318,7 +328,7 @@ def call_openrouter(model: str, prompt: str, image_path: Path, timeout_s: int =
 
     metadata = {
         "latency_sec": round(latency, 3),
-        "usage": body.get("usage"),
+        "usage": usage_from_response(body),
         "provider": body.get("provider"),
         "id": body.get("id"),
     }
@@ -416,6 +426,7 @@ class LocalQwenRouter:
 
         metadata = {
             "latency_sec": round(latency, 3),
+            "usage": local_usage(inputs.input_ids.shape[-1], len(trimmed[0])),
             "local_cuda": bundle["cuda"],
             "model_load_latency_sec": bundle["load_latency_sec"],
         }
@@ -643,6 +654,7 @@ def write_summary_md(out_path: Path, attempted: int, ok: int, err: int, skipped:
 def main() -> None:
     args = parse_args()
     load_environment()
+    install_from_env()
 
     corpus_path = Path(args.corpus)
     glyph_dir = Path(args.glyph_dir)
@@ -656,13 +668,18 @@ def main() -> None:
     if schema_version == 1 and "prompt_v2" in str(prompt_template_id):
         schema_version = 2
 
-    corpus = read_corpus(corpus_path, args.limit)
+    corpus = filter_corpus(read_corpus(corpus_path, args.limit), args.changes)
     glyph_index = build_glyph_index(glyph_dir)
 
     out_path.parent.mkdir(parents=True, exist_ok=True)
     existing_keys = load_existing_keys_for_resume(out_path) if args.resume else set()
+    stale = stale_names(args.changes)
+    if stale:
+        # Rows for changed fonts describe the old binary; regenerate them (appended rows supersede)
+        existing_keys = {k for k in existing_keys if k[0] not in stale}
 
     local_router = LocalQwenRouter()
+    ledger = UsageLedger(run_id=out_path.stem)
 
     total = 0
     skipped_resume = 0
@@ -742,6 +759,7 @@ def main() -> None:
 
                     row["description"] = desc
                     row["metadata"]["provider"] = provider_meta
+                    ledger.add(provider_meta, model, prompt_template_id, glyph_dir.name, n_queries=1)
                     row["metadata"]["parse"] = parse_meta
                     row["metadata"]["elapsed_sec"] = round(time.time() - t0, 3)
                     row["status"] = "ok"
@@ -750,6 +768,7 @@ def main() -> None:
                 except Exception as e:
                     row["error"] = str(e)
                     row["metadata"]["elapsed_sec"] = round(time.time() - t0, 3)
+                    ledger.add({"error": str(e)}, model, prompt_template_id, glyph_dir.name, n_queries=1)
                     err += 1
                     print(f"[error] {font_name} :: {model} :: {e}")
 
@@ -766,6 +785,7 @@ def main() -> None:
     if ok + err > 0:
         sum_path = write_summary_md(out_path, total, ok, err, skipped_resume)
         print(f"  Summary: {sum_path}")
+        ledger.write(out_path)
 
 
 if __name__ == "__main__":
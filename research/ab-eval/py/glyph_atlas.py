@@ -0,0 +1,363 @@
+"""
+Shared glyph atlas for the glyph-sheet and specimen renderers
+
+Each (font, size, glyph) is rasterized once with FreeType (via Pillow) and
+kept as an 8-bit coverage mask together with its advance; kerning is cached
+per glyph pair. Text is composed from those masks, so `render_glyph_sheet`,
+`render_specimen_v2`, `render_specimen_v3` and `render_specimen_v3_1` share
+rasterization work for the sizes and characters they have in common
+(48/24/12/8 px, A–Z, a–z, 0–9, the pangram, ...).
+
+Atlases persist under `research/ab-eval/out/.glyph_atlas/<font sha256>/`
+as one packed PNG sheet plus a JSON index per size, keyed by font *content*,
+so a font downloaded again by another renderer (or a new specimen version)
+reuses them.
+
+Renderers use it through two small shims that mirror the ImageDraw calls
+they already make:
+
+    atlas = GlyphAtlas(font_path)
+    font_large = atlas.font(72)             # instead of ImageFont.truetype(font_path, 72)
+    draw = AtlasDraw(img)                   # instead of ImageDraw.Draw(img)
+    draw.text((x, y), "Abg", font=font_large, fill=(0, 0, 0), anchor="lt")
+    atlas.save()
+
+Compare against direct Pillow rendering with:
+    python research/ab-eval/py/glyph_atlas.py parity --font path/to/font.ttf
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+
+DEFAULT_CACHE_DIR = "research/ab-eval/out/.glyph_atlas"
+
+
+@dataclass
+class Glyph:
+    mask: Image.Image  # "L" coverage, origin at the pen position on the baseline
+    dx: int
+    dy: int
+    advance: float
+
+
+class _SizeAtlas:
+    def __init__(self, font: ImageFont.FreeTypeFont):
+        self.font = font
+        self.glyphs: Dict[str, Glyph] = {}
+        self.kerning: Dict[str, float] = {}
+        ascent, descent = font.getmetrics()
+        self.ascent = ascent
+        self.descent = descent
+        # Pillow's multiline line height is bbox("A").bottom under the default "la" anchor
+        self.a_bottom = font.getbbox("A")[3]
+        self.dirty = False
+
+
+def _px(origin: float, pen: float) -> int:
+    """Pixel column of a glyph origin: Pillow truncates the start point and rounds the 26.6 pen offset."""
+    return int(origin) + int(math.floor(pen + (origin - int(origin)) + 0.5))
+
+
+class GlyphAtlas:
+    def __init__(self, font_path: str, cache_dir: Optional[str] = DEFAULT_CACHE_DIR):
+        with open(font_path, "rb") as f:
+            self.font_key = hashlib.sha256(f.read()).hexdigest()[:24]
+        self.font_path = font_path
+        self.cache_dir = Path(cache_dir) / self.font_key if cache_dir else None
+        self._sizes: Dict[int, _SizeAtlas] = {}
+        self._lock = threading.Lock()
+        self.stats = {"rasterized": 0, "loaded": 0, "kern_pairs": 0}
+
+    # --- cache management -------------------------------------------------
+
+    def _size(self, size: int) -> _SizeAtlas:
+        atlas = self._sizes.get(size)
+        if atlas is None:
+            atlas = _SizeAtlas(ImageFont.truetype(self.font_path, size))
+            self._load(size, atlas)
+            self._sizes[size] = atlas
+        return atlas
+
+    def _load(self, size: int, atlas: _SizeAtlas) -> None:
+        if not self.cache_dir:
+            return
+        index_path = self.cache_dir / f"{size}.json"
+        sheet_path = self.cache_dir / f"{size}.png"
+        if not (index_path.exists() and sheet_path.exists()):
+            return
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        with Image.open(sheet_path) as sheet:
+            sheet.load()
+            for ch, (x, y, w, h, dx, dy, adv) in index["glyphs"].items():
+                atlas.glyphs[ch] = Glyph(sheet.crop((x, y, x + w, y + h)), dx, dy, adv)
+        atlas.kerning.update(index.get("kerning", {}))
+        self.stats["loaded"] += len(index["glyphs"])
+
+    def save(self) -> None:
+        """Writes every size with new glyphs/kerning as a packed sheet + index (shelf packing)."""
+        if not self.cache_dir:
+            return
+        for size, atlas in self._sizes.items():
+            if not atlas.dirty:
+                continue
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            items = sorted(atlas.glyphs.items(), key=lambda kv: -kv[1].mask.height)
+            sheet_w = 1024
+            x = y = shelf_h = 0
+            placed = {}
+            for ch, g in items:
+                w, h = g.mask.size
+                if x + w > sheet_w:
+                    x, y, shelf_h = 0, y + shelf_h, 0
+                placed[ch] = (x, y)
+                x += w
+                shelf_h = max(shelf_h, h)
+            sheet = Image.new("L", (sheet_w, max(1, y + shelf_h)), 0)
+            index = {"font": os.path.basename(self.font_path), "size": size, "glyphs": {}, "kerning": atlas.kerning}
+            for ch, g in items:
+                px, py = placed[ch]
+                sheet.paste(g.mask, (px, py))
+                index["glyphs"][ch] = [px, py, g.mask.width, g.mask.height, g.dx, g.dy, g.advance]
+            tmp_png = self.cache_dir / f"{size}.png.tmp"
+            tmp_json = self.cache_dir / f"{size}.json.tmp"
+            sheet.save(tmp_png, format="PNG")
+            with open(tmp_json, "w", encoding="utf-8") as f:
+                json.dump(index, f, ensure_ascii=False)
+            os.replace(tmp_png, self.cache_dir / f"{size}.png")
+            os.replace(tmp_json, self.cache_dir / f"{size}.json")
+            atlas.dirty = False
+
+    # --- glyphs and layout ------------------------------------------------
+
+    def glyph(self, size: int, ch: str) -> Glyph:
+        atlas = self._size(size)
+        g = atlas.glyphs.get(ch)
+        if g is None:
+            with self._lock:
+                g = atlas.glyphs.get(ch)
+                if g is None:
+                    g = self._rasterize(atlas.font, ch)
+                    atlas.glyphs[ch] = g
+                    atlas.dirty = True
+                    self.stats["rasterized"] += 1
+        return g
+
+    @staticmethod
+    def _rasterize(font: ImageFont.FreeTypeFont, ch: str) -> Glyph:
+        x0, y0, x1, y1 = font.getbbox(ch, anchor="ls")
+        mask = Image.new("L", (max(0, x1 - x0), max(0, y1 - y0)), 0)
+        if mask.width and mask.height:
+            ImageDraw.Draw(mask).text((-x0, -y0), ch, font=font, fill=255, anchor="ls")
+        return Glyph(mask, x0, y0, font.getlength(ch))
+
+    def kern(self, size: int, a: str, b: str) -> float:
+        atlas = self._size(size)
+        pair = a + b
+        k = atlas.kerning.get(pair)
+        if k is None:
+            font = atlas.font
+            k = font.getlength(pair) - self.glyph(size, a).advance - self.glyph(size, b).advance
+            with self._lock:
+                atlas.kerning[pair] = k
+                atlas.dirty = True
+                self.stats["kern_pairs"] += 1
+        return k
+
+    def layout(self, text: str, size: int) -> List[Tuple[Glyph, float]]:
+        """(glyph, pen x) for each character, pen x relative to the text origin."""
+        placed = []
+        pen = 0.0
+        prev = None
+        for ch in text:
+            if prev is not None:
+                pen += self.kern(size, prev, ch)
+            g = self.glyph(size, ch)
+            placed.append((g, pen))
+            pen += g.advance
+            prev = ch
+        return placed
+
+    def textlength(self, text: str, size: int) -> float:
+        if not text:
+            return 0.0
+        placed = self.layout(text, size)
+        return placed[-1][1] + placed[-1][0].advance
+
+    def _baseline(self, text: str, size: int, y: float, anchor: str) -> float:
+        atlas = self._size(size)
+        v = anchor[1]
+        if v == "a":
+            return y + atlas.ascent
+        if v == "s":
+            return y
+        if v == "d":
+            return y - atlas.descent
+        ink = [g for g, _ in self.layout(text, size) if g.mask.height]
+        if v == "t":
+            return y - min((g.dy for g in ink), default=0)
+        if v == "b":
+            return y - max((g.dy + g.mask.height for g in ink), default=0)
+        raise ValueError(f"Unsupported anchor {anchor!r}")
+
+    def _origin_x(self, text: str, size: int, x: float, anchor: str) -> float:
+        h = anchor[0]
+        if h == "l":
+            return x
+        width = self.textlength(text, size)
+        return x - (width / 2.0 if h == "m" else width)
+
+    def textbbox(self, xy: Tuple[float, float], text: str, size: int, anchor: str = "la") -> Tuple[int, int, int, int]:
+        ox = self._origin_x(text, size, xy[0], anchor)
+        base = self._baseline(text, size, xy[1], anchor)
+        boxes = [
+            (_px(ox, pen) + g.dx, int(base) + g.dy, _px(ox, pen) + g.dx + g.mask.width, int(base) + g.dy + g.mask.height)
+            for g, pen in self.layout(text, size) if g.mask.width and g.mask.height
+        ]
+        if not boxes:
+            x, y = int(ox), int(base)
+            return x, y, x, y
+        return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+                max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+    def draw_text(self, draw: ImageDraw.ImageDraw, xy: Tuple[float, float], text: str, size: int, fill=None,
+                  anchor: str = "la") -> None:
+        """Composes `text` from cached glyph masks into one coverage mask and blends it with `fill`."""
+        if not text:
+            return
+        x0, y0, x1, y1 = self.textbbox(xy, text, size, anchor)
+        if x1 <= x0 or y1 <= y0:
+            return
+        ox = self._origin_x(text, size, xy[0], anchor)
+        base = int(self._baseline(text, size, xy[1], anchor))
+        line = Image.new("L", (x1 - x0, y1 - y0), 0)
+        for g, pen in self.layout(text, size):
+            if not (g.mask.width and g.mask.height):
+                continue
+            gx = _px(ox, pen) + g.dx - x0
+            gy = base + g.dy - y0
+            region = line.crop((gx, gy, gx + g.mask.width, gy + g.mask.height))
+            # Overlapping coverage combines like Pillow's string rendering (screen), not max
+            line.paste(ImageChops.screen(region, g.mask), (gx, gy))
+        draw.bitmap((x0, y0), line, fill=fill)
+
+    def font(self, size: int) -> "AtlasFont":
+        self._size(size)
+        return AtlasFont(self, size)
+
+
+class AtlasFont:
+    """Stands in for an ImageFont.FreeTypeFont of one size in AtlasDraw calls."""
+
+    def __init__(self, atlas: GlyphAtlas, size: int):
+        self.atlas = atlas
+        self.size = size
+
+    def getlength(self, text: str) -> float:
+        return self.atlas.textlength(text, self.size)
+
+    def getbbox(self, text: str, anchor: str = "la") -> Tuple[int, int, int, int]:
+        return self.atlas.textbbox((0, 0), text, self.size, anchor)
+
+    def getmetrics(self) -> Tuple[int, int]:
+        atlas = self.atlas._size(self.size)
+        return atlas.ascent, atlas.descent
+
+
+class AtlasDraw:
+    """ImageDraw.Draw look-alike: text calls with an AtlasFont go through the atlas, the rest to ImageDraw."""
+
+    def __init__(self, img: Image.Image):
+        self.img = img
+        self._draw = ImageDraw.Draw(img)
+
+    def __getattr__(self, name):
+        return getattr(self._draw, name)
+
+    def text(self, xy, text, fill=None, font=None, anchor=None, **kwargs):
+        if isinstance(font, AtlasFont):
+            if "\n" in text:
+                return self.multiline_text(xy, text, fill=fill, font=font, anchor=anchor, **kwargs)
+            return font.atlas.draw_text(self._draw, xy, text, font.size, fill, anchor or "la")
+        return self._draw.text(xy, text, fill=fill, font=font, anchor=anchor, **kwargs)
+
+    def multiline_text(self, xy, text, fill=None, font=None, anchor=None, spacing=4, **kwargs):
+        if not isinstance(font, AtlasFont):
+            return self._draw.multiline_text(xy, text, fill=fill, font=font, anchor=anchor, spacing=spacing, **kwargs)
+        anchor = anchor or "la"
+        line_spacing = font.atlas._size(font.size).a_bottom + spacing
+        x, y = xy
+        for line in text.split("\n"):
+            font.atlas.draw_text(self._draw, (x, y), line, font.size, fill, anchor)
+            y += line_spacing
+
+    def textlength(self, text, font=None, **kwargs):
+        if isinstance(font, AtlasFont):
+            return font.getlength(text)
+        return self._draw.textlength(text, font=font, **kwargs)
+
+    def textbbox(self, xy, text, font=None, anchor=None, **kwargs):
+        if isinstance(font, AtlasFont):
+            return font.atlas.textbbox(xy, text, font.size, anchor or "la")
+        return self._draw.textbbox(xy, text, font=font, anchor=anchor, **kwargs)
+
+
+def parity(font_path: str) -> Dict[str, float]:
+    """Pixel difference between atlas-composed and direct Pillow rendering of typical specimen lines."""
+    import numpy as np
+
+    samples = [
+        (200, "Abg", "lt"), (200, "il1I0O", "lt"), (72, "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "lt"),
+        (72, "rn/m  vv/w  e/o  S/s  C/c", "lt"), (48, "0123456789 !@#$%^&*()_+", "la"),
+        (24, "Body 24pt: The quick brown fox jumps over the lazy dog.", "lt"),
+        (12, "Body 12pt: The quick brown fox jumps over the lazy dog.", "lt"),
+        (8, "Body 8pt: The quick brown fox jumps over the lazy dog.", "la"),
+        (40, "ABCDEFGHIJKLM\nnopqrstuvwxyz\n1234567890", "la"),
+    ]
+    atlas = GlyphAtlas(font_path, cache_dir=None)
+    diffs = []
+    for size, text, anchor in samples:
+        ref = Image.new("RGB", (2600, 800), (255, 255, 255))
+        out = ref.copy()
+        pil_font = ImageFont.truetype(font_path, size)
+        if "\n" in text:
+            ImageDraw.Draw(ref).multiline_text((20, 20), text, font=pil_font, fill=(0, 0, 0), spacing=10)
+            AtlasDraw(out).multiline_text((20, 20), text, font=atlas.font(size), fill=(0, 0, 0), spacing=10)
+        else:
+            ImageDraw.Draw(ref).text((50, 60), text, font=pil_font, fill=(0, 0, 0), anchor=anchor)
+            AtlasDraw(out).text((50, 60), text, font=atlas.font(size), fill=(0, 0, 0), anchor=anchor)
+        d = np.abs(np.asarray(ref, dtype=np.int16) - np.asarray(out, dtype=np.int16))
+        diffs.append((d.max(), (d > 0).mean(), d.mean()))
+        same_bbox = ImageDraw.Draw(ref).textbbox((50, 60), text, font=pil_font, anchor=anchor) == \
+            atlas.textbbox((50, 60), text, size, anchor) if "\n" not in text else True
+        print(f"  {size:>3}px {anchor} {text[:28]!r:<32} max|diff|={d.max():>3}  "
+              f"px differing={(d > 0).any(axis=2).mean():.5f}  bbox {'same' if same_bbox else 'DIFFERENT'}")
+    return {
+        "max_abs_diff": int(max(m for m, _, _ in diffs)),
+        "mean_abs_diff": float(sum(a for _, _, a in diffs) / len(diffs)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Glyph atlas utilities")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("parity", help="Compare atlas-composed text against direct Pillow rendering")
+    p.add_argument("--font", required=True)
+    args = parser.parse_args()
+    if args.cmd == "parity":
+        print(json.dumps(parity(args.font), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""
+Record/replay layer for model API calls (offline, deterministic benchmarking)
+
+Installs itself under `requests` (every session's HTTPAdapter.send), so the
+runners' `requests.post` calls need no changes beyond `install_from_env()`
+at import time. Only hosts in AB_EVAL_CASSETTE_HOSTS (default: Gemini and
+OpenRouter) are intercepted; local servers pass through.
+
+Modes (AB_EVAL_HTTP_MODE):
+- live (default): no-op.
+- record: real calls; each request/response pair is appended to the
+  cassette (JSONL) with the observed latency. Request bodies are stored as
+  a hash only (they carry base64 specimens); API keys never reach the file.
+  Streamed responses (`stream=True`) are teed as the caller reads them and
+  written when the caller reaches the end or closes early, so early-abort
+  readers still abort and the entry holds what was received up to then
+  (`complete: false`, latency up to the close).
+- replay: no network. Requests are matched on method + URL (key removed) +
+  canonical JSON body; repeated identical requests (e.g. r1..r3 repeats)
+  return their recorded responses in order. A request that is not in the
+  cassette raises `CassetteMiss` (a `requests.ConnectionError`).
+
+Redirect (any mode): AB_EVAL_API_REDIRECT="generativelanguage.googleapis.com=http://127.0.0.1:8790,openrouter.ai=http://127.0.0.1:8790"
+sends those hosts' calls to another base URL (e.g. `stub_model_api.py`), path and query kept.
+
+Replay knobs:
+- AB_EVAL_REPLAY_LATENCY: "recorded" (default), or a fixed number of seconds
+- AB_EVAL_REPLAY_LATENCY_SCALE: multiplier on the latency above (default 1.0)
+- AB_EVAL_REPLAY_FAULTS: injected error rates, e.g. "429:0.1,503:0.05"
+- AB_EVAL_REPLAY_SEED: seed for fault injection (default 0)
+
+Usage:
+    AB_EVAL_HTTP_MODE=record AB_EVAL_CASSETTE=research/ab-eval/out/cassettes/trial.jsonl \
+        python research/ab-eval/py/run_production_trial.py ...
+    AB_EVAL_HTTP_MODE=replay AB_EVAL_CASSETTE=research/ab-eval/out/cassettes/trial.jsonl \
+        AB_EVAL_REPLAY_LATENCY_SCALE=0.1 AB_EVAL_REPLAY_FAULTS=429:0.1 \
+        python research/ab-eval/py/run_production_trial.py ...
+    python research/ab-eval/py/http_cassette.py stats research/ab-eval/out/cassettes/trial.jsonl
+"""
+
+from __future__ import annotations
+
+import argparse
+import atexit
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+DEFAULT_HOSTS = ("generativelanguage.googleapis.com", "openrouter.ai")
+SECRET_PARAMS = {"key", "api_key"}
+KEPT_HEADERS = ("content-type", "retry-after")
+
+_ORIGINAL_SEND = HTTPAdapter.send
+_active: Optional["Cassette"] = None
+_redirects: Dict[str, str] = {}
+
+
+class CassetteMiss(requests.ConnectionError):
+    """Replay found no recorded response for a request."""
+
+
+def redact_url(url: str) -> str:
+    parts = urlsplit(url)
+    query = [(k, "REDACTED" if k in SECRET_PARAMS else v) for k, v in parse_qsl(parts.query, keep_blank_values=True)]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+
+def request_key(method: str, url: str, body: Optional[bytes]) -> Tuple[str, str]:
+    """(match key, body sha256) for a request; JSON bodies are canonicalized first."""
+    raw = body.encode("utf-8") if isinstance(body, str) else (body or b"")
+    try:
+        raw = json.dumps(json.loads(raw), sort_keys=True, separators=(",", ":")).encode("utf-8")
+    except ValueError:
+        pass
+    body_hash = hashlib.sha256(raw).hexdigest()
+    key = hashlib.sha256(f"{method.upper()} {redact_url(url)} {body_hash}".encode("utf-8")).hexdigest()
+    return key, body_hash
+
+
+def parse_redirects(spec: str) -> Dict[str, str]:
+    """"host=http://127.0.0.1:8790,..." -> {host: base URL}"""
+    redirects = {}
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        host, base = item.split("=", 1)
+        redirects[host.strip()] = base.strip().rstrip("/")
+    return redirects
+
+
+def redirect_url(url: str) -> str:
+    parts = urlsplit(url)
+    base = _redirects.get(parts.hostname or "")
+    if base is None:
+        return url
+    target = urlsplit(base)
+    return urlunsplit((target.scheme, target.netloc, target.path + parts.path, parts.query, parts.fragment))
+
+
+def parse_faults(spec: str) -> List[Tuple[int, float]]:
+    """"429:0.1,503:0.05" -> [(429, 0.1), (503, 0.05)]"""
+    faults = []
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        status, rate = item.split(":")
+        faults.append((int(status), float(rate)))
+    return faults
+
+
+class _TeeRaw:
+    """Proxy for a streamed response's `raw` that keeps a copy of what the caller reads."""
+
+    def __init__(self, raw, on_done):
+        self._raw = raw
+        self._on_done = on_done
+        self._chunks: List[bytes] = []
+        self._done = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def stream(self, *args, **kwargs):
+        for chunk in self._raw.stream(*args, **kwargs):
+            self._chunks.append(chunk)
+            yield chunk
+        self._finish(complete=True)
+
+    def read(self, *args, **kwargs):
+        data = self._raw.read(*args, **kwargs)
+        if data:
+            self._chunks.append(data)
+        else:
+            self._finish(complete=True)
+        return data
+
+    def close(self):
+        self._finish(complete=False)
+        self._raw.close()
+
+    def _finish(self, complete: bool) -> None:
+        if not self._done:
+            self._done = True
+            self._on_done(b"".join(self._chunks), complete)
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str, hosts=DEFAULT_HOSTS, latency: str = "recorded",
+                 latency_scale: float = 1.0, faults: Optional[List[Tuple[int, float]]] = None, seed: int = 0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.hosts = tuple(hosts)
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self.faults = faults or []
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._served: Dict[str, int] = {}
+        self.stats = {"intercepted": 0, "recorded": 0, "replayed": 0, "misses": 0, "injected": 0}
+        if mode == "replay":
+            for entry in load_entries(path):
+                self._entries.setdefault(entry["key"], []).append(entry)
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def intercepts(self, url: str) -> bool:
+        host = urlsplit(url).hostname or ""
+        return any(host == h or host.endswith("." + h) for h in self.hosts)
+
+    def send(self, adapter: HTTPAdapter, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        if not self.intercepts(request.url):
+            return _ORIGINAL_SEND(adapter, request, **kwargs)
+        with self._lock:
+            self.stats["intercepted"] += 1
+        key, body_hash = request_key(request.method, request.url, request.body)
+        if self.mode == "record":
+            return self._record(adapter, request, key, body_hash, **kwargs)
+        return self._replay(request, key)
+
+    def _record(self, adapter, request, key, body_hash, **kwargs) -> requests.Response:
+        t0 = time.perf_counter()
+        resp = _ORIGINAL_SEND(adapter, request, **kwargs)
+        entry = {
+            "key": key,
+            "method": request.method,
+            "url": redact_url(request.url),
+            "body_sha256": body_hash,
+            "status": resp.status_code,
+            "reason": resp.reason,
+            "headers": {h: resp.headers[h] for h in KEPT_HEADERS if h in resp.headers},
+        }
+        if kwargs.get("stream"):
+            # Written when the caller finishes reading or closes the stream early
+            resp.raw = _TeeRaw(resp.raw, lambda body, complete: self._write(
+                {**entry, "streamed": True, "complete": complete}, body, t0))
+            return resp
+        self._write(entry, resp.content, t0)  # reads the body; the caller still gets it
+        return resp
+
+    def _write(self, entry: Dict[str, Any], body: bytes, t0: float) -> None:
+        entry["body"] = body.decode("utf-8", errors="replace")
+        entry["latency_sec"] = round(time.perf_counter() - t0, 4)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+            self.stats["recorded"] += 1
+
+    def _delay(self, recorded: float) -> None:
+        seconds = recorded if self.latency == "recorded" else float(self.latency)
+        if seconds * self.latency_scale > 0:
+            time.sleep(seconds * self.latency_scale)
+
+    def _replay(self, request: requests.PreparedRequest, key: str) -> requests.Response:
+        with self._lock:
+            injected = next((status for status, rate in self.faults if self._rng.random() < rate), None)
+            candidates = self._entries.get(key)
+            entry = None
+            if injected is not None:
+                self.stats["injected"] += 1
+            elif candidates:
+                i = self._served.get(key, 0)
+                self._served[key] = i + 1
+                entry = candidates[i % len(candidates)]
+                self.stats["replayed"] += 1
+            else:
+                self.stats["misses"] += 1
+        if injected is not None:
+            # Faults do not consume a recording: the retry gets the real response
+            self._delay(0.05)
+            body = json.dumps({"error": {"code": injected, "message": "injected by http_cassette", "status": "INJECTED"}})
+            return build_response(request, injected, body, {"content-type": "application/json", "retry-after": "1"}, 0.05)
+        if entry is None:
+            raise CassetteMiss(f"No recording for {request.method} {redact_url(request.url)} in {self.path}", request=request)
+        self._delay(entry.get("latency_sec", 0.0))
+        return build_response(request, entry["status"], entry["body"], entry.get("headers", {}),
+                              entry.get("latency_sec", 0.0), entry.get("reason"))
+
+    def summary(self) -> str:
+        s = self.stats
+        if self.mode == "record":
+            return f"http_cassette: recorded {s['recorded']} calls -> {self.path}"
+        return (f"http_cassette: replayed {s['replayed']} calls from {self.path} "
+                f"({s['misses']} misses, {s['injected']} injected faults)")
+
+
+def build_response(request: requests.PreparedRequest, status: int, body: str, headers: Dict[str, str],
+                   latency_sec: float, reason: Optional[str] = None) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = status
+    resp.reason = reason or ("OK" if status < 400 else "Error")
+    resp._content = body.encode("utf-8")
+    resp._content_consumed = True  # no `raw`: iter_content/close work from `_content`
+    resp.headers = CaseInsensitiveDict(headers)
+    resp.encoding = "utf-8"
+    resp.url = request.url
+    resp.request = request
+    resp.elapsed = timedelta(seconds=latency_sec)
+    return resp
+
+
+def load_entries(path: str) -> List[Dict[str, Any]]:
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Cassette not found: {path}")
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _patched_send(adapter, request, **kwargs):
+    if _redirects:
+        request.url = redirect_url(request.url)
+    if _active is None:
+        return _ORIGINAL_SEND(adapter, request, **kwargs)
+    return _active.send(adapter, request, **kwargs)
+
+
+def install(cassette: Cassette) -> Cassette:
+    global _active
+    _active = cassette
+    HTTPAdapter.send = _patched_send
+    atexit.register(lambda: print(cassette.summary(), file=sys.stderr))
+    return cassette
+
+
+def install_redirects(redirects: Dict[str, str]) -> None:
+    _redirects.update(redirects)
+    HTTPAdapter.send = _patched_send
+
+
+def uninstall() -> None:
+    global _active
+    _active = None
+    _redirects.clear()
+    HTTPAdapter.send = _ORIGINAL_SEND
+
+
+def install_from_env() -> Optional[Cassette]:
+    """Installs the cassette configured by AB_EVAL_HTTP_MODE/AB_EVAL_CASSETTE (no-op in live mode or if already installed) and any AB_EVAL_API_REDIRECT."""
+    redirects = parse_redirects(os.getenv("AB_EVAL_API_REDIRECT", ""))
+    if redirects:
+        install_redirects(redirects)
+    mode = os.getenv("AB_EVAL_HTTP_MODE", "live").lower()
+    if mode == "live" or _active is not None:
+        return _active
+    path = os.getenv("AB_EVAL_CASSETTE")
+    if not path:
+        raise RuntimeError(f"AB_EVAL_HTTP_MODE={mode} requires AB_EVAL_CASSETTE")
+    hosts = [h.strip() for h in os.getenv("AB_EVAL_CASSETTE_HOSTS", ",".join(DEFAULT_HOSTS)).split(",") if h.strip()]
+    return install(Cassette(
+        path, mode, hosts=hosts,
+        latency=os.getenv("AB_EVAL_REPLAY_LATENCY", "recorded"),
+        latency_scale=float(os.getenv("AB_EVAL_REPLAY_LATENCY_SCALE", "1.0")),
+        faults=parse_faults(os.getenv("AB_EVAL_REPLAY_FAULTS", "")),
+        seed=int(os.getenv("AB_EVAL_REPLAY_SEED", "0")),
+    ))
+
+
+def cmd_stats(args) -> None:
+    entries = load_entries(args.cassette)
+    by_host: Dict[str, List[Dict[str, Any]]] = {}
+    for e in entries:
+        by_host.setdefault(urlsplit(e["url"]).hostname or "?", []).append(e)
+    print(f"{args.cassette}: {len(entries)} recorded calls, {len({e['key'] for e in entries})} distinct requests")
+    for host, rows in sorted(by_host.items()):
+        lat = sorted(r["latency_sec"] for r in rows)
+        statuses: Dict[int, int] = {}
+        for r in rows:
+            statuses[r["status"]] = statuses.get(r["status"], 0) + 1
+        p = lambda q: lat[min(len(lat) - 1, int(q * len(lat)))]
+        streamed = [r for r in rows if r.get("streamed")]
+        closed_early = sum(1 for r in streamed if not r.get("complete"))
+        print(f"  {host}: {len(rows)} calls, status {dict(sorted(statuses.items()))}, "
+              f"latency p50 {p(0.5):.2f}s p95 {p(0.95):.2f}s max {lat[-1]:.2f}s"
+              + (f", {len(streamed)} streamed ({closed_early} closed early)" if streamed else ""))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Record/replay cassettes for model API calls")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_s = sub.add_parser("stats", help="Summarize a cassette")
+    p_s.add_argument("cassette")
+    args = parser.parse_args()
+    {"stats": cmd_stats}[args.cmd](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Provider-tuned specimen payloads for judge calls
+
+Specimens leave `finalize_and_save` as 1024x1024 RGB PNGs and used to be
+base64-encoded from disk on every request. Specimens are black-on-white text,
+so colour carries nothing and most of the bytes and vision tokens go on
+resolution the model resamples away anyway. Each profile below is one
+re-encoding:
+
+- `mode`: "RGB" (as rendered), "L" (8-bit gray) or "1" (bilevel, thresholded)
+- `format`: "PNG" (optimized) or "WEBP" (lossless)
+- `max_side`: downscale so the long side fits (provider tile size), if set
+- `snap`: round both sides down to a multiple of the provider patch size
+
+`original` sends the file bytes unchanged. Encoded payloads are cached in
+memory and on disk under `out/.image_payload_cache/`, keyed by file path,
+mtime, size and profile, so a trial encodes each specimen once.
+
+Usage:
+    python research/ab-eval/py/image_payload.py report --spec-dir research/ab-eval/out/specimens_v3
+    python research/ab-eval/py/image_payload.py report --spec-dir research/ab-eval/out/specimens_v3 \
+        --runs original=research/ab-eval/out/g3_pro_v3_gated_results.json gemini_gray=research/ab-eval/out/g3_pro_v3_gemini_gray_results.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import hashlib
+import io
+import json
+import math
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from metrics_kernel import compute_metrics, remap_label
+from render_specimen_v3_1 import PATCH_SIZE as QWEN_PATCH, patch_grid
+from results_columnar import load_detail_rows
+
+CACHE_DIR = Path("research/ab-eval/out/.image_payload_cache")
+SSOT_PATH = Path("research/ab-eval/out/full_set_review_export_1770612809775.json")
+
+# Gemini: images up to 384px on both sides cost one 258-token tile; larger
+# images are tiled at 768x768, 258 tokens per tile.
+GEMINI_TILE = 768
+GEMINI_SMALL_SIDE = 384
+GEMINI_TOKENS_PER_TILE = 258
+# Qwen3-VL: one token per QWEN_PATCH x QWEN_PATCH (32px) after 2x2 merging of 16px patches.
+
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "original": {},
+    "rgb_png": {"mode": "RGB", "format": "PNG"},
+    "gray_png": {"mode": "L", "format": "PNG"},
+    "gray_webp": {"mode": "L", "format": "WEBP"},
+    "bilevel_png": {"mode": "1", "format": "PNG"},
+    "gemini_gray": {"mode": "L", "format": "PNG", "max_side": GEMINI_TILE},
+    "gemini_bilevel": {"mode": "1", "format": "PNG", "max_side": GEMINI_TILE},
+    "qwen_gray": {"mode": "L", "format": "PNG", "max_side": 896, "snap": QWEN_PATCH},
+}
+
+MIME = {"PNG": "image/png", "WEBP": "image/webp"}
+BILEVEL_THRESHOLD = 160
+
+_memory_cache: Dict[str, Dict[str, Any]] = {}
+
+
+def gemini_tokens(width: int, height: int) -> int:
+    if width <= GEMINI_SMALL_SIDE and height <= GEMINI_SMALL_SIDE:
+        return GEMINI_TOKENS_PER_TILE
+    return math.ceil(width / GEMINI_TILE) * math.ceil(height / GEMINI_TILE) * GEMINI_TOKENS_PER_TILE
+
+
+def qwen_tokens(width: int, height: int) -> int:
+    w, h = patch_grid(width, height, QWEN_PATCH)
+    return w * h
+
+
+def _cache_key(path: Path, profile: str) -> str:
+    st = path.stat()
+    spec = json.dumps(PROFILES[profile], sort_keys=True)
+    raw = f"{path.resolve()}|{st.st_mtime_ns}|{st.st_size}|{profile}|{spec}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _transform(img: Image.Image, spec: Dict[str, Any]) -> Image.Image:
+    mode = spec.get("mode", "RGB")
+    img = img.convert("RGB") if img.mode not in ("RGB", "L") else img
+
+    max_side = spec.get("max_side")
+    w, h = img.size
+    scale = min(1.0, max_side / max(w, h)) if max_side else 1.0
+    snap = spec.get("snap")
+    new_w, new_h = int(w * scale), int(h * scale)
+    if snap:
+        new_w, new_h = max(snap, new_w // snap * snap), max(snap, new_h // snap * snap)
+    if (new_w, new_h) != (w, h):
+        img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+
+    if mode == "L":
+        return img.convert("L")
+    if mode == "1":
+        # Threshold rather than dither: dithering turns glyph edges into noise.
+        gray = np.asarray(img.convert("L"))
+        return Image.fromarray(gray >= BILEVEL_THRESHOLD)
+    return img.convert("RGB")
+
+
+def encode_image(image_path: Path, profile: str = "original") -> Dict[str, Any]:
+    """
+    Encoded payload for one specimen: {"data", "b64", "mime", "width", "height"}.
+    Results are cached in memory and on disk per (file version, profile).
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown image profile: {profile} (choose from {', '.join(PROFILES)})")
+    image_path = Path(image_path)
+    key = _cache_key(image_path, profile)
+    if key in _memory_cache:
+        return _memory_cache[key]
+
+    spec = PROFILES[profile]
+    fmt = spec.get("format", "PNG")
+    cached = CACHE_DIR / f"{key}.{fmt.lower()}"
+    if profile == "original":
+        data = image_path.read_bytes()
+        with Image.open(io.BytesIO(data)) as img:
+            size = img.size
+    elif cached.exists():
+        data = cached.read_bytes()
+        with Image.open(io.BytesIO(data)) as img:
+            size = img.size
+    else:
+        with Image.open(image_path) as img:
+            out = _transform(img, spec)
+        buf = io.BytesIO()
+        if fmt == "WEBP":
+            out.save(buf, format="WEBP", lossless=True, method=6)
+        else:
+            out.save(buf, format="PNG", optimize=True)
+        data = buf.getvalue()
+        size = out.size
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        cached.write_bytes(data)
+
+    payload = {
+        "data": data,
+        "b64": base64.b64encode(data).decode("utf-8"),
+        "mime": MIME[fmt] if profile != "original" else "image/png",
+        "width": size[0],
+        "height": size[1],
+    }
+    _memory_cache[key] = payload
+    return payload
+
+
+def image_to_base64(image_path: Path, profile: str = "original") -> str:
+    """Base64 payload for a specimen; "" when the file does not exist."""
+    if not Path(image_path).exists():
+        return ""
+    return encode_image(image_path, profile)["b64"]
+
+
+def image_to_data_url(image_path: Path, profile: str = "original") -> str:
+    if not Path(image_path).exists():
+        return ""
+    p = encode_image(image_path, profile)
+    return f"data:{p['mime']};base64,{p['b64']}"
+
+
+def image_mime(profile: str = "original") -> str:
+    return MIME[PROFILES[profile].get("format", "PNG")]
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+def payload_stats(paths: List[Path], profiles: List[str]) -> Dict[str, Dict[str, Any]]:
+    stats: Dict[str, Dict[str, Any]] = {}
+    for profile in profiles:
+        raw, b64, g_tok, q_tok, secs = [], [], [], [], []
+        for p in paths:
+            t0 = time.perf_counter()
+            enc = encode_image(p, profile)
+            secs.append(time.perf_counter() - t0)
+            raw.append(len(enc["data"]))
+            b64.append(len(enc["b64"]))
+            g_tok.append(gemini_tokens(enc["width"], enc["height"]))
+            q_tok.append(qwen_tokens(enc["width"], enc["height"]))
+        stats[profile] = {
+            "images": len(paths),
+            "mean_bytes": round(float(np.mean(raw)), 1),
+            "mean_b64_bytes": round(float(np.mean(b64)), 1),
+            "mean_gemini_tokens": round(float(np.mean(g_tok)), 1),
+            "mean_qwen_tokens": round(float(np.mean(q_tok)), 1),
+            "mean_encode_ms": round(float(np.mean(secs)) * 1000, 2),
+        }
+    base = stats.get("original")
+    if base:
+        for s in stats.values():
+            s["bytes_saved_pct"] = round(100 * (1 - s["mean_bytes"] / base["mean_bytes"]), 1)
+            s["gemini_tokens_saved_pct"] = round(100 * (1 - s["mean_gemini_tokens"] / base["mean_gemini_tokens"]), 1)
+            s["qwen_tokens_saved_pct"] = round(100 * (1 - s["mean_qwen_tokens"] / base["mean_qwen_tokens"]), 1)
+    return stats
+
+
+def agreement_deltas(runs: Dict[str, Path], ssot_path: Path, reference: str = "original") -> Dict[str, Dict[str, Any]]:
+    """SSoT agreement/precision per profile run on the pairs common to all runs, with deltas vs `reference`."""
+    with open(ssot_path, "r", encoding="utf-8") as f:
+        ssot_map = {(d["query_id"], d["font_name"]): remap_label(d.get("casey_label", 0)) for d in json.load(f)["decisions"]}
+
+    preds: Dict[str, Dict[Tuple[str, str], int]] = {}
+    for profile, path in runs.items():
+        rows = load_detail_rows(path, ("query_id", "font_name", "ai_match", "ai_match_gated")) or []
+        preds[profile] = {
+            (r["query_id"], r["font_name"]): 1 if r.get("ai_match_gated", r.get("ai_match", 0)) == 1 else 0
+            for r in rows
+        }
+    common = set(ssot_map)
+    for p in preds.values():
+        common &= set(p)
+    keys = sorted(common)
+
+    out: Dict[str, Dict[str, Any]] = {}
+    for profile, p in preds.items():
+        m = compute_metrics([ssot_map[k] for k in keys], [p[k] for k in keys])
+        out[profile] = {"pairs": len(keys), "agreement": m["agreement"], "precision": m["precision"]}
+    if reference in out:
+        for profile, m in out.items():
+            m["agreement_delta"] = round(m["agreement"] - out[reference]["agreement"], 4)
+            m["precision_delta"] = round(m["precision"] - out[reference]["precision"], 4)
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Specimen payload profiles: byte/token savings and SSoT agreement deltas")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_rep = sub.add_parser("report")
+    p_rep.add_argument("--spec-dir", required=True, help="Directory of specimen PNGs")
+    p_rep.add_argument("--profiles", nargs="+", default=list(PROFILES))
+    p_rep.add_argument("--limit", type=int, default=0, help="Only the first N specimens (0 = all)")
+    p_rep.add_argument("--runs", nargs="*", default=[], help="profile=results.json pairs judged with each profile")
+    p_rep.add_argument("--ssot", default=str(SSOT_PATH))
+    p_rep.add_argument("--out", default="research/ab-eval/out/image_payload_report.json")
+    args = parser.parse_args()
+
+    paths = sorted(Path(args.spec_dir).glob("*.png"))
+    if args.limit > 0:
+        paths = paths[:args.limit]
+    if not paths:
+        raise SystemExit(f"No specimens found in {args.spec_dir}")
+    profiles = ["original"] + [p for p in args.profiles if p != "original"]
+
+    stats = payload_stats(paths, profiles)
+    print("| Profile | Bytes | B64 | Saved | Gemini tok | Saved | Qwen tok | Saved | Encode ms |")
+    print("|---------|-------|-----|-------|------------|-------|----------|-------|-----------|")
+    for name, s in stats.items():
+        print(f"| {name} | {s['mean_bytes']:.0f} | {s['mean_b64_bytes']:.0f} | {s['bytes_saved_pct']:.1f}% | "
+              f"{s['mean_gemini_tokens']:.0f} | {s['gemini_tokens_saved_pct']:.1f}% | "
+              f"{s['mean_qwen_tokens']:.0f} | {s['qwen_tokens_saved_pct']:.1f}% | {s['mean_encode_ms']:.1f} |")
+
+    report: Dict[str, Any] = {"spec_dir": args.spec_dir, "payload": stats}
+    if args.runs:
+        runs = dict(r.split("=", 1) for r in args.runs)
+        deltas = agreement_deltas({k: Path(v) for k, v in runs.items()}, Path(args.ssot))
+        report["agreement"] = deltas
+        print("\n| Profile | Pairs | Agreement | Delta | Precision | Delta |")
+        print("|---------|-------|-----------|-------|-----------|-------|")
+        for name, m in deltas.items():
+            print(f"| {name} | {m['pairs']} | {m['agreement']:.4f} | {m.get('agreement_delta', 0):+.4f} | "
+                  f"{m['precision']:.4f} | {m.get('precision_delta', 0):+.4f} |")
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved report to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
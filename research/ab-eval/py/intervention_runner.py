@@ -1,6 +1,5 @@
 import os
 import json
-import base64
 import time
 import argparse
 from pathlib import Path
@@ -8,6 +7,15 @@ from typing import List, Dict, Any, Tuple
 import requests
 from dotenv import load_dotenv
 
+from call_telemetry import CallTimer, Telemetry
+from http_cassette import install_from_env
+from image_payload import PROFILES, encode_image, gemini_tokens, image_mime, image_to_base64, image_to_data_url, qwen_tokens
+from metrics_kernel import compute_metrics, pairs_to_arrays
+from query_packing import approx_tokens
+from results_columnar import write_sidecar
+from stream_verdicts import read_verdict_stream
+from usage_accounting import UsageLedger, estimated_usage, usage_from_response
+
 # Load environment variables
 def load_env():
     root = Path(__file__).resolve().parents[3]
@@ -15,22 +23,21 @@ def load_env():
     load_dotenv(root / ".env.local", override=False)
 
 load_env()
+install_from_env()
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-def image_to_base64(image_path: Path) -> str:
-    if not image_path.exists():
-        return ""
-    b = image_path.read_bytes()
-    return base64.b64encode(b).decode("utf-8")
+# Appended in --verdict-only mode so the verdicts stream before the reasoning (see stream_verdicts.py)
+VERDICT_ONLY_SUFFIX = """
+### OUTPUT ORDER
+Write the "{array}" array first and "{reasoning}" last: {{"{array}": [...], "{reasoning}": "..."}}
+"""
 
-def image_to_data_url(image_path: Path) -> str:
-    if not image_path.exists():
-        return ""
-    b = image_path.read_bytes()
-    b64 = base64.b64encode(b).decode("utf-8")
-    return f"data:image/png;base64,{b64}"
+def verdict_only_suffix(prompt_type: str) -> str:
+    if prompt_type == "v2":
+        return VERDICT_ONLY_SUFFIX.format(array="matches", reasoning="thought")
+    return VERDICT_ONLY_SUFFIX.format(array="results", reasoning="audit_reasoning")
 
 def get_prompt(prompt_type: str, queries_formatted: str) -> str:
     if prompt_type == "v2":
@@ -295,7 +302,42 @@ Return STRICT JSON only:
 }}
 """
 
-def call_openrouter_batched(queries: List[str], images: List[Path], prompt_type: str, model: str) -> Dict[str, Any]:
+def prompt_token_estimate(prompt: str, images: List[Path], image_profile: str, provider: str) -> int:
+    """Approximate billed prompt tokens of a judge request: prompt text plus each attached image's vision tokens."""
+    per_image = gemini_tokens if provider == "gemini" else qwen_tokens
+    tokens = approx_tokens(prompt)
+    for img_path in images:
+        if Path(img_path).exists():
+            enc = encode_image(img_path, image_profile)
+            tokens += per_image(enc["width"], enc["height"])
+    return tokens
+
+def finish_stream(resp, provider: str, queries: List[str], t0: float, timer: CallTimer, prompt_tokens: int) -> Dict[str, Any]:
+    """
+    Reads a streamed judge response into the same dict as the buffered path, plus `stream` stats.
+    Providers report completion usage in the final event, so a stream closed early gets
+    `estimated_usage` (the prompt is billed in full; completion from the characters received).
+    """
+    out = read_verdict_stream(resp, provider, len(queries))
+    latency = time.time() - t0
+    timer.lap("model_time")
+    data = out["data"]
+    if data is None:
+        data = {
+            "audit_reasoning": f"Failed to parse JSON. Raw content: {out['text']}",
+            "results": [{"query_index": i+1, "match": 0, "confidence": 0, "evidence": "PARSE FAILURE"} for i in range(len(queries))],
+        }
+    data['latency_sec'] = round(latency, 2)
+    usage = usage_from_response(out["usage_event"])
+    if out["aborted"] or usage is None:
+        # Gemini repeats usageMetadata on every chunk, so its prompt count is exact even mid-stream.
+        usage = estimated_usage((usage or {}).get("prompt_tokens") or prompt_tokens, out["chars"])
+    data['usage'] = usage
+    data['timing'] = timer.as_dict()
+    data['stream'] = {k: out[k] for k in ("aborted", "chars", "first_verdict_sec")}
+    return data
+
+def call_openrouter_batched(queries: List[str], images: List[Path], prompt_type: str, model: str, image_profile: str = "original", stream: bool = False, verdict_only: bool = False) -> Dict[str, Any]:
     if not OPENROUTER_API_KEY:
         raise RuntimeError("OPENROUTER_API_KEY is not set")
         
@@ -307,10 +349,13 @@ def call_openrouter_batched(queries: List[str], images: List[Path], prompt_type:
     
     queries_formatted = "\n".join([f"{i+1}. \"{q}\"" for i, q in enumerate(queries)])
     prompt = get_prompt(prompt_type, queries_formatted)
+    if verdict_only:
+        prompt += verdict_only_suffix(prompt_type)
     
+    timer = CallTimer()
     content = [{"type": "text", "text": prompt}]
     for img_path in images:
-        data_url = image_to_data_url(img_path)
+        data_url = image_to_data_url(img_path, image_profile)
         if data_url:
             content.append({
                 "type": "image_url",
@@ -328,11 +373,15 @@ def call_openrouter_batched(queries: List[str], images: List[Path], prompt_type:
         ],
         "response_format": { "type": "json_object" }
     }
+    if stream:
+        payload["stream"] = True
     
+    timer.lap("upload")
     t0 = time.time()
     for attempt in range(3):
+        timer.attempt()
         try:
-            resp = requests.post(url, headers=headers, json=payload, timeout=180)
+            resp = requests.post(url, headers=headers, json=payload, timeout=180, stream=stream)
             if resp.status_code == 429:
                 print(f"  Rate limited. Sleeping 10s...")
                 time.sleep(10)
@@ -348,7 +397,10 @@ def call_openrouter_batched(queries: List[str], images: List[Path], prompt_type:
     else:
         raise RuntimeError(f"Failed to call OpenRouter after 3 attempts")
         
+    if stream:
+        return finish_stream(resp, "openrouter", queries, t0, timer, prompt_token_estimate(prompt, images, image_profile, "openrouter"))
     latency = time.time() - t0
+    timer.lap("model_time")
     
     body = resp.json()
     choices = body.get('choices', [])
@@ -359,16 +411,22 @@ def call_openrouter_batched(queries: List[str], images: List[Path], prompt_type:
     
     try:
         data = json.loads(content_str)
+        timer.lap("parse")
         data['latency_sec'] = round(latency, 2)
+        data['usage'] = usage_from_response(body)
+        data['timing'] = timer.as_dict()
         return data
     except json.JSONDecodeError:
+        timer.lap("parse")
         return {
             "audit_reasoning": f"Failed to parse JSON. Raw content: {content_str}",
             "results": [{"query_index": i+1, "match": 0, "confidence": 0, "evidence": "PARSE FAILURE"} for i in range(len(queries))],
-            "latency_sec": round(latency, 2)
+            "latency_sec": round(latency, 2),
+            "usage": usage_from_response(body),
+            "timing": timer.as_dict()
         }
 
-def call_gemini_direct(queries: List[str], images: List[Path], prompt_type: str, model: str) -> Dict[str, Any]:
+def call_gemini_direct(queries: List[str], images: List[Path], prompt_type: str, model: str, image_profile: str = "original", stream: bool = False, verdict_only: bool = False) -> Dict[str, Any]:
     if not GEMINI_API_KEY:
         raise RuntimeError("GEMINI_API_KEY is not set")
         
@@ -379,21 +437,25 @@ def call_gemini_direct(queries: List[str], images: List[Path], prompt_type: str,
     if google_model.endswith(":free"):
         google_model = google_model.replace(":free", "")
 
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{google_model}:generateContent?key={GEMINI_API_KEY}"
+    action = "streamGenerateContent?alt=sse&" if stream else "generateContent?"
+    url = f"https://generativelanguage.googleapis.com/v1beta/models/{google_model}:{action}key={GEMINI_API_KEY}"
     headers = {
         "Content-Type": "application/json",
     }
     
     queries_formatted = "\n".join([f"{i+1}. \"{q}\"" for i, q in enumerate(queries)])
     prompt = get_prompt(prompt_type, queries_formatted)
+    if verdict_only:
+        prompt += verdict_only_suffix(prompt_type)
     
+    timer = CallTimer()
     parts = [{"text": prompt}]
     for img_path in images:
-        b64 = image_to_base64(img_path)
+        b64 = image_to_base64(img_path, image_profile)
         if b64:
             parts.append({
                 "inline_data": {
-                    "mime_type": "image/png",
+                    "mime_type": image_mime(image_profile),
                     "data": b64
                 }
             })
@@ -406,10 +468,12 @@ def call_gemini_direct(queries: List[str], images: List[Path], prompt_type: str,
         }
     }
     
+    timer.lap("upload")
     t0 = time.time()
     for attempt in range(5):
+        timer.attempt()
         try:
-            resp = requests.post(url, headers=headers, json=payload, timeout=180)
+            resp = requests.post(url, headers=headers, json=payload, timeout=180, stream=stream)
             if resp.status_code == 429:
                 print(f"  Rate limited (Google). Sleeping 15s...")
                 time.sleep(15)
@@ -421,6 +485,8 @@ def call_gemini_direct(queries: List[str], images: List[Path], prompt_type: str,
                 print(f"  Google Error {resp.status_code}: {resp.text}")
                 time.sleep(10)
                 continue
+            if stream:
+                break
             
             res = resp.json()
             if 'candidates' not in res or not res['candidates']:
@@ -436,17 +502,27 @@ def call_gemini_direct(queries: List[str], images: List[Path], prompt_type: str,
     else:
         raise RuntimeError(f"Failed to call Gemini after 5 attempts")
 
+    if stream:
+        return finish_stream(resp, "gemini", queries, t0, timer, prompt_token_estimate(prompt, images, image_profile, "gemini"))
+
     latency = time.time() - t0
+    timer.lap("model_time")
     
     try:
         data = json.loads(content_str)
+        timer.lap("parse")
         data['latency_sec'] = round(latency, 2)
+        data['usage'] = usage_from_response(res)
+        data['timing'] = timer.as_dict()
         return data
     except json.JSONDecodeError:
+        timer.lap("parse")
         return {
             "audit_reasoning": f"Failed to parse JSON. Raw content: {content_str}",
             "results": [{"query_index": i+1, "match": 0, "confidence": 0, "evidence": "PARSE FAILURE"} for i in range(len(queries))],
-            "latency_sec": round(latency, 2)
+            "latency_sec": round(latency, 2),
+            "usage": usage_from_response(res),
+            "timing": timer.as_dict()
         }
 
 def main():
@@ -456,7 +532,10 @@ def main():
     parser.add_argument("--n", type=int, default=0, help="Number of pairs to run (0 for all)")
     parser.add_argument("--output", required=True)
     parser.add_argument("--specimen_dir", default="specimens_v3")
+    parser.add_argument("--image-profile", choices=list(PROFILES), default="original", help="Specimen payload encoding (see image_payload.py)")
     parser.add_argument("--pool", default="candidate_pool.medium.v1.json")
+    parser.add_argument("--stream", action="store_true", help="Stream judge responses and stop once every query has a verdict")
+    parser.add_argument("--verdict-only", action="store_true", help="Ask for verdicts before the reasoning and skip the reasoning (implies --stream)")
     args = parser.parse_args()
 
     data_dir = Path("research/ab-eval/data")
@@ -496,6 +575,10 @@ def main():
         pairs = pairs[:args.n]
 
     results = []
+    ledger = UsageLedger(run_id=Path(args.output).stem)
+    telemetry = Telemetry(run_id=ledger.run_id)
+    stream = args.stream or args.verdict_only
+    streams_aborted = 0
     
     # Group by font to save on image loading/batches
     font_to_qids = {}
@@ -532,9 +615,15 @@ def main():
                 current_prompt_type = "v3_4"
             
             if args.model.startswith("gemini") or "google/" in args.model:
-                resp = call_gemini_direct(batch_texts, images, current_prompt_type, args.model)
+                provider = "gemini"
+                resp = call_gemini_direct(batch_texts, images, current_prompt_type, args.model, args.image_profile, stream, args.verdict_only)
             else:
-                resp = call_openrouter_batched(batch_texts, images, current_prompt_type, args.model)
+                provider = "openrouter"
+                resp = call_openrouter_batched(batch_texts, images, current_prompt_type, args.model, args.image_profile, stream, args.verdict_only)
+            if resp.get("stream", {}).get("aborted"):
+                streams_aborted += 1
+            ledger.add(resp, args.model, current_prompt_type + ("+verdict_only" if args.verdict_only else ""), args.specimen_dir if render_v3 else "specimens_v2_medium_nobias", n_queries=len(batch_texts))
+            telemetry.record(resp, provider, args.model, n_queries=len(batch_texts))
             
             res_map = {r['query_index']: r for r in resp.get('results', [])}
             
@@ -558,35 +647,33 @@ def main():
         print(" Done")
 
     # Calculate metrics
-    tp = fp = fn = tn = 0
-    for r in results:
-        h = r["human_match"]
-        a = r["ai_match"]
-        if h == 1 and a == 1: tp += 1
-        elif h == 0 and a == 1: fp += 1
-        elif h == 1 and a == 0: fn += 1
-        elif h == 0 and a == 0: tn += 1
-    
-    total = len(results)
-    agreement = (tp + tn) / total if total > 0 else 0
-    precision = tp / (tp + fp) if (tp + fp) > 0 else 0
-    recall = tp / (tp + fn) if (tp + fn) > 0 else 0
-    f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
+    arrays = pairs_to_arrays(results)
+    metrics = compute_metrics(arrays["y_true"], arrays["y_pred"], digits=None)
+    agreement, precision, recall, f1 = (metrics[k] for k in ("agreement", "precision", "recall", "f1"))
 
     final_output = {
         "exp": args.exp,
         "prompt_type": prompt_type,
         "render_v3": render_v3,
+        "image_profile": args.image_profile,
         "agreement": agreement,
         "precision": precision,
         "recall": recall,
         "f1": f1,
-        "counts": {"tp": tp, "fp": fp, "fn": fn, "tn": tn, "total": total},
+        "counts": metrics["counts"],
         "details": results
     }
+    if stream:
+        final_output["stream"] = True
+        final_output["verdict_only"] = args.verdict_only
 
     with open(out_dir / args.output, "w") as f:
         json.dump(final_output, f, indent=2)
+    write_sidecar(out_dir / args.output, final_output)
+    ledger.write(out_dir / args.output)
+    telemetry.write(out_dir / args.output)
+    if stream:
+        print(f"Streaming: {streams_aborted}/{len(telemetry.events)} calls closed before the model finished")
     
     print("\n" + "="*40)
     print(f"RESULTS: {args.exp}")
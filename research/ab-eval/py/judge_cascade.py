@@ -0,0 +1,501 @@
+"""
+Confidence-gated judge cascade for (query, font) pair judging
+
+A cheap judge (a fast model, or any earlier run of one) decides every pair
+first. Pairs whose cheap verdict is missing or whose confidence falls inside
+the escalation band (`confidence < escalate_below`) are re-judged by the
+expensive model; all other pairs keep the cheap verdict. Escalated pairs are
+re-packed per font, so the expensive model still sees one specimen upload
+per pack.
+
+- `calibrate` picks the band offline from two runs over the same SSoT pairs
+  (e.g. `g3_v3_gated_raw.json` vs `g3_pro_v3_gated_raw.json`): the lowest
+  threshold whose final verdicts stay within tolerance of the all-expensive
+  baseline, both in flips and in SSoT agreement. Query-level k-fold CV
+  reports how that choice holds up on unseen queries. The result is saved as
+  a cascade profile that `run` reads.
+- `simulate` applies a fixed band to the two runs and reports escalation
+  rate, expensive calls, cost, latency and agreement.
+- `run` executes the cascade live against the judge APIs.
+
+Cost and latency are per judge call (image upload + response). Defaults are
+relative units (expensive call = 1.0); pass measured per-call figures, or
+rows carrying `latency_sec`, for absolute numbers. `run` also meters every
+call's tokens per model (`usage_accounting.UsageLedger`) and writes them to
+`<output stem>.usage`; the results' `cascade.usage` and `cascade.cost_usd`
+are those measured figures (calls made by this invocation, not resumed ones).
+
+Usage:
+    python research/ab-eval/py/judge_cascade.py calibrate --cheap-results research/ab-eval/out/g3_v3_gated_raw.json --expensive-results research/ab-eval/out/g3_pro_v3_gated_raw.json
+    python research/ab-eval/py/judge_cascade.py simulate --cheap-results ... --expensive-results ... --escalate-below 0.95
+    python research/ab-eval/py/judge_cascade.py run --cheap-model gemini-3-flash-preview --expensive-model gemini-3-pro-preview --output cascade_v3_results.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import re
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from metrics_kernel import compute_metrics, gate_predictions
+from query_packing import JudgeFn, budget_pack_size, gemini_judge, load_ssot_pairs, plan_packs, resolve_pack_size
+from results_columnar import write_sidecar
+from usage_accounting import UsageLedger
+
+OUT_DIR = Path("research/ab-eval/out")
+SSOT_PATH = OUT_DIR / "full_set_review_export_1770612809775.json"
+QUERIES_PATH = Path("research/ab-eval/data/queries.medium.human.v1.json")
+
+DEFAULT_GATE = 0.9
+DEFAULT_MAX_AGREEMENT_DROP = 0.01
+DEFAULT_MAX_FLIP_RATE = 0.03
+DEFAULT_CHEAP_CALL_COST = 0.1
+DEFAULT_EXPENSIVE_CALL_COST = 1.0
+
+Key = Tuple[str, str]  # (query_id, font_name)
+
+
+# ---------------------------------------------------------------------------
+# Cascade policy
+# ---------------------------------------------------------------------------
+
+def escalation_mask(cheap_conf: np.ndarray, cheap_present: np.ndarray, escalate_below: float) -> np.ndarray:
+    """Pairs the expensive model must judge: no cheap verdict, or cheap confidence below the band edge."""
+    return ~cheap_present | (cheap_conf < escalate_below)
+
+
+def count_calls(keys: Sequence[Key], mask: np.ndarray, pack_size: int) -> int:
+    """Judge calls needed for the masked pairs when packed per font."""
+    per_font: Dict[str, int] = {}
+    for (qid, font), m in zip(keys, mask):
+        if m:
+            per_font[font] = per_font.get(font, 0) + 1
+    return sum(len(plan_packs(range(n), pack_size)) for n in per_font.values())
+
+
+def load_rows(path: str) -> Dict[Key, Dict[str, Any]]:
+    """Raw runner rows (list, or a metrics file with `details`) keyed by (query_id, font_name)."""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    rows = data["details"] if isinstance(data, dict) else data
+    return {(r["query_id"], r["font_name"]): r for r in rows}
+
+
+class PairedRuns:
+    """Cheap and expensive verdicts aligned on the SSoT pairs the expensive run covers."""
+
+    def __init__(self, cheap: Dict[Key, Dict[str, Any]], expensive: Dict[Key, Dict[str, Any]],
+                 ssot_map: Dict[Key, int], gate: float):
+        self.keys = sorted(k for k in expensive if k in ssot_map)
+        self.y_true = np.array([ssot_map[k] for k in self.keys])
+        self.cheap_present = np.array([k in cheap for k in self.keys], dtype=bool)
+        self.cheap_conf = np.array([float(cheap[k].get("confidence", 0)) if k in cheap else 0.0 for k in self.keys])
+        self.cheap_pred = gate_predictions(
+            np.array([cheap[k].get("ai_match", 0) if k in cheap else 0 for k in self.keys]), self.cheap_conf, gate)
+        exp_conf = np.array([float(expensive[k].get("confidence", 0)) for k in self.keys])
+        self.exp_pred = gate_predictions(np.array([expensive[k].get("ai_match", 0) for k in self.keys]), exp_conf, gate)
+        self.cheap_latency = [cheap[k].get("latency_sec") for k in self.keys if k in cheap]
+        self.exp_latency = [expensive[k].get("latency_sec") for k in self.keys]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+def mean_call_latency(values: List[Any]) -> Optional[float]:
+    vals = [float(v) for v in values if v is not None]
+    return float(np.mean(vals)) if vals else None
+
+
+def evaluate(runs: PairedRuns, escalate_below: float, pack_size: int, cheap_cost: float, expensive_cost: float,
+             cheap_latency: Optional[float], expensive_latency: Optional[float],
+             subset: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    """Cascade vs all-expensive baseline for one band edge (optionally on a subset of pairs)."""
+    idx = np.arange(len(runs)) if subset is None else np.flatnonzero(subset)
+    keys = [runs.keys[i] for i in idx]
+    escalate = escalation_mask(runs.cheap_conf[idx], runs.cheap_present[idx], escalate_below)
+    final = np.where(escalate, runs.exp_pred[idx], runs.cheap_pred[idx])
+    y_true = runs.y_true[idx]
+
+    everyone = np.ones(len(idx), dtype=bool)
+    cheap_calls = count_calls(keys, runs.cheap_present[idx], pack_size)
+    exp_calls = count_calls(keys, escalate, pack_size)
+    baseline_calls = count_calls(keys, everyone, pack_size)
+
+    cascade_m = compute_metrics(y_true, final)
+    baseline_m = compute_metrics(y_true, runs.exp_pred[idx])
+    cascade_cost = cheap_calls * cheap_cost + exp_calls * expensive_cost
+    baseline_cost = baseline_calls * expensive_cost
+    row = {
+        "escalate_below": float(escalate_below) if np.isfinite(escalate_below) else None,  # None = escalate all
+        "pairs": int(len(idx)),
+        "escalated": int(escalate.sum()),
+        "escalation_rate": round(float(escalate.mean()), 4) if len(idx) else 0.0,
+        "cheap_calls": cheap_calls,
+        "expensive_calls": exp_calls,
+        "baseline_calls": baseline_calls,
+        "cost": round(cascade_cost, 4),
+        "baseline_cost": round(baseline_cost, 4),
+        "cost_saved": round(1 - cascade_cost / baseline_cost, 4) if baseline_cost else 0.0,
+        "flip_rate_vs_expensive": round(float((final != runs.exp_pred[idx]).mean()), 4) if len(idx) else 0.0,
+        "agreement": cascade_m["agreement"],
+        "f1": cascade_m["f1"],
+        "baseline_agreement": baseline_m["agreement"],
+        "agreement_delta": round(cascade_m["agreement"] - baseline_m["agreement"], 4),
+    }
+    if cheap_latency is not None and expensive_latency is not None:
+        cascade_s = cheap_calls * cheap_latency + exp_calls * expensive_latency
+        baseline_s = baseline_calls * expensive_latency
+        row.update({
+            "call_seconds": round(cascade_s, 1),
+            "baseline_call_seconds": round(baseline_s, 1),
+            "latency_saved": round(1 - cascade_s / baseline_s, 4) if baseline_s else 0.0,
+        })
+    return row
+
+
+def within_tolerance(row: Dict[str, Any], max_agreement_drop: float, max_flip_rate: float) -> bool:
+    return -row["agreement_delta"] <= max_agreement_drop and row["flip_rate_vs_expensive"] <= max_flip_rate
+
+
+def select_band(table: List[Dict[str, Any]], max_agreement_drop: float, max_flip_rate: float) -> float:
+    """Lowest band edge (fewest escalations) within tolerance; 'escalate everything' when none is."""
+    for row in sorted(table, key=lambda r: r["escalate_below"]):
+        if within_tolerance(row, max_agreement_drop, max_flip_rate):
+            return row["escalate_below"]
+    return float("inf")
+
+
+def candidate_bands(runs: PairedRuns) -> List[float]:
+    """Every distinct cheap confidence is a band edge candidate, plus 0 (never escalate on confidence)."""
+    return sorted(set([0.0] + [float(c) for c in np.unique(runs.cheap_conf[runs.cheap_present])]))
+
+
+# ---------------------------------------------------------------------------
+# Profiles
+# ---------------------------------------------------------------------------
+
+def profile_path(cheap_model: str, expensive_model: str, out_dir: Path = OUT_DIR) -> Path:
+    slug = lambda m: re.sub(r"[^A-Za-z0-9]+", "_", m).strip("_").lower()
+    return out_dir / f"judge_cascade_profile_{slug(cheap_model)}__{slug(expensive_model)}.json"
+
+
+def resolve_band(value: str, cheap_model: str, expensive_model: str, default: float = 0.95) -> float:
+    """`--escalate-below` value -> float; "auto" reads the calibrated cascade profile."""
+    if str(value).lower() != "auto":
+        return float(value)
+    path = profile_path(cheap_model, expensive_model)
+    if not path.exists():
+        print(f"No cascade profile at {path}; escalating below {default}")
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        band = json.load(f)["escalate_below"]
+    band = float("inf") if band is None else float(band)
+    print(f"Using calibrated band (escalate below {band}) from {path}")
+    return band
+
+
+# ---------------------------------------------------------------------------
+# Live cascade
+# ---------------------------------------------------------------------------
+
+def openrouter_judge(model: str, spec_dir: Path, ledger: Optional[UsageLedger] = None) -> JudgeFn:
+    from run_phase2_comparisons import call_openrouter_v3
+
+    def judge(font: str, texts: List[str]) -> List[Optional[Dict[str, Any]]]:
+        safe = font.replace(" ", "_")
+        images = [spec_dir / f"{safe}_top.png", spec_dir / f"{safe}_bottom.png"]
+        resp = call_openrouter_v3(texts, images, model)
+        if ledger is not None:
+            ledger.add(resp, model, "v3", spec_dir.name, n_queries=len(texts))
+        if "error" in resp:
+            print(f"    {font}: {resp['error']}")
+            return [None] * len(texts)
+        by_index = {m.get("query_index"): m for m in resp.get("results", [])}
+        return [by_index.get(i + 1) for i in range(len(texts))]
+
+    return judge
+
+
+def make_judge(model: str, prompt: str, spec_dir: Path, keys_file: str, ledger: Optional[UsageLedger] = None) -> JudgeFn:
+    """Gemini models go to the Gemini API with `prompt`; anything else to OpenRouter (v3 prompt). Usage goes to `ledger`."""
+    if model.startswith("gemini"):
+        return gemini_judge(model, prompt, spec_dir, keys_file, ledger)
+    return openrouter_judge(model, spec_dir, ledger)
+
+
+def timed(judge: JudgeFn, font: str, texts: List[str]) -> Tuple[List[Optional[Dict[str, Any]]], float]:
+    t0 = time.time()
+    out = judge(font, texts)
+    return out, round(time.time() - t0, 2)
+
+
+def run_cascade(cheap: JudgeFn, expensive: JudgeFn, font_queries: Dict[str, List[str]], query_text: Dict[str, str],
+                escalate_below: float, pack_size: int, cache_path: Path) -> List[Dict[str, Any]]:
+    """Judges every pair with `cheap`, escalates per font, and checkpoints rows per font to `cache_path`."""
+    results: List[Dict[str, Any]] = []
+    done_fonts = set()
+    if cache_path.exists():
+        with open(cache_path, "r", encoding="utf-8") as f:
+            results = json.load(f)
+        done_fonts = {r["font_name"] for r in results}
+        print(f"Resuming from cache, {len(done_fonts)} fonts already processed.")
+
+    fonts = [f for f in sorted(font_queries) if f not in done_fonts]
+    for n, font in enumerate(fonts):
+        qids = font_queries[font]
+        print(f"[{n}/{len(fonts)}] {font} ({len(qids)} pairs)...", end="", flush=True)
+        rows: Dict[str, Dict[str, Any]] = {}
+        for i, pack in enumerate(plan_packs(qids, pack_size)):
+            verdicts, latency = timed(cheap, font, [query_text[q] for q in pack])
+            for qid, v in zip(pack, verdicts):
+                rows[qid] = {
+                    "query_id": qid,
+                    "font_name": font,
+                    "judge": "cheap",
+                    "escalated": False,
+                    "cheap_pack": i,
+                    "cheap_match": v.get("match", 0) if v else None,
+                    "cheap_confidence": v.get("confidence", 0) if v else None,
+                    "ai_match": v.get("match", 0) if v else 0,
+                    "confidence": v.get("confidence", 0) if v else 0,
+                    "evidence": v.get("evidence", "") if v else "",
+                    "cheap_latency_sec": latency,
+                }
+
+        escalate = [q for q in qids if rows[q]["cheap_confidence"] is None or rows[q]["cheap_confidence"] < escalate_below]
+        for i, pack in enumerate(plan_packs(escalate, pack_size)):
+            verdicts, latency = timed(expensive, font, [query_text[q] for q in pack])
+            for qid, v in zip(pack, verdicts):
+                # The call is paid for whether or not it returned a verdict for this pair
+                rows[qid].update({"escalated": True, "expensive_pack": i, "expensive_latency_sec": latency})
+                if v is None:
+                    continue  # keep the cheap verdict; `judge` stays "cheap"
+                rows[qid].update({
+                    "judge": "expensive",
+                    "ai_match": v.get("match", 0),
+                    "confidence": v.get("confidence", 0),
+                    "evidence": v.get("evidence", ""),
+                })
+        results.extend(rows[q] for q in qids)
+        print(f" {len(escalate)} escalated")
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def load_paired(args) -> PairedRuns:
+    ssot_map, _ = load_ssot_pairs(Path(args.ssot))
+    return PairedRuns(load_rows(args.cheap_results), load_rows(args.expensive_results), ssot_map, args.gate)
+
+
+def latencies(args, runs: PairedRuns) -> Tuple[Optional[float], Optional[float]]:
+    cheap = args.cheap_call_latency if args.cheap_call_latency is not None else mean_call_latency(runs.cheap_latency)
+    exp = args.expensive_call_latency if args.expensive_call_latency is not None else mean_call_latency(runs.exp_latency)
+    return cheap, exp
+
+
+def print_table(table: List[Dict[str, Any]], selected: Optional[float] = None) -> None:
+    print(f"\n{'Band <':>7} | {'Esc':>6} | {'Exp calls':>9} | {'Cost saved':>10} | {'Flip':>6} | {'Agree':>6} | {'Delta':>7}")
+    print("-" * 70)
+    for r in table:
+        mark = "  <- selected" if selected is not None and r["escalate_below"] == selected else ""
+        edge = "all" if r["escalate_below"] is None else f"{r['escalate_below']:.3f}"
+        print(f"{edge:>7} | {r['escalation_rate']:>6.3f} | {r['expensive_calls']:>4}/{r['baseline_calls']:<4} | "
+              f"{r['cost_saved']:>10.3f} | {r['flip_rate_vs_expensive']:>6.3f} | {r['agreement']:>6.4f} | "
+              f"{r['agreement_delta']:>+7.4f}{mark}")
+
+
+def cmd_calibrate(args) -> None:
+    runs = load_paired(args)
+    cheap_latency, exp_latency = latencies(args, runs)
+    bands = candidate_bands(runs)
+    common = (args.pack_size, args.cheap_call_cost, args.expensive_call_cost, cheap_latency, exp_latency)
+    print(f"Calibrating cascade band on {len(runs)} SSoT pairs ({int(runs.cheap_present.sum())} with a cheap verdict)")
+
+    table = [evaluate(runs, b, *common) for b in bands]
+    selected = select_band(table, args.max_agreement_drop, args.max_flip_rate)
+    for r in table:
+        r["safe"] = within_tolerance(r, args.max_agreement_drop, args.max_flip_rate)
+    print_table(table, selected)
+
+    # Query-level k-fold: choose the band on train queries, score it on held-out queries
+    queries = sorted({q for q, _ in runs.keys})
+    random.Random(args.seed).shuffle(queries)
+    folds = [set(queries[i::args.folds]) for i in range(args.folds)]
+    query_col = np.array([q for q, _ in runs.keys])
+    cv = []
+    for fold in folds:
+        test = np.isin(query_col, list(fold))
+        train_table = [evaluate(runs, b, *common, subset=~test) for b in bands]
+        band = select_band(train_table, args.max_agreement_drop, args.max_flip_rate)
+        cv.append(evaluate(runs, band, *common, subset=test))
+    cv_summary = {k: round(float(np.mean([r[k] for r in cv])), 4)
+                  for k in ("escalation_rate", "cost_saved", "flip_rate_vs_expensive", "agreement_delta")}
+    print(f"\n{args.folds}-fold CV (by query): {json.dumps(cv_summary)}")
+
+    chosen = next((r for r in table if r["escalate_below"] == selected), None)
+    if chosen is None:
+        print("\nNo band within tolerance: the cheap judge should not decide any pair on its own.")
+    else:
+        print(f"\nSelected: escalate below {selected} -> escalation {chosen['escalation_rate']:.1%}, "
+              f"cost saved {chosen['cost_saved']:.1%}, agreement {chosen['agreement_delta']:+.4f} vs all-expensive")
+
+    profile = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "cheap_model": args.cheap_model,
+        "expensive_model": args.expensive_model,
+        "cheap_results": args.cheap_results,
+        "expensive_results": args.expensive_results,
+        "gate": args.gate,
+        "pack_size": args.pack_size,
+        "call_cost": {"cheap": args.cheap_call_cost, "expensive": args.expensive_call_cost},
+        "call_latency_sec": {"cheap": cheap_latency, "expensive": exp_latency},
+        "tolerances": {"max_agreement_drop": args.max_agreement_drop, "max_flip_rate": args.max_flip_rate},
+        "sweep": table,
+        "cv": {"folds": args.folds, "seed": args.seed, "mean": cv_summary, "per_fold": cv},
+        "escalate_below": None if chosen is None else selected,
+        "selected": chosen,
+    }
+    path = Path(args.out) if args.out else profile_path(args.cheap_model, args.expensive_model)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+    print(f"Saved cascade profile to {path}")
+
+
+def cmd_simulate(args) -> None:
+    runs = load_paired(args)
+    cheap_latency, exp_latency = latencies(args, runs)
+    band = resolve_band(args.escalate_below, args.cheap_model, args.expensive_model)
+    row = evaluate(runs, band, args.pack_size, args.cheap_call_cost, args.expensive_call_cost, cheap_latency, exp_latency)
+    print_table([row])
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(row, f, indent=2)
+        print(f"Saved to {args.out}")
+
+
+def cmd_run(args) -> None:
+    ssot_map, font_queries = load_ssot_pairs(Path(args.ssot))
+    with open(args.queries, "r", encoding="utf-8") as f:
+        query_text = {q["id"]: q["text"] for q in json.load(f)}
+    spec_dir = OUT_DIR / args.spec_dir
+    font_queries = {
+        f: qs for f, qs in font_queries.items()
+        if (spec_dir / f"{f.replace(' ', '_')}_top.png").exists() and (spec_dir / f"{f.replace(' ', '_')}_bottom.png").exists()
+    }
+    if args.max_fonts:
+        font_queries = dict(sorted(font_queries.items())[:args.max_fonts])
+
+    band = resolve_band(args.escalate_below, args.cheap_model, args.expensive_model)
+    pack_size = min(resolve_pack_size(args.pack_size, args.expensive_model, args.prompt),
+                    budget_pack_size(list(query_text.values())))
+    print(f"Cascade: {args.cheap_model} -> {args.expensive_model} below {band} | Prompt={args.prompt} | Pack<={pack_size}")
+
+    ledger = UsageLedger(run_id=Path(args.output).stem)
+    cheap = make_judge(args.cheap_model, args.prompt, spec_dir, args.keys_file, ledger)
+    expensive = make_judge(args.expensive_model, args.prompt, spec_dir, args.keys_file, ledger)
+    cache_path = OUT_DIR / f"{Path(args.output).stem}_raw.json"
+    results = run_cascade(cheap, expensive, font_queries, query_text, band, pack_size, cache_path)
+
+    keys = [(r["query_id"], r["font_name"]) for r in results]
+    escalated = np.array([r["escalated"] for r in results], dtype=bool)
+    metrics = compute_metrics([ssot_map[k] for k in keys], [r["ai_match"] for r in results],
+                              confidence=[r["confidence"] for r in results], gates=[args.gate])
+    # One entry per call actually made (font, pack index) -> latency; failed escalations included
+    cheap_packs = {(r["font_name"], r["cheap_pack"]): r["cheap_latency_sec"] for r in results}
+    exp_packs = {(r["font_name"], r["expensive_pack"]): r["expensive_latency_sec"] for r in results if r["escalated"]}
+    cheap_calls, exp_calls = len(cheap_packs), len(exp_packs)
+    metrics["cascade"] = {
+        "cheap_model": args.cheap_model,
+        "expensive_model": args.expensive_model,
+        "escalate_below": band,
+        "escalation_rate": round(float(escalated.mean()), 4) if len(results) else 0.0,
+        "escalations_failed": sum(1 for r in results if r["escalated"] and r["judge"] != "expensive"),
+        "cheap_calls": cheap_calls,
+        "expensive_calls": exp_calls,
+        "baseline_calls": cheap_calls,
+        "cost": round(cheap_calls * args.cheap_call_cost + exp_calls * args.expensive_call_cost, 4),
+        "baseline_cost": round(cheap_calls * args.expensive_call_cost, 4),
+        "cheap_call_seconds": round(sum(cheap_packs.values()), 1),
+        "expensive_call_seconds": round(sum(exp_packs.values()), 1),
+    }
+    # Measured tokens/cost per model; `cost` above stays in --*-call-cost units
+    usage = ledger.summary()
+    metrics["cascade"]["usage"] = {
+        g["model"]: {k: g[k] for k in ("calls", "errors", "prompt_tokens", "completion_tokens", "total_tokens", "cost_usd")}
+        for g in usage["groups"]
+    }
+    metrics["cascade"]["cost_usd"] = usage["totals"]["cost_usd"]
+    metrics["details"] = results
+    final_path = OUT_DIR / args.output
+    with open(final_path, "w", encoding="utf-8") as f:
+        json.dump(metrics, f, indent=2)
+    write_sidecar(final_path, metrics)
+    ledger.write(final_path)
+
+    gated = metrics["gated"][str(args.gate)]
+    c = metrics["cascade"]
+    print(f"\nAgreement (gate {args.gate}): {gated['agreement']:.4f} | F1 {gated['f1']:.4f}")
+    print(f"Escalated {c['escalation_rate']:.1%} of pairs; expensive calls {c['expensive_calls']}/{c['baseline_calls']}")
+    print(f"Saved to {final_path}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Confidence-gated cheap -> expensive judge cascade")
+    parser.add_argument("--ssot", default=str(SSOT_PATH))
+    parser.add_argument("--queries", default=str(QUERIES_PATH))
+    parser.add_argument("--cheap-model", default="gemini-3-flash-preview")
+    parser.add_argument("--expensive-model", default="gemini-3-pro-preview")
+    parser.add_argument("--gate", type=float, default=DEFAULT_GATE, help="Confidence gate applied to final verdicts")
+    parser.add_argument("--cheap-call-cost", type=float, default=DEFAULT_CHEAP_CALL_COST)
+    parser.add_argument("--expensive-call-cost", type=float, default=DEFAULT_EXPENSIVE_CALL_COST)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    for name, help_text in (("calibrate", "Pick the escalation band from paired cheap/expensive runs"),
+                            ("simulate", "Score a fixed band on paired cheap/expensive runs")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--cheap-results", required=True, help="Raw rows or metrics file from the cheap judge")
+        p.add_argument("--expensive-results", required=True, help="Raw rows or metrics file from the expensive judge")
+        p.add_argument("--pack-size", type=int, default=10, help="Queries per call when counting calls")
+        p.add_argument("--cheap-call-latency", type=float, default=None, help="Seconds per cheap call (default: rows' latency_sec)")
+        p.add_argument("--expensive-call-latency", type=float, default=None, help="Seconds per expensive call")
+        p.add_argument("--out", default="")
+        if name == "calibrate":
+            p.add_argument("--max-agreement-drop", type=float, default=DEFAULT_MAX_AGREEMENT_DROP)
+            p.add_argument("--max-flip-rate", type=float, default=DEFAULT_MAX_FLIP_RATE)
+            p.add_argument("--folds", type=int, default=5)
+            p.add_argument("--seed", type=int, default=42)
+        else:
+            p.add_argument("--escalate-below", default="auto", help="Band edge, or 'auto' for the calibrated profile")
+
+    p_run = sub.add_parser("run", help="Judge the SSoT pairs live with the cascade")
+    p_run.add_argument("--escalate-below", default="auto", help="Band edge, or 'auto' for the calibrated profile")
+    p_run.add_argument("--prompt", choices=["v3", "v3_2", "v3_3", "v3_4", "v4", "v5_1"], default="v3")
+    p_run.add_argument("--spec-dir", default="specimens_v3")
+    p_run.add_argument("--pack-size", default="10", help="Max queries per judge call, or 'auto' for the calibrated pack profile")
+    p_run.add_argument("--max-fonts", type=int, default=0)
+    p_run.add_argument("--keys-file", default="")
+    p_run.add_argument("--output", required=True)
+
+    args = parser.parse_args()
+    if args.cmd == "calibrate":
+        cmd_calibrate(args)
+    elif args.cmd == "simulate":
+        cmd_simulate(args)
+    else:
+        cmd_run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Shared pair-metrics kernel for judged (query, font) results
+
+Every runner scores the same thing: a binary AI verdict against a human label
+(after the 2 -> 0 remap where the runner applies it). This module computes the
+confusion matrix for aligned label/prediction arrays with one `np.bincount`
+over (variant, segment, cell), so the ungated result, any number of
+confidence-gated variants and a per-class breakdown come out of a single call.
+
+Conventions kept from the original per-script implementations:
+- Only rows with label in {0, 1} and prediction in {0, 1} enter TP/FP/FN/TN.
+- `denominator="all"` divides agreement by every row (production-trial parity:
+  non-binary labels still count in the denominator); `"binary"` divides by
+  TP + FP + FN + TN; an int overrides both (e.g. a run's declared total).
+- Rates are rounded to 4 decimals unless `digits=None`.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# Column order of the count arrays returned by confusion_matrix().
+TP, FP, FN, TN, N = range(5)
+COUNT_KEYS = ("tp", "fp", "fn", "tn")
+
+Denominator = Union[str, int]
+
+
+def remap_label(label: Any) -> int:
+    """Governance policy: non-binary label 2 is treated as 0 for primary metrics."""
+    if label == 2:
+        return 0
+    return 1 if label == 1 else 0
+
+
+def gate_predictions(ai_match: np.ndarray, confidence: np.ndarray, gate) -> np.ndarray:
+    """Matches below the confidence gate are treated as 0. `gate` may be a scalar or per-row array."""
+    return np.where((ai_match == 1) & (confidence >= gate), 1, 0)
+
+
+def confusion_matrix(
+    y_true: np.ndarray,
+    y_pred: np.ndarray,
+    segments: Optional[np.ndarray] = None,
+    n_segments: int = 1,
+) -> np.ndarray:
+    """
+    Counts per segment as an int array of shape (n_segments, 5): TP, FP, FN, TN, N.
+
+    `y_pred` may be 2-D (variants x rows); the result then has shape
+    (variants, n_segments, 5). N counts every row, including rows whose label or
+    prediction is not binary.
+    """
+    y_true = np.asarray(y_true)
+    y_pred = np.asarray(y_pred)
+    single = y_pred.ndim == 1
+    preds = y_pred[None, :] if single else y_pred
+    n_variants, n_rows = preds.shape
+
+    if segments is None:
+        segments = np.zeros(n_rows, dtype=np.int64)
+
+    # cell: 0 TP, 1 FP, 2 FN, 3 TN, 4 not binary
+    pos_label = y_true == 1
+    neg_label = y_true == 0
+    pos_pred = preds == 1
+    neg_pred = preds == 0
+    cell = np.full(preds.shape, 4, dtype=np.int64)
+    cell[pos_label & pos_pred] = TP
+    cell[neg_label & pos_pred] = FP
+    cell[pos_label & neg_pred] = FN
+    cell[neg_label & neg_pred] = TN
+
+    variant = np.arange(n_variants)[:, None]
+    flat = ((variant * n_segments + segments[None, :]) * 5 + cell).ravel()
+    hist = np.bincount(flat, minlength=n_variants * n_segments * 5).reshape(n_variants, n_segments, 5)
+
+    counts = np.empty_like(hist)
+    counts[..., :4] = hist[..., :4]
+    counts[..., N] = hist.sum(axis=-1)
+    return counts[0] if single else counts
+
+
+def metrics_from_counts(
+    tp: int,
+    fp: int,
+    fn: int,
+    tn: int,
+    total: int,
+    digits: Optional[int] = 4,
+) -> Dict[str, Any]:
+    """`digits=None` leaves the rates unrounded."""
+    tp, fp, fn, tn, total = int(tp), int(fp), int(fn), int(tn), int(total)
+    agreement = (tp + tn) / total if total > 0 else 0
+    precision = tp / (tp + fp) if (tp + fp) > 0 else 0
+    recall = tp / (tp + fn) if (tp + fn) > 0 else 0
+    f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
+
+    def r(v):
+        return v if digits is None else round(v, digits)
+
+    return {
+        "agreement": r(agreement),
+        "precision": r(precision),
+        "recall": r(recall),
+        "f1": r(f1),
+        "counts": {"tp": tp, "fp": fp, "fn": fn, "tn": tn, "total": total},
+    }
+
+
+def _resolve_total(row: np.ndarray, denominator: Denominator) -> int:
+    if isinstance(denominator, str):
+        if denominator == "all":
+            return int(row[N])
+        if denominator == "binary":
+            return int(row[:4].sum())
+        raise ValueError(f"Unknown denominator: {denominator}")
+    return int(denominator)
+
+
+def summarize(row: np.ndarray, denominator: Denominator = "all", digits: Optional[int] = 4) -> Dict[str, Any]:
+    """Metrics dict for one row of confusion_matrix() output."""
+    return metrics_from_counts(row[TP], row[FP], row[FN], row[TN], _resolve_total(row, denominator), digits)
+
+
+def compute_metrics(
+    y_true: Sequence,
+    y_pred: Sequence,
+    confidence: Optional[Sequence] = None,
+    gates: Iterable[float] = (),
+    classes: Optional[Sequence] = None,
+    denominator: Denominator = "all",
+    digits: Optional[int] = 4,
+) -> Dict[str, Any]:
+    """
+    Agreement/precision/recall/F1 + counts for aligned arrays in one vectorized pass.
+
+    - `gates`: confidence gates to evaluate alongside the raw predictions; results
+      appear under `gated["<gate>"]` (requires `confidence`).
+    - `classes`: per-row class labels (e.g. query class); adds `per_class` to the
+      ungated result and to every gated variant. An int `denominator` applies to
+      the overall figures only; per-class figures use `"all"`.
+    """
+    y_true = np.asarray(y_true)
+    y_pred = np.asarray(y_pred)
+    gates = list(gates)
+
+    variants = [y_pred]
+    if gates:
+        if confidence is None:
+            raise ValueError("confidence is required for gated variants")
+        conf = np.asarray(confidence, dtype=float)
+        variants.extend(gate_predictions(y_pred, conf, g) for g in gates)
+    preds = np.stack(variants) if len(y_pred) else np.zeros((len(variants), 0), dtype=np.int64)
+
+    if classes is not None:
+        class_names, segments = np.unique(np.asarray(classes, dtype=object).astype(str), return_inverse=True)
+    else:
+        class_names, segments = np.array(["all"]), np.zeros(len(y_true), dtype=np.int64)
+
+    per_segment = confusion_matrix(y_true, preds, segments, len(class_names))
+    overall = per_segment.sum(axis=1)
+    class_denominator = denominator if isinstance(denominator, str) else "all"
+
+    def build(v: int) -> Dict[str, Any]:
+        out = summarize(overall[v], denominator, digits)
+        if classes is not None:
+            out["per_class"] = {
+                str(name): summarize(per_segment[v, i], class_denominator, digits)
+                for i, name in enumerate(class_names)
+            }
+        return out
+
+    result = build(0)
+    if gates:
+        result["gated"] = {str(g): build(i + 1) for i, g in enumerate(gates)}
+    return result
+
+
+def pairs_to_arrays(
+    rows: List[Dict[str, Any]],
+    pred_key: str = "ai_match",
+    label_key: str = "human_match",
+    ssot_map: Optional[Dict[Tuple[str, str], int]] = None,
+    confidence_key: str = "confidence",
+    default_confidence: float = 1.0,
+) -> Dict[str, Any]:
+    """
+    Align result rows into label/prediction/confidence arrays.
+
+    With `ssot_map`, rows whose (query_id, font_name) is missing from the map are
+    dropped and labels come from the map; otherwise labels come from `label_key`.
+    `index` holds the positions of the kept rows in `rows`.
+    """
+    if ssot_map is not None:
+        index = [i for i, r in enumerate(rows) if (r["query_id"], r["font_name"]) in ssot_map]
+        labels = [ssot_map[(rows[i]["query_id"], rows[i]["font_name"])] for i in index]
+    else:
+        index = list(range(len(rows)))
+        labels = [rows[i][label_key] for i in index]
+
+    return {
+        "index": index,
+        "y_true": np.array(labels, dtype=object),
+        "y_pred": np.array([rows[i].get(pred_key, 0) for i in index], dtype=object),
+        "confidence": np.array([rows[i].get(confidence_key, default_confidence) for i in index], dtype=float),
+    }
+
+
+def sweep_confusion(
+    y_true: np.ndarray,
+    ai_match: np.ndarray,
+    conf: np.ndarray,
+    thresholds: np.ndarray,
+    segments: np.ndarray = None,
+    n_segments: int = None,
+) -> Dict[str, np.ndarray]:
+    """
+    TP/FP/FN/TN for every (segment, threshold) in a single pass.
+
+    Each item is predicted positive at threshold t iff ai_match == 1 and conf >= t,
+    i.e. for the first k thresholds where k = searchsorted(thresholds, conf, "right").
+    Histogramming k per (segment, label) and taking a reverse cumulative sum yields
+    the positive-prediction counts for all thresholds at once. `thresholds` must be
+    sorted ascending. Items whose label is neither 0 nor 1 are counted in `n_other`.
+    Returns arrays of shape (n_segments, len(thresholds)); counts are additive
+    across segments, so train splits can be derived by subtraction.
+    """
+    n_t = len(thresholds)
+    if segments is None:
+        segments = np.zeros(len(y_true), dtype=np.int64)
+    if n_segments is None:
+        n_segments = int(segments.max()) + 1 if len(segments) else 1
+
+    conf = np.asarray(conf, dtype=float)
+    k = np.searchsorted(thresholds, np.nan_to_num(conf, nan=-np.inf), side="right")
+    k = np.where(ai_match == 1, k, 0)
+    cls = np.where(y_true == 1, 1, np.where(y_true == 0, 0, 2))
+
+    flat = (segments * 3 + cls) * (n_t + 1) + k
+    hist = np.bincount(flat, minlength=n_segments * 3 * (n_t + 1)).reshape(n_segments, 3, n_t + 1)
+    predicted = np.cumsum(hist[:, :, ::-1], axis=2)[:, :, ::-1][:, :, 1:]
+    n_cls = hist.sum(axis=2)
+
+    tp = predicted[:, 1]
+    fp = predicted[:, 0]
+    return {
+        "tp": tp,
+        "fp": fp,
+        "fn": n_cls[:, 1, None] - tp,
+        "tn": n_cls[:, 0, None] - fp,
+        "n_other": n_cls[:, 2],
+    }
+
+
+def labeled_accuracy(counts: Dict[str, np.ndarray]) -> np.ndarray:
+    """Accuracy over items with a binary label (0/1), per segment and threshold."""
+    correct = counts["tp"] + counts["tn"]
+    labeled = correct + counts["fp"] + counts["fn"]
+    return np.divide(correct, labeled, out=np.zeros(correct.shape, dtype=float), where=labeled > 0)
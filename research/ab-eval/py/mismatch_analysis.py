@@ -3,6 +3,9 @@ import os
 from collections import defaultdict
 import numpy as np
 
+from bootstrap_ci import resample_weights
+from metrics_kernel import compute_metrics
+
 SSOT_PATH = "research/ab-eval/out/full_set_review_export_1770612809775.json"
 PREDICTIONS_PATH = "research/ab-eval/out/full_set_no_bias_gemini3flashpreview.json"
 QUERIES_PATH = "research/ab-eval/data/queries.medium.human.v1.json"
@@ -35,38 +38,29 @@ def analyze(results_path, label):
     for item in predictions_raw['details']:
         pred_map[(item['query_id'], item['font_name'])] = item['ai_match']
 
+    keys = [k for k in gt_map if k in pred_map]
+    gt = np.array([gt_map[k] for k in keys])
+    pred = np.array([pred_map[k] for k in keys])
+    m = compute_metrics(gt, pred, digits=None)
+    tp, fp, fn, tn, total = (m["counts"][c] for c in ("tp", "fp", "fn", "tn", "total"))
+    agreement, precision, recall, f1 = m["agreement"], m["precision"], m["recall"], m["f1"]
+
+    thought_map = {(p['query_id'], p['font_name']): p.get('thought', '') for p in predictions_raw['details']}
     mismatches = []
-    
-    tp = fp = fn = tn = 0
-    total = 0
-    
-    for (qid, fname), gt in gt_map.items():
-        pred = pred_map.get((qid, fname))
-        if pred is None:
+    for k, g, p in zip(keys, gt, pred):
+        if p == g:
             continue
-            
-        total += 1
-        if pred == gt:
-            if pred == 1: tp += 1
-            else: tn += 1
-        else:
-            if pred == 1: fp += 1
-            else: fn += 1
-            mismatches.append({
-                'query_id': qid,
-                'font_name': fname,
-                'gt': gt,
-                'pred': pred,
-                'query_text': query_map.get(qid, {}).get('text', 'unknown'),
-                'category': query_map.get(qid, {}).get('class', 'unknown'),
-                'thought': next((p.get('thought', '') for p in predictions_raw['details'] if p['query_id'] == qid and p['font_name'] == fname), "")
-            })
+        qid, fname = k
+        mismatches.append({
+            'query_id': qid,
+            'font_name': fname,
+            'gt': int(g),
+            'pred': int(p),
+            'query_text': query_map.get(qid, {}).get('text', 'unknown'),
+            'category': query_map.get(qid, {}).get('class', 'unknown'),
+            'thought': thought_map.get(k, "")
+        })
 
-    agreement = (tp + tn) / total if total > 0 else 0
-    precision = tp / (tp + fp) if (tp + fp) > 0 else 0
-    recall = tp / (tp + fn) if (tp + fn) > 0 else 0
-    f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
-    
     print(f"\n=== {label} ===")
     print(f"Total pairs evaluated: {total}")
     print(f"Agreement: {agreement:.4f}")
@@ -75,26 +69,16 @@ def analyze(results_path, label):
     print(f"F1:        {f1:.4f}")
     print(f"TP: {tp}, FP: {fp}, FN: {fn}, TN: {tn}")
 
-    # Bootstrap CI for agreement
+    # Bootstrap CI for agreement (resampling SSoT pairs; pairs without a prediction are skipped)
     n_bootstrap = 1000
-    bs_agreements = []
-    keys = list(gt_map.keys())
-    for _ in range(n_bootstrap):
-        indices = np.random.choice(len(keys), len(keys), replace=True)
-        bs_tp = bs_tn = bs_total = 0
-        for idx in indices:
-            k = keys[idx]
-            gt = gt_map.get(k)
-            pred = pred_map.get(k)
-            if pred is None: continue
-            bs_total += 1
-            if pred == gt:
-                if pred == 1: bs_tp += 1
-                else: bs_tn += 1
-        if bs_total > 0:
-            bs_agreements.append((bs_tp + bs_tn) / bs_total)
-    
-    if bs_agreements:
+    all_keys = list(gt_map.keys())
+    present = np.array([k in pred_map for k in all_keys], dtype=float)
+    correct = np.array([pred_map.get(k) == gt_map[k] for k in all_keys], dtype=float)
+    W = resample_weights(len(all_keys), n_bootstrap, seed=42)
+    bs_total = W @ present
+    bs_agreements = (W @ correct)[bs_total > 0] / bs_total[bs_total > 0]
+
+    if len(bs_agreements):
         ci_low = np.percentile(bs_agreements, 2.5)
         ci_high = np.percentile(bs_agreements, 97.5)
         print(f"Agreement 95% CI: [{ci_low:.4f}, {ci_high:.4f}]")
@@ -158,30 +142,14 @@ if __name__ == "__main__":
             ssot = json.load(f)
         gt_map = {(d['query_id'], d['font_name']): (1 if d['casey_label'] >= 1 else 0) for d in ssot['decisions']}
 
-        for threshold in [0.6, 0.7, 0.8, 0.9]:
-            gated_matches = []
-            gt_list = []
-            for d in v_data['details']:
-                k = (d['query_id'], d['font_name'])
-                if k not in gt_map: continue
-                
-                m = d['ai_match']
-                c = d.get('confidence', 0.5)
-                if m == 1 and c < threshold:
-                    gated_matches.append(0)
-                else:
-                    gated_matches.append(m)
-                gt_list.append(gt_map[k])
-            
-            tp = fp = fn = tn = 0
-            for g, p in zip(gt_list, gated_matches):
-                if g == p:
-                    if p == 1: tp += 1
-                    else: tn += 1
-                else:
-                    if p == 1: fp += 1
-                    else: fn += 1
-            
-            if len(gt_list) > 0:
-                ag = (tp + tn) / len(gt_list)
-                print(f"Threshold {threshold}: Agreement {ag:.4f}, TP {tp}, FP {fp}, FN {fn}, TN {tn}")
+        rows = [d for d in v_data['details'] if (d['query_id'], d['font_name']) in gt_map]
+        gt = np.array([gt_map[(d['query_id'], d['font_name'])] for d in rows])
+        ai = np.array([d['ai_match'] for d in rows])
+        conf = np.array([d.get('confidence', 0.5) for d in rows], dtype=float)
+        thresholds = [0.6, 0.7, 0.8, 0.9]
+        gated = compute_metrics(gt, ai, conf, gates=thresholds, digits=None)["gated"]
+        if len(rows) > 0:
+            for threshold in thresholds:
+                m = gated[str(threshold)]
+                c = m["counts"]
+                print(f"Threshold {threshold}: Agreement {m['agreement']:.4f}, TP {c['tp']}, FP {c['fp']}, FN {c['fn']}, TN {c['tn']}")
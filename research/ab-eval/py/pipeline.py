@@ -0,0 +1,323 @@
+"""
+DAG pipeline orchestrator for the A/B evaluation scripts
+
+Each stage declares the script it runs, its arguments, and the files or
+directories it reads (`inputs`) and writes (`outputs`). Dependencies are
+derived from those declarations: a stage depends on every stage that
+produces one of its inputs. `optional_inputs` are ordered and fingerprinted
+the same way, but a failed producer does not block the stage (scoring can
+still report the variants that did succeed). The orchestrator then
+
+- skips a stage when its fingerprint (script source and the sources of the
+  local modules it imports, transitively + arguments + input contents)
+  matches the last successful run and its outputs are unchanged,
+- runs stages whose dependencies are satisfied concurrently (e.g. text and
+  VL embeddings), up to `max_workers`,
+- skips dependents of a failed stage, and
+- prints a per-stage timing summary (also stored in the state file).
+
+Stages run as child processes of the same interpreter so independent stages
+really execute in parallel and a crashing stage cannot take down its
+siblings; output is streamed line by line with a `[stage]` prefix.
+
+State lives in `research/ab-eval/out/.pipeline_state.json`:
+
+    {"stages": {"<name>": {"fingerprint": "...", "outputs": {"<path>": "<digest>"}, "seconds": 12.3}},
+     "last_run": [{"stage": "...", "status": "ran|skipped|failed|blocked", "seconds": ...}]}
+
+Usage (from the project root):
+    python research/ab-eval/py/run_all.py --dataset 200 --variant all
+    python research/ab-eval/py/run_all.py --dataset 200 --dry-run
+    python research/ab-eval/py/run_all.py --dataset 200 --force-stage embed_vl
+"""
+
+from __future__ import annotations
+
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Sequence, Set
+
+SCRIPT_DIR = os.path.join("research", "ab-eval", "py")
+DEFAULT_STATE_PATH = "research/ab-eval/out/.pipeline_state.json"
+
+
+@dataclass
+class Stage:
+    name: str
+    script: str
+    args: List[str] = field(default_factory=list)
+    inputs: List[str] = field(default_factory=list)
+    outputs: List[str] = field(default_factory=list)
+    optional_inputs: List[str] = field(default_factory=list)
+
+    @property
+    def script_path(self) -> str:
+        return os.path.join(SCRIPT_DIR, self.script)
+
+
+class _DigestCache:
+    """Content digests keyed by (path, size, mtime) so unchanged files are hashed once per process."""
+
+    def __init__(self) -> None:
+        self._cache: Dict[tuple, str] = {}
+        self._lock = threading.Lock()
+
+    def file(self, path: Path) -> str:
+        st = path.stat()
+        key = (str(path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with self._lock:
+            self._cache[key] = digest
+        return digest
+
+    def path(self, path: str) -> str:
+        """Digest of a file, of a directory tree (relative names + file digests), or "missing"."""
+        p = Path(path)
+        if p.is_file():
+            return self.file(p)
+        if p.is_dir():
+            h = hashlib.sha256()
+            for child in sorted(c for c in p.rglob("*") if c.is_file()):
+                h.update(child.relative_to(p).as_posix().encode("utf-8"))
+                h.update(self.file(child).encode("ascii"))
+            return "dir:" + h.hexdigest()
+        return "missing"
+
+
+def local_imports(script_path: str) -> List[str]:
+    """
+    Sorted paths of the modules in SCRIPT_DIR that `script_path` imports,
+    directly or through other local modules (including function-level and
+    `from x import y` imports). Unparseable files contribute nothing.
+    """
+    seen: Set[str] = set()
+    todo = [script_path]
+    while todo:
+        path = todo.pop()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                tree = ast.parse(f.read(), filename=path)
+        except (OSError, SyntaxError, UnicodeDecodeError):
+            continue
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [a.name for a in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                module = os.path.join(SCRIPT_DIR, name.split(".")[0] + ".py")
+                if module not in seen and module != script_path and os.path.isfile(module):
+                    seen.add(module)
+                    todo.append(module)
+    return sorted(seen)
+
+
+def resolve_dependencies(stages: Sequence[Stage], required_only: bool = False) -> Dict[str, Set[str]]:
+    """
+    name -> names of stages producing one of its inputs (including optional
+    inputs unless `required_only`). Raises on duplicate producers or cycles.
+    """
+    producer: Dict[str, str] = {}
+    for s in stages:
+        for out in s.outputs:
+            key = os.path.normpath(out)
+            if key in producer:
+                raise ValueError(f"{out} is produced by both {producer[key]} and {s.name}")
+            producer[key] = s.name
+    deps = {
+        s.name: {
+            producer[os.path.normpath(i)]
+            for i in (s.inputs if required_only else s.inputs + s.optional_inputs)
+            if os.path.normpath(i) in producer
+        } - {s.name}
+        for s in stages
+    }
+
+    # Kahn's algorithm, only to reject cycles up front
+    indegree = {n: len(d) for n, d in deps.items()}
+    ready = [n for n, d in indegree.items() if d == 0]
+    seen = 0
+    while ready:
+        n = ready.pop()
+        seen += 1
+        for m, d in deps.items():
+            if n in d:
+                indegree[m] -= 1
+                if indegree[m] == 0:
+                    ready.append(m)
+    if seen != len(deps):
+        raise ValueError("Pipeline stages form a dependency cycle")
+    return deps
+
+
+class Pipeline:
+    def __init__(
+        self,
+        stages: Sequence[Stage],
+        state_path: str = DEFAULT_STATE_PATH,
+        max_workers: int = 2,
+        force: bool = False,
+        force_stages: Sequence[str] = (),
+        dry_run: bool = False,
+    ):
+        names = [s.name for s in stages]
+        unknown = set(force_stages) - set(names)
+        if unknown:
+            raise ValueError(f"Unknown stage(s): {sorted(unknown)} (known: {names})")
+        self.stages = {s.name: s for s in stages}
+        self.order = names
+        self.deps = resolve_dependencies(stages)
+        self.required_deps = resolve_dependencies(stages, required_only=True)
+        self.state_path = Path(state_path)
+        self.max_workers = max(1, max_workers)
+        self.force = force
+        self.force_stages = set(force_stages)
+        self.dry_run = dry_run
+        self.digests = _DigestCache()
+        self.state = self._load_state()
+        self._print_lock = threading.Lock()
+
+    def _load_state(self) -> Dict:
+        if self.state_path.exists():
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {"stages": {}}
+
+    def _save_state(self) -> None:
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp, self.state_path)
+
+    def fingerprint(self, stage: Stage) -> str:
+        h = hashlib.sha256()
+        h.update(self.digests.path(stage.script_path).encode("ascii"))
+        for module in local_imports(stage.script_path):
+            h.update(module.encode("utf-8"))
+            h.update(self.digests.path(module).encode("ascii"))
+        h.update(json.dumps(stage.args).encode("utf-8"))
+        for i in sorted(stage.inputs + stage.optional_inputs):
+            h.update(i.encode("utf-8"))
+            h.update(self.digests.path(i).encode("ascii"))
+        return h.hexdigest()
+
+    def is_current(self, stage: Stage, fingerprint: str) -> bool:
+        if self.force or stage.name in self.force_stages:
+            return False
+        prev = self.state["stages"].get(stage.name)
+        if not prev or prev.get("fingerprint") != fingerprint:
+            return False
+        # Outputs must still be exactly what the last run wrote
+        return all(
+            self.digests.path(o) != "missing" and prev.get("outputs", {}).get(o) == self.digests.path(o)
+            for o in stage.outputs
+        )
+
+    def _log(self, name: str, line: str) -> None:
+        with self._print_lock:
+            print(f"[{name}] {line}", flush=True)
+
+    def _execute(self, stage: Stage) -> bool:
+        cmd = [sys.executable, stage.script_path] + stage.args
+        self._log(stage.name, "$ " + " ".join(cmd[1:]))
+        proc = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1,
+            env={**os.environ, "PYTHONUNBUFFERED": "1"},
+        )
+        assert proc.stdout is not None
+        for line in proc.stdout:
+            self._log(stage.name, line.rstrip("\n"))
+        return proc.wait() == 0
+
+    def _run_stage(self, stage: Stage, upstream_pending: bool = False) -> Dict:
+        fingerprint = self.fingerprint(stage)
+        if not upstream_pending and self.is_current(stage, fingerprint):
+            self._log(stage.name, "up to date, skipped")
+            return {"stage": stage.name, "status": "skipped", "seconds": 0.0}
+        if self.dry_run:
+            self._log(stage.name, "would run")
+            return {"stage": stage.name, "status": "would_run", "seconds": 0.0}
+
+        t0 = time.perf_counter()
+        ok = self._execute(stage)
+        seconds = time.perf_counter() - t0
+        if not ok:
+            self._log(stage.name, f"FAILED after {seconds:.1f}s")
+            return {"stage": stage.name, "status": "failed", "seconds": seconds}
+
+        self.state["stages"][stage.name] = {
+            "fingerprint": fingerprint,
+            "outputs": {o: self.digests.path(o) for o in stage.outputs},
+            "seconds": round(seconds, 3),
+        }
+        return {"stage": stage.name, "status": "ran", "seconds": seconds}
+
+    def run(self) -> List[Dict]:
+        """Runs the DAG; returns one result per stage in declaration order."""
+        results: Dict[str, Dict] = {}
+        pending = list(self.order)
+        running: Dict[Future, str] = {}
+        t0 = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for name in list(pending):
+                    deps = self.deps[name]
+                    if any(results.get(d, {}).get("status") in ("failed", "blocked") for d in self.required_deps[name]):
+                        pending.remove(name)
+                        results[name] = {"stage": name, "status": "blocked", "seconds": 0.0}
+                        self._log(name, "blocked by failed dependency")
+                    elif all(d in results for d in deps) and len(running) < self.max_workers:
+                        pending.remove(name)
+                        # In a dry run nothing is rewritten, so inputs from a would-run stage count as changed
+                        upstream_pending = any(results[d]["status"] == "would_run" for d in deps)
+                        running[pool.submit(self._run_stage, self.stages[name], upstream_pending)] = name
+                if not running:
+                    continue
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    name = running.pop(fut)
+                    results[name] = fut.result()
+
+        ordered = [results[n] for n in self.order]
+        if not self.dry_run:
+            self.state["last_run"] = ordered
+            self.state["last_run_seconds"] = round(time.perf_counter() - t0, 3)
+            self._save_state()
+        print_summary(ordered, time.perf_counter() - t0)
+        return ordered
+
+
+def print_summary(results: Sequence[Dict], wall_seconds: float) -> None:
+    print(f"\n{'='*60}")
+    print(f"{'Stage':<24} {'Status':<10} {'Seconds':>9}")
+    print(f"{'-'*60}")
+    for r in results:
+        print(f"{r['stage']:<24} {r['status']:<10} {r['seconds']:>9.1f}")
+    print(f"{'-'*60}")
+    serial = sum(r["seconds"] for r in results)
+    print(f"{'Wall clock':<35} {wall_seconds:>9.1f}  (stage sum {serial:.1f})")
+    print(f"{'='*60}\n")
+
+
+def failed(results: Sequence[Dict]) -> bool:
+    return any(r["status"] in ("failed", "blocked") for r in results)
@@ -0,0 +1,379 @@
+"""
+Query packing planner for multi-query VLM judge calls
+
+A judge call carries one font's specimen image(s) plus a numbered list of
+queries. Image bytes dominate the request, so a font should be judged in as
+few calls as the model allows:
+
+- output budget: each query costs ~`output_tokens_per_query` response tokens
+  (verdict, confidence, evidence) on top of a fixed reasoning preamble;
+- prompt budget: query text is small next to the image but still bounded;
+- accuracy: long query lists can drift away from single-query verdicts.
+
+`plan_packs()` splits a font's pending queries into the fewest packs under a
+size cap: full packs then the remainder (the historical `range(0, n, 10)`
+split), or sizes balanced to within one with `balanced=True` (runners'
+`--balance-packs`). `measure_drift()` judges a sample of SSoT fonts at several
+pack sizes (unlabeled filler queries bring each pack up to the target size;
+only SSoT pairs are scored) and `select_pack_size()` keeps the largest size
+whose agreement drop and verdict flip rate versus single-query calls stay
+within tolerance. The choice is saved as a pack profile that runners read
+with `--pack-size auto`.
+
+Usage:
+    python research/ab-eval/py/query_packing.py plan --pack-size 10
+    python research/ab-eval/py/query_packing.py calibrate --model gemini-3-pro-preview --prompt v3 --sizes 1 5 10 20 --sample-fonts 12
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import random
+import re
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from usage_accounting import UsageLedger
+
+from metrics_kernel import compute_metrics, remap_label
+
+OUT_DIR = Path("research/ab-eval/out")
+SSOT_PATH = OUT_DIR / "full_set_review_export_1770612809775.json"
+QUERIES_PATH = Path("research/ab-eval/data/queries.medium.human.v1.json")
+
+# Response tokens per query for the evidence-bearing prompts (v3..v5_1): index,
+# match, confidence, evidence and counter-evidence strings.
+OUTPUT_TOKENS_PER_QUERY = 90
+OUTPUT_OVERHEAD_TOKENS = 250
+DEFAULT_OUTPUT_BUDGET = 8192
+DEFAULT_PROMPT_BUDGET = 32768
+PROMPT_OVERHEAD_TOKENS = 900
+HARD_MAX_PACK = 40
+
+DEFAULT_MAX_AGREEMENT_DROP = 0.02
+DEFAULT_MAX_FLIP_RATE = 0.05
+DEFAULT_MAX_MISSING_RATE = 0.0
+
+# judge_fn(font_name, query_texts) -> one verdict dict per query ({"match", "confidence", ...}) or None.
+JudgeFn = Callable[[str, List[str]], List[Optional[Dict[str, Any]]]]
+
+
+def approx_tokens(text: str) -> int:
+    """Rough token count for English prompt text (~4 chars/token)."""
+    return len(text) // 4 + 1
+
+
+def budget_pack_size(
+    query_texts: Sequence[str] = (),
+    output_budget: int = DEFAULT_OUTPUT_BUDGET,
+    prompt_budget: int = DEFAULT_PROMPT_BUDGET,
+    output_tokens_per_query: int = OUTPUT_TOKENS_PER_QUERY,
+    hard_max: int = HARD_MAX_PACK,
+) -> int:
+    """Largest pack size that fits the output and prompt token budgets."""
+    by_output = (output_budget - OUTPUT_OVERHEAD_TOKENS) // output_tokens_per_query
+    per_query_prompt = max((approx_tokens(t) + 4 for t in query_texts), default=32)
+    by_prompt = (prompt_budget - PROMPT_OVERHEAD_TOKENS) // per_query_prompt
+    return max(1, min(hard_max, by_output, by_prompt))
+
+
+def plan_packs(items: Sequence[Any], pack_size: int, balanced: bool = False) -> List[List[Any]]:
+    """
+    Fewest packs of at most `pack_size` items, in order. By default packs are
+    filled greedily (12 items at size 10 -> 10 + 2), matching the call
+    structure of committed baselines; `balanced=True` evens the sizes out to
+    within one (12 -> 6 + 6). `pack_size <= 0` means a single pack.
+    """
+    items = list(items)
+    if not items:
+        return []
+    if pack_size <= 0:
+        return [items]
+    if not balanced:
+        return [items[i:i + pack_size] for i in range(0, len(items), pack_size)]
+    n_packs = math.ceil(len(items) / pack_size)
+    base, extra = divmod(len(items), n_packs)
+    packs, start = [], 0
+    for i in range(n_packs):
+        size = base + (1 if i < extra else 0)
+        packs.append(items[start:start + size])
+        start += size
+    return packs
+
+
+# ---------------------------------------------------------------------------
+# Pack profiles
+# ---------------------------------------------------------------------------
+
+def profile_path(model: str, prompt: str, out_dir: Path = OUT_DIR) -> Path:
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", model).strip("_").lower()
+    return out_dir / f"query_pack_profile_{slug}_{prompt}.json"
+
+
+def resolve_pack_size(value: str, model: str = "", prompt: str = "", default: int = 10) -> int:
+    """
+    `--pack-size` value -> int. "auto" reads the calibrated pack profile for
+    (model, prompt) and falls back to `default` when none exists.
+    """
+    if str(value).lower() != "auto":
+        return int(value)
+    path = profile_path(model, prompt)
+    if not path.exists():
+        print(f"No pack profile at {path}; using pack size {default}")
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        size = int(json.load(f)["selected_pack_size"])
+    print(f"Using calibrated pack size {size} from {path}")
+    return size
+
+
+# ---------------------------------------------------------------------------
+# Drift measurement
+# ---------------------------------------------------------------------------
+
+def build_probe_packs(
+    labeled: List[str],
+    fillers: List[str],
+    pack_size: int,
+    rng: random.Random,
+) -> List[List[Tuple[str, bool]]]:
+    """
+    Packs of (query_id, is_labeled) at exactly `pack_size` (when enough
+    fillers exist): labeled queries are split over the fewest packs and each
+    pack is topped up with distinct filler queries, then shuffled so labeled
+    queries do not always sit at the head of the list.
+    """
+    packs = []
+    for group in plan_packs(labeled, pack_size):
+        need = max(0, pack_size - len(group))
+        extra = rng.sample(fillers, min(need, len(fillers)))
+        pack = [(q, True) for q in group] + [(q, False) for q in extra]
+        rng.shuffle(pack)
+        packs.append(pack)
+    return packs
+
+
+def measure_drift(
+    judge_fn: JudgeFn,
+    font_queries: Dict[str, List[str]],
+    query_text: Dict[str, str],
+    ssot_map: Dict[Tuple[str, str], int],
+    sizes: Sequence[int],
+    seed: int = 42,
+) -> List[Dict[str, Any]]:
+    """
+    Judge every labeled (query, font) pair at each pack size and compare to
+    size 1 (always measured) and to the SSoT. Failed calls and missing
+    `query_index` entries count as missing, not as 0 verdicts.
+    """
+    sizes = sorted(set([1, *sizes]))
+    all_queries = sorted(query_text)
+    verdicts: Dict[int, Dict[Tuple[str, str], int]] = {}
+    n_calls: Dict[int, int] = {}
+
+    for size in sizes:
+        rng = random.Random(f"{seed}:{size}")
+        verdicts[size], n_calls[size] = {}, 0
+        for font, labeled in font_queries.items():
+            fillers = [q for q in all_queries if q not in set(labeled)]
+            for pack in build_probe_packs(labeled, fillers, size, rng):
+                texts = [query_text[q] for q, _ in pack]
+                out = judge_fn(font, texts)
+                n_calls[size] += 1
+                for (qid, is_labeled), v in zip(pack, out):
+                    if is_labeled and v is not None:
+                        verdicts[size][(qid, font)] = 1 if v.get("match", 0) == 1 else 0
+        print(f"  size {size}: {n_calls[size]} calls, {len(verdicts[size])} labeled verdicts")
+
+    keys = sorted((q, f) for f, qs in font_queries.items() for q in qs)
+    base = verdicts[1]
+    table = []
+    for size in sizes:
+        got = verdicts[size]
+        scored = [k for k in keys if k in got]
+        m = compute_metrics([ssot_map[k] for k in scored], [got[k] for k in scored])
+        both = [k for k in scored if k in base]
+        flips = sum(got[k] != base[k] for k in both)
+        table.append({
+            "pack_size": size,
+            "calls": n_calls[size],
+            "pairs": len(keys),
+            "scored": len(scored),
+            "missing_rate": round(1 - len(scored) / len(keys), 4) if keys else 0.0,
+            "agreement": m["agreement"],
+            "precision": m["precision"],
+            "flip_rate_vs_single": round(flips / len(both), 4) if both else 0.0,
+        })
+    return table
+
+
+def select_pack_size(
+    table: List[Dict[str, Any]],
+    max_agreement_drop: float = DEFAULT_MAX_AGREEMENT_DROP,
+    max_flip_rate: float = DEFAULT_MAX_FLIP_RATE,
+    max_missing_rate: float = DEFAULT_MAX_MISSING_RATE,
+) -> int:
+    """
+    Largest measured size such that it and every smaller size stay within
+    tolerance of the single-query reference (a lucky large size after a
+    failing smaller one is not trusted).
+    """
+    rows = sorted(table, key=lambda r: r["pack_size"])
+    reference = next(r for r in rows if r["pack_size"] == 1)
+    selected = 1
+    for r in rows:
+        safe = (
+            reference["agreement"] - r["agreement"] <= max_agreement_drop
+            and r["flip_rate_vs_single"] <= max_flip_rate
+            and r["missing_rate"] <= max_missing_rate
+        )
+        r["safe"] = safe
+        if not safe:
+            break
+        selected = r["pack_size"]
+    return selected
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def load_ssot_pairs(ssot_path: Path) -> Tuple[Dict[Tuple[str, str], int], Dict[str, List[str]]]:
+    with open(ssot_path, "r", encoding="utf-8") as f:
+        decisions = json.load(f)["decisions"]
+    ssot_map = {(d["query_id"], d["font_name"]): remap_label(d.get("casey_label", 0)) for d in decisions}
+    font_queries: Dict[str, List[str]] = {}
+    for d in decisions:
+        font_queries.setdefault(d["font_name"], []).append(d["query_id"])
+    return ssot_map, font_queries
+
+
+def gemini_judge(model: str, prompt: str, spec_dir: Path, keys_file: str, ledger: Optional[UsageLedger] = None) -> JudgeFn:
+    """Judges one pack per call with `call_gemini_v3`; each call's usage (and failures) go to `ledger` if given."""
+    from run_production_trial import call_gemini_v3, load_api_keys
+
+    api_keys = load_api_keys(keys_file)
+    if not api_keys:
+        raise RuntimeError("No API keys found. Set GEMINI_API_KEY or pass --keys-file")
+
+    def judge(font: str, texts: List[str]) -> List[Optional[Dict[str, Any]]]:
+        safe = font.replace(" ", "_")
+        images = [spec_dir / f"{safe}_top.png", spec_dir / f"{safe}_bottom.png"]
+        resp = call_gemini_v3(texts, images, model, prompt, api_keys)
+        if ledger is not None:
+            ledger.add(resp, model, prompt, spec_dir.name, n_queries=len(texts))
+        if "error" in resp:
+            print(f"    {font}: {resp['error']}")
+            return [None] * len(texts)
+        by_index = {m.get("query_index"): m for m in resp.get("results", [])}
+        return [by_index.get(i + 1) for i in range(len(texts))]
+
+    return judge
+
+
+def cmd_plan(args) -> None:
+    _, font_queries = load_ssot_pairs(Path(args.ssot))
+    with open(args.queries, "r", encoding="utf-8") as f:
+        texts = [q["text"] for q in json.load(f)]
+    budget = budget_pack_size(texts, args.output_budget, args.prompt_budget)
+    pack_size = min(args.pack_size, budget) if args.pack_size > 0 else budget
+
+    counts = np.array([len(v) for v in font_queries.values()])
+    per_pair = int(counts.sum())
+    fixed_10 = int(np.ceil(counts / 10).sum())
+    planned = sum(len(plan_packs(range(c), pack_size)) for c in counts)
+    print(f"{len(counts)} fonts, {per_pair} pairs; budget allows packs of {budget}")
+    print(f"  one pair per call : {per_pair:5d} calls / image uploads")
+    print(f"  fixed packs of 10 : {fixed_10:5d}")
+    print(f"  planned (<= {pack_size:>3})  : {planned:5d}")
+
+
+def cmd_calibrate(args) -> None:
+    ssot_map, font_queries = load_ssot_pairs(Path(args.ssot))
+    with open(args.queries, "r", encoding="utf-8") as f:
+        query_text = {q["id"]: q["text"] for q in json.load(f)}
+
+    spec_dir = OUT_DIR / args.spec_dir
+    fonts = sorted(
+        f for f in font_queries
+        if (spec_dir / f"{f.replace(' ', '_')}_top.png").exists()
+        and (spec_dir / f"{f.replace(' ', '_')}_bottom.png").exists()
+    )
+    rng = random.Random(args.seed)
+    sample = sorted(rng.sample(fonts, min(args.sample_fonts, len(fonts))))
+    sample_queries = {f: font_queries[f] for f in sample}
+
+    budget = budget_pack_size(list(query_text.values()), args.output_budget, args.prompt_budget)
+    sizes = [s for s in args.sizes if s <= budget]
+    print(f"Calibrating pack size for {args.model}/{args.prompt} on {len(sample)} fonts, sizes {sizes} (budget {budget})")
+
+    judge = gemini_judge(args.model, args.prompt, spec_dir, args.keys_file)
+    table = measure_drift(judge, sample_queries, query_text, ssot_map, sizes, seed=args.seed)
+    selected = select_pack_size(table, args.max_agreement_drop, args.max_flip_rate, args.max_missing_rate)
+
+    print(f"\n{'Size':>4} | {'Calls':>5} | {'Agree':>6} | {'Prec':>6} | {'Flip':>6} | {'Miss':>6} | Safe")
+    print("-" * 56)
+    for r in table:
+        print(f"{r['pack_size']:>4} | {r['calls']:>5} | {r['agreement']:>6.4f} | {r['precision']:>6.4f} | "
+              f"{r['flip_rate_vs_single']:>6.4f} | {r['missing_rate']:>6.4f} | {r.get('safe', '-')}")
+    print(f"\nSelected pack size: {selected}")
+
+    profile = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "model": args.model,
+        "prompt": args.prompt,
+        "spec_dir": args.spec_dir,
+        "fonts": sample,
+        "budget_pack_size": budget,
+        "tolerances": {
+            "max_agreement_drop": args.max_agreement_drop,
+            "max_flip_rate": args.max_flip_rate,
+            "max_missing_rate": args.max_missing_rate,
+        },
+        "drift": table,
+        "selected_pack_size": selected,
+    }
+    path = Path(args.out) if args.out else profile_path(args.model, args.prompt)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+    print(f"Saved pack profile to {path}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Query packing planner for multi-query judge calls")
+    parser.add_argument("--ssot", default=str(SSOT_PATH))
+    parser.add_argument("--queries", default=str(QUERIES_PATH))
+    parser.add_argument("--output-budget", type=int, default=DEFAULT_OUTPUT_BUDGET, help="Max response tokens per call")
+    parser.add_argument("--prompt-budget", type=int, default=DEFAULT_PROMPT_BUDGET, help="Max text prompt tokens per call")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_plan = sub.add_parser("plan", help="Compare call counts for the SSoT population (offline)")
+    p_plan.add_argument("--pack-size", type=int, default=0, help="Cap; 0 = token budget only")
+
+    p_cal = sub.add_parser("calibrate", help="Measure drift vs single-query calls and save a pack profile")
+    p_cal.add_argument("--model", default="gemini-3-pro-preview")
+    p_cal.add_argument("--prompt", choices=["v3", "v3_2", "v3_3", "v3_4", "v4", "v5_1"], default="v3")
+    p_cal.add_argument("--spec-dir", default="specimens_v3")
+    p_cal.add_argument("--sizes", type=int, nargs="+", default=[1, 5, 10, 20])
+    p_cal.add_argument("--sample-fonts", type=int, default=12)
+    p_cal.add_argument("--seed", type=int, default=42)
+    p_cal.add_argument("--max-agreement-drop", type=float, default=DEFAULT_MAX_AGREEMENT_DROP)
+    p_cal.add_argument("--max-flip-rate", type=float, default=DEFAULT_MAX_FLIP_RATE)
+    p_cal.add_argument("--max-missing-rate", type=float, default=DEFAULT_MAX_MISSING_RATE)
+    p_cal.add_argument("--keys-file", default="")
+    p_cal.add_argument("--out", default="", help="Profile path (default out/query_pack_profile_<model>_<prompt>.json)")
+
+    args = parser.parse_args()
+    if args.cmd == "plan":
+        cmd_plan(args)
+    else:
+        cmd_calibrate(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Vectorized raster metrics for glyph sheets and specimens
+
+Measures the deterministic bitmaps written by `render_glyph_sheet.py` and the
+specimen renderers, in batches of same-sized images stacked into one
+(N, H, W) array:
+
+- ink density (binary) and anti-aliased coverage,
+- stroke-width distribution from a city-block distance transform (repeated
+  4-neighbour erosion of the whole batch): widths at ridge pixels, as
+  p10/p50/p90, mean and coefficient of variation (a stroke-contrast proxy),
+- row projection profile: text lines, gaps between lines, cap height,
+  x-height and baseline pitch (the lowercase line's dense core is the x-height),
+- column projection per line: pitch regularity of glyph centres (low for
+  monospaced fonts),
+- QA signals: ink on the 1-px canvas border (clipping) and missing or
+  touching line gaps (overlap).
+
+Results are one float32 matrix (`<out>.npy`, rows = images, columns listed
+in `<out>.json`). `neighbors` uses the standardized matrix as a cheap
+look-alike retrieval signal. `qa` lists clipping/overlap suspects.
+
+Usage:
+    python research/ab-eval/py/raster_metrics.py compute --dir research/ab-eval/out/glyphs --expected-lines 3
+    python research/ab-eval/py/raster_metrics.py neighbors --font "Playfair Display" --k 10
+    python research/ab-eval/py/raster_metrics.py qa
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+DEFAULT_OUT = "research/ab-eval/out/raster_metrics"
+INK = 128
+MAX_HALF_WIDTH = 64  # erosion passes; strokes wider than 2x this saturate
+
+COLUMNS = [
+    "ink_density", "coverage",
+    "stroke_p10", "stroke_p50", "stroke_p90", "stroke_mean", "stroke_cv",
+    "n_lines", "line_gap_min", "cap_height_px", "x_height_px", "x_to_cap", "baseline_pitch_cv",
+    "glyph_pitch_cv",
+    "clip_top", "clip_bottom", "clip_left", "clip_right",
+]
+
+
+def load_stack(paths: Sequence[Path]) -> np.ndarray:
+    """Grayscale (N, H, W) uint8 stack; all images must share one size."""
+    return np.stack([np.asarray(Image.open(p).convert("L")) for p in paths])
+
+
+def city_block_distance(ink: np.ndarray, max_iter: int = MAX_HALF_WIDTH) -> np.ndarray:
+    """Distance (in px, city-block) from each ink pixel to the nearest background pixel, for a (N, H, W) batch."""
+    dist = np.zeros(ink.shape, dtype=np.int16)
+    cur = ink.copy()
+    for _ in range(max_iter):
+        if not cur.any():
+            break
+        dist += cur
+        p = np.pad(cur, ((0, 0), (1, 1), (1, 1)))
+        cur = cur & p[:, :-2, 1:-1] & p[:, 2:, 1:-1] & p[:, 1:-1, :-2] & p[:, 1:-1, 2:]
+    return dist
+
+
+def stroke_widths(ink: np.ndarray) -> Dict[str, np.ndarray]:
+    """Per-image stroke-width statistics from ridge pixels of the distance transform."""
+    dist = city_block_distance(ink)
+    p = np.pad(dist, ((0, 0), (1, 1), (1, 1)))
+    ridge = (dist > 0) & (dist >= p[:, :-2, 1:-1]) & (dist >= p[:, 2:, 1:-1]) & (dist >= p[:, 1:-1, :-2]) & (dist >= p[:, 1:-1, 2:])
+    widths = 2 * dist.astype(np.int32) - 1
+
+    n = ink.shape[0]
+    n_bins = 2 * MAX_HALF_WIDTH + 1
+    img_idx = np.broadcast_to(np.arange(n)[:, None, None], ink.shape)[ridge]
+    hist = np.bincount(img_idx * n_bins + widths[ridge], minlength=n * n_bins).reshape(n, n_bins).astype(np.float64)
+    total = hist.sum(axis=1)
+    bins = np.arange(n_bins)
+    safe = np.maximum(total, 1)
+    mean = (hist * bins).sum(axis=1) / safe
+    std = np.sqrt(np.maximum((hist * bins ** 2).sum(axis=1) / safe - mean ** 2, 0))
+    cdf = np.cumsum(hist, axis=1) / safe[:, None]
+    out = {f"stroke_p{q}": np.argmax(cdf >= q / 100, axis=1).astype(float) for q in (10, 50, 90)}
+    out["stroke_mean"] = mean
+    out["stroke_cv"] = np.where(mean > 0, std / np.maximum(mean, 1e-9), 0.0)
+    for k in out:
+        out[k] = np.where(total > 0, out[k], np.nan)
+    return out
+
+
+def runs(mask: np.ndarray) -> List[Tuple[int, int]]:
+    """[start, end) runs of True in a 1-D array."""
+    edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+    return [(int(a), int(b)) for a, b in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1))]
+
+
+def line_metrics(ink: np.ndarray, expected_lines: int = 0) -> Dict[str, float]:
+    """Row/column projection metrics for one image (text lines stacked vertically)."""
+    rows = ink.sum(axis=1)
+    bands = runs(rows > 0)
+    out = {k: np.nan for k in ("line_gap_min", "cap_height_px", "x_height_px", "x_to_cap", "baseline_pitch_cv", "glyph_pitch_cv")}
+    out["n_lines"] = float(len(bands))
+    if not bands:
+        return out
+    gaps = [b[0] - a[1] for a, b in zip(bands, bands[1:])]
+    # Fewer bands than expected means two lines touch: an overlap, reported as a zero gap
+    out["line_gap_min"] = float(min(gaps)) if gaps else (0.0 if expected_lines > 1 else np.nan)
+    if expected_lines and len(bands) < expected_lines:
+        out["line_gap_min"] = 0.0
+
+    cores, baselines = [], []
+    for start, end in bands:
+        prof = rows[start:end]
+        core = np.flatnonzero(prof >= 0.5 * prof.max())
+        cores.append(int(core[-1] - core[0] + 1))
+        baselines.append(start + int(core[-1]))
+    out["cap_height_px"] = float(cores[0])
+    if len(cores) > 1:
+        out["x_height_px"] = float(cores[1])
+        out["x_to_cap"] = cores[1] / cores[0] if cores[0] else np.nan
+    if len(baselines) > 2:
+        pitch = np.diff(baselines)
+        out["baseline_pitch_cv"] = float(pitch.std() / pitch.mean()) if pitch.mean() else np.nan
+
+    # Glyph pitch regularity on the letter lines (digits are tabular in most fonts)
+    cvs = []
+    for start, end in bands[:2]:
+        centres = [(a + b) / 2 for a, b in runs(ink[start:end].any(axis=0))]
+        if len(centres) >= 4:
+            pitch = np.diff(centres)
+            cvs.append(pitch.std() / pitch.mean())
+    if cvs:
+        out["glyph_pitch_cv"] = float(np.median(cvs))
+    return out
+
+
+def compute_batch(gray: np.ndarray, expected_lines: int = 0) -> np.ndarray:
+    """(N, len(COLUMNS)) float32 metrics for a same-sized grayscale batch."""
+    ink = gray < INK
+    cols: Dict[str, np.ndarray] = {
+        "ink_density": ink.mean(axis=(1, 2)),
+        "coverage": (255 - gray.astype(np.float32)).mean(axis=(1, 2)) / 255,
+        "clip_top": ink[:, 0, :].sum(axis=1).astype(float),
+        "clip_bottom": ink[:, -1, :].sum(axis=1).astype(float),
+        "clip_left": ink[:, :, 0].sum(axis=1).astype(float),
+        "clip_right": ink[:, :, -1].sum(axis=1).astype(float),
+    }
+    cols.update(stroke_widths(ink))
+    per_image = [line_metrics(ink[i], expected_lines) for i in range(len(ink))]
+    for key in per_image[0] if per_image else []:
+        cols[key] = np.array([m[key] for m in per_image], dtype=float)
+    return np.stack([cols[c] for c in COLUMNS], axis=1).astype(np.float32)
+
+
+def compute(paths: Sequence[Path], expected_lines: int = 0, batch: int = 64) -> np.ndarray:
+    """Metrics for many images, batched by size so each batch is one stacked array."""
+    by_size: Dict[Tuple[int, int], List[int]] = {}
+    for i, p in enumerate(paths):
+        with Image.open(p) as im:
+            by_size.setdefault(im.size, []).append(i)
+    X = np.full((len(paths), len(COLUMNS)), np.nan, dtype=np.float32)
+    for idx in by_size.values():
+        for s in range(0, len(idx), batch):
+            chunk = idx[s:s + batch]
+            X[chunk] = compute_batch(load_stack([paths[i] for i in chunk]), expected_lines)
+    return X
+
+
+def qa_flags(X: np.ndarray, clip_min_px: int = 1) -> List[List[str]]:
+    """Per-row list of issues: clipped edges and overlapping lines."""
+    c = {name: X[:, i] for i, name in enumerate(COLUMNS)}
+    flags: List[List[str]] = [[] for _ in range(len(X))]
+    for edge in ("top", "bottom", "left", "right"):
+        for i in np.flatnonzero(c[f"clip_{edge}"] >= clip_min_px):
+            flags[i].append(f"clip_{edge}")
+    for i in np.flatnonzero(c["line_gap_min"] <= 0):
+        flags[i].append("line_overlap")
+    return flags
+
+
+def load_matrix(out: str = DEFAULT_OUT) -> Tuple[np.ndarray, Dict[str, Any]]:
+    with open(f"{out}.json", "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    return np.load(f"{out}.npy"), meta
+
+
+def similarity_matrix(X: np.ndarray, columns: Sequence[str] = COLUMNS) -> np.ndarray:
+    """Cosine similarity of z-scored shape columns (QA columns excluded; NaN -> column mean)."""
+    keep = [i for i, c in enumerate(columns) if not c.startswith("clip_") and c != "n_lines"]
+    Z = X[:, keep].astype(np.float64)
+    mean = np.nanmean(Z, axis=0)
+    Z = np.where(np.isnan(Z), mean, Z)
+    std = Z.std(axis=0)
+    Z = (Z - mean) / np.where(std > 0, std, 1)
+    Z /= np.maximum(np.linalg.norm(Z, axis=1, keepdims=True), 1e-9)
+    return Z @ Z.T
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def cmd_compute(args) -> None:
+    paths = sorted(Path(args.dir).glob(args.pattern))
+    if not paths:
+        print(f"No images matching {args.pattern} in {args.dir}")
+        return
+    t0 = time.perf_counter()
+    X = compute(paths, args.expected_lines, args.batch)
+    dt = time.perf_counter() - t0
+    names = [p.stem for p in paths]
+    flags = qa_flags(X)
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    np.save(f"{args.out}.npy", X)
+    with open(f"{args.out}.json", "w", encoding="utf-8") as f:
+        json.dump({
+            "source": args.dir,
+            "pattern": args.pattern,
+            "expected_lines": args.expected_lines,
+            "columns": COLUMNS,
+            "names": names,
+            "flags": {n: fl for n, fl in zip(names, flags) if fl},
+        }, f, indent=2)
+    print(f"{len(paths)} images in {dt:.2f}s ({1000 * dt / len(paths):.1f} ms/image) -> {args.out}.npy ({X.shape[0]}x{X.shape[1]})")
+    print(f"{sum(1 for fl in flags if fl)} images flagged for clipping/overlap")
+
+
+def cmd_neighbors(args) -> None:
+    X, meta = load_matrix(args.metrics)
+    names = meta["names"]
+    key = args.font.replace(" ", "_")
+    if key not in names:
+        raise SystemExit(f"{args.font} not in {args.metrics}.json")
+    i = names.index(key)
+    sims = similarity_matrix(X, meta["columns"])[i]
+    for j in np.argsort(-sims)[1:args.k + 1]:
+        print(f"  {sims[j]:.3f}  {names[j]}")
+
+
+def cmd_qa(args) -> None:
+    _, meta = load_matrix(args.metrics)
+    flags = meta.get("flags", {})
+    for name, fl in sorted(flags.items()):
+        print(f"  {name}: {', '.join(fl)}")
+    print(f"{len(flags)}/{len(meta['names'])} images flagged")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Vectorized raster metrics for glyph sheets and specimens")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_c = sub.add_parser("compute", help="Metric matrix for a directory of rendered images")
+    p_c.add_argument("--dir", default="research/ab-eval/out/glyphs")
+    p_c.add_argument("--pattern", default="*.png")
+    p_c.add_argument("--expected-lines", type=int, default=3, help="Text lines per image (glyph sheet: 3; 0 = unknown)")
+    p_c.add_argument("--batch", type=int, default=64, help="Images per stacked batch")
+    p_c.add_argument("--out", default=DEFAULT_OUT, help="Output prefix (.npy + .json)")
+
+    p_n = sub.add_parser("neighbors", help="Closest fonts by raster metrics")
+    p_n.add_argument("--font", required=True)
+    p_n.add_argument("--k", type=int, default=10)
+    p_n.add_argument("--metrics", default=DEFAULT_OUT)
+
+    p_q = sub.add_parser("qa", help="List images flagged for clipping/overlap")
+    p_q.add_argument("--metrics", default=DEFAULT_OUT)
+
+    args = parser.parse_args()
+    {"compute": cmd_compute, "neighbors": cmd_neighbors, "qa": cmd_qa}[args.cmd](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,71 @@
 import json
+import argparse
+import time
 from pathlib import Path
 from typing import List, Dict, Any
 
+from metrics_kernel import compute_metrics, pairs_to_arrays, remap_label
+from results_columnar import load_detail_rows, write_sidecar
+
+SCORED_COLUMNS = ("query_id", "font_name", "ai_match", "confidence")
+
 def calculate_metrics(results: List[Dict[str, Any]]) -> Dict[str, Any]:
-    tp = fp = fn = tn = 0
-    for r in results:
-        h = r["human_match"]
-        a = r["ai_match"]
-        if h == 1 and a == 1: tp += 1
-        elif h == 0 and a == 1: fp += 1
-        elif h == 1 and a == 0: fn += 1
-        elif h == 0 and a == 0: tn += 1
-        
-    total = len(results)
-    agreement = (tp + tn) / total if total > 0 else 0
-    precision = tp / (tp + fp) if (tp + fp) > 0 else 0
-    recall = tp / (tp + fn) if (tp + fn) > 0 else 0
-    f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
-    
-    return {
-        "agreement": round(agreement, 4),
-        "precision": round(precision, 4),
-        "recall": round(recall, 4),
-        "f1": round(f1, 4),
-        "counts": {"tp": tp, "fp": fp, "fn": fn, "tn": tn, "total": total}
-    }
+    arrays = pairs_to_arrays(results)
+    return compute_metrics(arrays["y_true"], arrays["y_pred"])
+
+def recompute_all_results(out_dir: Path, ssot_map: Dict, query_class: Dict[str, str], gates: List[float]) -> Dict[str, Any]:
+    """
+    Re-score every results file under out_dir that carries judged (query, font) rows
+    against the amended SSoT (2 -> 0), with gated variants and a per-class breakdown.
+    Files are read but never rewritten; only the scored columns are loaded from
+    columnar sidecars when they are up to date.
+    """
+    summary = {}
+    for path in sorted(out_dir.glob("*.json")):
+        rows = load_detail_rows(path, SCORED_COLUMNS)
+        if not rows or "ai_match" not in rows[0]:
+            continue
+
+        arrays = pairs_to_arrays(rows, ssot_map=ssot_map, default_confidence=1.0)
+        if not arrays["index"]:
+            continue
+        labels = [remap_label(h) for h in arrays["y_true"]]
+        classes = [query_class.get(rows[i]["query_id"], "unclassified") for i in arrays["index"]]
+        metrics = compute_metrics(labels, arrays["y_pred"], arrays["confidence"], gates=gates, classes=classes)
+        metrics["rows"] = len(rows)
+        metrics["missing_ssot"] = len(rows) - len(arrays["index"])
+        summary[path.name] = metrics
+    return summary
 
 def main():
+    parser = argparse.ArgumentParser(description="Recompute judged-pair metrics against the amended SSoT")
+    parser.add_argument("--all", action="store_true",
+                        help="Re-score every results file in out/ (read-only) instead of the fixed model list")
+    parser.add_argument("--gates", type=float, nargs="*", default=[0.8, 0.9])
+    parser.add_argument("--summary-out", default="research/ab-eval/out/recomputed_metrics_all.json")
+    args = parser.parse_args()
+
     out_dir = Path("research/ab-eval/out")
     ssot_path = out_dir / "full_set_review_export_1770612809775.json"
     
     with open(ssot_path, "r") as f:
         ssot_data = json.load(f)
+
+    if args.all:
+        with open("research/ab-eval/data/queries.medium.human.v1.json", "r") as f:
+            query_class = {q["id"]: q.get("class", "unclassified") for q in json.load(f)}
+        ssot_map = {(d["query_id"], d["font_name"]): d["casey_label"] for d in ssot_data["decisions"]}
+        t0 = time.time()
+        summary = recompute_all_results(out_dir, ssot_map, query_class, args.gates)
+        elapsed = time.time() - t0
+        with open(args.summary_out, "w") as f:
+            json.dump(summary, f, indent=2)
+        print("| File | Rows | SSoT | Agreement | Precision | Recall | F1 |")
+        print("|------|------|------|-----------|-----------|--------|----|")
+        for name, m in summary.items():
+            print(f"| {name} | {m['rows']} | {m['counts']['total']} | {m['agreement']:.4f} | {m['precision']:.4f} | {m['recall']:.4f} | {m['f1']:.4f} |")
+        print(f"\nRecomputed {len(summary)} result files in {elapsed:.2f}s -> {args.summary_out}")
+        return
         
     # Create mapping: (query_id, font_name) -> label
     ssot_map = {}
@@ -84,6 +118,7 @@ def main():
         updated_filename = filename.replace(".json", "_updated_ssot.json")
         with open(out_dir / updated_filename, "w") as f:
             json.dump({"details": updated_results, "metrics": metrics}, f, indent=2)
+        write_sidecar(out_dir / updated_filename, {"details": updated_results, "metrics": metrics})
 
     # Print summary table
     print("| Model | Agreement | Precision | Recall | F1 | TP | FP | FN | TN | Total |")
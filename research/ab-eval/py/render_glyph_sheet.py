@@ -1,16 +1,19 @@
 import os
 import json
-import requests
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 import tempfile
 import argparse
 
+from corpus_changes import filter_corpus, font_bytes
+from glyph_atlas import AtlasDraw, GlyphAtlas
+
 def render_font(font_path, output_path, text="ABCDEFGHIJKLM\nnopqrstuvwxyz\n1234567890", size=40):
     """Renders a deterministic glyph sheet for a font."""
     img = Image.new('RGB', (512, 256), color=(255, 255, 255))
-    draw = ImageDraw.Draw(img)
+    draw = AtlasDraw(img)
     try:
-        font = ImageFont.truetype(font_path, size)
+        atlas = GlyphAtlas(font_path)
+        font = atlas.font(size)
     except Exception as e:
         print(f"  Error loading font {font_path}: {e}")
         return False
@@ -18,37 +21,33 @@ def render_font(font_path, output_path, text="ABCDEFGHIJKLM\nnopqrstuvwxyz\n1234
     # Use a fixed offset for determinism instead of centering which might vary with font metrics
     draw.multiline_text((20, 20), text, font=font, fill=(0, 0, 0), spacing=10)
     img.save(output_path)
+    atlas.save()
     return True
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--corpus", default="research/ab-eval/data/corpus.toy.json")
     parser.add_argument("--out", default="research/ab-eval/out/glyphs")
+    parser.add_argument("--changes", default="", help="Change manifest from build_corpus_google_fonts.py; only added/changed fonts are rendered")
     args = parser.parse_args()
 
     os.makedirs(args.out, exist_ok=True)
     
     with open(args.corpus, 'r') as f:
         corpus = json.load(f)
+    corpus = filter_corpus(corpus, args.changes)
         
     for font in corpus:
         name = font['name']
         print(f"Processing {name}...")
-        files = font.get('files', {})
-        # Try 400 weight first, then any available
-        url = files.get('400') or (next(iter(files.values())) if files else None)
-        
-        if not url:
-            print(f"  No file URL for {name}")
-            continue
-            
         try:
-            # Download font
-            resp = requests.get(url, timeout=10)
-            resp.raise_for_status()
-            
+            content = font_bytes(font)
+            if content is None:
+                print(f"  No font file or URL for {name}")
+                continue
+
             with tempfile.NamedTemporaryFile(suffix=".ttf", delete=False) as tmp:
-                tmp.write(resp.content)
+                tmp.write(content)
                 tmp_path = tmp.name
                 
             safe_name = name.replace(' ', '_').replace('/', '_')
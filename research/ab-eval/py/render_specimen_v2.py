@@ -1,23 +1,26 @@
 import os
 import json
-import requests
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 import tempfile
 import argparse
 
+from corpus_changes import filter_corpus, font_bytes
+from glyph_atlas import AtlasDraw, GlyphAtlas
+
 def render_specimen_v2(font_path, output_path):
     """Renders a deterministic 1024x1024 specimen v2 for a font."""
     WIDTH, HEIGHT = 1024, 1024
     img = Image.new('RGB', (WIDTH, HEIGHT), color=(255, 255, 255))
-    draw = ImageDraw.Draw(img)
+    draw = AtlasDraw(img)
     
     try:
-        # Load font at different sizes
-        font_display = ImageFont.truetype(font_path, 160)
-        font_medium = ImageFont.truetype(font_path, 48)
-        font_small = ImageFont.truetype(font_path, 24)
-        font_micro = ImageFont.truetype(font_path, 12)
-        font_nano = ImageFont.truetype(font_path, 8)
+        # Load font at different sizes (glyphs rasterize once per font/size, shared across specimen versions)
+        atlas = GlyphAtlas(font_path)
+        font_display = atlas.font(160)
+        font_medium = atlas.font(48)
+        font_small = atlas.font(24)
+        font_micro = atlas.font(12)
+        font_nano = atlas.font(8)
     except Exception as e:
         print(f"  Error loading font {font_path}: {e}")
         return False
@@ -70,35 +73,33 @@ def render_specimen_v2(font_path, output_path):
     draw.text((margin, HEIGHT - 40), f"Specimen v2 - Deterministic 1024 - No Label", font=font_nano, fill=(150, 150, 150))
 
     img.save(output_path)
+    atlas.save()
     return True
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--corpus", default="research/ab-eval/data/corpus.toy.json")
     parser.add_argument("--out", default="research/ab-eval/out/specimens_v2")
+    parser.add_argument("--changes", default="", help="Change manifest from build_corpus_google_fonts.py; only added/changed fonts are rendered")
     args = parser.parse_args()
 
     os.makedirs(args.out, exist_ok=True)
     
     with open(args.corpus, 'r') as f:
         corpus = json.load(f)
+    corpus = filter_corpus(corpus, args.changes)
         
     for font in corpus:
         name = font['name']
         print(f"Processing {name}...")
-        files = font.get('files', {})
-        url = files.get('400') or (next(iter(files.values())) if files else None)
-        
-        if not url:
-            print(f"  No file URL for {name}")
-            continue
-            
         try:
-            resp = requests.get(url, timeout=10)
-            resp.raise_for_status()
-            
+            content = font_bytes(font)
+            if content is None:
+                print(f"  No font file or URL for {name}")
+                continue
+
             with tempfile.NamedTemporaryFile(suffix=".ttf", delete=False) as tmp:
-                tmp.write(resp.content)
+                tmp.write(content)
                 tmp_path = tmp.name
                 
             safe_name = name.replace(' ', '_').replace('/', '_')
@@ -1,58 +1,24 @@
 import os
 import json
-import requests
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 import tempfile
 import argparse
 
-def draw_section(draw, text, font, x, y, max_width, fill=(0, 0, 0), section_spacing=30, line_spacing=10):
-    """Draws text with robust wrapping and dynamic vertical spacing."""
+from corpus_changes import filter_corpus, font_bytes
+from glyph_atlas import AtlasDraw, GlyphAtlas
+from text_layout import TextLayout
+
+def draw_section(draw, text, font, x, y, max_width, fill=(0, 0, 0), section_spacing=30, line_spacing=10, layout=None):
+    """Draws text with robust wrapping and dynamic vertical spacing (measurements cached in `layout`)."""
     if not text:
         return y
-        
-    lines = []
-    words = text.split(' ')
-    current_line_parts = []
-    
-    for word in words:
-        test_line = ' '.join(current_line_parts + [word]) if current_line_parts else word
-        if draw.textlength(test_line, font=font) <= max_width:
-            current_line_parts.append(word)
-        else:
-            if current_line_parts:
-                lines.append(' '.join(current_line_parts))
-                current_line_parts = [word]
-                if draw.textlength(word, font=font) > max_width:
-                    word_line = current_line_parts.pop()
-                    temp = ""
-                    for char in word_line:
-                        if draw.textlength(temp + char, font=font) <= max_width:
-                            temp += char
-                        else:
-                            lines.append(temp)
-                            temp = char
-                    if temp:
-                        current_line_parts = [temp]
-            else:
-                temp = ""
-                for char in word:
-                    if draw.textlength(temp + char, font=font) <= max_width:
-                        temp += char
-                    else:
-                        lines.append(temp)
-                        temp = char
-                if temp:
-                    current_line_parts = [temp]
-                    
-    if current_line_parts:
-        lines.append(' '.join(current_line_parts))
+    layout = layout or TextLayout()
 
     curr_y = y
-    for line in lines:
-        bbox = draw.textbbox((x, curr_y), line, font=font, anchor="lt")
+    for line in layout.wrap(text, font, max_width):
         draw.text((x, curr_y), line, font=font, fill=fill, anchor="lt")
-        curr_y = bbox[3] + line_spacing
-        
+        curr_y = layout.line_bottom(line, font, curr_y) + line_spacing
+
     return curr_y + section_spacing
 
 def finalize_and_save(tall_img, current_y, output_path, target_size=(1024, 1024), margin=40):
@@ -111,60 +77,64 @@ def render_specimen_v3(font_path, output_dir, font_name):
     TALL_HEIGHT = 4096 # Large enough to avoid initial cropping
     
     try:
-        # Load font at different sizes
-        font_display = ImageFont.truetype(font_path, 200)
-        font_large = ImageFont.truetype(font_path, 72)
-        font_medium = ImageFont.truetype(font_path, 48)
-        font_small = ImageFont.truetype(font_path, 24)
-        font_micro = ImageFont.truetype(font_path, 12)
-        font_nano = ImageFont.truetype(font_path, 8)
+        # Load font at different sizes (glyphs rasterize once per font/size, shared across specimen versions)
+        atlas = GlyphAtlas(font_path)
+        font_display = atlas.font(200)
+        font_large = atlas.font(72)
+        font_medium = atlas.font(48)
+        font_small = atlas.font(24)
+        font_micro = atlas.font(12)
+        font_nano = atlas.font(8)
     except Exception as e:
         print(f"  Error loading font {font_path}: {e}")
         return False
 
     margin = 50
     max_w = WIDTH - (2 * margin)
+    # One measurement cache (advances, kerning, word widths) for every section of both halves
+    text_layout = TextLayout()
 
     # --- IMAGE 1: MACRO & CHARACTER SET ---
     img1 = Image.new('RGB', (WIDTH, TALL_HEIGHT), color=(255, 255, 255))
-    draw1 = ImageDraw.Draw(img1)
+    draw1 = AtlasDraw(img1)
     
     y = 60
-    y = draw_section(draw1, "Abg", font_display, margin, y, max_w)
+    y = draw_section(draw1, "Abg", font_display, margin, y, max_w, layout=text_layout)
     
     chars_upper = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
     chars_lower = "abcdefghijklmnopqrstuvwxyz"
-    y = draw_section(draw1, chars_upper, font_large, margin, y, max_w)
-    y = draw_section(draw1, chars_lower, font_large, margin, y, max_w)
+    y = draw_section(draw1, chars_upper, font_large, margin, y, max_w, layout=text_layout)
+    y = draw_section(draw1, chars_lower, font_large, margin, y, max_w, layout=text_layout)
 
     chars_num_sym = "0123456789 !@#$%^&*()_+"
-    y = draw_section(draw1, chars_num_sym, font_large, margin, y, max_w)
+    y = draw_section(draw1, chars_num_sym, font_large, margin, y, max_w, layout=text_layout)
     
     finalize_and_save(img1, y, os.path.join(output_dir, f"{font_name}_top.png"))
 
     # --- IMAGE 2: MICRO-TELLS & TEXTURE ---
     img2 = Image.new('RGB', (WIDTH, TALL_HEIGHT), color=(255, 255, 255))
-    draw2 = ImageDraw.Draw(img2)
+    draw2 = AtlasDraw(img2)
     
     y = 60
     pairs = "il1I  O0  rn/m  vv/w  e/o"
-    y = draw_section(draw2, "Legibility Pairs (Zoomed):", font_small, margin, y, max_w, fill=(100, 100, 100), section_spacing=10)
-    y = draw_section(draw2, pairs, font_large, margin, y, max_w)
+    y = draw_section(draw2, "Legibility Pairs (Zoomed):", font_small, margin, y, max_w, fill=(100, 100, 100), section_spacing=10, layout=text_layout)
+    y = draw_section(draw2, pairs, font_large, margin, y, max_w, layout=text_layout)
 
     tells = "a g y Q & f t G S R k 1 2 3"
-    y = draw_section(draw2, "Style Identifiers:", font_small, margin, y, max_w, fill=(100, 100, 100), section_spacing=10)
-    y = draw_section(draw2, tells, font_large, margin, y, max_w)
+    y = draw_section(draw2, "Style Identifiers:", font_small, margin, y, max_w, fill=(100, 100, 100), section_spacing=10, layout=text_layout)
+    y = draw_section(draw2, tells, font_large, margin, y, max_w, layout=text_layout)
 
     pangram = "The quick brown fox jumps over the lazy dog."
-    y = draw_section(draw2, f"Body 24pt: {pangram}", font_small, margin, y, max_w, section_spacing=15)
-    y = draw_section(draw2, f"Body 12pt: {pangram}", font_micro, margin, y, max_w, section_spacing=10)
-    y = draw_section(draw2, f"Body 8pt: {pangram}", font_nano, margin, y, max_w, section_spacing=30)
+    y = draw_section(draw2, f"Body 24pt: {pangram}", font_small, margin, y, max_w, section_spacing=15, layout=text_layout)
+    y = draw_section(draw2, f"Body 12pt: {pangram}", font_micro, margin, y, max_w, section_spacing=10, layout=text_layout)
+    y = draw_section(draw2, f"Body 8pt: {pangram}", font_nano, margin, y, max_w, section_spacing=30, layout=text_layout)
 
     strip_text = "||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||"
-    y = draw_section(draw2, "Contrast & Rhythm Strip:", font_small, margin, y, max_w, fill=(100, 100, 100), section_spacing=10)
-    y = draw_section(draw2, strip_text, font_medium, margin, y, max_w)
+    y = draw_section(draw2, "Contrast & Rhythm Strip:", font_small, margin, y, max_w, fill=(100, 100, 100), section_spacing=10, layout=text_layout)
+    y = draw_section(draw2, strip_text, font_medium, margin, y, max_w, layout=text_layout)
     
     finalize_and_save(img2, y, os.path.join(output_dir, f"{font_name}_bottom.png"))
+    atlas.save()
     
     return True
 
@@ -172,6 +142,7 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--corpus", default="research/ab-eval/data/corpus.toy.json")
     parser.add_argument("--out", default="research/ab-eval/out/specimens_v3")
+    parser.add_argument("--changes", default="", help="Change manifest from build_corpus_google_fonts.py; only added/changed fonts are rendered")
     args = parser.parse_args()
 
     os.makedirs(args.out, exist_ok=True)
@@ -182,22 +153,17 @@ def main():
 
     with open(args.corpus, 'r') as f:
         corpus = json.load(f)
+    corpus = filter_corpus(corpus, args.changes)
         
     for font in corpus:
         name = font['name']
         print(f"Processing {name}...")
-        files = font.get('files', {})
-        url = files.get('400') or (next(iter(files.values())) if files else None)
-        
-        if not url:
-            print(f"  No URL for {name}")
-            continue
-            
         try:
-            resp = requests.get(url, timeout=10)
-            resp.raise_for_status()
-            
-            content = resp.content
+            content = font_bytes(font)
+            if content is None:
+                print(f"  No font file or URL for {name}")
+                continue
+
             if content.startswith(b'PK\x03\x04'):
                 import zipfile, io
                 with zipfile.ZipFile(io.BytesIO(content)) as z:
@@ -229,6 +195,7 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--corpus", default="research/ab-eval/data/corpus.toy.json")
     parser.add_argument("--out", default="research/ab-eval/out/specimens_v3")
+    parser.add_argument("--changes", default="", help="Change manifest from build_corpus_google_fonts.py; only added/changed fonts are rendered")
     args = parser.parse_args()
 
     os.makedirs(args.out, exist_ok=True)
@@ -239,22 +206,17 @@ def main():
 
     with open(args.corpus, 'r') as f:
         corpus = json.load(f)
+    corpus = filter_corpus(corpus, args.changes)
         
     for font in corpus:
         name = font['name']
         print(f"Processing {name}...")
-        files = font.get('files', {})
-        url = files.get('400') or (next(iter(files.values())) if files else None)
-        
-        if not url:
-            print(f"  No URL for {name}")
-            continue
-            
         try:
-            resp = requests.get(url, timeout=10)
-            resp.raise_for_status()
-            
-            content = resp.content
+            content = font_bytes(font)
+            if content is None:
+                print(f"  No font file or URL for {name}")
+                continue
+
             if content.startswith(b'PK\x03\x04'):
                 import zipfile, io
                 with zipfile.ZipFile(io.BytesIO(content)) as z:
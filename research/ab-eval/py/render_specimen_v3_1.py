@@ -1,62 +1,103 @@
 import os
 import json
-import requests
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 import tempfile
 import argparse
 
-def draw_section(draw, text, font, x, y, max_width, fill=(0, 0, 0), section_spacing=30, line_spacing=10):
-    """Draws text with robust wrapping and dynamic vertical spacing."""
+from corpus_changes import filter_corpus, font_bytes
+from glyph_atlas import AtlasDraw, GlyphAtlas
+from text_layout import TextLayout
+
+# Side of one vision token in pixels (Qwen3-VL: 16px patches merged 2x2; Qwen2/2.5-VL: 28)
+PATCH_SIZE = 32
+
+def draw_section(draw, text, font, x, y, max_width, fill=(0, 0, 0), section_spacing=30, line_spacing=10, layout=None):
+    """Draws text with robust wrapping and dynamic vertical spacing (measurements cached in `layout`)."""
     if not text:
         return y
-        
-    lines = []
-    words = text.split(' ')
-    current_line_parts = []
-    
-    for word in words:
-        test_line = ' '.join(current_line_parts + [word]) if current_line_parts else word
-        if draw.textlength(test_line, font=font) <= max_width:
-            current_line_parts.append(word)
-        else:
-            if current_line_parts:
-                lines.append(' '.join(current_line_parts))
-                current_line_parts = [word]
-                if draw.textlength(word, font=font) > max_width:
-                    word_line = current_line_parts.pop()
-                    temp = ""
-                    for char in word_line:
-                        if draw.textlength(temp + char, font=font) <= max_width:
-                            temp += char
-                        else:
-                            lines.append(temp)
-                            temp = char
-                    if temp:
-                        current_line_parts = [temp]
-            else:
-                temp = ""
-                for char in word:
-                    if draw.textlength(temp + char, font=font) <= max_width:
-                        temp += char
-                    else:
-                        lines.append(temp)
-                        temp = char
-                if temp:
-                    current_line_parts = [temp]
-                    
-    if current_line_parts:
-        lines.append(' '.join(current_line_parts))
+    layout = layout or TextLayout()
 
     curr_y = y
-    for line in lines:
-        bbox = draw.textbbox((x, curr_y), line, font=font, anchor="lt")
+    for line in layout.wrap(text, font, max_width):
         draw.text((x, curr_y), line, font=font, fill=fill, anchor="lt")
-        curr_y = bbox[3] + line_spacing
-        
+        curr_y = layout.line_bottom(line, font, curr_y) + line_spacing
+
     return curr_y + section_spacing
 
-def finalize_and_save(tall_img, current_y, output_path, target_size=(1024, 1024), margin=40):
-    """Crops the tall image to content, scales to fit target_size, and saves."""
+def patch_grid(width, height, patch=PATCH_SIZE):
+    """Vision-token grid the processor resizes an image to (nearest multiple of `patch` per side)."""
+    return max(1, round(width / patch)), max(1, round(height / patch))
+
+def split_at_whitespace(img, max_height, min_gap=4):
+    """
+    Splits `img` into horizontal bands no taller than `max_height`, cutting
+    in the middle of blank row runs (>= `min_gap` rows) so no glyph is cut.
+    Falls back to a hard cut when a band has no such gap.
+    """
+    import numpy as np
+
+    blank = (np.asarray(img.convert('L')) >= 250).all(axis=1)
+    bands = []
+    start = 0
+    while img.height - start > max_height:
+        limit = start + max_height
+        cut = limit
+        # Walk blank-row runs backwards from the limit; cut in the middle of the first wide one
+        y = limit - 1
+        while y > start:
+            if not blank[y]:
+                y -= 1
+                continue
+            run_end = y
+            while y > start and blank[y]:
+                y -= 1
+            if run_end - y >= min_gap:
+                cut = (y + 1 + run_end + 1) // 2
+                break
+        bands.append((start, cut))
+        start = cut
+    bands.append((start, img.height))
+    return [img.crop((0, top, img.width, bottom)) for top, bottom in bands]
+
+def pack_tiles(cropped, output_path, max_side=1024, patch=PATCH_SIZE, margin=8):
+    """
+    Tiles layout: no scale-to-canvas. Content wider than `max_side` is
+    downscaled (never upscaled), tall content is split at whitespace into
+    tiles of at most `max_side`, each tile is re-trimmed and padded only up
+    to the next multiple of `patch`. Writes `<stem>_t<i>.png` and returns
+    tile metadata including the vision-token cost.
+    """
+    from PIL import ImageOps
+
+    w, h = cropped.size
+    if w > max_side:
+        cropped = cropped.resize((max_side, max(1, round(h * max_side / w))), Image.Resampling.LANCZOS)
+
+    stem, ext = os.path.splitext(output_path)
+    tiles = []
+    for band in split_at_whitespace(cropped, max_side):
+        bbox = ImageOps.invert(band.convert('L')).getbbox()
+        if not bbox:
+            continue
+        band = band.crop((0, max(0, bbox[1] - margin), band.width, min(band.height, bbox[3] + margin)))
+        tw = -(-band.width // patch) * patch
+        th = -(-band.height // patch) * patch
+        tile = Image.new('RGB', (tw, th), color=(255, 255, 255))
+        tile.paste(band, ((tw - band.width) // 2, (th - band.height) // 2))
+        tile_path = f"{stem}_t{len(tiles)}{ext}"
+        tile.save(tile_path)
+        gw, gh = tw // patch, th // patch
+        tiles.append({"path": tile_path, "width": tw, "height": th, "patch_grid": [gw, gh], "vision_tokens": gw * gh})
+    return tiles
+
+def finalize_and_save(tall_img, current_y, output_path, target_size=(1024, 1024), margin=40, layout="canvas",
+                      patch=PATCH_SIZE):
+    """
+    Crops the tall image to content, scales to fit target_size, and saves.
+    With layout="tiles" the content is instead packed into aspect-preserving,
+    patch-aligned tiles (see pack_tiles). Returns the vision-token metadata
+    of what was written.
+    """
     # Crop to content (0, 0, 1024, current_y)
     content_img = tall_img.crop((0, 0, 1024, min(current_y, tall_img.height)))
     
@@ -66,10 +107,12 @@ def finalize_and_save(tall_img, current_y, output_path, target_size=(1024, 1024)
     inverted = ImageOps.invert(gray)
     bbox = inverted.getbbox()
     
+    canvas_grid = patch_grid(*target_size, patch=patch)
+    canvas_tokens = canvas_grid[0] * canvas_grid[1]
     if not bbox:
         final_img = Image.new('RGB', target_size, color=(255, 255, 255))
         final_img.save(output_path)
-        return
+        return {"layout": "canvas", "files": [output_path], "vision_tokens": canvas_tokens, "canvas_vision_tokens": canvas_tokens}
 
     # Add margin to bbox
     bbox = (
@@ -80,6 +123,12 @@ def finalize_and_save(tall_img, current_y, output_path, target_size=(1024, 1024)
     )
     
     cropped = content_img.crop(bbox)
+
+    if layout == "tiles":
+        tiles = pack_tiles(cropped, output_path, max_side=max(target_size), patch=patch)
+        tokens = sum(t["vision_tokens"] for t in tiles)
+        return {"layout": "tiles", "files": [t["path"] for t in tiles], "tiles": tiles,
+                "vision_tokens": tokens, "canvas_vision_tokens": canvas_tokens}
     
     # Scale to fit target_size while maintaining aspect ratio
     w, h = cropped.size
@@ -99,74 +148,95 @@ def finalize_and_save(tall_img, current_y, output_path, target_size=(1024, 1024)
     final_img.paste(resized, (paste_x, paste_y))
     
     final_img.save(output_path)
+    return {"layout": "canvas", "files": [output_path], "vision_tokens": canvas_tokens, "canvas_vision_tokens": canvas_tokens}
 
-def render_specimen_v3_1(font_path, output_dir, font_name):
-    """Renders split specimen v3.1 for a font with enhanced micro-distinction blocks."""
+def render_specimen_v3_1(font_path, output_dir, font_name, layout="canvas", patch=PATCH_SIZE):
+    """
+    Renders split specimen v3.1 for a font with enhanced micro-distinction blocks.
+    In the tiles layout a `<font>.tiles.json` sidecar records each half's tiles and vision-token cost.
+    """
     WIDTH = 1024
     TALL_HEIGHT = 4096 
     
     try:
-        # Load font at different sizes
-        font_display = ImageFont.truetype(font_path, 200)
-        font_large = ImageFont.truetype(font_path, 72)
-        font_medium = ImageFont.truetype(font_path, 48)
-        font_small = ImageFont.truetype(font_path, 24)
-        font_micro = ImageFont.truetype(font_path, 12)
-        font_nano = ImageFont.truetype(font_path, 8)
+        # Load font at different sizes (glyphs rasterize once per font/size, shared across specimen versions)
+        atlas = GlyphAtlas(font_path)
+        font_display = atlas.font(200)
+        font_large = atlas.font(72)
+        font_medium = atlas.font(48)
+        font_small = atlas.font(24)
+        font_micro = atlas.font(12)
+        font_nano = atlas.font(8)
     except Exception as e:
         print(f"  Error loading font {font_path}: {e}")
         return False
 
     margin = 50
     max_w = WIDTH - (2 * margin)
+    # One measurement cache (advances, kerning, word widths) for every section of both halves
+    text_layout = TextLayout()
 
     # --- IMAGE 1: MACRO & CHARACTER SET ---
     img1 = Image.new('RGB', (WIDTH, TALL_HEIGHT), color=(255, 255, 255))
-    draw1 = ImageDraw.Draw(img1)
+    draw1 = AtlasDraw(img1)
     
     y = 60
-    y = draw_section(draw1, "Abg", font_display, margin, y, max_w)
+    y = draw_section(draw1, "Abg", font_display, margin, y, max_w, layout=text_layout)
     
     chars_upper = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
     chars_lower = "abcdefghijklmnopqrstuvwxyz"
-    y = draw_section(draw1, chars_upper, font_large, margin, y, max_w)
-    y = draw_section(draw1, chars_lower, font_large, margin, y, max_w)
+    y = draw_section(draw1, chars_upper, font_large, margin, y, max_w, layout=text_layout)
+    y = draw_section(draw1, chars_lower, font_large, margin, y, max_w, layout=text_layout)
 
     chars_num_sym = "0123456789 !@#$%^&*()_+"
-    y = draw_section(draw1, chars_num_sym, font_large, margin, y, max_w)
+    y = draw_section(draw1, chars_num_sym, font_large, margin, y, max_w, layout=text_layout)
     
-    finalize_and_save(img1, y, os.path.join(output_dir, f"{font_name}_top.png"))
+    top = finalize_and_save(img1, y, os.path.join(output_dir, f"{font_name}_top.png"), layout=layout, patch=patch)
 
     # --- IMAGE 2: MICRO-TELLS & TEXTURE ---
     img2 = Image.new('RGB', (WIDTH, TALL_HEIGHT), color=(255, 255, 255))
-    draw2 = ImageDraw.Draw(img2)
+    draw2 = AtlasDraw(img2)
     
     y = 60
     
     # NEW V3.1: Dedicated Distinction Block (Macro-scale)
     distinction = "il1I0O"
-    y = draw_section(draw2, "Critical Distinction (Macro):", font_small, margin, y, max_w, fill=(100, 100, 100), section_spacing=10)
-    y = draw_section(draw2, distinction, font_display, margin, y, max_w)
+    y = draw_section(draw2, "Critical Distinction (Macro):", font_small, margin, y, max_w, fill=(100, 100, 100), section_spacing=10, layout=text_layout)
+    y = draw_section(draw2, distinction, font_display, margin, y, max_w, layout=text_layout)
     
     pairs = "rn/m  vv/w  e/o  S/s  C/c"
-    y = draw_section(draw2, "Legibility Pairs (Zoomed):", font_small, margin, y, max_w, fill=(100, 100, 100), section_spacing=10)
-    y = draw_section(draw2, pairs, font_large, margin, y, max_w)
+    y = draw_section(draw2, "Legibility Pairs (Zoomed):", font_small, margin, y, max_w, fill=(100, 100, 100), section_spacing=10, layout=text_layout)
+    y = draw_section(draw2, pairs, font_large, margin, y, max_w, layout=text_layout)
 
     # Expanded Style Identifiers
     tells = "a g y Q & f t G S R k 1 2 3 M W"
-    y = draw_section(draw2, "Style Identifiers:", font_small, margin, y, max_w, fill=(100, 100, 100), section_spacing=10)
-    y = draw_section(draw2, tells, font_large, margin, y, max_w)
+    y = draw_section(draw2, "Style Identifiers:", font_small, margin, y, max_w, fill=(100, 100, 100), section_spacing=10, layout=text_layout)
+    y = draw_section(draw2, tells, font_large, margin, y, max_w, layout=text_layout)
 
     pangram = "The quick brown fox jumps over the lazy dog."
-    y = draw_section(draw2, f"Body 24pt: {pangram}", font_small, margin, y, max_w, section_spacing=15)
-    y = draw_section(draw2, f"Body 12pt: {pangram}", font_micro, margin, y, max_w, section_spacing=10)
-    y = draw_section(draw2, f"Body 8pt: {pangram}", font_nano, margin, y, max_w, section_spacing=30)
+    y = draw_section(draw2, f"Body 24pt: {pangram}", font_small, margin, y, max_w, section_spacing=15, layout=text_layout)
+    y = draw_section(draw2, f"Body 12pt: {pangram}", font_micro, margin, y, max_w, section_spacing=10, layout=text_layout)
+    y = draw_section(draw2, f"Body 8pt: {pangram}", font_nano, margin, y, max_w, section_spacing=30, layout=text_layout)
 
     strip_text = "||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||"
-    y = draw_section(draw2, "Contrast & Rhythm Strip:", font_small, margin, y, max_w, fill=(100, 100, 100), section_spacing=10)
-    y = draw_section(draw2, strip_text, font_medium, margin, y, max_w)
+    y = draw_section(draw2, "Contrast & Rhythm Strip:", font_small, margin, y, max_w, fill=(100, 100, 100), section_spacing=10, layout=text_layout)
+    y = draw_section(draw2, strip_text, font_medium, margin, y, max_w, layout=text_layout)
     
-    finalize_and_save(img2, y, os.path.join(output_dir, f"{font_name}_bottom.png"))
+    bottom = finalize_and_save(img2, y, os.path.join(output_dir, f"{font_name}_bottom.png"), layout=layout, patch=patch)
+    atlas.save()
+
+    if layout == "tiles":
+        meta = {
+            "font": font_name,
+            "patch_size": patch,
+            "top": top,
+            "bottom": bottom,
+            "vision_tokens": top["vision_tokens"] + bottom["vision_tokens"],
+            "canvas_vision_tokens": top["canvas_vision_tokens"] + bottom["canvas_vision_tokens"],
+        }
+        with open(os.path.join(output_dir, f"{font_name}.tiles.json"), 'w') as f:
+            json.dump(meta, f, indent=2)
+        print(f"  {meta['vision_tokens']} vision tokens in tiles vs {meta['canvas_vision_tokens']} on 1024x1024 canvases")
     
     return True
 
@@ -174,6 +244,11 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--corpus", default="research/ab-eval/data/corpus.200.json")
     parser.add_argument("--out", default="research/ab-eval/out/specimens_v3_1")
+    parser.add_argument("--changes", default="", help="Change manifest from build_corpus_google_fonts.py; only added/changed fonts are rendered")
+    parser.add_argument("--layout", choices=["canvas", "tiles"], default="canvas",
+                        help="canvas: 1024x1024 padded PNGs (default); tiles: aspect-preserving patch-aligned tiles + <font>.tiles.json")
+    parser.add_argument("--patch-size", type=int, default=PATCH_SIZE,
+                        help="Pixels per vision token side for tile padding and token counts (32 = Qwen3-VL, 28 = Qwen2/2.5-VL)")
     args = parser.parse_args()
 
     os.makedirs(args.out, exist_ok=True)
@@ -184,22 +259,17 @@ def main():
 
     with open(args.corpus, 'r') as f:
         corpus = json.load(f)
+    corpus = filter_corpus(corpus, args.changes)
         
     for font in corpus:
         name = font['name']
         print(f"Processing {name}...")
-        files = font.get('files', {})
-        url = files.get('400') or (next(iter(files.values())) if files else None)
-        
-        if not url:
-            print(f"  No URL for {name}")
-            continue
-            
         try:
-            resp = requests.get(url, timeout=10)
-            resp.raise_for_status()
-            
-            content = resp.content
+            content = font_bytes(font)
+            if content is None:
+                print(f"  No font file or URL for {name}")
+                continue
+
             if content.startswith(b'PK\x03\x04'):
                 import zipfile, io
                 with zipfile.ZipFile(io.BytesIO(content)) as z:
@@ -219,7 +289,7 @@ def main():
                 tmp_path = tmp.name
             
             safe_name = name.replace(" ", "_")
-            render_specimen_v3_1(tmp_path, args.out, safe_name)
+            render_specimen_v3_1(tmp_path, args.out, safe_name, layout=args.layout, patch=args.patch_size)
             os.remove(tmp_path)
         except Exception as e:
             print(f"  Failed {name}: {e}")
@@ -0,0 +1,447 @@
+"""
+Columnar sidecar format for judged (query, font) results
+
+Runners keep writing their pretty-printed JSON; `write_sidecar()` stores the
+same `details` rows next to it as `<stem>.cols`, one array per field:
+
+- `dict`  : dictionary-encoded strings (int32 codes + vocabulary), used for
+            query_id / font_name and any other low-cardinality string field
+- `int`   : int64 (ai_match, human_match, ai_match_gated, ...)
+- `bool`  : bool
+- `float` : float64 (confidence, latency_sec); a `.isint` mask is stored when a
+            field mixes ints and floats so rows round-trip exactly
+- `text`  : UTF-8 blob + int64 offsets (evidence, thought)
+- `json`  : per-row JSON text for nested / mixed / null values
+
+A `.present` mask is stored only for fields missing from some rows. Top-level
+keys other than `details` (agreement, counts, ...) are kept as a JSON segment.
+
+File layout: magic, uint32 directory length, JSON directory (schema + segment
+offsets), then one 8-byte aligned segment per array. Numeric segments are raw;
+text segments are zlib-compressed. Opening a file reads only the directory and
+each column is one seek + read, so `load_columns(path, ["query_id",
+"font_name", "ai_match"])` never touches the evidence/thought blobs.
+
+Usage:
+    python research/ab-eval/py/results_columnar.py convert "research/ab-eval/out/*.json"
+    python research/ab-eval/py/results_columnar.py bench "research/ab-eval/out/*.json" --columns query_id font_name ai_match
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import struct
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+FORMAT_VERSION = 1
+SIDECAR_SUFFIX = ".cols"
+MAGIC = b"ABCOLS1\n"
+HEADER_SEGMENT = "__header__"
+ALIGN = 8
+
+# Always dictionary-encoded; other string fields are when at most half their values are distinct.
+DICT_COLUMNS = ("query_id", "font_name")
+DICT_MAX_UNIQUE_RATIO = 0.5
+
+
+def sidecar_path(json_path: Path) -> Path:
+    json_path = Path(json_path)
+    return json_path.with_name(json_path.stem + SIDECAR_SUFFIX)
+
+
+def split_results(data: Any) -> Tuple[Optional[List[Dict[str, Any]]], Dict[str, Any]]:
+    """(detail rows, header) for a results payload; rows is None when it carries no judged pairs."""
+    if isinstance(data, list):
+        rows, header = data, {}
+    elif isinstance(data, dict) and isinstance(data.get("details"), list):
+        rows = data["details"]
+        header = {k: v for k, v in data.items() if k != "details"}
+    else:
+        return None, {}
+    if not rows or not all(isinstance(r, dict) for r in rows):
+        return None, {}
+    if not {"query_id", "font_name"} <= rows[0].keys():
+        return None, {}
+    return rows, header
+
+
+# ---------------------------------------------------------------------------
+# Encoding
+# ---------------------------------------------------------------------------
+
+def _encode_strings(values: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return blob, offsets
+
+
+def _decode_strings(blob: np.ndarray, offsets: np.ndarray) -> List[str]:
+    raw = blob.tobytes()
+    return [raw[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+
+def _infer_kind(name: str, values: List[Any]) -> str:
+    if any(v is None for v in values):
+        return "json"
+    if all(isinstance(v, bool) for v in values):
+        return "bool"
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        return "int"
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        return "float"
+    if all(isinstance(v, str) for v in values):
+        if name in DICT_COLUMNS or len(set(values)) <= DICT_MAX_UNIQUE_RATIO * len(values):
+            return "dict"
+        return "text"
+    return "json"
+
+
+def encode_rows(rows: List[Dict[str, Any]]) -> Tuple[Dict[str, np.ndarray], List[Dict[str, str]]]:
+    """Column arrays (segment name -> array) and the column schema for `rows`."""
+    names: Dict[str, None] = {}
+    for r in rows:
+        names.update(dict.fromkeys(r))
+
+    arrays: Dict[str, np.ndarray] = {}
+    schema: List[Dict[str, str]] = []
+    for name in names:
+        present = np.array([name in r for r in rows], dtype=bool)
+        values = [r[name] for r in rows if name in r]
+        kind = _infer_kind(name, values)
+        schema.append({"name": name, "kind": kind})
+        if not present.all():
+            arrays[f"{name}.present"] = present
+
+        if kind == "dict":
+            vocab, codes = np.unique(np.array(values, dtype=object).astype(str), return_inverse=True)
+            full = np.zeros(len(rows), dtype=np.int32)
+            full[present] = codes
+            arrays[f"{name}.codes"] = full
+            arrays[f"{name}.vocab.blob"], arrays[f"{name}.vocab.offsets"] = _encode_strings(vocab.tolist())
+        elif kind in ("int", "bool", "float"):
+            dtype = {"int": np.int64, "bool": bool, "float": np.float64}[kind]
+            full = np.zeros(len(rows), dtype=dtype)
+            full[present] = values
+            arrays[name] = full
+            if kind == "float":
+                isint = np.zeros(len(rows), dtype=bool)
+                isint[present] = [isinstance(v, int) for v in values]
+                if isint.any():
+                    arrays[f"{name}.isint"] = isint
+        else:
+            it = iter(values)
+            texts = [(next(it) if p else "") for p in present]
+            if kind == "json":
+                texts = [json.dumps(t, ensure_ascii=False) if p else "" for t, p in zip(texts, present)]
+            arrays[f"{name}.blob"], arrays[f"{name}.offsets"] = _encode_strings(texts)
+    return arrays, schema
+
+
+def write_columnar(path: Path, rows: List[Dict[str, Any]], header: Optional[Dict[str, Any]] = None) -> Path:
+    arrays, schema = encode_rows(rows)
+    arrays[HEADER_SEGMENT] = np.frombuffer(json.dumps(header or {}).encode("utf-8"), dtype=np.uint8)
+
+    segments: Dict[str, Dict[str, Any]] = {}
+    payloads: List[bytes] = []
+    offset = 0
+    for member, arr in arrays.items():
+        raw = np.ascontiguousarray(arr).tobytes()
+        codec = "zlib" if arr.dtype == np.uint8 and len(raw) > 256 else "raw"
+        data = zlib.compress(raw, 6) if codec == "zlib" else raw
+        pad = -len(data) % ALIGN
+        segments[member] = {
+            "offset": offset,
+            "nbytes": len(data),
+            "dtype": arr.dtype.str,
+            "count": int(arr.size),
+            "codec": codec,
+        }
+        payloads.append(data + b"\0" * pad)
+        offset += len(data) + pad
+
+    directory = json.dumps({
+        "format": "ab-eval-columnar",
+        "version": FORMAT_VERSION,
+        "n_rows": len(rows),
+        "columns": schema,
+        "segments": segments,
+    }).encode("utf-8")
+    directory += b" " * (-(len(MAGIC) + 4 + len(directory)) % ALIGN)
+
+    path = Path(path)
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(directory)))
+        f.write(directory)
+        for data in payloads:
+            f.write(data)
+    return path
+
+
+def write_sidecar(json_path: Path, data: Any) -> Optional[Path]:
+    """Write `<stem>.cols` next to a results JSON; no-op for payloads without detail rows."""
+    rows, header = split_results(data)
+    if rows is None:
+        return None
+    return write_columnar(sidecar_path(json_path), rows, header)
+
+
+# ---------------------------------------------------------------------------
+# Reading
+# ---------------------------------------------------------------------------
+
+class ColumnarResults:
+    """Lazy reader: opening reads the directory only; each column is read when requested."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._f = open(self.path, "rb")
+        try:
+            if self._f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{self.path}: not a columnar results file")
+            (dir_len,) = struct.unpack("<I", self._f.read(4))
+            directory = json.loads(self._f.read(dir_len).decode("utf-8"))
+        except Exception:
+            self._f.close()
+            raise
+        if directory.get("version") != FORMAT_VERSION:
+            self._f.close()
+            raise ValueError(f"{self.path}: unsupported columnar version {directory.get('version')}")
+        self._base = len(MAGIC) + 4 + dir_len
+        self._segments: Dict[str, Dict[str, Any]] = directory["segments"]
+        self.n_rows: int = directory["n_rows"]
+        self.kinds: Dict[str, str] = {c["name"]: c["kind"] for c in directory["columns"]}
+        self._header: Optional[Dict[str, Any]] = None
+
+    def __enter__(self) -> "ColumnarResults":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._f.close()
+
+    def _read(self, member: str) -> np.ndarray:
+        seg = self._segments[member]
+        self._f.seek(self._base + seg["offset"])
+        data = self._f.read(seg["nbytes"])
+        if seg["codec"] == "zlib":
+            data = zlib.decompress(data)
+        return np.frombuffer(data, dtype=np.dtype(seg["dtype"]), count=seg["count"])
+
+    @property
+    def header(self) -> Dict[str, Any]:
+        """Top-level payload keys other than `details`."""
+        if self._header is None:
+            self._header = json.loads(self._read(HEADER_SEGMENT).tobytes().decode("utf-8"))
+        return self._header
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self.kinds)
+
+    def _kind(self, name: str) -> str:
+        if name not in self.kinds:
+            raise KeyError(f"{self.path}: no column {name!r}")
+        return self.kinds[name]
+
+    def present(self, name: str) -> np.ndarray:
+        self._kind(name)
+        key = f"{name}.present"
+        return self._read(key) if key in self._segments else np.ones(self.n_rows, dtype=bool)
+
+    def vocab(self, name: str) -> np.ndarray:
+        if self._kind(name) != "dict":
+            raise ValueError(f"{name!r} is not dictionary-encoded")
+        return np.array(_decode_strings(self._read(f"{name}.vocab.blob"), self._read(f"{name}.vocab.offsets")), dtype=object)
+
+    def codes(self, name: str) -> np.ndarray:
+        if self._kind(name) != "dict":
+            raise ValueError(f"{name!r} is not dictionary-encoded")
+        return self._read(f"{name}.codes")
+
+    def column(self, name: str, decode: bool = True) -> np.ndarray:
+        """
+        One column as a (read-only) array. Dictionary columns return decoded strings, or the
+        int32 codes with `decode=False` (pair with `vocab()`). Rows where the field
+        is absent hold 0 / "" / None; check `present()` when it matters.
+        """
+        kind = self._kind(name)
+        if kind == "dict":
+            codes = self.codes(name)
+            return self.vocab(name)[codes] if decode else codes
+        if kind in ("int", "bool", "float"):
+            return self._read(name)
+        texts = _decode_strings(self._read(f"{name}.blob"), self._read(f"{name}.offsets"))
+        if kind == "json":
+            present = self.present(name)
+            texts = [json.loads(t) if p else None for t, p in zip(texts, present)]
+        return np.array(texts, dtype=object)
+
+    def text_offsets(self, name: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Raw (blob, offsets) of a text column, e.g. for length statistics without decoding."""
+        if self._kind(name) not in ("text", "json"):
+            raise ValueError(f"{name!r} is not a text column")
+        return self._read(f"{name}.blob"), self._read(f"{name}.offsets")
+
+    def to_rows(self, columns: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """Rebuild detail dicts; identical to the JSON rows when `columns` is None."""
+        names = list(columns) if columns is not None else self.columns
+        rows: List[Dict[str, Any]] = [{} for _ in range(self.n_rows)]
+        for name in names:
+            if name not in self.kinds:
+                continue
+            values = self.column(name).tolist()
+            if self.kinds[name] == "float" and f"{name}.isint" in self._segments:
+                isint = self._read(f"{name}.isint")
+                values = [int(v) if i else v for v, i in zip(values, isint)]
+            present = self.present(name)
+            for row, v, p in zip(rows, values, present):
+                if p:
+                    row[name] = v
+        return rows
+
+
+def load_columns(path: Path, columns: Sequence[str], decode: bool = True) -> Dict[str, np.ndarray]:
+    with ColumnarResults(path) as cr:
+        return {name: cr.column(name, decode=decode) for name in columns}
+
+
+def fresh_sidecar(json_path: Path) -> Optional[Path]:
+    """Sidecar path if one exists and is at least as new as the JSON it mirrors."""
+    json_path = Path(json_path)
+    side = sidecar_path(json_path)
+    if not side.exists():
+        return None
+    if json_path.exists() and side.stat().st_mtime < json_path.stat().st_mtime:
+        return None
+    return side
+
+
+def load_detail_rows(json_path: Path, columns: Optional[Sequence[str]] = None) -> Optional[List[Dict[str, Any]]]:
+    """
+    Detail rows of a results file, read from a fresh sidecar when available
+    (only `columns` are loaded) and from the JSON otherwise. Returns None for
+    files that carry no judged pairs.
+    """
+    side = fresh_sidecar(json_path)
+    if side is not None:
+        with ColumnarResults(side) as cr:
+            return cr.to_rows(columns)
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    rows, _ = split_results(data)
+    if rows is None or columns is None:
+        return rows
+    keep = list(columns)
+    return [{k: r[k] for k in keep if k in r} for r in rows]
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def expand_paths(patterns: List[str]) -> List[Path]:
+    paths: List[Path] = []
+    for p in patterns:
+        matches = sorted(glob.glob(p))
+        paths.extend(Path(m) for m in (matches or [p]))
+    return [p for p in paths if p.suffix == ".json"]
+
+
+def convert(paths: List[Path], check: bool, force: bool) -> None:
+    n_written = json_bytes = col_bytes = 0
+    for path in paths:
+        if not force and fresh_sidecar(path) is not None:
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            continue
+        side = write_sidecar(path, data)
+        if side is None:
+            continue
+        if check:
+            rows, header = split_results(data)
+            with ColumnarResults(side) as cr:
+                if cr.to_rows() != rows or cr.header != header:
+                    raise SystemExit(f"Round-trip mismatch: {path}")
+        n_written += 1
+        json_bytes += path.stat().st_size
+        col_bytes += side.stat().st_size
+        print(f"  {path.name} -> {side.name} ({path.stat().st_size / 1024:.0f} KB -> {side.stat().st_size / 1024:.0f} KB)")
+    if n_written:
+        print(f"Wrote {n_written} sidecars: {json_bytes / 1e6:.2f} MB JSON -> {col_bytes / 1e6:.2f} MB columnar")
+    else:
+        print("No sidecars written (up to date or no detail rows)")
+
+
+def bench(paths: List[Path], columns: List[str]) -> None:
+    pairs = []
+    for p in paths:
+        side = fresh_sidecar(p)
+        if side is None:
+            continue
+        with ColumnarResults(side) as cr:
+            if set(columns) <= set(cr.columns):
+                pairs.append((p, side))
+    if not pairs:
+        print(f"No fresh sidecars with columns {columns}; run `convert` first")
+        return
+
+    t0 = time.perf_counter()
+    n_json = 0
+    for p, _ in pairs:
+        with open(p, "r", encoding="utf-8") as f:
+            rows, _ = split_results(json.load(f))
+        n_json += len(rows or [])
+    t_json = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    n_col = 0
+    for _, s in pairs:
+        cols = load_columns(s, columns, decode=False)
+        n_col += len(next(iter(cols.values())))
+    t_col = time.perf_counter() - t0
+
+    print(f"{len(pairs)} runs, {n_json} rows")
+    print(f"  JSON parse:          {t_json * 1000:8.1f} ms")
+    print(f"  Columnar {columns}: {t_col * 1000:8.1f} ms ({n_col} rows)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Columnar sidecars for judged-pair results")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_conv = sub.add_parser("convert", help="Write <stem>.cols next to results JSON files")
+    p_conv.add_argument("paths", nargs="+", help="Results JSON paths or globs")
+    p_conv.add_argument("--check", action="store_true", help="Verify rows round-trip exactly")
+    p_conv.add_argument("--force", action="store_true", help="Rewrite sidecars that are already up to date")
+
+    p_bench = sub.add_parser("bench", help="Compare full JSON parse against columnar column loads")
+    p_bench.add_argument("paths", nargs="+", help="Results JSON paths or globs")
+    p_bench.add_argument("--columns", nargs="+", default=["query_id", "font_name", "ai_match"])
+
+    args = parser.parse_args()
+    if args.cmd == "convert":
+        convert(expand_paths(args.paths), args.check, args.force)
+    else:
+        bench(expand_paths(args.paths), args.columns)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,8 @@ from typing import List, Dict, Any, Tuple
 import numpy as np
 from itertools import product
 
+from metrics_kernel import compute_metrics
+
 def load_json(path: Path) -> Any:
     if not path.exists():
         return None
@@ -12,28 +14,8 @@ def load_json(path: Path) -> Any:
         return json.load(f)
 
 def calculate_metrics(y_true: np.ndarray, y_pred: np.ndarray) -> Dict[str, Any]:
-    tp = np.sum((y_true == 1) & (y_pred == 1))
-    fp = np.sum((y_true == 0) & (y_pred == 1))
-    fn = np.sum((y_true == 1) & (y_pred == 0))
-    tn = np.sum((y_true == 0) & (y_pred == 0))
-    
-    total = len(y_true)
-    agreement = (tp + tn) / total if total > 0 else 0
-    precision = tp / (tp + fp) if (tp + fp) > 0 else 0
-    recall = tp / (tp + fn) if (tp + fn) > 0 else 0
-    f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
-    
-    return {
-        "agreement": round(float(agreement), 4),
-        "precision": round(float(precision), 4),
-        "recall": round(float(recall), 4),
-        "f1": round(float(f1), 4),
-        "tp": int(tp),
-        "fp": int(fp),
-        "fn": int(fn),
-        "tn": int(tn),
-        "total": int(total)
-    }
+    m = compute_metrics(y_true, y_pred)
+    return {k: m[k] for k in ("agreement", "precision", "recall", "f1")} | m["counts"]
 
 def main():
     out_dir = Path("research/ab-eval/out")
@@ -1,23 +1,64 @@
-import subprocess
 import sys
 import os
 import argparse
 
-def run_script(script_name, args=[]):
-    """Helper to run a python script and stream output."""
-    script_path = os.path.join("research", "ab-eval", "py", script_name)
-    print(f"\n{'='*60}")
-    print(f"Running: {script_name} {' '.join(args)}")
-    print(f"{'='*60}\n")
-    
-    cmd = [sys.executable, script_path] + args
-    result = subprocess.run(cmd)
-    
-    if result.returncode != 0:
-        print(f"\nError: {script_name} failed with exit code {result.returncode}")
-        # Don't exit immediately if we are running 'all', maybe some parts can still work
-        return False
-    return True
+from pipeline import Pipeline, Stage, failed
+from embed_server import SERVER_ENV
+
+OUT = "research/ab-eval/out"
+GLYPH_DIR = f"{OUT}/glyphs"
+TEXT_OUTPUTS = [f"{OUT}/embeddings_text_docs.jsonl", f"{OUT}/embeddings_text_queries.jsonl"]
+VL_OUTPUTS = [
+    f"{OUT}/embeddings_vl_docs_b1.npy",
+    f"{OUT}/embeddings_vl_docs_b2.npy",
+    f"{OUT}/embeddings_vl_docs_b2plus.npy",
+    f"{OUT}/embeddings_vl_queries.npy",
+    f"{OUT}/metadata_docs.json",
+    f"{OUT}/metadata_queries.json",
+]
+
+def build_stages(args):
+    """corpus -> glyphs -> embeddings (text | VL, independent) -> scores/report."""
+    stages = []
+    if args.variant in ["A", "all"]:
+        stages.append(Stage(
+            "embed_text", "embed_openrouter_text.py",
+            ["--corpus", args.corpus, "--queries", args.queries],
+            inputs=[args.corpus, args.queries], outputs=TEXT_OUTPUTS,
+        ))
+    if args.variant in ["B", "all"]:
+        stages.append(Stage(
+            "glyphs", "render_glyph_sheet.py",
+            ["--corpus", args.corpus, "--out", GLYPH_DIR],
+            inputs=[args.corpus], outputs=[GLYPH_DIR],
+        ))
+        stages.append(Stage(
+            "embed_vl", "embed_qwen3_vl_batch.py",
+            ["--corpus", args.corpus, "--queries", args.queries, "--model", args.model,
+             "--glyph_dir", GLYPH_DIR, "--skip-render"],
+            inputs=[args.corpus, args.queries, GLYPH_DIR], outputs=VL_OUTPUTS,
+        ))
+
+    if args.variant == "A":
+        stages.append(Stage(
+            "score", "score_retrieval.py",
+            ["--labels", args.labels],
+            inputs=[args.labels] + TEXT_OUTPUTS,
+            outputs=[f"{OUT}/report_text.json", f"{OUT}/report_text.md"],
+        ))
+    else:
+        # score_all_variants handles a missing A (or B) gracefully, so under --variant all
+        # a failed embedding stage does not block scoring of the other one.
+        required_vl = VL_OUTPUTS if args.variant == "B" else []
+        optional_vl = VL_OUTPUTS if args.variant == "all" else []
+        stages.append(Stage(
+            "score", "score_all_variants.py",
+            ["--labels", args.labels, "--queries", args.queries],
+            inputs=[args.labels, args.queries] + required_vl,
+            optional_inputs=TEXT_OUTPUTS + optional_vl,
+            outputs=[f"{OUT}/report_all.json", f"{OUT}/report_all.md"],
+        ))
+    return stages
 
 def main():
     parser = argparse.ArgumentParser()
@@ -32,6 +73,13 @@ def main():
     parser.add_argument("--labels", help="Path to labels file")
     parser.add_argument("--seed", type=int, default=42, help="Fixed seed for reproducibility")
     parser.add_argument("--repeats", type=int, default=1, help="Number of times to repeat stochastic steps")
+    parser.add_argument("--embed-server", default="",
+                        help="URL of a running embed_server.py so the VL model is loaded once across runs")
+    parser.add_argument("--jobs", type=int, default=2, help="Max stages running concurrently")
+    parser.add_argument("--force", action="store_true", help="Re-run every stage even if its fingerprint is current")
+    parser.add_argument("--force-stage", action="append", default=[], help="Re-run this stage (repeatable)")
+    parser.add_argument("--dry-run", action="store_true", help="Only report which stages would run")
+    parser.add_argument("--state", default=f"{OUT}/.pipeline_state.json", help="Fingerprint/timing state file")
     args = parser.parse_args()
 
     # Set defaults based on dataset preset if provided
@@ -57,48 +105,18 @@ def main():
         print("Error: Run this script from the project root.")
         sys.exit(1)
 
-    success_a = False
-    success_b = False
-
-    # 1. Run Variant A (Text)
-    if args.variant in ["A", "all"]:
-        print("\n>>> RUNNING VARIANT A (TEXT) PIPELINE <<<")
-        success_a = run_script("embed_openrouter_text.py", [
-            "--corpus", args.corpus,
-            "--queries", args.queries
-        ])
-
-    # 2. Run Variant B (VL)
-    if args.variant in ["B", "all"]:
-        print("\n>>> RUNNING VARIANT B (VL) PIPELINE <<<")
-        # embed_qwen3_vl_batch.py already calls render_glyph_sheet.py internally
-        success_b = run_script("embed_qwen3_vl_batch.py", [
-            "--corpus", args.corpus,
-            "--queries", args.queries,
-            "--model", args.model
-        ])
+    if args.embed_server:
+        # Passed via the environment so switching server/in-process does not change stage fingerprints
+        os.environ[SERVER_ENV] = args.embed_server
 
-    # 3. Final Scoring (Variant C / All)
-    if args.variant == "all":
-        print("\n>>> RUNNING FINAL SCORING (A + B + C + D) <<<")
-        run_script("score_all_variants.py", [
-            "--labels", args.labels,
-            "--queries", args.queries
-        ])
-    elif args.variant == "A" and success_a:
-        run_script("score_retrieval.py", [
-            "--labels", args.labels
-        ])
-    elif args.variant == "B" and success_b:
-        # B doesn't have a standalone scorer for just B in the old script,
-        # so we use score_all_variants which handles missing A gracefully.
-        run_script("score_all_variants.py", [
-            "--labels", args.labels,
-            "--queries", args.queries
-        ])
+    pipeline = Pipeline(
+        build_stages(args), state_path=args.state, max_workers=args.jobs,
+        force=args.force, force_stages=args.force_stage, dry_run=args.dry_run,
+    )
+    results = pipeline.run()
 
     print(f"\n{'='*60}")
-    print("Evaluation Pipeline Run Complete!")
+    print("Evaluation Pipeline Run Complete!" if not failed(results) else "Evaluation Pipeline finished with failures.")
     print(f"{'='*60}\n")
 
 if __name__ == "__main__":
@@ -1,43 +1,45 @@
-import subprocess
 import sys
 import os
+import argparse
 
-def run_script(script_name, args=[]):
-    """Helper to run a python script and stream output."""
-    script_path = os.path.join("research", "ab-eval", "py", script_name)
-    print(f"\n{'='*60}")
-    print(f"Running: {script_name} {' '.join(args)}")
-    print(f"{'='*60}\n")
-    
-    # Use sys.executable to ensure we use the same python interpreter
-    cmd = [sys.executable, script_path] + args
-    result = subprocess.run(cmd)
-    
-    if result.returncode != 0:
-        print(f"\nError: {script_name} failed with exit code {result.returncode}")
-        sys.exit(result.returncode)
+from pipeline import Pipeline, Stage, failed
+
+CORPUS = "research/ab-eval/data/corpus.toy.json"
+QUERIES = "research/ab-eval/data/queries.toy.json"
+LABELS = "research/ab-eval/data/labels.toy.json"
+OUT = "research/ab-eval/out"
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=2, help="Max stages running concurrently")
+    parser.add_argument("--force", action="store_true", help="Re-run every stage even if its fingerprint is current")
+    parser.add_argument("--dry-run", action="store_true", help="Only report which stages would run")
+    args = parser.parse_args()
+
     # Ensure we are in the project root
     if not os.path.exists("research/ab-eval"):
         print("Error: Run this script from the project root.")
         sys.exit(1)
 
-    # 1. Render glyph sheets
-    run_script("render_glyph_sheet.py", ["--corpus", "research/ab-eval/data/corpus.toy.json"])
-
-    # 2. Generate Text Embeddings (Variant A)
-    run_script("embed_openrouter_text.py", [
-        "--corpus", "research/ab-eval/data/corpus.toy.json",
-        "--queries", "research/ab-eval/data/queries.toy.json"
-    ])
-
-    # 3. Score retrieval
-    run_script("score_retrieval.py", [
-        "--doc_embeddings", "research/ab-eval/out/embeddings_text_docs.jsonl",
-        "--query_embeddings", "research/ab-eval/out/embeddings_text_queries.jsonl",
-        "--labels", "research/ab-eval/data/labels.toy.json"
-    ])
+    text_docs = f"{OUT}/embeddings_text_docs.jsonl"
+    text_queries = f"{OUT}/embeddings_text_queries.jsonl"
+    stages = [
+        # 1. Render glyph sheets (independent of the text baseline; runs alongside it)
+        Stage("glyphs", "render_glyph_sheet.py", ["--corpus", CORPUS],
+              inputs=[CORPUS], outputs=[f"{OUT}/glyphs"]),
+        # 2. Generate Text Embeddings (Variant A)
+        Stage("embed_text", "embed_openrouter_text.py", ["--corpus", CORPUS, "--queries", QUERIES],
+              inputs=[CORPUS, QUERIES], outputs=[text_docs, text_queries]),
+        # 3. Score retrieval
+        Stage("score", "score_retrieval.py",
+              ["--doc_embeddings", text_docs, "--query_embeddings", text_queries, "--labels", LABELS],
+              inputs=[text_docs, text_queries, LABELS],
+              outputs=[f"{OUT}/report_text.json", f"{OUT}/report_text.md"]),
+    ]
+
+    results = Pipeline(stages, max_workers=args.jobs, force=args.force, dry_run=args.dry_run).run()
+    if failed(results):
+        sys.exit(1)
 
     print(f"\n{'='*60}")
     print("Full Text Baseline Evaluation Pipeline Complete!")
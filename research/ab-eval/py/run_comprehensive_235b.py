@@ -2,11 +2,19 @@ import os
 import json
 import base64
 import time
+import argparse
 from pathlib import Path
 from typing import List, Dict, Any, Tuple
 import requests
 from dotenv import load_dotenv
 
+from call_telemetry import CallTimer, Telemetry
+from http_cassette import install_from_env
+from metrics_kernel import compute_metrics, pairs_to_arrays
+from query_packing import plan_packs
+from results_columnar import write_sidecar
+from usage_accounting import UsageLedger, usage_from_response
+
 # Load environment variables
 def load_env():
     root = Path(__file__).resolve().parents[3]
@@ -14,6 +22,7 @@ def load_env():
     load_dotenv(root / ".env.local", override=False)
 
 load_env()
+install_from_env()
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 MODEL = "qwen/qwen3-vl-235b-a22b-instruct"
@@ -23,7 +32,8 @@ def image_to_data_url(image_path: Path) -> str:
     b64 = base64.b64encode(b).decode("utf-8")
     return f"data:image/png;base64,{b64}"
 
-def call_openrouter(query: str, font_name: str, image_path: Path) -> Dict[str, Any]:
+def post_openrouter(prompt: str, image_path: Path, timer: CallTimer) -> Tuple[str, float, Dict[str, Any]]:
+    """One chat call with the specimen image attached; returns (content, latency_sec, usage). Phases are lapped on `timer`."""
     if not OPENROUTER_API_KEY:
         raise RuntimeError("OPENROUTER_API_KEY is not set")
         
@@ -33,21 +43,6 @@ def call_openrouter(query: str, font_name: str, image_path: Path) -> Dict[str, A
         "Content-Type": "application/json",
     }
     
-    prompt = f"""You are a typography expert judging font relevance to a query.
-Query: "{query}"
-Font: "{font_name}"
-
-Analyze the provided specimen image for this font. 
-Pay close attention to the "Legibility Pairs" (il1I, O0, etc.) and character forms.
-Determine if this font is a good match for the query.
-
-Return STRICT JSON only (no markdown blocks, no prose):
-{{
-  "thought": "your reasoning here, referencing visual details from the image",
-  "match": 1 or 0
-}}
-"""
-    
     data_url = image_to_data_url(image_path)
     payload = {
         "model": MODEL,
@@ -63,9 +58,11 @@ Return STRICT JSON only (no markdown blocks, no prose):
         ],
     }
     
+    timer.lap("upload")
     t0 = time.time()
     # Adding retry logic
     for attempt in range(3):
+        timer.attempt()
         try:
             resp = requests.post(url, headers=headers, json=payload, timeout=180)
             if resp.status_code == 429:
@@ -84,6 +81,7 @@ Return STRICT JSON only (no markdown blocks, no prose):
         raise RuntimeError(f"Failed to call OpenRouter after 3 attempts")
         
     latency = time.time() - t0
+    timer.lap("model_time")
     
     body = resp.json()
     choices = body.get('choices', [])
@@ -97,43 +95,97 @@ Return STRICT JSON only (no markdown blocks, no prose):
         content = content[7:-3].strip()
     elif content.startswith("```"):
         content = content[3:-3].strip()
+    return content, latency, usage_from_response(body)
+
+def call_openrouter(query: str, font_name: str, image_path: Path) -> Dict[str, Any]:
+    prompt = f"""You are a typography expert judging font relevance to a query.
+Query: "{query}"
+Font: "{font_name}"
+
+Analyze the provided specimen image for this font. 
+Pay close attention to the "Legibility Pairs" (il1I, O0, etc.) and character forms.
+Determine if this font is a good match for the query.
+
+Return STRICT JSON only (no markdown blocks, no prose):
+{{
+  "thought": "your reasoning here, referencing visual details from the image",
+  "match": 1 or 0
+}}
+"""
+    timer = CallTimer()
+    content, latency, usage = post_openrouter(prompt, image_path, timer)
         
     try:
         data = json.loads(content)
+        timer.lap("parse")
         data['latency_sec'] = round(latency, 2)
+        data['usage'] = usage
+        data['timing'] = timer.as_dict()
         return data
     except json.JSONDecodeError:
+        timer.lap("parse")
         return {
             "thought": f"Failed to parse JSON. Raw content: {content}",
             "match": 0,
-            "latency_sec": round(latency, 2)
+            "latency_sec": round(latency, 2),
+            "usage": usage,
+            "timing": timer.as_dict()
+        }
+
+def call_openrouter_packed(queries: List[str], font_name: str, image_path: Path) -> Dict[str, Any]:
+    """Same judgement as call_openrouter for several queries at once; the image is sent once."""
+    queries_formatted = "\n".join([f"{i+1}. \"{q}\"" for i, q in enumerate(queries)])
+    prompt = f"""You are a typography expert judging font relevance to multiple queries.
+Font: "{font_name}"
+
+Analyze the provided specimen image for this font. 
+Pay close attention to the "Legibility Pairs" (il1I, O0, etc.) and character forms.
+Determine if this font is a good match for EACH of the following queries.
+
+Queries:
+{queries_formatted}
+
+Return STRICT JSON only (no markdown blocks, no prose):
+{{
+  "thought": "your overall reasoning here, referencing visual details from the image",
+  "matches": [
+    {{"query_index": 1, "match": 1 or 0}},
+    {{"query_index": 2, "match": 1 or 0}},
+    ...
+  ]
+}}
+"""
+    timer = CallTimer()
+    content, latency, usage = post_openrouter(prompt, image_path, timer)
+
+    try:
+        data = json.loads(content)
+        timer.lap("parse")
+        data['latency_sec'] = round(latency, 2)
+        data['usage'] = usage
+        data['timing'] = timer.as_dict()
+        return data
+    except json.JSONDecodeError:
+        timer.lap("parse")
+        return {
+            "thought": f"Failed to parse JSON. Raw content: {content}",
+            "matches": [],
+            "latency_sec": round(latency, 2),
+            "usage": usage,
+            "timing": timer.as_dict()
         }
 
 def calculate_metrics(results: List[Dict[str, Any]]) -> Dict[str, Any]:
-    tp = fp = fn = tn = 0
-    for r in results:
-        h = r["human_match"]
-        a = r["ai_match"]
-        if h == 1 and a == 1: tp += 1
-        elif h == 0 and a == 1: fp += 1
-        elif h == 1 and a == 0: fn += 1
-        elif h == 0 and a == 0: tn += 1
-        
-    total = len(results)
-    agreement = (tp + tn) / total if total > 0 else 0
-    precision = tp / (tp + fp) if (tp + fp) > 0 else 0
-    recall = tp / (tp + fn) if (tp + fn) > 0 else 0
-    f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
-    
-    return {
-        "agreement": round(agreement, 4),
-        "precision": round(precision, 4),
-        "recall": round(recall, 4),
-        "f1": round(f1, 4),
-        "counts": {"tp": tp, "fp": fp, "fn": fn, "tn": tn, "total": total}
-    }
+    arrays = pairs_to_arrays(results)
+    return compute_metrics(arrays["y_true"], arrays["y_pred"])
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pack-size", type=int, default=1,
+                        help="Queries per call for the same font (1 = one pair per call, 0 = all of a font's queries)")
+    parser.add_argument("--balance-packs", action="store_true", help="Even out pack sizes (12 at 10 -> 6+6) instead of full packs then the remainder")
+    args = parser.parse_args()
+
     data_dir = Path("research/ab-eval/data")
     out_dir = Path("research/ab-eval/out")
     specimen_dir = out_dir / "specimens_v2_medium"
@@ -166,33 +218,53 @@ def main():
     
     print(f"Total pairs to evaluate: {len(todo)}")
     
+    # Group pending pairs by font so each pack sends the specimen image once
+    if args.pack_size == 1:
+        packs = [(font, [qid]) for qid, font in todo]
+    else:
+        font_todo: Dict[str, List[str]] = {}
+        for qid, font in todo:
+            font_todo.setdefault(font, []).append(qid)
+        packs = [(font, pack) for font, qids in font_todo.items() for pack in plan_packs(qids, args.pack_size, balanced=args.balance_packs)]
+    print(f"Planned {len(packs)} calls (pack size {args.pack_size or 'all'})")
+
+    ledger = UsageLedger(run_id=cache_file.stem)
+    telemetry = Telemetry(run_id=ledger.run_id)
     try:
-        for i, (qid, font) in enumerate(todo):
-            print(f"[{i+1}/{len(todo)}] Evaluating {qid} | {font}")
+        for i, (font, qids) in enumerate(packs):
+            print(f"[{i+1}/{len(packs)}] Evaluating {font} | {', '.join(qids)}")
             
             image_path = specimen_dir / f"{font.replace(' ', '_')}.png"
             if not image_path.exists():
                 print(f"  WARNING: Specimen not found at {image_path}")
                 continue
                 
-            query_text = query_map.get(qid, "Unknown query")
+            query_texts = [query_map.get(qid, "Unknown query") for qid in qids]
             
             # Call AI
-            ai_resp = call_openrouter(query_text, font, image_path)
-            
-            # Get human label
-            human_match = 1 if font in labels_pos.get(qid, []) else 0
+            if len(qids) == 1:
+                ai_resp = call_openrouter(query_texts[0], font, image_path)
+                matches = {1: ai_resp.get("match", 0)}
+            else:
+                ai_resp = call_openrouter_packed(query_texts, font, image_path)
+                matches = {m.get("query_index"): m.get("match", 0) for m in ai_resp.get("matches", [])}
+            ledger.add(ai_resp, MODEL, "v2", specimen_dir.name, n_queries=len(qids))
+            telemetry.record(ai_resp, "openrouter", MODEL, n_queries=len(qids))
             
-            res = {
-                "query_id": qid,
-                "query_text": query_text,
-                "font_name": font,
-                "human_match": human_match,
-                "ai_match": ai_resp.get("match", 0),
-                "thought": ai_resp.get("thought", ""),
-                "latency_sec": ai_resp.get("latency_sec", 0)
-            }
-            results.append(res)
+            for idx, (qid, query_text) in enumerate(zip(qids, query_texts)):
+                # Get human label
+                human_match = 1 if font in labels_pos.get(qid, []) else 0
+                
+                res = {
+                    "query_id": qid,
+                    "query_text": query_text,
+                    "font_name": font,
+                    "human_match": human_match,
+                    "ai_match": matches.get(idx + 1, 0),
+                    "thought": ai_resp.get("thought", ""),
+                    "latency_sec": ai_resp.get("latency_sec", 0)
+                }
+                results.append(res)
             
             # Intermediate save
             if (i + 1) % 5 == 0:
@@ -204,6 +276,9 @@ def main():
     finally:
         with open(cache_file, "w") as f:
             json.dump({"details": results}, f, indent=2)
+        write_sidecar(cache_file, {"details": results})
+        ledger.write(cache_file)
+        telemetry.write(cache_file)
             
     # Calculate and Print metrics
     metrics = calculate_metrics(results)
@@ -3,10 +3,15 @@ import json
 import time
 import argparse
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import requests
 from dotenv import load_dotenv
 
+from http_cassette import install_from_env
+from metrics_kernel import compute_metrics, pairs_to_arrays
+from query_packing import budget_pack_size, plan_packs
+from usage_accounting import UsageLedger, usage_from_response
+
 # Load environment variables
 def load_env():
     root = Path(__file__).resolve().parents[3]
@@ -14,12 +19,15 @@ def load_env():
     load_dotenv(root / ".env.local", override=False)
 
 load_env()
+install_from_env()
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 
-def call_openrouter_proxy_batched(queries: List[str], description: str, model: str = "anthropic/claude-3-haiku") -> List[int]:
+def call_openrouter_proxy_batched(queries: List[str], description: str, model: str = "anthropic/claude-3-haiku",
+                                  ledger: Optional[UsageLedger] = None) -> List[int]:
     """
     Simulates FontCLIP signal by judging match between Query and Typographic Description.
+    Token usage (and failed calls) go to `ledger` if given.
     """
     if not OPENROUTER_API_KEY:
         raise RuntimeError("OPENROUTER_API_KEY is not set")
@@ -61,6 +69,7 @@ Return STRICT JSON only (no markdown, no prose):
         ]
     }
     
+    t0 = time.time()
     for attempt in range(5):
         try:
             resp = requests.post(url, headers=headers, json=payload, timeout=60)
@@ -76,11 +85,17 @@ Return STRICT JSON only (no markdown, no prose):
             print(f"Error: {e}")
             time.sleep(5)
     else:
+        if ledger is not None:
+            ledger.add({"error": "all attempts failed", "latency_sec": time.time() - t0}, model, "fontclip_proxy",
+                       n_queries=len(queries))
         return [0] * len(queries)
         
     content = ""
     try:
         data = resp.json()
+        if ledger is not None:
+            ledger.add({"latency_sec": time.time() - t0}, model, "fontclip_proxy", n_queries=len(queries),
+                       usage=usage_from_response(data))
         content = data['choices'][0]['message']['content']
         # Remove potential markdown block
         content = content.replace("```json", "").replace("```", "").strip()
@@ -96,28 +111,8 @@ Return STRICT JSON only (no markdown, no prose):
         return [0] * len(queries)
 
 def calculate_metrics(results: List[Dict[str, Any]], match_key: str = "ai_match") -> Dict[str, Any]:
-    tp = fp = fn = tn = 0
-    for r in results:
-        h = r["human_match"]
-        a = r[match_key]
-        if h == 1 and a == 1: tp += 1
-        elif h == 0 and a == 1: fp += 1
-        elif h == 1 and a == 0: fn += 1
-        elif h == 0 and a == 0: tn += 1
-        
-    total = len(results)
-    agreement = (tp + tn) / total if total > 0 else 0
-    precision = tp / (tp + fp) if (tp + fp) > 0 else 0
-    recall = tp / (tp + fn) if (tp + fn) > 0 else 0
-    f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
-    
-    return {
-        "agreement": round(agreement, 4),
-        "precision": round(precision, 4),
-        "recall": round(recall, 4),
-        "f1": round(f1, 4),
-        "counts": {"tp": tp, "fp": fp, "fn": fn, "tn": tn, "total": total}
-    }
+    arrays = pairs_to_arrays(results, pred_key=match_key)
+    return compute_metrics(arrays["y_true"], arrays["y_pred"])
 
 def main():
     parser = argparse.ArgumentParser()
@@ -125,6 +120,7 @@ def main():
     parser.add_argument("--baseline", default="research/ab-eval/out/full_set_no_bias_gemini3flashpreview_updated_ssot.json")
     parser.add_argument("--descriptions", default="research/ab-eval/out/descriptions_bakeoff_qwen32_235_full200.jsonl")
     parser.add_argument("--output", default="research/ab-eval/out/experiment_fontclip_results.json")
+    parser.add_argument("--pack-size", type=int, default=0, help="Max queries per call (0 = token budget only)")
     args = parser.parse_args()
 
     # 1. Load SSoT
@@ -176,19 +172,23 @@ def main():
         font_to_queries[f_name].append(p["query_id"])
 
     fontclip_results_map = {}
+    budget = budget_pack_size(list(query_text_map.values()), output_tokens_per_query=16)
+    pack_size = min(args.pack_size, budget) if args.pack_size > 0 else budget
     
+    ledger = UsageLedger(run_id=Path(args.output).stem)
     total_fonts = len(font_to_queries)
     for i, (f_name, q_ids) in enumerate(font_to_queries.items()):
         print(f"  [{i+1}/{total_fonts}] Processing {f_name} ({len(q_ids)} queries)...")
         desc = font_descriptions.get(f_name, "No description available.")
-        q_texts = [query_text_map.get(qid, qid) for qid in q_ids]
-        
-        matches = call_openrouter_proxy_batched(q_texts, desc)
-        for qid, m in zip(q_ids, matches):
-            fontclip_results_map[(qid, f_name)] = m
         
-        # Rate limiting safety
-        time.sleep(0.5)
+        for pack in plan_packs(q_ids, pack_size):
+            q_texts = [query_text_map.get(qid, qid) for qid in pack]
+            matches = call_openrouter_proxy_batched(q_texts, desc, ledger=ledger)
+            for qid, m in zip(pack, matches):
+                fontclip_results_map[(qid, f_name)] = m
+            
+            # Rate limiting safety
+            time.sleep(0.5)
 
     # 5. Collate Results and Perform Fusion
     print("Collating results...")
@@ -230,6 +230,7 @@ def main():
     }
     with open(args.output, 'w') as f:
         json.dump(output_obj, f, indent=2)
+    ledger.write(Path(args.output))
 
     print("\n" + "="*50)
     print("EXPERIMENT RESULTS")
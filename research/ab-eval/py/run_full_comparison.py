@@ -8,6 +8,12 @@ from typing import List, Dict, Any, Tuple
 import requests
 from dotenv import load_dotenv
 
+from call_telemetry import CallTimer, Telemetry
+from http_cassette import install_from_env
+from metrics_kernel import compute_metrics, pairs_to_arrays
+from results_columnar import write_sidecar
+from usage_accounting import UsageLedger, usage_from_response
+
 # Load environment variables
 def load_env():
     root = Path(__file__).resolve().parents[3]
@@ -15,6 +21,7 @@ def load_env():
     load_dotenv(root / ".env.local", override=False)
 
 load_env()
+install_from_env()
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -57,6 +64,7 @@ Return STRICT JSON only (no markdown blocks, no prose):
 }}
 """
     
+    timer = CallTimer()
     data_url = image_to_data_url(image_path)
     payload = {
         "model": model,
@@ -72,9 +80,11 @@ Return STRICT JSON only (no markdown blocks, no prose):
         ],
     }
     
+    timer.lap("upload")
     t0 = time.time()
     # Adding retry logic
     for attempt in range(3):
+        timer.attempt()
         try:
             resp = requests.post(url, headers=headers, json=payload, timeout=180)
             if resp.status_code == 429:
@@ -93,6 +103,7 @@ Return STRICT JSON only (no markdown blocks, no prose):
         raise RuntimeError(f"Failed to call OpenRouter after 3 attempts")
         
     latency = time.time() - t0
+    timer.lap("model_time")
     
     body = resp.json()
     choices = body.get('choices', [])
@@ -109,13 +120,19 @@ Return STRICT JSON only (no markdown blocks, no prose):
         
     try:
         data = json.loads(content)
+        timer.lap("parse")
         data['latency_sec'] = round(latency, 2)
+        data['usage'] = usage_from_response(body)
+        data['timing'] = timer.as_dict()
         return data
     except json.JSONDecodeError:
+        timer.lap("parse")
         return {
             "thought": f"Failed to parse JSON. Raw content: {content}",
             "matches": [{"query_index": i+1, "match": 0} for i in range(len(queries))],
-            "latency_sec": round(latency, 2)
+            "latency_sec": round(latency, 2),
+            "usage": usage_from_response(body),
+            "timing": timer.as_dict()
         }
 
 def call_gemini_batched(queries: List[str], image_path: Path, model: str) -> Dict[str, Any]:
@@ -149,6 +166,7 @@ Return STRICT JSON only (no markdown blocks, no prose):
 }}
 """
     
+    timer = CallTimer()
     with open(image_path, "rb") as f:
         img_data = base64.b64encode(f.read()).decode("utf-8")
 
@@ -172,8 +190,10 @@ Return STRICT JSON only (no markdown blocks, no prose):
         }
     }
     
+    timer.lap("upload")
     t0 = time.time()
     for attempt in range(5):
+        timer.attempt()
         try:
             resp = requests.post(url, headers=headers, json=payload, timeout=180)
             if resp.status_code == 429:
@@ -196,6 +216,7 @@ Return STRICT JSON only (no markdown blocks, no prose):
         raise RuntimeError(f"Failed to call Gemini after 5 attempts")
         
     latency = time.time() - t0
+    timer.lap("model_time")
     
     body = resp.json()
     try:
@@ -211,38 +232,24 @@ Return STRICT JSON only (no markdown blocks, no prose):
         
     try:
         data = json.loads(content)
+        timer.lap("parse")
         data['latency_sec'] = round(latency, 2)
+        data['usage'] = usage_from_response(body)
+        data['timing'] = timer.as_dict()
         return data
     except json.JSONDecodeError:
+        timer.lap("parse")
         return {
             "thought": f"Failed to parse JSON. Raw content: {content}",
             "matches": [{"query_index": i+1, "match": 0} for i in range(len(queries))],
-            "latency_sec": round(latency, 2)
+            "latency_sec": round(latency, 2),
+            "usage": usage_from_response(body),
+            "timing": timer.as_dict()
         }
 
 def calculate_metrics(results: List[Dict[str, Any]]) -> Dict[str, Any]:
-    tp = fp = fn = tn = 0
-    for r in results:
-        h = r["human_match"]
-        a = r["ai_match"]
-        if h == 1 and a == 1: tp += 1
-        elif h == 0 and a == 1: fp += 1
-        elif h == 1 and a == 0: fn += 1
-        elif h == 0 and a == 0: tn += 1
-        
-    total = len(results)
-    agreement = (tp + tn) / total if total > 0 else 0
-    precision = tp / (tp + fp) if (tp + fp) > 0 else 0
-    recall = tp / (tp + fn) if (tp + fn) > 0 else 0
-    f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
-    
-    return {
-        "agreement": round(agreement, 4),
-        "precision": round(precision, 4),
-        "recall": round(recall, 4),
-        "f1": round(f1, 4),
-        "counts": {"tp": tp, "fp": fp, "fn": fn, "tn": tn, "total": total}
-    }
+    arrays = pairs_to_arrays(results)
+    return compute_metrics(arrays["y_true"], arrays["y_pred"])
 
 def main():
     parser = argparse.ArgumentParser()
@@ -291,6 +298,8 @@ def main():
     print(f"Total pairs to evaluate for {args.model}: {total_pairs} across {len(font_to_queries)} fonts")
     
     processed_count = 0
+    ledger = UsageLedger(run_id=Path(args.output).stem)
+    telemetry = Telemetry(run_id=ledger.run_id)
     try:
         for font_name, qids in font_to_queries.items():
             image_path = specimen_dir / f"{font_name.replace(' ', '_')}.png"
@@ -308,9 +317,13 @@ def main():
                 batch_query_texts = [query_map.get(qid, "Unknown query") for qid in batch_qids]
                 
                 if "gemini" in args.model.lower() and not ("openrouter" in args.model.lower() or "google/" in args.model.lower()):
+                    provider = "gemini"
                     ai_resp = call_gemini_batched(batch_query_texts, image_path, args.model)
                 else:
+                    provider = "openrouter"
                     ai_resp = call_openrouter_batched(batch_query_texts, image_path, args.model)
+                ledger.add(ai_resp, args.model, "v2", specimen_dir.name, n_queries=len(batch_query_texts))
+                telemetry.record(ai_resp, provider, args.model, n_queries=len(batch_query_texts))
 
                 matches_map = {m['query_index']: m['match'] for m in ai_resp.get('matches', [])}
                 last_latency = ai_resp.get('latency_sec', 0)
@@ -345,6 +358,9 @@ def main():
     finally:
         with open(cache_file, "w") as f:
             json.dump({"details": results}, f, indent=2)
+        write_sidecar(cache_file, {"details": results})
+        ledger.write(cache_file)
+        telemetry.write(cache_file)
             
     # Calculate and Print metrics
     metrics = calculate_metrics(results)
@@ -20,6 +20,8 @@ from pathlib import Path
 from typing import Dict, List, Any, Tuple
 from datetime import datetime
 
+from metrics_kernel import compute_metrics as compute_pair_metrics, pairs_to_arrays
+
 
 def remap_label(label: Any) -> int:
     """Governance policy: non-binary label 2 is treated as 0 for primary metrics."""
@@ -75,38 +77,8 @@ def build_font_payload(font_data: Dict[str, Any]) -> str:
 
 def compute_metrics(results: List[Dict], ssot_map: Dict) -> Dict[str, Any]:
     """Compute confusion matrix metrics for a result set."""
-    tp = fp = fn = tn = 0
-    
-    for r in results:
-        key = (r["query_id"], r["font_name"])
-        if key not in ssot_map:
-            continue
-        
-        h = ssot_map[key]
-        a = r["predicted_match"]
-        
-        if h == 1 and a == 1:
-            tp += 1
-        elif h == 0 and a == 1:
-            fp += 1
-        elif h == 1 and a == 0:
-            fn += 1
-        elif h == 0 and a == 0:
-            tn += 1
-    
-    total = tp + fp + fn + tn
-    agreement = (tp + tn) / total if total > 0 else 0
-    precision = tp / (tp + fp) if (tp + fp) > 0 else 0
-    recall = tp / (tp + fn) if (tp + fn) > 0 else 0
-    f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
-    
-    return {
-        "agreement": round(agreement, 4),
-        "precision": round(precision, 4),
-        "recall": round(recall, 4),
-        "f1": round(f1, 4),
-        "counts": {"tp": tp, "fp": fp, "fn": fn, "tn": tn, "total": total},
-    }
+    arrays = pairs_to_arrays(results, pred_key="predicted_match", ssot_map=ssot_map)
+    return compute_pair_metrics(arrays["y_true"], arrays["y_pred"], denominator="binary")
 
 
 def compute_helps_hurts(
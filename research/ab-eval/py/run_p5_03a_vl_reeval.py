@@ -19,11 +19,15 @@ import random
 import time
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 import requests
 
+from http_cassette import install_from_env
+from metrics_kernel import compute_metrics, pairs_to_arrays
+from usage_accounting import UsageLedger, usage_from_response
+
 
 def remap_label(label: Any) -> int:
     """Governance policy: non-binary label 2 is treated as 0 for primary metrics."""
@@ -115,41 +119,14 @@ def compute_retrieval_metrics(
 
 
 def compute_pair_metrics(pairs: List[Dict[str, Any]], pred_key: str) -> Dict[str, Any]:
-    tp = fp = fn = tn = 0
-    for p in pairs:
-        h = p["human"]
-        a = p[pred_key]
-        if h == 1 and a == 1:
-            tp += 1
-        elif h == 0 and a == 1:
-            fp += 1
-        elif h == 1 and a == 0:
-            fn += 1
-        else:
-            tn += 1
-
-    total = len(pairs)
-    agreement = (tp + tn) / total if total else 0.0
-    precision = tp / (tp + fp) if (tp + fp) else 0.0
-    recall = tp / (tp + fn) if (tp + fn) else 0.0
-    f1 = (2 * precision * recall / (precision + recall)) if (precision + recall) else 0.0
-
-    return {
-        "agreement": round(agreement, 4),
-        "precision": round(precision, 4),
-        "recall": round(recall, 4),
-        "f1": round(f1, 4),
-        "counts": {
-            "tp": tp,
-            "fp": fp,
-            "fn": fn,
-            "tn": tn,
-            "total": total,
-        },
-    }
+    arrays = pairs_to_arrays(pairs, pred_key=pred_key, label_key="human")
+    return compute_metrics(arrays["y_true"], arrays["y_pred"])
 
 
-def call_openrouter_embedding(text: str, api_key: str, model: str, retries: int = 5) -> List[float]:
+def call_openrouter_embedding(
+    text: str, api_key: str, model: str, retries: int = 5, ledger: Optional[UsageLedger] = None
+) -> List[float]:
+    """Embedding for `text`; token usage (or the failure) goes to `ledger` if given."""
     url = "https://openrouter.ai/api/v1/embeddings"
     headers = {
         "Authorization": f"Bearer {api_key}",
@@ -157,6 +134,7 @@ def call_openrouter_embedding(text: str, api_key: str, model: str, retries: int
     }
     payload = {"model": model, "input": text}
 
+    t0 = time.time()
     for attempt in range(retries):
         try:
             resp = requests.post(url, headers=headers, json=payload, timeout=60)
@@ -165,12 +143,19 @@ def call_openrouter_embedding(text: str, api_key: str, model: str, retries: int
                 continue
             resp.raise_for_status()
             data = resp.json()
+            if ledger is not None:
+                ledger.add({"latency_sec": time.time() - t0}, model, "vl_enriched_docs", n_queries=1,
+                           usage=usage_from_response(data))
             return data["data"][0]["embedding"]
-        except Exception:
+        except Exception as e:
             if attempt == retries - 1:
+                if ledger is not None:
+                    ledger.add({"error": str(e), "latency_sec": time.time() - t0}, model, "vl_enriched_docs", n_queries=1)
                 raise
             time.sleep(min(30, 2 * (attempt + 1)))
 
+    if ledger is not None:
+        ledger.add({"error": "rate limited", "latency_sec": time.time() - t0}, model, "vl_enriched_docs", n_queries=1)
     raise RuntimeError("Embedding request failed after retries")
 
 
@@ -243,10 +228,11 @@ def load_or_build_text_doc_embeddings(
                 "OPENROUTER_API_KEY missing and enriched text-doc embedding cache is incomplete."
             )
 
+        ledger = UsageLedger(run_id=out_path.stem)
         for i, name in enumerate(missing, start=1):
             font = corpus_map[name]
             text = build_doc_context(font, desc_map.get(name, ""))
-            emb = call_openrouter_embedding(text, api_key, embed_model)
+            emb = call_openrouter_embedding(text, api_key, embed_model, ledger=ledger)
             existing[name] = emb
             print(f"Embedded VL-enriched text doc {i}/{len(missing)}: {name}")
             if sleep_sec > 0:
@@ -256,6 +242,8 @@ def load_or_build_text_doc_embeddings(
         with open(out_path, "w", encoding="utf-8") as f:
             for name in doc_names:
                 f.write(json.dumps({"name": name, "embedding": existing[name]}) + "\n")
+        # Only written when embeddings were fetched; a full cache hit makes no calls
+        ledger.write(out_path)
 
     matrix = np.stack([np.array(existing[n], dtype=np.float32) for n in doc_names])
     meta = {
@@ -276,6 +264,7 @@ def load_text_query_embeddings(path: Path, query_ids: List[str]) -> np.ndarray:
 
 
 def main() -> None:
+    install_from_env()
     parser = argparse.ArgumentParser(description="Run P5-03A B2 vs VL-enriched text-only re-evaluation")
     parser.add_argument("--b2-docs", default="research/ab-eval/out/embeddings_vl_docs_b2.npy")
     parser.add_argument("--b2-queries", default="research/ab-eval/out/embeddings_vl_queries.npy")
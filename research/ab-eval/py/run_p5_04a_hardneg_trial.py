@@ -27,6 +27,8 @@ from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
+from metrics_kernel import compute_metrics as compute_pair_metrics, pairs_to_arrays
+
 
 VINTAGE_TERMS = ["vintage", "retro", "classic", "old-school", "art deco", "70s", "80s"]
 STRICT_TERMS = ["exact", "literally", "strictly", "must", "only", "precise"]
@@ -117,46 +119,19 @@ def assign_motif(query_text: str) -> Optional[str]:
 
 
 def compute_metrics(rows: List[Dict[str, Any]], pred_key: str) -> Dict[str, Any]:
-    tp = fp = fn = tn = 0
-    for r in rows:
-        h = r["human"]
-        p = r[pred_key]
-        if h == 1 and p == 1:
-            tp += 1
-        elif h == 0 and p == 1:
-            fp += 1
-        elif h == 1 and p == 0:
-            fn += 1
-        else:
-            tn += 1
-
-    total = len(rows)
-    agreement = (tp + tn) / total if total else 0.0
-    precision = tp / (tp + fp) if (tp + fp) else 0.0
-    recall = tp / (tp + fn) if (tp + fn) else 0.0
-    f1 = (2 * precision * recall / (precision + recall)) if (precision + recall) else 0.0
-
-    agreement_r = round(agreement, 4)
-    precision_r = round(precision, 4)
-    recall_r = round(recall, 4)
-    f1_r = round(f1, 4)
+    arrays = pairs_to_arrays(rows, pred_key=pred_key, label_key="human")
+    metrics = compute_pair_metrics(arrays["y_true"], arrays["y_pred"])
 
     return {
-        "agreement": agreement_r,
-        "precision": precision_r,
-        "recall": recall_r,
-        "f1": f1_r,
+        "agreement": metrics["agreement"],
+        "precision": metrics["precision"],
+        "recall": metrics["recall"],
+        "f1": metrics["f1"],
         # Compatibility aliases for legacy gate-validator access pattern.
         # NOTE: values are duplicated intentionally; semantics unchanged.
-        "Agreement": agreement_r,
-        "Precision@10": precision_r,
-        "counts": {
-            "tp": tp,
-            "fp": fp,
-            "fn": fn,
-            "tn": tn,
-            "total": total,
-        },
+        "Agreement": metrics["agreement"],
+        "Precision@10": metrics["precision"],
+        "counts": metrics["counts"],
     }
 
 
@@ -1,6 +1,5 @@
 import os
 import json
-import base64
 import time
 import argparse
 from pathlib import Path
@@ -8,6 +7,14 @@ from typing import List, Dict, Any, Tuple
 import requests
 from dotenv import load_dotenv
 
+from call_telemetry import CallTimer, Telemetry
+from http_cassette import install_from_env
+from image_payload import PROFILES, image_mime, image_to_base64
+from metrics_kernel import compute_metrics, gate_predictions, pairs_to_arrays
+from query_packing import budget_pack_size, plan_packs, resolve_pack_size
+from results_columnar import write_sidecar
+from usage_accounting import UsageLedger, usage_from_response
+
 # Load environment variables
 def load_env():
     root = Path(__file__).resolve().parents[3]
@@ -15,16 +22,12 @@ def load_env():
     load_dotenv(root / ".env.local", override=False)
 
 load_env()
+install_from_env()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 
-def image_to_base64(image_path: Path) -> str:
-    if not image_path.exists():
-        return ""
-    return base64.b64encode(image_path.read_bytes()).decode("utf-8")
-
-def call_gemini_v3(queries: List[str], images: List[Path], model: str) -> Dict[str, Any]:
+def call_gemini_v3(queries: List[str], images: List[Path], model: str, image_profile: str = "original") -> Dict[str, Any]:
     if not GEMINI_API_KEY:
         raise RuntimeError("GEMINI_API_KEY is not set")
         
@@ -64,13 +67,14 @@ Return STRICT JSON only:
 }}
 """
     
+    timer = CallTimer()
     parts = [{"text": prompt}]
     for img_path in images:
-        b64 = image_to_base64(img_path)
+        b64 = image_to_base64(img_path, image_profile)
         if b64:
             parts.append({
                 "inline_data": {
-                    "mime_type": "image/png",
+                    "mime_type": image_mime(image_profile),
                     "data": b64
                 }
             })
@@ -83,7 +87,9 @@ Return STRICT JSON only:
         }
     }
     
+    timer.lap("upload")
     for attempt in range(5):
+        timer.attempt()
         try:
             resp = requests.post(url, headers=headers, json=payload, timeout=180)
             if resp.status_code == 429:
@@ -96,19 +102,25 @@ Return STRICT JSON only:
                 time.sleep(10)
                 continue
             
+            timer.lap("model_time")
             res = resp.json()
             content_str = res['candidates'][0]['content']['parts'][0]['text'].strip()
             # Clean markdown if present
             if content_str.startswith("```json"): content_str = content_str[7:-3].strip()
             elif content_str.startswith("```"): content_str = content_str[3:-3].strip()
             
-            return json.loads(content_str)
+            data = json.loads(content_str)
+            timer.lap("parse")
+            data['usage'] = usage_from_response(res)
+            data['timing'] = timer.as_dict()
+            return data
         except Exception as e:
-            if attempt == 4: return {"error": f"Failed: {str(e)}"}
+            if attempt == 4: return {"error": f"Failed: {str(e)}", "timing": timer.as_dict()}
             time.sleep(10)
-    return {"error": "Failed after 5 attempts"}
+    timer.lap("queue_wait")
+    return {"error": "Failed after 5 attempts", "timing": timer.as_dict()}
 
-def call_openrouter_v3(queries: List[str], images: List[Path], model: str) -> Dict[str, Any]:
+def call_openrouter_v3(queries: List[str], images: List[Path], model: str, image_profile: str = "original") -> Dict[str, Any]:
     if not OPENROUTER_API_KEY:
         raise RuntimeError("OPENROUTER_API_KEY is not set")
         
@@ -149,14 +161,15 @@ Return STRICT JSON only (no prose, no markdown blocks):
 }}
 """
     
+    timer = CallTimer()
     content = [{"type": "text", "text": prompt}]
     for img_path in images:
-        b64 = image_to_base64(img_path)
+        b64 = image_to_base64(img_path, image_profile)
         if b64:
             content.append({
                 "type": "image_url",
                 "image_url": {
-                    "url": f"data:image/png;base64,{b64}"
+                    "url": f"data:{image_mime(image_profile)};base64,{b64}"
                 }
             })
     
@@ -167,7 +180,9 @@ Return STRICT JSON only (no prose, no markdown blocks):
         "response_format": {"type": "json_object"}
     }
     
+    timer.lap("upload")
     for attempt in range(5):
+        timer.attempt()
         try:
             resp = requests.post(url, headers=headers, json=payload, timeout=240)
             if resp.status_code == 429:
@@ -177,53 +192,34 @@ Return STRICT JSON only (no prose, no markdown blocks):
                 time.sleep(10)
                 continue
             
+            timer.lap("model_time")
             res = resp.json()
             content_str = res['choices'][0]['message']['content'].strip()
             # Clean markdown if present
             if content_str.startswith("```json"): content_str = content_str[7:-3].strip()
             elif content_str.startswith("```"): content_str = content_str[3:-3].strip()
             
-            return json.loads(content_str)
+            data = json.loads(content_str)
+            timer.lap("parse")
+            data['usage'] = usage_from_response(res)
+            data['timing'] = timer.as_dict()
+            return data
         except Exception as e:
-            if attempt == 4: return {"error": f"Failed: {str(e)}"}
+            if attempt == 4: return {"error": f"Failed: {str(e)}", "timing": timer.as_dict()}
             time.sleep(10)
-    return {"error": "Failed after 5 attempts"}
+    timer.lap("queue_wait")
+    return {"error": "Failed after 5 attempts", "timing": timer.as_dict()}
 
 def calculate_metrics(results: List[Dict[str, Any]], ssot_map: Dict[Tuple[str, str], int], confidence_gate: float = 0.9) -> Dict[str, Any]:
-    tp = fp = fn = tn = 0
-    gated_results = []
-    
-    for r in results:
-        key = (r["query_id"], r["font_name"])
-        if key not in ssot_map:
-            continue
-            
-        h = ssot_map[key]
-        raw_match = r.get("ai_match", 0)
-        confidence = r.get("confidence", 1.0)
-        ai_match = 1 if (raw_match == 1 and confidence >= confidence_gate) else 0
-        
-        if h == 1 and ai_match == 1: tp += 1
-        elif h == 0 and ai_match == 1: fp += 1
-        elif h == 1 and ai_match == 0: fn += 1
-        elif h == 0 and ai_match == 0: tn += 1
-        
-        gated_results.append({**r, "ai_match_gated": ai_match, "human_match": h})
-        
-    total = len(gated_results)
-    agreement = (tp + tn) / total if total > 0 else 0
-    precision = tp / (tp + fp) if (tp + fp) > 0 else 0
-    recall = tp / (tp + fn) if (tp + fn) > 0 else 0
-    f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
-    
-    return {
-        "agreement": round(agreement, 4),
-        "precision": round(precision, 4),
-        "recall": round(recall, 4),
-        "f1": round(f1, 4),
-        "counts": {"tp": tp, "fp": fp, "fn": fn, "tn": tn, "total": total},
-        "details": gated_results
-    }
+    arrays = pairs_to_arrays(results, ssot_map=ssot_map)
+    gated = gate_predictions(arrays["y_pred"], arrays["confidence"], confidence_gate)
+    metrics = compute_metrics(arrays["y_true"], gated)
+
+    metrics["details"] = [
+        {**results[i], "ai_match_gated": int(a), "human_match": h}
+        for i, a, h in zip(arrays["index"], gated, arrays["y_true"])
+    ]
+    return metrics
 
 def main():
     parser = argparse.ArgumentParser()
@@ -231,6 +227,9 @@ def main():
     parser.add_argument("--provider", choices=["gemini", "openrouter"], default="openrouter")
     parser.add_argument("--gate", type=float, default=0.9)
     parser.add_argument("--output", required=True)
+    parser.add_argument("--image-profile", choices=list(PROFILES), default="original", help="Specimen payload encoding (see image_payload.py)")
+    parser.add_argument("--pack-size", default="10", help="Max queries per judge call, or 'auto' for the calibrated pack profile")
+    parser.add_argument("--balance-packs", action="store_true", help="Even out pack sizes (12 at 10 -> 6+6) instead of full packs then the remainder")
     args = parser.parse_args()
 
     out_dir = Path("research/ab-eval/out")
@@ -256,6 +255,10 @@ def main():
     with open(queries_path, 'r') as f:
         queries_json = json.load(f)
     query_text_map = {q['id']: q['text'] for q in queries_json}
+    pack_size = min(
+        resolve_pack_size(args.pack_size, args.model, "v3"),
+        budget_pack_size(list(query_text_map.values())),
+    )
 
     results = []
     cache_path = out_dir / args.output
@@ -268,8 +271,10 @@ def main():
         processed_keys = set()
 
     font_names = sorted(list(font_to_queries.keys()))
+    ledger = UsageLedger(run_id=Path(args.output).stem)
+    telemetry = Telemetry(run_id=ledger.run_id)
     
-    print(f"Model={args.model} | Provider={args.provider} | Gate={args.gate}")
+    print(f"Model={args.model} | Provider={args.provider} | Gate={args.gate} | Pack<={pack_size}{' balanced' if args.balance_packs else ''} | Image={args.image_profile}")
     
     try:
         for fname in font_names:
@@ -293,15 +298,16 @@ def main():
             
             print(f"Evaluating {fname} ({len(q_texts)} pairs)...", end="", flush=True)
             
-            # Batch call (max 10)
-            for i in range(0, len(q_texts), 10):
-                batch_texts = q_texts[i:i+10]
-                batch_ids = q_ids[i:i+10]
+            # Fewest packs within the pack size; images go once per pack
+            for batch_ids in plan_packs(q_ids, pack_size, balanced=args.balance_packs):
+                batch_texts = [query_text_map[qid] for qid in batch_ids]
                 
                 if args.provider == "gemini":
-                    resp = call_gemini_v3(batch_texts, images, args.model)
+                    resp = call_gemini_v3(batch_texts, images, args.model, args.image_profile)
                 else:
-                    resp = call_openrouter_v3(batch_texts, images, args.model)
+                    resp = call_openrouter_v3(batch_texts, images, args.model, args.image_profile)
+                ledger.add(resp, args.model, "v3", spec_v3_dir.name, n_queries=len(batch_texts))
+                telemetry.record(resp, args.provider, args.model, n_queries=len(batch_texts))
                 
                 if "error" in resp:
                     print(f" ERROR: {resp['error']}")
@@ -335,9 +341,14 @@ def main():
         print("Stopped.")
 
     metrics = calculate_metrics(results, ssot_map, args.gate)
+    if args.image_profile != "original":
+        metrics["image_profile"] = args.image_profile
     final_results_path = out_dir / f"metrics_{args.output}"
     with open(final_results_path, 'w') as f:
         json.dump(metrics, f, indent=2)
+    write_sidecar(final_results_path, metrics)
+    ledger.write(final_results_path)
+    telemetry.write(final_results_path)
         
     print("\nMETRICS:")
     print(f"Agreement: {metrics['agreement']}")
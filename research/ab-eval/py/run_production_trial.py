@@ -1,6 +1,5 @@
 import os
 import json
-import base64
 import time
 import argparse
 import re
@@ -9,6 +8,14 @@ from typing import List, Dict, Any, Tuple
 import requests
 from dotenv import load_dotenv
 
+from call_telemetry import CallTimer, Telemetry
+from http_cassette import install_from_env
+from image_payload import PROFILES, image_mime, image_to_base64
+from metrics_kernel import compute_metrics, gate_predictions, pairs_to_arrays
+from query_packing import budget_pack_size, plan_packs, resolve_pack_size
+from results_columnar import write_sidecar
+from usage_accounting import UsageLedger, usage_from_response
+
 # Load environment variables
 def load_env():
     root = Path(__file__).resolve().parents[3]
@@ -16,6 +23,7 @@ def load_env():
     load_dotenv(root / ".env.local", override=False)
 
 load_env()
+install_from_env()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
@@ -62,17 +70,13 @@ def load_api_keys(keys_file: str = "") -> List[str]:
 
     return unique
 
-def image_to_base64(image_path: Path) -> str:
-    if not image_path.exists():
-        return ""
-    return base64.b64encode(image_path.read_bytes()).decode("utf-8")
-
 def call_gemini_v3(
     queries: List[str],
     images: List[Path],
     model: str,
     prompt_type: str = "v3",
     api_keys: List[str] = None,
+    image_profile: str = "original",
 ) -> Dict[str, Any]:
     if api_keys is None:
         api_keys = []
@@ -312,13 +316,14 @@ Return STRICT JSON only:
 }}
 """
     
+    timer = CallTimer()
     parts = [{"text": prompt}]
     for img_path in images:
-        b64 = image_to_base64(img_path)
+        b64 = image_to_base64(img_path, image_profile)
         if b64:
             parts.append({
                 "inline_data": {
-                    "mime_type": "image/png",
+                    "mime_type": image_mime(image_profile),
                     "data": b64
                 }
             })
@@ -331,10 +336,12 @@ Return STRICT JSON only:
         }
     }
     
+    timer.lap("upload")
     t0 = time.time()
     last_error = ""
     max_attempts = max(5, len(api_keys) * 2)
     for attempt in range(max_attempts):
+        timer.attempt()
         active_key = api_keys[attempt % len(api_keys)]
         url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={active_key}"
         try:
@@ -356,58 +363,38 @@ Return STRICT JSON only:
             last_error = f"Exception: {str(e)}"
             time.sleep(1)
     else:
-        return {"error": f"Failed after {max_attempts} attempts ({last_error})"}
+        timer.lap("queue_wait")
+        return {"error": f"Failed after {max_attempts} attempts ({last_error})", "timing": timer.as_dict()}
         
     latency = time.time() - t0
+    timer.lap("model_time")
     try:
         res = resp.json()
         content_str = res['candidates'][0]['content']['parts'][0]['text'].strip()
         data = json.loads(content_str)
+        timer.lap("parse")
         data['latency_sec'] = round(latency, 2)
+        data['usage'] = usage_from_response(res)
+        data['timing'] = timer.as_dict()
         return data
     except Exception as e:
-        return {"error": f"Parse error: {str(e)}", "raw": content_str if 'content_str' in locals() else ""}
+        timer.lap("parse")
+        return {"error": f"Parse error: {str(e)}", "raw": content_str if 'content_str' in locals() else "", "timing": timer.as_dict()}
 
 def calculate_metrics(results: List[Dict[str, Any]], ssot_map: Dict[Tuple[str, str], int], confidence_gate: float = 0.9) -> Dict[str, Any]:
-    tp = fp = fn = tn = 0
-    gated_results = []
-    
-    for r in results:
-        key = (r["query_id"], r["font_name"])
-        if key not in ssot_map:
-            continue
-            
-        h = remap_casey_label(ssot_map[key])
-        
-        # Apply confidence gating
-        raw_match = r.get("ai_match", 0)
-        confidence = r.get("confidence", 1.0)
-        
-        # Policy: 0.9 confidence gating for strict decision
-        # Matches with confidence < gate are treated as 0
-        ai_match = 1 if (raw_match == 1 and confidence >= confidence_gate) else 0
-        
-        if h == 1 and ai_match == 1: tp += 1
-        elif h == 0 and ai_match == 1: fp += 1
-        elif h == 1 and ai_match == 0: fn += 1
-        elif h == 0 and ai_match == 0: tn += 1
-        
-        gated_results.append({**r, "ai_match_gated": ai_match, "human_match": h})
-        
-    total = len(gated_results)
-    agreement = (tp + tn) / total if total > 0 else 0
-    precision = tp / (tp + fp) if (tp + fp) > 0 else 0
-    recall = tp / (tp + fn) if (tp + fn) > 0 else 0
-    f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
-    
-    return {
-        "agreement": round(agreement, 4),
-        "precision": round(precision, 4),
-        "recall": round(recall, 4),
-        "f1": round(f1, 4),
-        "counts": {"tp": tp, "fp": fp, "fn": fn, "tn": tn, "total": total},
-        "details": gated_results
-    }
+    arrays = pairs_to_arrays(results, ssot_map=ssot_map)
+    labels = [remap_casey_label(h) for h in arrays["y_true"]]
+
+    # Policy: 0.9 confidence gating for strict decision
+    # Matches with confidence < gate are treated as 0
+    gated = gate_predictions(arrays["y_pred"], arrays["confidence"], confidence_gate)
+    metrics = compute_metrics(labels, gated)
+
+    metrics["details"] = [
+        {**results[i], "ai_match_gated": int(a), "human_match": h}
+        for i, a, h in zip(arrays["index"], gated, labels)
+    ]
+    return metrics
 
 def main():
     parser = argparse.ArgumentParser()
@@ -416,6 +403,9 @@ def main():
     parser.add_argument("--gate", type=float, default=0.9)
     parser.add_argument("--spec-dir", default="specimens_v3", help="Subdirectory in out/ containing specimens")
     parser.add_argument("--output", help="Optional custom output filename")
+    parser.add_argument("--image-profile", choices=list(PROFILES), default="original", help="Specimen payload encoding (see image_payload.py)")
+    parser.add_argument("--pack-size", default="10", help="Max queries per judge call, or 'auto' for the calibrated pack profile")
+    parser.add_argument("--balance-packs", action="store_true", help="Even out pack sizes (12 at 10 -> 6+6) instead of full packs then the remainder")
     parser.add_argument("--cache-output", default="", help="Optional cache filename for resumable raw rows")
     parser.add_argument("--max-fonts", type=int, default=0, help="Limit number of fonts to process for smoke tests")
     parser.add_argument("--keys-file", default="", help="Optional file containing multiple Gemini API keys to cycle")
@@ -452,13 +442,19 @@ def main():
     with open(queries_path, 'r') as f:
         queries_json = json.load(f)
     query_text_map = {q['id']: q['text'] for q in queries_json}
+    pack_size = min(
+        resolve_pack_size(args.pack_size, args.model, args.prompt),
+        budget_pack_size(list(query_text_map.values())),
+    )
 
     results = []
     spec_v3_dir = out_dir / args.spec_dir
     
-    print(f"Executing Production Trial: Model={args.model} | Specimen={args.spec_dir} | Prompt={args.prompt} | Gate={args.gate}")
+    print(f"Executing Production Trial: Model={args.model} | Specimen={args.spec_dir} | Prompt={args.prompt} | Gate={args.gate} | Pack<={pack_size}{' balanced' if args.balance_packs else ''} | Image={args.image_profile}")
     
     processed_count = 0
+    ledger = UsageLedger(run_id=Path(args.output).stem if args.output else f"g3_pro_{args.prompt}_gated")
+    telemetry = Telemetry(run_id=ledger.run_id)
     font_names = sorted(list(font_to_queries.keys()))
 
     if args.max_fonts and args.max_fonts > 0:
@@ -499,12 +495,13 @@ def main():
             
             print(f"[{processed_count}/{len(font_names)}] {fname} ({len(q_texts)} pairs)...", end="", flush=True)
             
-            # Batch call (max 10 at a time for safety/context)
-            for i in range(0, len(q_texts), 10):
-                batch_texts = q_texts[i:i+10]
-                batch_ids = q_ids[i:i+10]
+            # Fewest packs within the pack size; images go once per pack
+            for batch_ids in plan_packs(q_ids, pack_size, balanced=args.balance_packs):
+                batch_texts = [query_text_map[qid] for qid in batch_ids]
                 
-                resp = call_gemini_v3(batch_texts, images, args.model, args.prompt, api_keys)
+                resp = call_gemini_v3(batch_texts, images, args.model, args.prompt, api_keys, args.image_profile)
+                ledger.add(resp, args.model, args.prompt, args.spec_dir, n_queries=len(batch_texts))
+                telemetry.record(resp, "gemini", args.model, n_queries=len(batch_texts))
                 if "error" in resp:
                     print(f" ERROR: {resp['error']}")
                     continue
@@ -542,11 +539,16 @@ def main():
 
     # 4. Final Metric Computation
     metrics = calculate_metrics(results, ssot_map, args.gate)
+    if args.image_profile != "original":
+        metrics["image_profile"] = args.image_profile
     
     # Save final results
     final_path = out_dir / (args.output if args.output else f"g3_pro_{args.prompt}_gated_results.json")
     with open(final_path, 'w') as f:
         json.dump(metrics, f, indent=2)
+    write_sidecar(final_path, metrics)
+    ledger.write(final_path)
+    telemetry.write(final_path)
         
     print("\n" + "="*40)
     print("FINAL METRICS")
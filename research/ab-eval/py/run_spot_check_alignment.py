@@ -7,6 +7,9 @@ from typing import List, Dict, Any, Tuple
 import requests
 from dotenv import load_dotenv
 
+from http_cassette import install_from_env
+from usage_accounting import UsageLedger, usage_from_response
+
 # Load environment variables
 def load_env():
     root = Path(__file__).resolve().parents[3]
@@ -14,6 +17,7 @@ def load_env():
     load_dotenv(root / ".env.local", override=False)
 
 load_env()
+install_from_env()
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 
@@ -86,13 +90,15 @@ Return STRICT JSON only (no markdown blocks, no prose):
     try:
         data = json.loads(content)
         data['latency_sec'] = round(latency, 2)
+        data['usage'] = usage_from_response(body)
         return data
     except json.JSONDecodeError:
         # Fallback for malformed JSON
         return {
             "thought": f"Failed to parse JSON. Raw content: {content}",
             "match": 0,
-            "latency_sec": round(latency, 2)
+            "latency_sec": round(latency, 2),
+            "usage": usage_from_response(body)
         }
 
 def main():
@@ -119,6 +125,7 @@ def main():
     target_query_ids = ["cq_002", "cq_011", "cq_025", "cq_033", "cq_016"]
     
     results = []
+    ledger = UsageLedger(run_id="spot_check_alignment")
     
     for qid in target_query_ids:
         query_text = queries[qid]['text']
@@ -138,6 +145,7 @@ def main():
                 
             print(f"  [JUDGING] {font_name}...", end="", flush=True)
             judgment = call_gpt52(query_text, font_name, image_path)
+            ledger.add(judgment, "openai/gpt-5.2", "v2", specimen_dir.name, n_queries=1)
             
             ai_match = judgment.get("match", 0)
             human_match = 1 if font_name in labeled_positive else 0
@@ -184,6 +192,7 @@ def main():
     out_file = out_dir / "spot_check_alignment.json"
     with open(out_file, "w") as f:
         json.dump(summary, f, indent=2)
+    ledger.write(out_file)
         
     print(f"\nFinal Agreement Rate: {agreement_rate:.2%}")
     print(f"Confusion: TP={tp}, FP={fp}, FN={fn}, TN={tn}")
@@ -7,6 +7,9 @@ from typing import List, Dict, Any, Tuple
 import requests
 from dotenv import load_dotenv
 
+from http_cassette import install_from_env
+from usage_accounting import UsageLedger, usage_from_response
+
 # Load environment variables
 def load_env():
     root = Path(__file__).resolve().parents[3]
@@ -14,6 +17,7 @@ def load_env():
     load_dotenv(root / ".env.local", override=False)
 
 load_env()
+install_from_env()
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 
@@ -108,15 +112,17 @@ Return STRICT JSON only (no markdown blocks, no prose):
     try:
         data = json.loads(content)
         data['latency_sec'] = round(latency, 2)
+        data['usage'] = usage_from_response(body)
         return data
     except json.JSONDecodeError:
         return {
             "thought": f"Failed to parse JSON. Raw content: {content}",
             "matches": [{"query_index": i+1, "match": 0} for i in range(len(queries))],
-            "latency_sec": round(latency, 2)
+            "latency_sec": round(latency, 2),
+            "usage": usage_from_response(body)
         }
 
-def run_evaluation(model_id: str):
+def run_evaluation(model_id: str, ledger: UsageLedger):
     print(f"\n=== Starting Evaluation for {model_id} ===")
     data_dir = Path("research/ab-eval/data")
     out_dir = Path("research/ab-eval/out")
@@ -169,7 +175,8 @@ def run_evaluation(model_id: str):
                 judgment = call_openrouter_batched(model_id, batch_query_texts, font_name, image_path)
             except Exception as e:
                 print(f" Error: {e}")
-                judgment = {"thought": f"Error: {e}", "matches": [], "latency_sec": 0}
+                judgment = {"thought": f"Error: {e}", "matches": [], "latency_sec": 0, "error": str(e)}
+            ledger.add(judgment, model_id, "v2", specimen_dir.name, n_queries=len(batch_qids))
             
             matches_map = {m['query_index']: m['match'] for m in judgment.get('matches', [])}
             
@@ -220,17 +227,21 @@ def main():
     
     # Model 1: Qwen 235B
     model_235b = "qwen/qwen3-vl-235b-a22b-instruct"
-    res_235b = run_evaluation(model_235b)
+    ledger_235b = UsageLedger(run_id="spot_check_alignment_qwen3vl_235b")
+    res_235b = run_evaluation(model_235b, ledger_235b)
     if res_235b:
         with open(out_dir / "spot_check_alignment_qwen3vl_235b.json", "w") as f:
             json.dump(res_235b, f, indent=2)
+        ledger_235b.write(out_dir / "spot_check_alignment_qwen3vl_235b.json")
             
     # Model 2: Qwen VL Plus
     model_vl_plus = "qwen/qwen-vl-plus"
-    res_vl_plus = run_evaluation(model_vl_plus)
+    ledger_vl_plus = UsageLedger(run_id="spot_check_alignment_vl_plus")
+    res_vl_plus = run_evaluation(model_vl_plus, ledger_vl_plus)
     if res_vl_plus:
         with open(out_dir / "spot_check_alignment_vl_plus.json", "w") as f:
             json.dump(res_vl_plus, f, indent=2)
+        ledger_vl_plus.write(out_dir / "spot_check_alignment_vl_plus.json")
 
 if __name__ == "__main__":
     main()
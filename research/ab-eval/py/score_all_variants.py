@@ -3,6 +3,8 @@ import numpy as np
 import argparse
 import os
 
+from font_features import FeatureTable, fuse_scores
+
 def cosine_similarity_matrix(queries, docs):
     """
     queries: (N_q, D)
@@ -136,7 +138,13 @@ def main():
     # Output
     parser.add_argument("--out_json", default="research/ab-eval/out/report_all.json")
     parser.add_argument("--out_md", default="research/ab-eval/out/report_all.md")
+    # Typographic features (font_features.py)
+    parser.add_argument("--features", default="", help="Feature table from font_features.py; adds '<variant>+F' variants")
+    parser.add_argument("--feature-weight", type=float, default=0.5, help="Feature score weight, in units of each query's score spread")
+    parser.add_argument("--feature-filter", action="store_true", help="Also sink docs vetoed by a query's feature rules")
     args = parser.parse_args()
+    if args.features and not os.path.exists(args.features):
+        parser.error(f"--features {args.features} does not exist (run font_features.py extract first)")
 
     # Load labels
     with open(args.labels, 'r') as f:
@@ -231,6 +239,17 @@ def main():
         else:
             print(f"Warning: Skipping Variant D (RRF) due to shape mismatch: A={all_scores['A'].shape}, B2={all_scores['B2'].shape}")
 
+    # 4c. Feature-fused variants: rule-bearing (technical) queries get typographic feature scores
+    if args.features:
+        print(f"Fusing typographic features from {args.features}...")
+        table = FeatureTable.load(args.features, doc_names)
+        query_texts = [q.get('text', '') for q in queries_meta]
+        feature_scores, has_rule = table.score_matrix(query_texts)
+        veto = table.veto_matrix(query_texts) if args.feature_filter else None
+        print(f"  {int(has_rule.sum())}/{len(query_ids)} queries matched feature rules; {int(table.present.sum())}/{len(doc_names)} docs have features")
+        for var_name in list(all_scores):
+            all_scores[f"{var_name}+F"] = fuse_scores(all_scores[var_name], feature_scores, has_rule, args.feature_weight, veto)
+
     # 5. Evaluate all variants
     final_report = {
         "variants": {},
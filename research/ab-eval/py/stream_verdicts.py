@@ -0,0 +1,211 @@
+"""
+Streaming judge responses: incremental verdict parsing with early abort
+
+Judge calls normally wait for the whole JSON body. With streaming, the
+server-sent events are read as they arrive (Gemini
+`:streamGenerateContent?alt=sse` parts, OpenRouter `stream: true` deltas), the
+model's JSON text is scanned once, left to right, and every object of the
+top-level `results` (or v2 `matches`) array is decoded as soon as its closing
+brace arrives. Once every requested `query_index` has a verdict the response
+is closed, which stops generation (OpenRouter cancels the upstream request on
+disconnect; Gemini stops streaming).
+
+Prompts list `audit_reasoning` before `results`, so early abort alone only
+skips trailing text. Verdict-only mode (`intervention_runner.py
+--verdict-only`) asks for `results` first, so the reasoning that would follow
+is never generated; top-level strings that did arrive (e.g. `audit_reasoning`
+in the default order) are kept.
+
+Usage:
+    resp = requests.post(url, json={**payload, "stream": True}, stream=True)
+    out = read_verdict_stream(resp, "openrouter", n_queries=len(queries))
+    out["data"]        # {"audit_reasoning": ..., "results": [...]} or None if nothing parsed
+    out["aborted"]     # True if closed before the model finished
+"""
+
+from __future__ import annotations
+
+import json
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+ARRAY_KEYS = ("results", "matches")
+
+
+class VerdictStream:
+    """
+    Single-pass scanner over a growing JSON text. Tracks string/escape state
+    and nesting depth so braces inside strings are ignored; decodes each
+    element object of a top-level `results`/`matches` array when it closes.
+    """
+
+    def __init__(self, expected: Iterable[int]):
+        self.expected = set(expected)
+        self.text = ""
+        self.verdicts: Dict[int, Dict[str, Any]] = {}
+        self.top: Dict[str, Any] = {}  # top-level string values seen so far
+        self.array_key: Optional[str] = None
+        self.array_closed = False
+        self._pos = 0
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._str_start = 0
+        self._last_str: Optional[str] = None  # last string at depth 1, a key or a value
+        self._key: Optional[str] = None  # key whose value is being read at depth 1
+        self._in_array = False
+        self._obj_start = 0
+
+    @property
+    def complete(self) -> bool:
+        return self.array_closed or (bool(self.expected) and self.expected <= set(self.verdicts))
+
+    def feed(self, chunk: str) -> bool:
+        """Scans `chunk`; returns True once all expected verdicts (or the whole array) have arrived."""
+        self.text += chunk
+        text = self.text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif c == "\\":
+                    self._esc = True
+                elif c == '"':
+                    self._in_str = False
+                    if self._depth == 1:
+                        s = json.loads(text[self._str_start:i + 1])
+                        if self._key is not None:
+                            self.top[self._key] = s
+                            self._key = None
+                        else:
+                            self._last_str = s
+                continue
+            if c == '"':
+                self._in_str = True
+                self._str_start = i
+            elif c == ":" and self._depth == 1:
+                self._key, self._last_str = self._last_str, None
+            elif c == "," and self._depth == 1:
+                self._key = None
+            elif c in "{[":
+                self._depth += 1
+                if c == "[" and self._depth == 2 and self._key in ARRAY_KEYS and self.array_key is None:
+                    self.array_key, self._in_array = self._key, True
+                elif c == "{" and self._in_array and self._depth == 3:
+                    self._obj_start = i
+            elif c in "}]":
+                if c == "}" and self._in_array and self._depth == 3:
+                    self._add(text[self._obj_start:i + 1])
+                self._depth -= 1
+                if c == "]" and self._in_array and self._depth == 1:
+                    self._in_array, self.array_closed = False, True
+                if self._depth == 1:
+                    self._key = None
+        self._pos = len(text)
+        return self.complete
+
+    def _add(self, obj_text: str) -> None:
+        try:
+            v = json.loads(obj_text)
+        except json.JSONDecodeError:
+            return
+        if isinstance(v, dict) and isinstance(v.get("query_index"), int):
+            self.verdicts.setdefault(v["query_index"], v)
+
+    def data(self) -> Optional[Dict[str, Any]]:
+        """Response dict from what has arrived; the full JSON when it parses, else top-level strings + verdicts."""
+        try:
+            full = json.loads(strip_fences(self.text))
+            if isinstance(full, dict):
+                return full
+        except json.JSONDecodeError:
+            pass
+        if not self.verdicts:
+            return None
+        out: Dict[str, Any] = dict(self.top)
+        out[self.array_key or "results"] = [self.verdicts[k] for k in sorted(self.verdicts)]
+        return out
+
+
+def strip_fences(text: str) -> str:
+    text = text.strip()
+    if text.startswith("```json"):
+        return text[7:-3].strip()
+    if text.startswith("```"):
+        return text[3:-3].strip()
+    return text
+
+
+def iter_sse_events(resp) -> Iterator[Dict[str, Any]]:
+    """JSON payloads of `data:` lines; comments (`: keep-alive`) are skipped, `[DONE]` ends the stream."""
+    for raw in resp.iter_lines(chunk_size=None):
+        if not raw:
+            continue
+        line = raw.decode("utf-8") if isinstance(raw, bytes) else raw
+        if not line.startswith("data:"):
+            continue
+        payload = line[5:].strip()
+        if payload == "[DONE]":
+            return
+        event = json.loads(payload)
+        if "error" in event:
+            raise RuntimeError(f"Stream error: {event['error']}")
+        yield event
+
+
+def event_text(provider: str, event: Dict[str, Any]) -> str:
+    if provider == "gemini":
+        parts: List[str] = []
+        for cand in event.get("candidates", [])[:1]:
+            for part in cand.get("content", {}).get("parts", []):
+                if isinstance(part.get("text"), str) and not part.get("thought"):
+                    parts.append(part["text"])
+        return "".join(parts)
+    choices = event.get("choices") or [{}]
+    return (choices[0].get("delta") or {}).get("content") or ""
+
+
+def read_verdict_stream(resp, provider: str, n_queries: int) -> Dict[str, Any]:
+    """
+    Reads a streamed judge response until query indices 1..n_queries all have
+    verdicts (then closes it) or the stream ends. Returns the parsed data, the
+    last usage-bearing event (for `usage_from_response`), whether the stream
+    was aborted early, characters received and seconds to the first verdict.
+    """
+    t0 = time.time()
+    stream = VerdictStream(range(1, n_queries + 1))
+    usage_event: Dict[str, Any] = {}
+    first_verdict = None
+    aborted = False
+    try:
+        for event in iter_sse_events(resp):
+            if event.get("usageMetadata") or event.get("usage"):
+                usage_event = event
+            text = event_text(provider, event)
+            if not text:
+                continue
+            done = stream.feed(text)
+            if first_verdict is None and stream.verdicts:
+                first_verdict = time.time() - t0
+            if done and stream.expected <= set(stream.verdicts):
+                aborted = True
+                break
+    finally:
+        resp.close()
+    return {
+        "data": stream.data(),
+        "text": stream.text,
+        "usage_event": usage_event,
+        "aborted": aborted and not _finished(stream.text),
+        "chars": len(stream.text),
+        "first_verdict_sec": None if first_verdict is None else round(first_verdict, 3),
+    }
+
+
+def _finished(text: str) -> bool:
+    try:
+        json.loads(strip_fences(text))
+        return True
+    except json.JSONDecodeError:
+        return False
@@ -0,0 +1,176 @@
+"""
+Local stand-in for the Fontsource API used by build_corpus_google_fonts.py
+
+Serves a deterministic synthetic catalogue with the same shapes as the real
+API so the corpus builder can be exercised offline at any scale:
+
+- GET /v1/fonts              list of fonts (id, family, category, subsets, type, ...)
+- GET /v1/fonts/{id}         details with variants -> weight -> style -> subset -> url
+- GET|HEAD /files/{name}     font binary (pseudo-random bytes, stable per font revision)
+
+JSON and binary responses carry an ETag and honour If-None-Match with 304.
+`--latency-ms` adds a per-request delay to mimic the network. `--revision N`
+changes the details and binary of roughly `--churn` of the fonts (chosen per
+revision), which is what incremental refresh runs are checked against.
+
+Usage:
+    python research/ab-eval/py/stub_fontsource_api.py --port 8765 --fonts 5000 --latency-ms 40
+    python research/ab-eval/py/build_corpus_google_fonts.py --api-base http://127.0.0.1:8765/v1 --limit 5000 \
+        --fonts-dir /tmp/fonts --cache-dir /tmp/fs_cache --out /tmp/corpus.5000.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+CATEGORIES = ["sans-serif", "serif", "display", "handwriting", "monospace"]
+SUBSETS = ["latin", "latin-ext", "cyrillic", "greek", "vietnamese"]
+
+
+class Catalogue:
+    def __init__(self, n_fonts: int, revision: int, churn: float, binary_kb: int):
+        self.revision = revision
+        self.binary_kb = binary_kb
+        rng = random.Random(7)
+        self.fonts: List[Dict[str, Any]] = []
+        for i in range(n_fonts):
+            fid = f"stub-font-{i:05d}"
+            self.fonts.append({
+                "id": fid,
+                "family": f"Stub Font {i:05d}",
+                "subsets": ["latin"] + rng.sample(SUBSETS[1:], rng.randint(0, 2)),
+                "weights": [400, 700],
+                "styles": ["normal", "italic"],
+                "defSubset": "latin",
+                "variable": False,
+                "category": CATEGORIES[i % len(CATEGORIES)] if i % 11 else "other",
+                "license": "OFL-1.1",
+                "type": "google" if i % 17 else "other",
+            })
+        self.by_id = {f["id"]: f for f in self.fonts}
+        changed = random.Random(f"churn:{revision}")
+        self.font_revision = {
+            f["id"]: (revision if revision and changed.random() < churn else 0) for f in self.fonts
+        }
+
+    def details(self, fid: str, base_url: str) -> Optional[Dict[str, Any]]:
+        font = self.by_id.get(fid)
+        if font is None:
+            return None
+        rev = self.font_revision[fid]
+        variants: Dict[str, Any] = {}
+        for weight in ("400", "700"):
+            variants[weight] = {
+                style: {
+                    subset: {"url": {
+                        "ttf": f"{base_url}/files/{fid}-{subset}-{weight}-{style}.ttf",
+                        "woff2": f"{base_url}/files/{fid}-{subset}-{weight}-{style}.woff2",
+                    }}
+                    for subset in font["subsets"]
+                }
+                for style in ("normal", "italic")
+            }
+        return {**font, "version": f"v{rev + 1}.0", "lastModified": f"2026-0{1 + rev % 9}-01", "variants": variants}
+
+    def binary(self, name: str) -> Optional[bytes]:
+        fid = "-".join(name.split("-")[:3])  # stub-font-NNNNN-<subset>-<weight>-<style>
+        if fid not in self.by_id:
+            return None
+        seed = hashlib.sha256(f"{name}|{self.font_revision[fid]}".encode("utf-8")).digest()
+        rng = random.Random(seed)
+        return b"\x00\x01\x00\x00" + rng.randbytes(self.binary_kb * 1024)
+
+
+def make_handler(catalogue: Catalogue, latency_s: float):
+    counters: Dict[str, int] = {"requests": 0, "not_modified": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):  # keep the console quiet
+            pass
+
+        def _resolve(self) -> Tuple[int, bytes, str]:
+            base = f"http://{self.headers.get('Host')}"
+            path = self.path.split("?")[0]
+            if path == "/v1/fonts":
+                return 200, json.dumps(catalogue.fonts).encode("utf-8"), "application/json"
+            if path.startswith("/v1/fonts/"):
+                d = catalogue.details(path[len("/v1/fonts/"):], f"{base}")
+                if d is None:
+                    return 404, b'{"error": "not found"}', "application/json"
+                return 200, json.dumps(d).encode("utf-8"), "application/json"
+            if path.startswith("/files/"):
+                name = path[len("/files/"):].rsplit(".", 1)[0]
+                data = catalogue.binary(name)
+                if data is None:
+                    return 404, b"not found", "text/plain"
+                return 200, data, "font/ttf"
+            if path == "/__stats__":
+                return 200, json.dumps(counters).encode("utf-8"), "application/json"
+            return 404, b"not found", "text/plain"
+
+        def _serve(self, with_body: bool) -> None:
+            if latency_s:
+                time.sleep(latency_s)
+            with lock:
+                counters["requests"] += 1
+            status, body, ctype = self._resolve()
+            etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+            if status == 200 and self.headers.get("If-None-Match") == etag:
+                with lock:
+                    counters["not_modified"] += 1
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            if status == 200:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            if with_body:
+                self.wfile.write(body)
+
+        def do_GET(self):
+            self._serve(True)
+
+        def do_HEAD(self):
+            self._serve(False)
+
+    return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stub of the Fontsource API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fonts", type=int, default=5000)
+    parser.add_argument("--binary-kb", type=int, default=24, help="Size of each synthetic font binary")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--revision", type=int, default=0, help="Catalogue revision; >0 changes ~--churn of the fonts")
+    parser.add_argument("--churn", type=float, default=0.05)
+    args = parser.parse_args()
+
+    catalogue = Catalogue(args.fonts, args.revision, args.churn, args.binary_kb)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(catalogue, args.latency_ms / 1000))
+    server.daemon_threads = True
+    print(f"Stub Fontsource API on http://{args.host}:{args.port}/v1 ({args.fonts} fonts, revision {args.revision})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""
+Local stand-in for the Gemini and OpenRouter APIs used by the judging runners
+
+Speaks the request/response shapes the runners send and parse, so
+concurrency, key rotation and retry logic can be stress-tested offline:
+
+- POST /v1beta/models/{model}:generateContent?key=K   Gemini (candidates[0].content.parts[0].text)
+- POST /v1beta/models/{model}:streamGenerateContent?alt=sse&key=K   Gemini, streamed
+- POST /api/v1/chat/completions                       OpenRouter chat (choices[0].message.content;
+                                                      `"stream": true` streams choices[0].delta.content)
+- POST /api/v1/embeddings                             OpenRouter embeddings (deterministic unit vectors)
+- GET  /__stats__                                     counters (per provider, model, key, status; max in-flight)
+- POST /__reset__                                     zero the counters and rate-limit buckets
+
+Verdicts are rule-based by default: the numbered queries (`1. "..."`) are
+read from the prompt and each gets a match/confidence derived from a hash of
+query + attached images, so the same request always gets the same verdict.
+v2 prompts get the `thought`/`matches` shape, all others `audit_reasoning`/
+`results` (verdicts first when the prompt says 'Write the "results" array
+first', as in verdict-only mode); `--reasoning-chars` pads the reasoning to simulate long rationales.
+`--canned FILE` returns that file's text verbatim instead.
+
+Generation takes `--stream-chunk-ms` per `--stream-chunk-chars` characters
+of output on top of the latency: streams send one event per piece as it is
+"generated", buffered responses arrive after all of it, so the two are
+comparable. A client that disconnects early is counted in `aborted_streams`
+/ `stream_chars_unsent`.
+
+Each API key has a token bucket (`--rpm`, `--burst`); an empty bucket
+answers 429 in the provider's error shape. `--error-rate` adds random 503s.
+Latency is `--latency fixed:MS | uniform:LO,HI | lognormal:MEDIAN_MS,SIGMA`
+plus `--per-query-ms` per judged query.
+
+Point the runners at it with the redirect in http_cassette.py:
+    python research/ab-eval/py/stub_model_api.py --port 8790 --rpm 60 --latency lognormal:800,0.4
+    AB_EVAL_API_REDIRECT="generativelanguage.googleapis.com=http://127.0.0.1:8790,openrouter.ai=http://127.0.0.1:8790" \
+        python research/ab-eval/py/run_production_trial.py ...
+    curl http://127.0.0.1:8790/__stats__
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+QUERY_LINE = re.compile(r'^\s*(\d+)\.\s+"(.*)"\s*$', re.M)
+GEMINI_PATH = re.compile(r"^/v1beta/models/(?P<model>[^/:]+):(?P<method>generateContent|streamGenerateContent)$")
+VERDICTS_FIRST = re.compile(r'write the "(results|matches)" array first', re.I)
+
+
+def parse_latency(spec: str):
+    """'fixed:MS' | 'uniform:LO,HI' | 'lognormal:MEDIAN_MS,SIGMA' -> rng -> seconds"""
+    kind, _, args = spec.partition(":")
+    vals = [float(v) for v in args.split(",")] if args else [0.0]
+    if kind == "fixed":
+        return lambda rng: vals[0] / 1000
+    if kind == "uniform":
+        return lambda rng: rng.uniform(vals[0], vals[1]) / 1000
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(max(vals[0], 1e-3)), vals[1]) / 1000
+    raise ValueError(f"Unknown latency spec {spec!r}")
+
+
+def _unit(seed: str) -> float:
+    return int(hashlib.sha256(seed.encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF
+
+
+class TokenBucket:
+    def __init__(self, rpm: float, burst: int):
+        self.rate = rpm / 60.0
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class StubModels:
+    def __init__(self, args):
+        self.rpm = args.rpm
+        self.burst = args.burst or max(1, int(args.rpm // 6))
+        self.error_rate = args.error_rate
+        self.match_rate = args.match_rate
+        self.embed_dim = args.embed_dim
+        self.per_query_s = args.per_query_ms / 1000
+        self.reasoning_chars = args.reasoning_chars
+        self.chunk_chars = max(1, args.stream_chunk_chars)
+        self.chunk_s = args.stream_chunk_ms / 1000
+        self.latency = parse_latency(args.latency)
+        self.canned = open(args.canned, "r", encoding="utf-8").read() if args.canned else None
+        self.rng = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.buckets.clear()
+            self.in_flight = 0
+            self.counters: Dict[str, Any] = {
+                "requests": 0, "max_in_flight": 0, "by_status": {}, "by_provider": {}, "by_model": {}, "by_key": {},
+                "streams": 0, "aborted_streams": 0, "stream_chars_unsent": 0,
+            }
+
+    @staticmethod
+    def _bump(d: Dict[str, int], k) -> None:
+        d[str(k)] = d.get(str(k), 0) + 1
+
+    def admit(self, provider: str, model: str, key: str) -> Tuple[Optional[int], float]:
+        """Counts the request; returns (error status or None, latency to simulate)."""
+        masked = f"{key[:4]}...{key[-2:]}" if len(key) > 8 else (key or "<none>")
+        with self.lock:
+            c = self.counters
+            c["requests"] += 1
+            self._bump(c["by_provider"], provider)
+            self._bump(c["by_model"], model)
+            self._bump(c["by_key"], masked)
+            self.in_flight += 1
+            c["max_in_flight"] = max(c["max_in_flight"], self.in_flight)
+            latency = self.latency(self.rng)
+            if not key:
+                return 401, 0.0
+            if self.rpm > 0:
+                bucket = self.buckets.setdefault(key, TokenBucket(self.rpm, self.burst))
+                if not bucket.take():
+                    return 429, 0.0
+            if self.error_rate and self.rng.random() < self.error_rate:
+                return 503, latency
+        return None, latency
+
+    def done(self, status: int) -> None:
+        with self.lock:
+            self.in_flight -= 1
+            self._bump(self.counters["by_status"], status)
+
+    def verdict_text(self, prompt: str, images: List[str]) -> Tuple[str, int]:
+        """Model output text for a judge prompt, and the number of queries judged."""
+        queries = [(int(i), q) for i, q in QUERY_LINE.findall(prompt)]
+        if self.canned is not None:
+            return self.canned, len(queries)
+        image_seed = hashlib.sha256("".join(images).encode("utf-8")).hexdigest()[:16]
+        results = []
+        for i, q in queries:
+            u = _unit(f"{image_seed}|{q}")
+            match = 1 if u < self.match_rate else 0
+            conf = round(0.55 + 0.45 * _unit(f"conf|{image_seed}|{q}"), 2)
+            results.append({"query_index": i, "match": match, "confidence": conf,
+                            "evidence": f"stub verdict for query {i}", "counter_evidence": ""})
+        reasoning = "stub judge (rule-based, deterministic per query and specimen)"
+        reasoning += " ." * max(0, (self.reasoning_chars - len(reasoning)) // 2)
+        if '"matches"' in prompt:
+            body = {"thought": reasoning, "matches": [{"query_index": r["query_index"], "match": r["match"]} for r in results]}
+        else:
+            body = {"audit_reasoning": reasoning, "results": results}
+        if VERDICTS_FIRST.search(prompt):
+            body = dict(reversed(list(body.items())))
+        return json.dumps(body), len(queries)
+
+    def embedding(self, text: str) -> List[float]:
+        rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+        v = [rng.gauss(0, 1) for _ in range(self.embed_dim)]
+        norm = math.sqrt(sum(x * x for x in v)) or 1.0
+        return [x / norm for x in v]
+
+
+def _error_body(provider: str, status: int) -> Dict[str, Any]:
+    messages = {401: "No auth credentials found", 429: "Rate limit exceeded", 503: "The model is overloaded"}
+    if provider == "gemini":
+        codes = {401: "UNAUTHENTICATED", 429: "RESOURCE_EXHAUSTED", 503: "UNAVAILABLE"}
+        return {"error": {"code": status, "message": messages[status], "status": codes[status]}}
+    return {"error": {"code": status, "message": messages[status]}}
+
+
+def make_handler(stub: StubModels):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):  # keep the console quiet
+            pass
+
+        def _send(self, status: int, body: Dict[str, Any]) -> None:
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            if status == 429:
+                self.send_header("Retry-After", "1")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _stream(self, provider: str, model: str, text: str, usage: Tuple[int, int]) -> None:
+            """Server-sent events in the provider's streaming shape, one HTTP chunk per event."""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def write_chunk(data: bytes) -> None:
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            with stub.lock:
+                stub.counters["streams"] += 1
+            chunks = [text[i:i + stub.chunk_chars] for i in range(0, len(text), stub.chunk_chars)] or [""]
+            sent = 0
+            try:
+                for n, chunk in enumerate(chunks):
+                    last = n == len(chunks) - 1
+                    if provider == "gemini":
+                        event: Dict[str, Any] = {"candidates": [{"content": {"parts": [{"text": chunk}], "role": "model"}, "index": 0}], "modelVersion": model}
+                        if last:
+                            event["candidates"][0]["finishReason"] = "STOP"
+                            event["usageMetadata"] = {"promptTokenCount": usage[0], "candidatesTokenCount": usage[1], "totalTokenCount": sum(usage)}
+                    else:
+                        event = {"id": "stub-stream", "object": "chat.completion.chunk", "model": model,
+                                 "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": "stop" if last else None}]}
+                        if last:
+                            event["usage"] = {"prompt_tokens": usage[0], "completion_tokens": usage[1], "total_tokens": sum(usage)}
+                    write_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                    sent += len(chunk)
+                    if not last:
+                        time.sleep(stub.chunk_s)
+                if provider != "gemini":
+                    write_chunk(b"data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True
+                with stub.lock:
+                    stub.counters["aborted_streams"] += 1
+                    stub.counters["stream_chars_unsent"] += len(text) - sent
+
+        def do_GET(self):
+            if urlsplit(self.path).path == "/__stats__":
+                with stub.lock:
+                    self._send(200, {**stub.counters, "in_flight": stub.in_flight})
+            else:
+                self._send(404, {"error": {"code": 404, "message": "not found"}})
+
+        def do_POST(self):
+            url = urlsplit(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            if url.path == "/__reset__":
+                stub.reset()
+                return self._send(200, {"reset": True})
+            try:
+                payload = json.loads(raw or b"{}")
+            except ValueError:
+                return self._send(400, {"error": {"code": 400, "message": "invalid JSON"}})
+
+            m = GEMINI_PATH.match(url.path)
+            if m:
+                provider, model = "gemini", m["model"]
+                key = parse_qs(url.query).get("key", [""])[0]
+            elif url.path in ("/api/v1/chat/completions", "/api/v1/embeddings"):
+                provider, model = "openrouter", payload.get("model", "")
+                key = (self.headers.get("Authorization") or "").removeprefix("Bearer ").strip()
+            else:
+                return self._send(404, {"error": {"code": 404, "message": f"unknown path {url.path}"}})
+
+            error, latency = stub.admit(provider, model, key)
+            status = error or 200
+            try:
+                if error is not None:
+                    time.sleep(latency)
+                    return self._send(error, _error_body(provider, error))
+                if url.path == "/api/v1/embeddings":
+                    inputs = payload.get("input", [])
+                    inputs = [inputs] if isinstance(inputs, str) else inputs
+                    time.sleep(latency)
+                    return self._send(200, {
+                        "object": "list", "model": model,
+                        "data": [{"object": "embedding", "index": i, "embedding": stub.embedding(t)} for i, t in enumerate(inputs)],
+                        "usage": {"prompt_tokens": sum(len(t.split()) for t in inputs), "total_tokens": sum(len(t.split()) for t in inputs)},
+                    })
+                prompt, images = self._prompt_and_images(provider, payload)
+                text, n_queries = stub.verdict_text(prompt, images)
+                usage = (len(prompt) // 4 + 258 * len(images), len(text) // 4)
+                time.sleep(latency + n_queries * stub.per_query_s)
+                if (m and m["method"] == "streamGenerateContent") or (not m and payload.get("stream")):
+                    return self._stream(provider, model, text, usage)
+                time.sleep(math.ceil(len(text) / stub.chunk_chars) * stub.chunk_s)
+                if provider == "gemini":
+                    return self._send(200, {
+                        "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP", "index": 0}],
+                        "usageMetadata": {"promptTokenCount": usage[0], "candidatesTokenCount": usage[1], "totalTokenCount": sum(usage)},
+                        "modelVersion": model,
+                    })
+                return self._send(200, {
+                    "id": f"stub-{stub.counters['requests']}", "object": "chat.completion", "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": usage[0], "completion_tokens": usage[1], "total_tokens": sum(usage)},
+                })
+            finally:
+                stub.done(status)
+
+        @staticmethod
+        def _prompt_and_images(provider: str, payload: Dict[str, Any]) -> Tuple[str, List[str]]:
+            texts, images = [], []
+            if provider == "gemini":
+                for content in payload.get("contents", []):
+                    for part in content.get("parts", []):
+                        if "text" in part:
+                            texts.append(part["text"])
+                        elif "inline_data" in part:
+                            images.append(hashlib.sha256(part["inline_data"].get("data", "").encode("utf-8")).hexdigest())
+            else:
+                for msg in payload.get("messages", []):
+                    content = msg.get("content", "")
+                    for part in ([{"type": "text", "text": content}] if isinstance(content, str) else content):
+                        if part.get("type") == "text":
+                            texts.append(part.get("text", ""))
+                        elif part.get("type") == "image_url":
+                            # data URLs hash like Gemini inline_data so both providers agree on a specimen
+                            data = part["image_url"].get("url", "").split("base64,", 1)[-1]
+                            images.append(hashlib.sha256(data.encode("utf-8")).hexdigest())
+            return "\n".join(texts), images
+
+    return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stub of the Gemini and OpenRouter judge/embedding APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--rpm", type=float, default=0, help="Requests per minute per API key (0 = unlimited)")
+    parser.add_argument("--burst", type=int, default=0, help="Bucket size per key (default rpm/6)")
+    parser.add_argument("--latency", default="fixed:0", help="fixed:MS | uniform:LO,HI | lognormal:MEDIAN_MS,SIGMA")
+    parser.add_argument("--per-query-ms", type=float, default=0.0, help="Extra latency per judged query")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of admitted requests answered with 503")
+    parser.add_argument("--match-rate", type=float, default=0.35, help="Share of rule-based verdicts that are matches")
+    parser.add_argument("--canned", default="", help="Return this file's text as the model output instead of rule-based verdicts")
+    parser.add_argument("--reasoning-chars", type=int, default=0, help="Pad the judge's reasoning field to this many characters")
+    parser.add_argument("--stream-chunk-chars", type=int, default=16, help="Characters per streamed event")
+    parser.add_argument("--stream-chunk-ms", type=float, default=0.0, help="Generation time per --stream-chunk-chars of output")
+    parser.add_argument("--embed-dim", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    stub = StubModels(args)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(stub))
+    server.daemon_threads = True
+    print(f"Stub model API on http://{args.host}:{args.port} (rpm/key {args.rpm or 'unlimited'}, latency {args.latency})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Vision resolution sweep for glyph-sheet embeddings (Variant B1)
+
+Loads the VL embedder once, embeds the query texts once, then re-embeds the
+glyph sheets under a series of max-pixel budgets (expressed in vision
+tokens; one token = (patch_size * merge_size)^2 px from the processor, 32x32
+for Qwen3-VL). For each budget it records the vision-token
+count per sheet, per-sheet latency and retrieval quality (Recall@10,
+Recall@20, MRR@10 against the labels), plus cosine agreement with the
+processor-default embeddings when that setting is part of the sweep.
+
+Usage:
+    python research/ab-eval/py/sweep_vision_resolution.py --dataset medium --max-tokens 0 32 64 96 128 160
+
+This produces:
+    research/ab-eval/out/vision_resolution_sweep.json
+    research/ab-eval/out/vision_resolution_sweep.md
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from embed_qwen3_vl import Qwen3VLEmbedder
+from score_all_variants import calculate_metrics_from_scores, cosine_similarity_matrix
+
+DATASETS = {
+    "toy": ("research/ab-eval/data/corpus.toy.json", "research/ab-eval/data/queries.toy.json", "research/ab-eval/data/labels.toy.json"),
+    "200": ("research/ab-eval/data/corpus.200.json", "research/ab-eval/data/queries.200.json", "research/ab-eval/data/labels.200.json"),
+    "medium": ("research/ab-eval/data/corpus.200.json", "research/ab-eval/data/queries.medium.human.v1.json", "research/ab-eval/data/labels.medium.human.v1.json"),
+}
+
+
+def glyph_path(glyph_dir: str, name: str) -> str:
+    safe_name = name.replace(' ', '_').replace('/', '_')
+    return os.path.join(glyph_dir, f"{safe_name}.png")
+
+
+def run_setting(embedder: Qwen3VLEmbedder, doc_items: List[Dict[str, str]], max_tokens: int, min_tokens: int):
+    max_px = max_tokens * embedder.pixels_per_token if max_tokens else None
+    # The processor-default row keeps the processor's own lower bound too
+    min_px = min(min_tokens, max_tokens) * embedder.pixels_per_token if (min_tokens and max_tokens) else None
+    embedder.set_vision_policy("default", min_pixels=min_px, max_pixels=max_px)
+    t0 = time.perf_counter()
+    embs = embedder.embed_items(doc_items)
+    total_s = time.perf_counter() - t0
+    tokens = np.array(embedder.last_vision_tokens)
+    seconds = np.array(embedder.last_item_seconds)
+    stats = {
+        "max_tokens": max_tokens or None,
+        "min_pixels": min_px,
+        "max_pixels": max_px,
+        "vision_tokens_mean": round(float(tokens.mean()), 1),
+        "vision_tokens_p50": float(np.percentile(tokens, 50)),
+        "vision_tokens_max": int(tokens.max()),
+        "sec_per_doc_mean": round(float(seconds.mean()), 4),
+        "sec_per_doc_p95": round(float(np.percentile(seconds, 95)), 4),
+        "total_s": round(total_s, 2),
+    }
+    return embs, stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sweep glyph-sheet vision resolution: tokens, latency, Recall@10")
+    parser.add_argument("--dataset", choices=list(DATASETS), default="medium")
+    parser.add_argument("--corpus")
+    parser.add_argument("--queries")
+    parser.add_argument("--labels")
+    parser.add_argument("--glyph-dir", default="research/ab-eval/out/glyphs")
+    parser.add_argument("--model", default="Qwen/Qwen3-VL-Embedding-8B")
+    parser.add_argument("--precision", default="auto")
+    parser.add_argument("--max-tokens", type=int, nargs="+", default=[0, 32, 64, 96, 128, 160],
+                        help="Max vision tokens per sheet; 0 = processor default (the current path)")
+    parser.add_argument("--min-tokens", type=int, default=16, help="Lower pixel bound in tokens (0 = processor default)")
+    parser.add_argument("--limit-docs", type=int, default=None)
+    parser.add_argument("--out", default="research/ab-eval/out/vision_resolution_sweep.json")
+    args = parser.parse_args()
+
+    corpus_path, queries_path, labels_path = DATASETS[args.dataset]
+    corpus_path, queries_path, labels_path = args.corpus or corpus_path, args.queries or queries_path, args.labels or labels_path
+    with open(corpus_path, 'r') as f:
+        corpus = json.load(f)
+    with open(queries_path, 'r') as f:
+        queries = json.load(f)
+    with open(labels_path, 'r') as f:
+        labels = json.load(f)
+
+    docs = [f for f in corpus if os.path.exists(glyph_path(args.glyph_dir, f['name']))]
+    if args.limit_docs:
+        docs = docs[:args.limit_docs]
+    if len(docs) < len(corpus):
+        print(f"Using {len(docs)} of {len(corpus)} fonts (glyph sheet present{', limited' if args.limit_docs else ''})")
+    doc_names = [f['name'] for f in docs]
+    doc_items = [{"image": glyph_path(args.glyph_dir, n)} for n in doc_names]
+    query_ids = [q['id'] for q in queries]
+
+    embedder = Qwen3VLEmbedder(model_name=args.model, precision=args.precision)
+    print("Embedding queries (text only, resolution-independent)...")
+    query_embs = embedder.embed_items([{"text": q['text']} for q in queries])
+
+    rows = []  # (stats, doc embeddings) per setting
+    default_embs = None
+    for max_tokens in args.max_tokens:
+        label = f"max {max_tokens} tokens" if max_tokens else "processor default"
+        print(f"\n--- {label} ---")
+        embs, stats = run_setting(embedder, doc_items, max_tokens, args.min_tokens)
+        metrics, _, _ = calculate_metrics_from_scores(cosine_similarity_matrix(query_embs, embs), doc_names, query_ids, labels)
+        stats.update({k: round(v, 4) for k, v in metrics.items()})
+        if max_tokens == 0:
+            default_embs = embs
+        rows.append((stats, embs))
+        print(json.dumps(stats))
+
+    results = []
+    for stats, embs in rows:
+        if default_embs is not None:
+            stats["cosine_vs_default_mean"] = round(float(np.mean(np.sum(embs * default_embs, axis=1))), 5)
+        results.append(stats)
+
+    report = {
+        "dataset": args.dataset,
+        "corpus": corpus_path,
+        "queries": queries_path,
+        "labels": labels_path,
+        "model": args.model,
+        "precision": embedder.precision,
+        "n_docs": len(doc_names),
+        "min_tokens": args.min_tokens,
+        "pixels_per_token": embedder.pixels_per_token,
+        "settings": results,
+    }
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    md_path = os.path.splitext(args.out)[0] + ".md"
+    with open(md_path, 'w') as f:
+        f.write(f"# Vision Resolution Sweep ({args.dataset}, {len(doc_names)} glyph sheets)\n\n")
+        f.write("| Max tokens | Tokens (mean) | Tokens (max) | s/doc | Recall@10 | Recall@20 | MRR@10 | cos vs default |\n")
+        f.write("| --- | --- | --- | --- | --- | --- | --- | --- |\n")
+        for r in results:
+            f.write(f"| {r['max_tokens'] or 'default'} | {r['vision_tokens_mean']} | {r['vision_tokens_max']} | "
+                    f"{r['sec_per_doc_mean']} | {r['Recall@10']:.4f} | {r['Recall@20']:.4f} | {r['MRR@10']:.4f} | "
+                    f"{r.get('cosine_vs_default_mean', '-')} |\n")
+    print(f"\nSaved to {args.out} and {md_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Text layout with cached glyph advances for the specimen renderers
+
+`draw_section` used to wrap by re-measuring the growing line with
+`draw.textlength` for every word (and every character of an over-long
+word), which is quadratic per section, then measured each line again with
+`textbbox`. `TextLayout` measures each glyph advance and kerning pair once
+per font size, caches word widths, and breaks lines greedily in one pass:
+a candidate line's width is the current line's width extended by the next
+word, accumulated left to right exactly as the atlas/Pillow measure a whole
+string, so line breaks are identical to the old per-line measurements.
+
+One `TextLayout` is shared by all sections of a specimen (and can be shared
+across specimens); fonts are `glyph_atlas.AtlasFont` or Pillow
+`FreeTypeFont` objects.
+
+Usage:
+    layout = TextLayout()
+    for line in layout.wrap(text, font, max_width):
+        draw.text((x, y), line, font=font, anchor="lt")
+        y = layout.line_bottom(line, font, y) + line_spacing
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from glyph_atlas import AtlasFont
+
+
+class _FontMetrics:
+    """Cached advances, kerning, vertical ink extents and word widths of one font size."""
+
+    def __init__(self, font):
+        self.font = font
+        self.advance: Dict[str, float] = {}
+        self.kerning: Dict[str, float] = {}
+        # (top, bottom) of each glyph's ink relative to the baseline; None for blank glyphs
+        self.extent: Dict[str, Optional[Tuple[int, int]]] = {}
+        self.words: Dict[str, float] = {}
+
+
+class TextLayout:
+    def __init__(self):
+        self._fonts: Dict[Hashable, _FontMetrics] = {}
+        self.stats = {"glyphs": 0, "kern_pairs": 0, "words": 0}
+
+    def _metrics(self, font) -> _FontMetrics:
+        key = (id(font.atlas), font.size) if isinstance(font, AtlasFont) else id(font)
+        m = self._fonts.get(key)
+        if m is None:
+            m = self._fonts[key] = _FontMetrics(font)
+        return m
+
+    def _advance(self, m: _FontMetrics, ch: str) -> float:
+        adv = m.advance.get(ch)
+        if adv is None:
+            font = m.font
+            adv = font.atlas.glyph(font.size, ch).advance if isinstance(font, AtlasFont) else font.getlength(ch)
+            m.advance[ch] = adv
+            self.stats["glyphs"] += 1
+        return adv
+
+    def _kern(self, m: _FontMetrics, a: str, b: str) -> float:
+        pair = a + b
+        k = m.kerning.get(pair)
+        if k is None:
+            font = m.font
+            if isinstance(font, AtlasFont):
+                k = font.atlas.kern(font.size, a, b)
+            else:
+                # Pillow's basic layout applies kerning inside getlength
+                k = font.getlength(pair) - self._advance(m, a) - self._advance(m, b)
+            m.kerning[pair] = k
+            self.stats["kern_pairs"] += 1
+        return k
+
+    def _extend(self, m: _FontMetrics, width: float, last: Optional[str], text: str) -> float:
+        """Width of (measured prefix ending in `last`) + `text`, accumulated in string order."""
+        for ch in text:
+            if last is not None:
+                width += self._kern(m, last, ch)
+            width += self._advance(m, ch)
+            last = ch
+        return width
+
+    def textlength(self, text: str, font) -> float:
+        m = self._metrics(font)
+        w = m.words.get(text)
+        if w is None:
+            w = m.words[text] = self._extend(m, 0.0, None, text)
+            self.stats["words"] += 1
+        return w
+
+    def wrap(self, text: str, font, max_width: float) -> List[str]:
+        """
+        Greedy line breaking at single spaces; a word wider than `max_width`
+        is broken between characters. Same lines as measuring every candidate
+        line with `draw.textlength`, in one pass over the text.
+        """
+        m = self._metrics(font)
+        lines: List[str] = []
+        parts: List[str] = []
+        width = 0.0  # width of ' '.join(parts)
+
+        def split_word(word: str) -> None:
+            # Character-level breaking of an over-long word; the tail starts the next line
+            nonlocal parts, width
+            temp, temp_w = "", 0.0
+            for ch in word:
+                w = self._extend(m, temp_w, temp[-1] if temp else None, ch)
+                if w <= max_width:
+                    temp, temp_w = temp + ch, w
+                else:
+                    lines.append(temp)
+                    temp, temp_w = ch, self._advance(m, ch)
+            parts, width = ([temp], temp_w) if temp else ([], 0.0)
+
+        for word in text.split(' '):
+            if parts:
+                last = parts[-1][-1] if parts[-1] else (" " if len(parts) > 1 else None)
+                test_w = self._extend(m, width, last, " " + word)
+            else:
+                test_w = self.textlength(word, font)
+            if test_w <= max_width:
+                parts.append(word)
+                width = test_w
+            elif parts:
+                lines.append(' '.join(parts))
+                parts, width = [word], self.textlength(word, font)
+                if width > max_width:
+                    split_word(word)
+            else:
+                split_word(word)
+
+        if parts:
+            lines.append(' '.join(parts))
+        return lines
+
+    def line_bottom(self, line: str, font, y: int) -> int:
+        """Bottom of `line`'s ink bbox when drawn at `y` with anchor "lt" (textbbox(...)[3])."""
+        m = self._metrics(font)
+        if not isinstance(font, AtlasFont):
+            return y + font.getbbox(line, anchor="lt")[3]
+        top, bottom = None, None
+        for ch in line:
+            if ch not in m.extent:
+                g = font.atlas.glyph(font.size, ch)
+                m.extent[ch] = (g.dy, g.dy + g.mask.height) if g.mask.width and g.mask.height else None
+            ext = m.extent[ch]
+            if ext is not None:
+                top = ext[0] if top is None else min(top, ext[0])
+                bottom = ext[1] if bottom is None else max(bottom, ext[1])
+        if top is None:
+            return int(y)
+        # The "lt" anchor puts the highest ink at y; the atlas truncates the baseline like Pillow
+        return int(y - top) + bottom
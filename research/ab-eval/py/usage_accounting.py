@@ -0,0 +1,279 @@
+"""
+Token, cost and throughput accounting for model runners
+
+Call functions attach the provider's usage block to their response dict as
+`usage` (normalized by `usage_from_response`); a runner feeds every response
+to one `UsageLedger` and writes the summary next to its results file:
+
+- Gemini `usageMetadata`: promptTokenCount, candidatesTokenCount,
+  thoughtsTokenCount (billed as output), cachedContentTokenCount
+- OpenRouter `usage`: prompt_tokens, completion_tokens (incl. reasoning),
+  completion_tokens_details.reasoning_tokens, prompt_tokens_details.cached_tokens,
+  cost (USD, when OpenRouter reports it)
+- local models: `local_usage(prompt_tokens, completion_tokens)` from the
+  tokenizer's input/output ids
+- streams closed before the provider's final (usage) event:
+  `estimated_usage(prompt_tokens, completion_chars)`, prompt tokens estimated
+  from the request and completion tokens from the characters received,
+  flagged `estimated`
+
+The summary is grouped by (model, prompt version, specimen version): calls,
+errors, calls without usage, calls with estimated usage, tokens (total and
+per query), latency, and cost. Per-query and per-call figures only count
+calls that reported (or estimated) usage.
+Cost is the provider-reported cost when present, otherwise tokens x the price
+table in AB_EVAL_PRICES (a JSON file of
+`{"model": {"input_per_mtok": USD, "output_per_mtok": USD}}`); models without
+either get `cost_usd: null` rather than a guess. Throughput (calls/min,
+queries/min, tokens/s) is over the ledger's wall-clock time.
+
+The summary is JSON written to `<results stem>.usage` (not `.json`, so
+`out/*.json` globs over results files do not pick it up).
+
+Usage:
+    ledger = UsageLedger(run_id="v5_1_full")
+    resp = call_gemini_v3(...)
+    ledger.add(resp, model=args.model, prompt_version=args.prompt, specimen_version=args.spec_dir, n_queries=len(batch))
+    ledger.write(final_path)
+
+    python research/ab-eval/py/usage_accounting.py compare "research/ab-eval/out/*.usage"
+
+This produces:
+- `research/ab-eval/out/<results stem>.usage`
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+TOKEN_FIELDS = ("prompt_tokens", "completion_tokens", "reasoning_tokens", "cached_tokens", "total_tokens")
+COUNT_FIELDS = ("calls", "errors", "calls_without_usage", "estimated_calls", "queries")
+CHARS_PER_TOKEN = 4
+
+
+def usage_from_response(body: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Normalized usage of a raw Gemini or OpenRouter response body; None if it carries none."""
+    meta = body.get("usageMetadata")
+    if isinstance(meta, dict):
+        candidates = int(meta.get("candidatesTokenCount") or 0)
+        thoughts = int(meta.get("thoughtsTokenCount") or 0)
+        prompt = int(meta.get("promptTokenCount") or 0)
+        return {
+            "prompt_tokens": prompt,
+            "completion_tokens": candidates + thoughts,
+            "reasoning_tokens": thoughts,
+            "cached_tokens": int(meta.get("cachedContentTokenCount") or 0),
+            "total_tokens": int(meta.get("totalTokenCount") or prompt + candidates + thoughts),
+        }
+    usage = body.get("usage")
+    if isinstance(usage, dict):
+        prompt = int(usage.get("prompt_tokens") or 0)
+        completion = int(usage.get("completion_tokens") or 0)
+        out = {
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "reasoning_tokens": int((usage.get("completion_tokens_details") or {}).get("reasoning_tokens") or 0),
+            "cached_tokens": int((usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0),
+            "total_tokens": int(usage.get("total_tokens") or prompt + completion),
+        }
+        if usage.get("cost") is not None:
+            out["cost_usd"] = float(usage["cost"])
+        return out
+    return None
+
+
+def local_usage(prompt_tokens: int, completion_tokens: int) -> Dict[str, Any]:
+    return {
+        "prompt_tokens": int(prompt_tokens),
+        "completion_tokens": int(completion_tokens),
+        "reasoning_tokens": 0,
+        "cached_tokens": 0,
+        "total_tokens": int(prompt_tokens) + int(completion_tokens),
+    }
+
+
+def estimated_usage(prompt_tokens: int, completion_chars: int) -> Dict[str, Any]:
+    """Usage for a call the provider never reported (stream closed early): the prompt as sent, completion from characters received."""
+    usage = local_usage(prompt_tokens, -(-completion_chars // CHARS_PER_TOKEN))
+    usage["estimated"] = True
+    return usage
+
+
+def load_prices(path: str = "") -> Dict[str, Dict[str, float]]:
+    path = path or os.getenv("AB_EVAL_PRICES", "")
+    if not path:
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _new_group() -> Dict[str, Any]:
+    return {
+        "calls": 0, "errors": 0, "calls_without_usage": 0, "estimated_calls": 0, "queries": 0, "metered_queries": 0, "latency_sec": 0.0,
+        **{k: 0 for k in TOKEN_FIELDS},
+        "reported_cost_usd": 0.0, "reported_cost_calls": 0, "unreported_cost_tokens": [0, 0],
+    }
+
+
+class UsageLedger:
+    def __init__(self, run_id: str = "", prices: Optional[Dict[str, Dict[str, float]]] = None):
+        self.run_id = run_id
+        self.prices = load_prices() if prices is None else prices
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._groups: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+
+    def add(
+        self,
+        resp: Optional[Dict[str, Any]],
+        model: str,
+        prompt_version: str = "",
+        specimen_version: str = "",
+        n_queries: int = 0,
+        usage: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        Accounts one call. `resp` is the runner's response dict (`usage`,
+        `latency_sec`, `error`); pass `usage` directly for callers without one.
+        """
+        resp = resp or {}
+        usage = usage if usage is not None else resp.get("usage")
+        with self._lock:
+            g = self._groups.setdefault((model, prompt_version, specimen_version), _new_group())
+            g["calls"] += 1
+            g["queries"] += n_queries
+            g["latency_sec"] += float(resp.get("latency_sec") or 0)
+            if "error" in resp:
+                g["errors"] += 1
+            if not usage:
+                g["calls_without_usage"] += 1
+                return
+            g["metered_queries"] += n_queries
+            if usage.get("estimated"):
+                g["estimated_calls"] += 1
+            for k in TOKEN_FIELDS:
+                g[k] += int(usage.get(k) or 0)
+            if usage.get("cost_usd") is not None:
+                g["reported_cost_usd"] += usage["cost_usd"]
+                g["reported_cost_calls"] += 1
+            else:
+                g["unreported_cost_tokens"][0] += int(usage.get("prompt_tokens") or 0)
+                g["unreported_cost_tokens"][1] += int(usage.get("completion_tokens") or 0)
+
+    def _cost(self, model: str, g: Dict[str, Any]) -> Optional[float]:
+        cost = g["reported_cost_usd"] if g["reported_cost_calls"] else 0.0
+        prompt, completion = g["unreported_cost_tokens"]
+        if prompt or completion:
+            price = self.prices.get(model)
+            if price is None:
+                return None
+            cost += (prompt * price.get("input_per_mtok", 0) + completion * price.get("output_per_mtok", 0)) / 1e6
+        elif not g["reported_cost_calls"]:
+            return None
+        return round(cost, 6)
+
+    def summary(self) -> Dict[str, Any]:
+        wall = max(time.time() - self.started, 1e-9)
+        groups, totals = [], _new_group()
+        total_cost: Optional[float] = 0.0
+        with self._lock:
+            for (model, prompt_version, specimen_version), g in sorted(self._groups.items()):
+                cost = self._cost(model, g)
+                metered_calls = g["calls"] - g["calls_without_usage"]
+                mq = g["metered_queries"]
+                row = {
+                    "model": model,
+                    "prompt_version": prompt_version,
+                    "specimen_version": specimen_version,
+                    **{k: g[k] for k in (*COUNT_FIELDS, *TOKEN_FIELDS)},
+                    "tokens_per_query": round(g["total_tokens"] / mq, 1) if mq else None,
+                    "completion_tokens_per_call": round(g["completion_tokens"] / metered_calls, 1) if metered_calls else None,
+                    "mean_latency_sec": round(g["latency_sec"] / g["calls"], 3) if g["calls"] else None,
+                    "cost_usd": cost,
+                    "cost_per_query_usd": round(cost / mq, 8) if cost is not None and mq else None,
+                }
+                groups.append(row)
+                for k in (*COUNT_FIELDS, *TOKEN_FIELDS):
+                    totals[k] += g[k]
+                total_cost = None if cost is None or total_cost is None else total_cost + cost
+        return {
+            "run_id": self.run_id,
+            "wall_sec": round(wall, 2),
+            "totals": {
+                **{k: totals[k] for k in (*COUNT_FIELDS, *TOKEN_FIELDS)},
+                "cost_usd": None if total_cost is None else round(total_cost, 6),
+                "calls_per_min": round(totals["calls"] / wall * 60, 2),
+                "queries_per_min": round(totals["queries"] / wall * 60, 2),
+                "tokens_per_sec": round(totals["total_tokens"] / wall, 1),
+            },
+            "groups": groups,
+        }
+
+    def write(self, results_path: Path) -> Path:
+        """Writes the summary as `<results stem>.usage` and prints a one-line total."""
+        path = usage_path(results_path)
+        summary = self.summary()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        t = summary["totals"]
+        cost = "n/a (no price)" if t["cost_usd"] is None else f"${t['cost_usd']:.4f}"
+        print(f"Usage: {t['calls']} calls, {t['total_tokens']} tokens ({t['prompt_tokens']} in / {t['completion_tokens']} out), "
+              f"cost {cost}, {t['calls_per_min']} calls/min -> {path}")
+        return path
+
+
+def usage_path(results_path: Path) -> Path:
+    results_path = Path(results_path)
+    return results_path.with_name(results_path.stem + ".usage")
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def compare(patterns: List[str]) -> None:
+    """One row per (run, model, prompt, specimen) group, with the run's agreement/F1 when its results JSON is next to it."""
+    paths = [Path(m) for p in patterns for m in (sorted(glob.glob(p)) or [p])]
+    print(f"{'run':<34} {'model':<28} {'prompt':<7} {'spec':<14} {'calls':>5} {'tok/q':>7} {'out/call':>8} {'$/q':>10} {'agree':>6} {'f1':>6}")
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            summary = json.load(f)
+        quality: Dict[str, Any] = {}
+        results = path.with_suffix(".json")
+        if results.exists():
+            try:
+                with open(results, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    quality = data.get("metrics", data)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                pass
+        for g in summary["groups"]:
+            fmt = lambda v, spec: "-" if v is None else format(v, spec)  # noqa: E731
+            # "~": some of the group's tokens are estimates (streams closed before the provider reported usage).
+            est = "~" if g.get("estimated_calls") else ""
+            print(f"{path.stem[:34]:<34} {g['model'][:28]:<28} {g['prompt_version'][:7]:<7} {g['specimen_version'][:14]:<14} "
+                  f"{g['calls']:>5} {est + fmt(g['tokens_per_query'], '.0f'):>7} {fmt(g['completion_tokens_per_call'], '.0f'):>8} "
+                  f"{fmt(g['cost_per_query_usd'], '.6f'):>10} {fmt(quality.get('agreement'), '.3f'):>6} {fmt(quality.get('f1'), '.3f'):>6}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Token/cost accounting summaries for model runs")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("compare", help="Tabulate tokens and cost per query across .usage summaries")
+    p.add_argument("paths", nargs="+", help="Paths or glob patterns of .usage files")
+    args = parser.parse_args()
+
+    if args.cmd == "compare":
+        compare(args.paths)
+
+
+if __name__ == "__main__":
+    main()
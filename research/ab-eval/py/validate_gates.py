@@ -12,6 +12,10 @@ import argparse
 import sys
 from pathlib import Path
 
+# Thresholds from EVALUATION_CONTRACT.md
+AGREEMENT_DELTA_MIN = 0.01
+PRECISION_DELTA_MIN = -0.02
+
 def load_report(path: Path):
     if not path.exists():
         print(f"Error: Report not found at {path}")
@@ -19,11 +23,7 @@ def load_report(path: Path):
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
-def validate_gates(report, baseline=None):
-    # Thresholds from EVALUATION_CONTRACT.md
-    AGREEMENT_DELTA_MIN = 0.01
-    PRECISION_DELTA_MIN = -0.02
-    
+def validate_gates(report, baseline=None, visual_qa=None):
     gates = {
         "G1 (Agreement Delta)": {"status": "FAIL", "value": 0.0, "threshold": f">= {AGREEMENT_DELTA_MIN}"},
         "G2 (Precision Delta)": {"status": "FAIL", "value": 0.0, "threshold": f">= {PRECISION_DELTA_MIN}"},
@@ -89,11 +89,21 @@ def validate_gates(report, baseline=None):
     elif "helps_hurts" not in report:
         gates["G3 (Helps/Hurts Net)"]["status"] = "SKIP (Missing Data)"
 
-    # G4: Visual QA (Manual input from report metadata/results)
-    manual_g4 = report.get("visual_qa", {}).get("status")
-    if manual_g4:
-        gates["G4 (Visual QA)"]["status"] = manual_g4
-        gates["G4 (Visual QA)"]["value"] = report.get("visual_qa", {}).get("evidence", "Manual")
+    # G4: Visual QA (automated result from visual_qa.py, else manual input from report metadata/results)
+    g4 = visual_qa or report.get("visual_qa", {})
+    if g4.get("status"):
+        gates["G4 (Visual QA)"]["status"] = g4["status"]
+        gates["G4 (Visual QA)"]["value"] = g4.get("evidence", "Manual")
+
+    # Bootstrap CIs (informational; produced by bootstrap_ci.py / aggregate_promotion_results.py)
+    # Point estimates above remain the sole PASS/FAIL criterion.
+    boot_gates = report.get("bootstrap", {}).get("gates", {})
+    for name, ci in boot_gates.items():
+        if name in gates:
+            gates[name]["ci"] = [ci["ci_low"], ci["ci_high"]]
+            gates[name]["ci_level"] = 1 - report["bootstrap"].get("alpha", 0.05)
+            gates[name]["p_value"] = ci["p_value"]
+            gates[name]["p_gate_pass"] = ci["p_gate_pass"]
 
     # Final decision
     # STRICT POLICY: PENDING status (like G4) MUST block a programmatic "GO".
@@ -106,16 +116,18 @@ def main():
     parser = argparse.ArgumentParser(description="Validate report against governance gates.")
     parser.add_argument("report", help="Path to report.json")
     parser.add_argument("--baseline", help="Path to baseline report.json (optional)")
+    parser.add_argument("--visual-qa", help="Path to automated G4 result from visual_qa.py (overrides report visual_qa)")
     parser.add_argument("--out", help="Path to save gate results (json)")
     args = parser.parse_args()
 
     report = load_report(Path(args.report))
     baseline = load_report(Path(args.baseline)) if args.baseline else None
+    visual_qa = load_report(Path(args.visual_qa)) if args.visual_qa else None
 
-    if not report:
+    if not report or (args.visual_qa and not visual_qa):
         sys.exit(1)
 
-    success, gates = validate_gates(report, baseline)
+    success, gates = validate_gates(report, baseline, visual_qa)
 
     print("\n=== GOVERNANCE GATE CHECK ===")
     print(f"{'Gate':<30} | {'Status':<10} | {'Value':<10} | {'Threshold':<10}")
@@ -123,6 +135,8 @@ def main():
     for name, result in gates.items():
         val_str = f"{result['value']:.4f}" if isinstance(result['value'], float) else str(result['value'])
         print(f"{name:<30} | {result['status']:<10} | {val_str:<10} | {result['threshold']:<10}")
+        if "ci" in result:
+            print(f"{'':<30} |   {100 * result['ci_level']:g}% CI [{result['ci'][0]:+.4f}, {result['ci'][1]:+.4f}]  p={result['p_value']:.4f}  P(pass)={result['p_gate_pass']:.4f}")
     
     if args.out:
         with open(args.out, "w", encoding="utf-8") as f:
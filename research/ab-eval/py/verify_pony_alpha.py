@@ -5,6 +5,8 @@ import requests
 from pathlib import Path
 from dotenv import load_dotenv
 
+from http_cassette import install_from_env
+
 def load_env():
     root = Path(__file__).resolve().parents[3]
     load_dotenv(root / ".env", override=False)
@@ -17,6 +19,7 @@ def image_to_base64(image_path: Path) -> str:
 
 def check_multimodal(model_id: str):
     load_env()
+    install_from_env()
     api_key = os.getenv("OPENROUTER_API_KEY")
     if not api_key:
         print("OPENROUTER_API_KEY not found")
@@ -0,0 +1,259 @@
+"""
+Automated G4 visual QA for rendered specimens
+
+Checks every specimen half written by `render_specimen_v3_1.py` (or v3),
+canvas or tiles layout, and writes a machine-readable G4 result that
+`validate_gates.py --visual-qa` consumes. Checks, all on the PNGs:
+
+- clipping: ink touching the image border, or a crop margin that is missing
+  on one side only (the renderer pads content symmetrically, so a one-sided
+  deficit means ink ran past the tall canvas),
+- overlap: two `draw_section` lines merged into one ink band, split by a
+  near-empty valley row between two dense line cores,
+- tofu: hollow rectangles with four inked corners (missing-glyph .notdef boxes),
+- empty section: a blank half, or fewer text lines than the renderer draws sections.
+
+Specimens are checked in parallel; the whole set takes seconds, and only
+flagged specimens need a human look.
+
+Usage:
+    python research/ab-eval/py/visual_qa.py --specimens research/ab-eval/out/specimens_v3_1 --renderer v3_1
+    python research/ab-eval/py/validate_gates.py report.json --visual-qa research/ab-eval/out/visual_qa.json
+
+This produces:
+    research/ab-eval/out/visual_qa.json
+    research/ab-eval/out/visual_qa.md
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from raster_metrics import runs
+
+# Lighter than raster_metrics.INK: downscaled 8pt body text and anti-aliased touches must count as ink
+INK = 200
+CROP_MARGIN = 40  # finalize_and_save margin around content (source px)
+TILE_MARGIN = 8   # pack_tiles vertical re-trim margin
+# Sections drawn per specimen half (draw_section calls); wrapping only adds lines
+EXPECTED_SECTIONS = {
+    "v3_1": {"top": 4, "bottom": 11},
+    "v3": {"top": 4, "bottom": 9},
+}
+THRESHOLDS = {
+    "clip_margin_px": 3,        # source-px margin at or below which a one-sided crop counts as clipped
+    "valley_ratio": 0.06,       # valley row ink / smaller neighbouring core (smoothed) for an overlap
+    "valley_smooth_rows": 5,
+    "valley_side_mass": 0.05,   # min share of the band's ink on each side (a descender tail is not a line)
+    "tofu_side_cover": 0.9,     # fraction of each box side that must be inked
+    "tofu_interior_fill": 0.35,
+    "tofu_aspect": [0.25, 1.25],  # width / height
+    "tofu_min_height_px": 10,
+}
+SPECIMEN_RE = re.compile(r"^(?P<font>.+)_(?P<half>top|bottom)(?:_t(?P<tile>\d+))?\.png$")
+
+
+def find_specimens(spec_dir: str) -> Dict[str, List[Path]]:
+    """`<font>_<half>` -> image paths (one canvas PNG or the half's tiles in order)."""
+    found: Dict[str, List[Tuple[int, Path]]] = {}
+    for p in Path(spec_dir).glob("*.png"):
+        m = SPECIMEN_RE.match(p.name)
+        if m:
+            found.setdefault(f"{m['font']}_{m['half']}", []).append((int(m["tile"] or 0), p))
+    return {k: [p for _, p in sorted(v)] for k, v in sorted(found.items())}
+
+
+def ink_margins(ink: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    """Blank margins (left, top, right, bottom) around the ink bbox, or None when blank."""
+    cols, rows = np.flatnonzero(ink.any(axis=0)), np.flatnonzero(ink.any(axis=1))
+    if not len(cols):
+        return None
+    h, w = ink.shape
+    return int(cols[0]), int(rows[0]), int(w - 1 - cols[-1]), int(h - 1 - rows[-1])
+
+
+def clipped_edges(margins: Tuple[int, int, int, int], expected: Tuple[int, int], scale: Optional[float] = None) -> List[str]:
+    """
+    Edges whose margin is missing: ink on the border, or a margin short of the
+    opposite one by (nearly) the whole expected crop margin. `scale` maps
+    source px to image px; None estimates it from the axis the canvas fills.
+    """
+    l, t, r, b = margins
+    if scale is None:
+        filled = (l, r) if l + r <= t + b else (t, b)
+        scale = max(max(filled) / (expected[0] if filled == (l, r) else expected[1]), 1e-6)
+    tol = THRESHOLDS["clip_margin_px"]
+    edges = []
+    for name, side, opp, exp in (("left", l, r, expected[0]), ("right", r, l, expected[0]),
+                                 ("top", t, b, expected[1]), ("bottom", b, t, expected[1])):
+        if side == 0 or (opp - side) / scale >= exp - tol:
+            edges.append(name)
+    return edges
+
+
+def split_lines(ink: np.ndarray) -> Tuple[List[Tuple[int, int]], List[int]]:
+    """Text lines from the row profile, splitting ink bands at near-empty valleys. Returns (lines, valley rows)."""
+    profile = ink.sum(axis=1).astype(float)
+    k = THRESHOLDS["valley_smooth_rows"]
+    smooth = np.convolve(profile, np.ones(k) / k, mode="same")
+    lines, valleys = [], []
+    for start, end in runs(profile > 0):
+        cut = start
+        seg = smooth[start:end]
+        # Running maxima above and below each row, within the band
+        above = np.maximum.accumulate(seg)
+        below = np.maximum.accumulate(seg[::-1])[::-1]
+        core = np.minimum(above, below)
+        mass = np.cumsum(profile[start:end])
+        side = np.minimum(mass - profile[start:end], mass[-1] - mass)
+        cand = np.flatnonzero((profile[start:end] <= THRESHOLDS["valley_ratio"] * core)
+                              & (side >= THRESHOLDS["valley_side_mass"] * mass[-1]))
+        for group in np.split(cand, np.flatnonzero(np.diff(cand) > k) + 1) if len(cand) else []:
+            row = start + int(group[np.argmin(profile[start + group])])
+            lines.append((cut, row))
+            valleys.append(row)
+            cut = row + 1
+        lines.append((cut, end))
+    return lines, valleys
+
+
+def tofu_boxes(ink: np.ndarray, lines: List[Tuple[int, int]]) -> List[Tuple[int, int, int, int]]:
+    """Hollow, four-cornered rectangles among the glyph segments of each line (x0, y0, x1, y1)."""
+    lo, hi = THRESHOLDS["tofu_aspect"]
+    cover, max_fill = THRESHOLDS["tofu_side_cover"], THRESHOLDS["tofu_interior_fill"]
+    boxes = []
+    for y0, y1 in lines:
+        band = ink[y0:y1]
+        for x0, x1 in runs(band.any(axis=0)):
+            rows = np.flatnonzero(band[:, x0:x1].any(axis=1))
+            g = band[rows[0]:rows[-1] + 1, x0:x1]
+            h, w = g.shape
+            if w < 4 or h < THRESHOLDS["tofu_min_height_px"] or not lo <= w / h <= hi:
+                continue
+            if not (g[:2].any(axis=0).mean() >= cover and g[-2:].any(axis=0).mean() >= cover
+                    and g[:, :2].any(axis=1).mean() >= cover and g[:, -2:].any(axis=1).mean() >= cover):
+                continue
+            if not (g[:2, :2].any() and g[:2, -2:].any() and g[-2:, :2].any() and g[-2:, -2:].any()):
+                continue
+            # Side thickness from the middle row; the inside of the box must be mostly blank
+            mid = g[h // 2]
+            stroke = max(int(np.argmin(mid)) if not mid.all() else w, 1)
+            inner = g[stroke:h - stroke, stroke:w - stroke]
+            if inner.size >= 4 and inner.mean() <= max_fill:
+                boxes.append((int(x0), y0 + int(rows[0]), int(x1), y0 + int(rows[-1]) + 1))
+    return boxes
+
+
+def check_specimen(name: str, paths: List[Path], expected_sections: int) -> Dict[str, Any]:
+    """All G4 checks for one specimen half (one canvas image or all of its tiles)."""
+    tiles = len(paths) > 1 or "_t" in paths[0].stem[len(name):]
+    issues: List[Dict[str, Any]] = []
+    n_lines = 0
+    inks = [np.asarray(Image.open(p).convert("L")) < INK for p in paths]
+    margins = [ink_margins(ink) for ink in inks]
+    drawn = [m for m in margins if m is not None]
+    # Tiles share one width but each holds only some lines: horizontal margins come from their union
+    union_lr = (min(m[0] for m in drawn), min(m[2] for m in drawn)) if drawn else (0, 0)
+    for path, ink, m in zip(paths, inks, margins):
+        if m is None:
+            continue
+        # Tiles keep source scale; canvases are resized to fit, so the scale is estimated
+        if tiles:
+            m, expected, scale = (union_lr[0], m[1], union_lr[1], m[3]), (CROP_MARGIN, TILE_MARGIN), 1.0
+        else:
+            expected, scale = (CROP_MARGIN, CROP_MARGIN), None
+        for edge in clipped_edges(m, expected, scale):
+            issues.append({"check": "clipping", "file": path.name, "detail": f"{edge} edge"})
+        lines, valleys = split_lines(ink)
+        n_lines += len(lines)
+        for row in valleys:
+            issues.append({"check": "overlap", "file": path.name, "detail": f"lines touch at y={row}"})
+        boxes = tofu_boxes(ink, lines)
+        if boxes:
+            issues.append({"check": "tofu", "file": path.name, "detail": f"{len(boxes)} box glyph(s)", "boxes": boxes})
+    if n_lines == 0:
+        issues.append({"check": "empty_section", "file": paths[0].name, "detail": "blank specimen"})
+    elif n_lines < expected_sections:
+        issues.append({"check": "empty_section", "file": paths[0].name,
+                       "detail": f"{n_lines} text lines for {expected_sections} sections"})
+    return {"specimen": name, "files": [p.name for p in paths], "lines": n_lines, "issues": issues}
+
+
+def run_visual_qa(spec_dir: str, renderer: str = "v3_1", workers: int = 0) -> Dict[str, Any]:
+    specimens = find_specimens(spec_dir)
+    expected = EXPECTED_SECTIONS[renderer]
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        results = list(pool.map(lambda kv: check_specimen(kv[0], kv[1], expected[kv[0].rsplit("_", 1)[1]]),
+                                specimens.items()))
+    flagged = [r for r in results if r["issues"]]
+    by_check: Dict[str, int] = {}
+    for r in flagged:
+        for check in {i["check"] for i in r["issues"]}:
+            by_check[check] = by_check.get(check, 0) + 1
+    return {
+        "gate": "G4",
+        # No specimens is not evidence of zero clipping
+        "status": "PASS" if results and not flagged else "FAIL",
+        "specimens_dir": spec_dir,
+        "renderer": renderer,
+        "checked": len(results),
+        "flagged": len(flagged),
+        "flagged_by_check": by_check,
+        "seconds": round(time.perf_counter() - t0, 2),
+        "thresholds": THRESHOLDS,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "results": flagged,
+    }
+
+
+def write_markdown(result: Dict[str, Any], path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"# Automated Visual QA (G4): {result['status']}\n\n")
+        f.write(f"- Specimens: `{result['specimens_dir']}` (renderer {result['renderer']})\n")
+        f.write(f"- Checked: {result['checked']} halves, flagged: {result['flagged']}\n")
+        for check, n in sorted(result["flagged_by_check"].items()):
+            f.write(f"  - {check}: {n}\n")
+        if result["results"]:
+            f.write("\n| Specimen | Check | File | Detail |\n| --- | --- | --- | --- |\n")
+            for r in result["results"]:
+                for issue in r["issues"]:
+                    f.write(f"| {r['specimen']} | {issue['check']} | {issue['file']} | {issue['detail']} |\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Automated G4 visual QA for rendered specimens")
+    parser.add_argument("--specimens", default="research/ab-eval/out/specimens_v3_1")
+    parser.add_argument("--renderer", choices=list(EXPECTED_SECTIONS), default="v3_1")
+    parser.add_argument("--workers", type=int, default=0, help="Parallel checks (0 = CPU count)")
+    parser.add_argument("--out", default="research/ab-eval/out/visual_qa.json")
+    args = parser.parse_args()
+
+    result = run_visual_qa(args.specimens, args.renderer, args.workers)
+    result["evidence"] = f"{args.out} ({result['checked']} specimen halves, {result['flagged']} flagged)"
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    md_path = os.path.splitext(args.out)[0] + ".md"
+    write_markdown(result, md_path)
+
+    print(f"Checked {result['checked']} specimen halves in {result['seconds']}s: {result['flagged']} flagged")
+    for check, n in sorted(result["flagged_by_check"].items()):
+        print(f"  {check}: {n}")
+    print(f"G4 (Visual QA): {result['status']}")
+    print(f"Saved to {args.out} and {md_path}")
+
+
+if __name__ == "__main__":
+    main()
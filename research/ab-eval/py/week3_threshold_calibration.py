@@ -1,10 +1,20 @@
 import json
 import os
+import argparse
 from pathlib import Path
 from typing import List, Dict, Any, Tuple
 import numpy as np
 from collections import defaultdict
 
+from metrics_kernel import (
+    TP, FP, FN, TN,
+    confusion_matrix,
+    gate_predictions,
+    labeled_accuracy,
+    metrics_from_counts as kernel_metrics_from_counts,
+    sweep_confusion,
+)
+
 # --- Configuration ---
 RESULTS_PATH = Path("research/ab-eval/out/week2_g3pro_v3_1_results.json")
 QUERIES_PATH = Path("research/ab-eval/data/queries.medium.human.v1.json")
@@ -14,126 +24,109 @@ REPORT_PATH = Path("research/ab-eval/REPORT_WEEK3_CALIBRATION.md")
 
 TECHNICAL_CLASSES = ["visual_shape"]
 
+def metrics_from_counts(tp: int, fp: int, fn: int, tn: int, total: int) -> Dict[str, Any]:
+    m = kernel_metrics_from_counts(tp, fp, fn, tn, total)
+    flat = {k: m[k] for k in ("agreement", "precision", "recall", "f1")} | m["counts"]
+    flat["coverage"] = round(float((tp + fp) / total), 4) if total > 0 else 0
+    return flat
+
 def calculate_metrics(y_true: np.ndarray, y_pred: np.ndarray, total_denominator: int = None) -> Dict[str, Any]:
-    tp = np.sum((y_true == 1) & (y_pred == 1))
-    fp = np.sum((y_true == 0) & (y_pred == 1))
-    fn = np.sum((y_true == 1) & (y_pred == 0))
-    tn = np.sum((y_true == 0) & (y_pred == 0))
-    
+    counts = confusion_matrix(y_true, y_pred)[0]
     total = total_denominator if total_denominator is not None else len(y_true)
-    agreement = (tp + tn) / total if total > 0 else 0
-    precision = tp / (tp + fp) if (tp + fp) > 0 else 0
-    recall = tp / (tp + fn) if (tp + fn) > 0 else 0
-    f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
-    
-    return {
-        "agreement": round(float(agreement), 4),
-        "precision": round(float(precision), 4),
-        "recall": round(float(recall), 4),
-        "f1": round(float(f1), 4),
-        "tp": int(tp),
-        "fp": int(fp),
-        "fn": int(fn),
-        "tn": int(tn),
-        "total": int(total),
-        "coverage": round(float((tp + fp) / total), 4) if total > 0 else 0
-    }
-
-def accuracy_score_local(y_true, y_pred):
-    if len(y_true) == 0: return 0
-    mask = (y_true == 0) | (y_true == 1)
-    if np.sum(mask) == 0: return 0
-    return np.sum(y_true[mask] == y_pred[mask]) / np.sum(mask)
+    return metrics_from_counts(counts[TP], counts[FP], counts[FN], counts[TN], total)
 
 def main():
-    print(f"Loading results from {RESULTS_PATH}...")
-    with open(RESULTS_PATH, "r", encoding="utf-8") as f:
+    parser = argparse.ArgumentParser(description="Group-aware confidence threshold calibration")
+    parser.add_argument("--results", default=str(RESULTS_PATH))
+    parser.add_argument("--queries", default=str(QUERIES_PATH))
+    parser.add_argument("--ssot", default=str(SSOT_PATH))
+    parser.add_argument("--group-by", choices=["technical", "class"], default="technical",
+                        help="technical: Technical vs Subjective; class: one group per query class")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--n-thresholds", type=int, default=101)
+    parser.add_argument("--out", default=str(OUTPUT_DIR / "week3_calibration_results.json"))
+    parser.add_argument("--report", default=str(REPORT_PATH))
+    args = parser.parse_args()
+
+    print(f"Loading results from {args.results}...")
+    with open(args.results, "r", encoding="utf-8") as f:
         data = json.load(f)
-    
-    print(f"Loading queries from {QUERIES_PATH}...")
-    with open(QUERIES_PATH, "r", encoding="utf-8") as f:
+
+    print(f"Loading queries from {args.queries}...")
+    with open(args.queries, "r", encoding="utf-8") as f:
         queries = json.load(f)
     q_class_map = {q["id"]: q.get("class", "unclassified") for q in queries}
-    
-    print(f"Loading SSoT from {SSOT_PATH}...")
-    with open(SSOT_PATH, "r", encoding="utf-8") as f:
+
+    print(f"Loading SSoT from {args.ssot}...")
+    with open(args.ssot, "r", encoding="utf-8") as f:
         ssot_data = json.load(f)
     ssot_map = {(d["query_id"], d["font_name"]): d["casey_label"] for d in ssot_data["decisions"]}
 
+    def group_of(q_id: str) -> str:
+        if args.group_by == "class":
+            return q_class_map.get(q_id, "unclassified")
+        return "Technical" if q_class_map.get(q_id) in TECHNICAL_CLASSES else "Subjective"
+
     # 1. Align Data
-    dataset = []
-    total_items = data["counts"]["total"]
-    
-    for r in data["details"]:
-        q_id = r["query_id"]
-        f_name = r["font_name"]
-        y_true = ssot_map.get((q_id, f_name), -1) 
-        dataset.append({
-            "query_id": q_id,
-            "font_name": f_name,
-            "y_true": y_true,
-            "ai_match": r["ai_match"],
-            "confidence": r["confidence"],
-            "group": "Technical" if q_class_map.get(q_id) in TECHNICAL_CLASSES else "Subjective"
-        })
-
-    y_true_all = np.array([d["y_true"] for d in dataset])
-    ai_match_all = np.array([d["ai_match"] for d in dataset])
-    conf_all = np.array([d["confidence"] for d in dataset])
-    q_groups_all = np.array([d["group"] for d in dataset])
-    q_ids_all = np.array([d["query_id"] for d in dataset])
+    details = data["details"]
+    total_items = data.get("counts", {}).get("total", len(details))
+
+    q_ids_all = np.array([r["query_id"] for r in details])
+    y_true_all = np.array([ssot_map.get((r["query_id"], r["font_name"]), -1) for r in details])
+    ai_match_all = np.array([r["ai_match"] for r in details])
+    conf_all = np.array([r["confidence"] for r in details], dtype=float)
+
+    query_names, query_codes = np.unique(q_ids_all, return_inverse=True)
+    groups, group_codes = np.unique(np.array([group_of(q) for q in query_names])[query_codes], return_inverse=True)
+    n_groups = len(groups)
 
     # 2. Baseline (0.9 Gate)
-    baseline_pred = np.where((ai_match_all == 1) & (conf_all >= 0.9), 1, 0)
+    baseline_pred = gate_predictions(ai_match_all, conf_all, 0.9)
     baseline_metrics = calculate_metrics(y_true_all, baseline_pred, total_denominator=total_items)
 
     # 3. Global Threshold Sweep
-    thresholds = np.linspace(0.0, 1.0, 101)
-    global_results = []
-    for t in thresholds:
-        pred = np.where((ai_match_all == 1) & (conf_all >= t), 1, 0)
-        m = calculate_metrics(y_true_all, pred, total_denominator=total_items)
-        m["threshold"] = t
-        global_results.append(m)
-    best_global = max(global_results, key=lambda x: x["agreement"])
-
-    # 4. Group-Aware Thresholding
-    groups = np.unique(q_groups_all)
-    group_policies = {}
-    for grp in groups:
-        mask = (q_groups_all == grp)
-        grp_results = []
-        for t in thresholds:
-            pred = np.where((ai_match_all[mask] == 1) & (conf_all[mask] >= t), 1, 0)
-            acc = accuracy_score_local(y_true_all[mask], pred)
-            grp_results.append({"threshold": t, "accuracy": acc})
-        group_policies[grp] = max(grp_results, key=lambda x: x["accuracy"])
-
-    # 5. Validation Protocol (K-Fold by Query)
-    unique_queries = np.unique(q_ids_all)
+    thresholds = np.linspace(0.0, 1.0, args.n_thresholds)
+    global_counts = sweep_confusion(y_true_all, ai_match_all, conf_all, thresholds)
+    best_idx = int(np.argmax(global_counts["tp"][0] + global_counts["tn"][0]))
+    best_global = metrics_from_counts(*(global_counts[c][0, best_idx] for c in ("tp", "fp", "fn", "tn")), total_items)
+    best_global["threshold"] = float(thresholds[best_idx])
+
+    # 4 + 5. Group-Aware Thresholding and K-Fold by Query, from one (fold, group) histogram
+    unique_queries = query_names.copy()
     np.random.seed(42)
     np.random.shuffle(unique_queries)
-    folds = np.array_split(unique_queries, 5)
-    
+    folds = np.array_split(unique_queries, args.folds)
+    fold_of_query = np.empty(len(query_names), dtype=np.int64)
+    for i, fold in enumerate(folds):
+        fold_of_query[np.searchsorted(query_names, fold)] = i
+    fold_codes = fold_of_query[query_codes]
+
+    fold_counts = sweep_confusion(
+        y_true_all, ai_match_all, conf_all, thresholds,
+        segments=fold_codes * n_groups + group_codes, n_segments=args.folds * n_groups,
+    )
+    fold_counts = {c: v.reshape(args.folds, n_groups, *v.shape[1:]) for c, v in fold_counts.items()}
+    group_counts = {c: v.sum(axis=0) for c, v in fold_counts.items()}
+
+    group_acc = labeled_accuracy(group_counts)
+    group_best = np.argmax(group_acc, axis=1)
+    group_policies = {
+        grp: {"threshold": float(thresholds[group_best[g]]), "accuracy": float(group_acc[g, group_best[g]])}
+        for g, grp in enumerate(groups)
+    }
+
+    group_sizes = np.bincount(group_codes, minlength=n_groups)
+    fold_group_sizes = np.bincount(fold_codes * n_groups + group_codes, minlength=args.folds * n_groups).reshape(args.folds, n_groups)
+
     cv_family_metrics = []
-    for i in range(5):
-        test_mask = np.isin(q_ids_all, folds[i])
-        train_mask = ~test_mask
-        best_t_family = {}
-        for grp in groups:
-            mask = train_mask & (q_groups_all == grp)
-            if np.sum(mask) == 0: continue
-            train_results = []
-            for t in thresholds:
-                pred = np.where((ai_match_all[mask] == 1) & (conf_all[mask] >= t), 1, 0)
-                train_results.append((t, accuracy_score_local(y_true_all[mask], pred)))
-            best_t_family[grp] = max(train_results, key=lambda x: x[1])[0]
-        
-        test_pred = np.zeros(np.sum(test_mask))
-        tm, tc, tg = ai_match_all[test_mask], conf_all[test_mask], q_groups_all[test_mask]
-        for idx in range(len(test_pred)):
-            t = best_t_family.get(tg[idx], 0.9)
-            if tm[idx] == 1 and tc[idx] >= t: test_pred[idx] = 1
+    for i in range(args.folds):
+        train_counts = {c: group_counts[c] - fold_counts[c][i] for c in group_counts}
+        train_best = np.argmax(labeled_accuracy(train_counts), axis=1)
+        has_train = (group_sizes - fold_group_sizes[i]) > 0
+        best_t_family = np.where(has_train, thresholds[train_best], 0.9)
+
+        test_mask = fold_codes == i
+        test_pred = gate_predictions(ai_match_all[test_mask], conf_all[test_mask], best_t_family[group_codes[test_mask]])
         cv_family_metrics.append(calculate_metrics(y_true_all[test_mask], test_pred))
 
     def aggregate(ml):
@@ -145,10 +138,8 @@ def main():
     cv_final = aggregate(cv_family_metrics)
 
     # 6. Final Selection
-    final_pred = np.zeros_like(y_true_all)
-    for i in range(len(final_pred)):
-        t = group_policies[q_groups_all[i]]["threshold"]
-        if ai_match_all[i] == 1 and conf_all[i] >= t: final_pred[i] = 1
+    policy_thresholds = thresholds[group_best]
+    final_pred = gate_predictions(ai_match_all, conf_all, policy_thresholds[group_codes])
     final_metrics = calculate_metrics(y_true_all, final_pred, total_denominator=total_items)
 
     # 7. Calibration Curve
@@ -169,10 +160,10 @@ def main():
         "final_policy": final_metrics,
         "calibration": cal_stats
     }
-    with open(OUTPUT_DIR / "week3_calibration_results.json", "w") as f:
+    with open(args.out, "w") as f:
         json.dump(results, f, indent=2)
 
-    with open(REPORT_PATH, "w") as f:
+    with open(args.report, "w") as f:
         f.write("# Week 3 Report: Dynamic Threshold Calibration\n\n")
         f.write("## Objective\nMaximize Agreement with SSoT using dynamic confidence gating.\n\n")
         f.write("## Calibration Methods\n- Baseline: Fixed 0.9 gate\n- Global Sweep: Optimal single T\n- Group-Aware: T optimized for Technical vs Subjective queries\n\n")
@@ -190,7 +181,7 @@ def main():
         f.write("\n## Observed Accuracy vs Confidence\n\n| Conf | Accuracy | Count |\n| :--- | :--- | :--- |\n")
         for s in cal_stats: f.write(f"| {s['conf']} | {s['accuracy']:.4f} | {s['count']} |\n")
 
-    print(f"Report: {REPORT_PATH}")
+    print(f"Report: {args.report}")
 
 if __name__ == "__main__":
     main()